@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+Bounded least-recently-used cache of constructed LED animations.
+
+Switching patterns back and forth reuses the animation objects instead of
+allocating new ones, which keeps the heap from fragmenting and avoids GC
+pauses right when the robot changes state.
+"""
+
+
+class AnimationCache:
+    """LRU cache of animations keyed by pattern, segment and shape parameters.
+
+    Colors and speeds are updated in place on a cached animation, so they don't
+    need to be part of the key. `get` hands back the animation where it left
+    off, callers reset it when they switch to it.
+    """
+
+    def __init__(self, size: int = 6) -> None:
+        self.size = size
+        self.entries = {}
+        # least recently used key first
+        self.order = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached animation for key, or None"""
+        animation = self.entries.get(key)
+        if animation is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if self.order[-1] != key:
+            self.order.remove(key)
+            self.order.append(key)
+        return animation
+
+    def put(self, key, animation):
+        """Add an animation, evicting the least recently used one when full"""
+        if key in self.entries:
+            self.order.remove(key)
+        elif len(self.order) >= self.size:
+            del self.entries[self.order.pop(0)]
+            self.evictions += 1
+        self.entries[key] = animation
+        self.order.append(key)
+        return animation
+
+    def clear(self):
+        """Drop every cached animation, e.g. when the pixel object they draw to is replaced"""
+        self.entries = {}
+        self.order = []
+
+    def __len__(self):
+        return len(self.order)
+
+    def __repr__(self) -> str:
+        return (
+            f"AnimationCache(size={len(self.order)}/{self.size}, hits={self.hits},"
+            f" misses={self.misses}, evictions={self.evictions})"
+        )
@@ -0,0 +1,16 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+import json
+import usb_cdc
+
+# sniffer and gateway modes use a second USB serial port, so the console
+# (REPL and print output) stays usable on the first one
+try:
+    with open("can_config.json", "r") as config_file:
+        mode = json.load(config_file).get("mode", "device")
+except (OSError, ValueError):
+    mode = "device"
+
+if mode in ("sniffer", "gateway"):
+    usb_cdc.enable(console=True, data=True)
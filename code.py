@@ -5,42 +5,112 @@ import sys
 import asyncio
 import board
 import json
-import neopixel
 import supervisor
 import keypad
 from digitalio import DigitalInOut, Direction
 
 from adafruit_led_animation.animation.blink import Blink
-from adafruit_led_animation.animation.pulse import Pulse
-from adafruit_led_animation.animation.rainbowsparkle import RainbowSparkle
-from adafruit_led_animation.animation.rainbowcomet import RainbowComet
 from adafruit_led_animation.animation.solid import Solid
 from adafruit_led_animation.color import RED, GREEN, BLUE, ORANGE
 
-from frc_can_7491 import CANDevice, CANMessage, CANMessageType
+from frc_can_7491 import (
+    BinaryGateway,
+    CANDevice,
+    CANMessage,
+    CANMessageType,
+    CANSniffer,
+    InputMonitor,
+    IOBreakout,
+    LoopMonitor,
+    MCP2515Transport,
+    Scheduler,
+    SLCANGateway,
+    StatusReply,
+)
 
-from enums import API_ID
+from enums import API_ID, APP_EVENT
+from message_schemas import SCHEMAS
+from led_renderer import LEDRenderer, PixelFrame, PixelSegment
+from animation_cache import AnimationCache
+from pixel_stream import PixelStream
+from pattern_commands import PatternDecoder, apply_parameters, build_animation, cache_key
 
 is_enabled = False
 last_heartbeat_msg_time: int = 0
 
 device_status = "disabled"
 
+FIRMWARE_VERSION = (1, 0)
+
 led = DigitalInOut(board.LED)
 led.direction = Direction.OUTPUT
 
-statusPixel = neopixel.NeoPixel(board.NEOPIXEL, 1, brightness=0.03, auto_write=False)
-status_animation = Blink(statusPixel, speed=0.5, color=RED)
+statusPixel = PixelFrame(board.NEOPIXEL, 1, brightness=0.03)
+
+# animation cache keys are (pattern, segment, size, flags)
+STATUS_DISABLED_KEY = ("disabled", -1, 0, 0)
+STATUS_ENABLED_KEY = ("enabled", -1, 0, 0)
+
+# reuse constructed animations instead of allocating on every state change
+status_cache = AnimationCache(size=2)
+pattern_cache = AnimationCache(size=6)
+
+status_animation = status_cache.put(
+    STATUS_DISABLED_KEY, Blink(statusPixel, speed=0.5, color=RED)
+)
 
 keys = keypad.Keys((board.BUTTON,), value_when_pressed=False, pull=True)
 
 pixel_pin = board.D12
 pixel_num = 1
 pixel_brightness = 30
+# gamma for the strip's brightness table, 1.0 keeps colors linear
+pixel_gamma = 1.0
 pixels = None
-pixel_animation = None
+# each segment of the strip runs its own animation
+segments = []
+segment_animations = []
+# cache key of the animation each segment is running
+segment_keys = []
+pattern_decoder = PatternDecoder()
+
+# only writes the NeoPixels on ticks where an animation changed something
+renderer = LEDRenderer()
 
 can_config = json.load(open("can_config.json", "r"))
+pixel_gamma = can_config.get("pixel_gamma", pixel_gamma)
+
+# "sniffer" mode: a listen-only bus monitor streaming every frame to the USB data
+# port (enabled in boot.py), read it on the host with tools/sniff.py
+if can_config.get("mode", "device") == "sniffer":
+    import usb_cdc
+
+    sniffer_config = can_config.get("sniffer", {})
+    statusPixel.fill(BLUE)
+    statusPixel.show()
+    sniffer = CANSniffer(
+        MCP2515Transport(silent=True, spi_baudrate=sniffer_config.get("spi_baudrate", 8_000_000)),
+        usb_cdc.data if usb_cdc.data is not None else usb_cdc.console,
+        max_frames=sniffer_config.get("max_frames", 32),
+        flush_ms=sniffer_config.get("flush_ms", 5),
+    )
+    sniffer.run()
+
+# "gateway" mode: a USB to CAN adapter on the USB data port, SLCAN for slcand /
+# python-can or the binary protocol, try it on the host with tools/gateway_sim.py
+if can_config.get("mode", "device") == "gateway":
+    import usb_cdc
+
+    gateway_config = can_config.get("gateway", {})
+    statusPixel.fill(ORANGE)
+    statusPixel.show()
+    gateway_class = SLCANGateway if gateway_config.get("protocol", "slcan") == "slcan" else BinaryGateway
+    gateway = gateway_class(
+        MCP2515Transport(spi_baudrate=gateway_config.get("spi_baudrate", 8_000_000)),
+        usb_cdc.data if usb_cdc.data is not None else usb_cdc.console,
+        max_frames=gateway_config.get("max_frames", 32),
+    )
+    gateway.run()
 
 canDevice = CANDevice(
     dev_type= can_config.get("frc_device_type", 11), 
@@ -48,6 +118,35 @@ canDevice = CANDevice(
     dev_number=can_config["device_number"],
 )
 
+# share of the bus this device's periodic frames may use before a warning is logged
+canDevice.bus_load.budget_pct = can_config.get("bus_budget_pct", 10)
+
+# handler timing, dump with canDevice.profiler.dump() or query over CAN
+if can_config.get("profile_handlers", False):
+    canDevice.enable_profiling()
+
+# keep the last N frames in RAM, save from the REPL with canDevice.capture.save(path)
+# (needs a writable filesystem) and read it with tools/can_replay.py
+if can_config.get("capture_records", 0) > 0:
+    canDevice.enable_capture(can_config["capture_records"])
+
+# bus/loop health frames, 0 = only when a TelemetryRequest is received
+if "telemetry_period_ms" in can_config:
+    canDevice.enable_telemetry(can_config["telemetry_period_ms"])
+
+status_reply = StatusReply(canDevice, API_ID.StatusReply, firmware_version=FIRMWARE_VERSION)
+
+# stream utilization is counted against the same bus as canDevice.bus_load
+pixel_stream = PixelStream(canDevice.device_filter, canDevice.bus_load.bit_rate)
+
+log = canDevice.log
+log.register(APP_EVENT.InitPixelArray, "Init Pixel Array. Brightness: {0} Number of LEDs: {1}")
+log.register(APP_EVENT.PatternChange, "Pattern {0:#x} Segment: {1}")
+log.register(APP_EVENT.DefineSegment, "Segment {0}: start {1} length {2}")
+log.register(APP_EVENT.StatusEnabled, "Set Status: Enabled")
+log.register(APP_EVENT.StatusDisabled, "Set Status: Disabled")
+log.register(APP_EVENT.HeartbeatLost, "No heartbeat in {0}ms - Disabling Device")
+
 # TODO add routes to handle device number changes
 
 # 'Heartbeat' messages
@@ -61,7 +160,8 @@ def heartbeat(message: CANMessage):  # pylint: disable=unused-argument
 
     # capture the time of the last heartbeat message
     # used to ensure robot is talking to us
-    last_heartbeat_msg_time: int = supervisor.ticks_ms()
+    last_heartbeat_msg_time = supervisor.ticks_ms()
+    status_reply.heartbeat()
 
     return
 
@@ -80,10 +180,8 @@ def broadcast(message: CANMessage):  # pylint: disable=unused-argument
 # Status Request
 @canDevice.route(API_ID.StatusRequest)
 def status_request(message: CANMessage):  # pylint: disable=unused-argu4117
-    # immediately send a reply with a status update
-    statusMessage = "Team7491"
-    canDevice.send_message_simple(API_ID.StatusReply, message=bytes(statusMessage, "utf-8"))
-    # print("Status Sent: ", statusMessage)
+    # immediately send a reply with the latest status snapshot
+    status_reply.send()
     # print('\t', message)
     return
 
@@ -96,159 +194,263 @@ def set_device_number(message: CANMessage):  # pylint: disable=unused-argu4117
     return
 
 
+def define_segments(segment_list):
+    """Split the strip into segments from a list of (start, number of pixels)"""
+    global segments, segment_animations, segment_keys
+    segments = []
+    for start, count in segment_list:
+        start = min(start, pixel_num)
+        segments.append(PixelSegment(pixels, start, min(start + count, pixel_num)))
+    if not segments:
+        segments.append(PixelSegment(pixels, 0, pixel_num))
+
+    # cached animations still draw to the old segments
+    pattern_cache.clear()
+    segment_animations = []
+    segment_keys = []
+    for index, segment in enumerate(segments):
+        key = (API_ID.InitPixelArray, index, 0, 0)
+        segment_animations.append(pattern_cache.put(key, Blink(segment, speed=0.5, color=RED)))
+        segment_keys.append(key)
+
+
 # Set Number of LEDs
 @canDevice.route(API_ID.InitPixelArray)
 def init_pixel_array(message: CANMessage):  # pylint: disable=unused-argument
-    print("Brightness:", int(message.data[6]))
-    print("Number of LEDs:", int(message.data[7]))
-    print("Pixel Pin", pixel_pin)
+    global pixel_num, pixel_brightness, pixels
+    pixel_brightness, pixel_num = pattern_decoder.decode_init(message.data)
+    log.info(APP_EVENT.InitPixelArray, pixel_brightness, pixel_num)
 
-    global pixel_num, pixel_brightness, pixels, pixel_animation
-    if(pixels):
+    if pixels is not None:
         pixels.deinit()
-    pixel_num = int(message.data[7])
-    pixel_brightness = int(message.data[6])
-    pixels = neopixel.NeoPixel(pixel_pin, pixel_num, brightness=pixel_brightness, auto_write=False)
-    pixel_animation = Blink(pixels, speed=0.5, color=RED)
+    # brightness is sent as 0-255
+    pixels = PixelFrame(
+        pixel_pin, pixel_num, brightness=pixel_brightness / 255, gamma=pixel_gamma
+    )
+    define_segments(can_config.get("segments", ()))
+    pixel_stream.attach(pixels)
 
     return
 
 
-# Pattern Chaos
-@canDevice.route(API_ID.PatternChaos)
-def base(message: CANMessage):  # pylint: disable=unused-argument
-    global pixel_animation
-    if(pixels and not isinstance(pixel_animation, RainbowSparkle)):
-        pixel_animation = RainbowSparkle(pixels, speed=0.05, num_sparkles=30)
-        print('\t', 'Pattern Chaos')
+# Define one segment of the strip, a length of 0 for segment 0 resets to a single segment
+@canDevice.route(API_ID.DefineSegment)
+def define_segment(message: CANMessage):
+    if pixels is None:
+        return
+    index, start, count = pattern_decoder.decode_segment(message.data)
+    log.info(APP_EVENT.DefineSegment, index, start, count)
+
+    if index == 0 and count == 0:
+        define_segments(())
+    elif index <= len(segments):
+        segment_list = [(segment.start, segment.n) for segment in segments]
+        if index == len(segments):
+            segment_list.append((start, count))
+        else:
+            segment_list[index] = (start, count)
+        define_segments(segment_list)
     return
 
 
-# Pattern Rainbow
+# Pattern commands, see message_schemas.py for the payloads
+@canDevice.route(API_ID.PatternChaos)
 @canDevice.route(API_ID.PatternRainbow)
-def base(message: CANMessage):  # pylint: disable=unused-argument
-    global pixel_animation
-    if(pixels and not isinstance(pixel_animation, RainbowComet)):
-        pixel_animation = RainbowComet(pixels, speed=0.05, tail_length=10, bounce=True)
-        print('\t', 'Pattern Rainbow')
-    return
-
-
-# Pattern Solid
 @canDevice.route(API_ID.PatternSolid)
-def base(message: CANMessage):  # pylint: disable=unused-argument
-    # global status_animation
-    # status_animation = Blink(statusPixel, speed=0.4, color=ORANGE)
-    # print("Device", hex(message.api_id))
-    # print('\t', message)
-    return
-
-
-# Pattern Blink
 @canDevice.route(API_ID.PatternBlink)
-def base(message: CANMessage):  # pylint: disable=unused-argument
-    # global status_animation
-    # status_animation = Blink(statusPixel, speed=0.4, color=BLUE)
-    # print("Device", hex(message.api_id))
-    # print('\t', message)
-    return
-
-
-# Pattern Intensity
 @canDevice.route(API_ID.PatternIntensity)
-def base(message: CANMessage):  # pylint: disable=unused-argument
-    # print("Device", hex(message.api_id))
-    # print('\t', message)
+@canDevice.route(API_ID.PatternScanner)
+@canDevice.route(API_ID.PatternAlternating)
+@canDevice.route(API_ID.PatternChase)
+def pattern(message: CANMessage):
+    if pixels is None:
+        return
+
+    if pixel_stream.active:
+        # animations take the strip back from streaming
+        pixel_stream.stop()
+        for segment in segments:
+            segment.fill_color = None
+
+    command = pattern_decoder.decode(message.api_id, message.data)
+    if command.api_id == API_ID.PatternIntensity:
+        # only rebuilds the brightness table
+        pixels.brightness = command.brightness / 255
+        return
+    if command.segment >= len(segments):
+        return
+
+    key = cache_key(command)
+    animation = segment_animations[command.segment]
+    # the roboRIO repeats pattern commands, the same key keeps the running
+    # animation and only takes the new colors and speed
+    if key != segment_keys[command.segment]:
+        animation = pattern_cache.get(key)
+        if animation is None:
+            try:
+                animation = pattern_cache.put(
+                    key, build_animation(segments[command.segment], command)
+                )
+            except ValueError:
+                # e.g. sparkles need at least 2 pixels
+                return
+        else:
+            animation.reset()
+        segment_animations[command.segment] = animation
+        segment_keys[command.segment] = key
+        log.info(APP_EVENT.PatternChange, command.api_id, command.segment)
+    apply_parameters(animation, command)
     return
 
 
-# Pattern Scanner
-@canDevice.route(API_ID.PatternScanner)
-def base(message: CANMessage):  # pylint: disable=unused-argument
-    # print("Device", hex(message.api_id))
-    # print('\t', message)
+# Pixel streaming, see pixel_stream.py for the payloads
+@canDevice.route(API_ID.StreamPalette)
+@canDevice.route(API_ID.StreamRun)
+@canDevice.route(API_ID.StreamLiteral)
+@canDevice.route(API_ID.StreamIndexed)
+@canDevice.route(API_ID.StreamCommit)
+def stream(message: CANMessage):
+    pixel_stream.handle(message.api_id, message.data)
     return
 
 
-# Pattern Alternating
-@canDevice.route(API_ID.PatternAlternating)
-def base(message: CANMessage):  # pylint: disable=unused-argument
-    # print("Device", hex(message.api_id))
-    # print('\t', message)
-    return
+# Stream stats: fps x10, bus utilization in 0.1%, frames and dropped frames
+stream_stats_frame = bytearray(8)
 
 
-# Pattern Chase
-@canDevice.route(API_ID.PatternChase)
-def base(message: CANMessage):  # pylint: disable=unused-argument
-    # print("Device", hex(message.api_id))
-    # print('\t', message)
+@canDevice.route(API_ID.StreamStatsRequest)
+def stream_stats(message: CANMessage):  # pylint: disable=unused-argument
+    SCHEMAS[API_ID.StreamStatsReply].encode_into(
+        stream_stats_frame, 0, *[min(value, 0xFFFF) for value in pixel_stream.stats()]
+    )
+    canDevice.send_message_simple(API_ID.StreamStatsReply, message=stream_stats_frame)
     return
 
 
 def set_status(status):
     global is_enabled, device_status, status_animation
+    status_reply.set_enabled(is_enabled)
     if not is_enabled:  # disabled take precedence
-        status_animation = Blink(statusPixel, speed=0.5, color=RED)
-        print("Set Status: Disabled")
+        animation = status_cache.get(STATUS_DISABLED_KEY)
+        if animation is None:
+            animation = status_cache.put(
+                STATUS_DISABLED_KEY, Blink(statusPixel, speed=0.5, color=RED)
+            )
+        log.info(APP_EVENT.StatusDisabled)
     else:
-        status_animation = Solid(statusPixel, color=GREEN)
-        print("Set Status: Enabled")
-
+        animation = status_cache.get(STATUS_ENABLED_KEY)
+        if animation is None:
+            animation = status_cache.put(
+                STATUS_ENABLED_KEY, Solid(statusPixel, color=GREEN)
+            )
+        log.info(APP_EVENT.StatusEnabled)
+    # a repeated status keeps the running animation
+    if animation is not status_animation:
+        animation.reset()
+        status_animation = animation
+
+
+# press/release/long/double presses in a window go out as one ButtonPress frame
+inputs = InputMonitor(canDevice, API_ID.ButtonPress, keys)
+
+# IO breakout channels, pins are board names e.g. "A0" or "D5". At most 8 analog
+# inputs (IOAnalogStatus0 and 1 carry four each) and 16 digital inputs
+io_config = can_config.get("io", {})
+io = None
+if io_config.get("analog") or io_config.get("digital"):
+    if len(io_config.get("analog", ())) > 8:
+        raise ValueError("At most 8 analog inputs, IOAnalogStatus0 and 1 carry four each")
+    io = IOBreakout(
+        canDevice,
+        analog_pins=[getattr(board, name) for name in io_config.get("analog", ())],
+        digital_pins=[getattr(board, name) for name in io_config.get("digital", ())],
+        analog_api=API_ID.IOAnalogStatus0,
+        digital_api=API_ID.IODigitalStatus,
+        sample_period_ms=io_config.get("sample_period_ms", 5),
+        decimation=io_config.get("decimation", 1),
+        average=io_config.get("average", True),
+        publish_period_ms=io_config.get("publish_period_ms", 20),
+    )
 
 canDevice.start_listener()
 
-# async Methods for multi-tasking
-async def status_update():
-    while True:
-        status_animation.animate()
-        if (pixel_animation):
-            pixel_animation.animate()
-
-        # update the status every 20ms
-        await asyncio.sleep(0.02)
+# Tasks, run by the scheduler in main()
+def status_update():
+    renderer.render(status_animation, statusPixel)
+    if pixels is None:
+        pass
+    elif pixel_stream.active:
+        # streamed frames are only shown once they are committed
+        if pixel_stream.take_commit():
+            renderer.render_segments(pixels, ())
+    else:
+        # every segment draws into one buffer, then a single show()
+        renderer.render_segments(pixels, segment_animations)
 
 
-async def message_update():
+def message_update():
     global is_enabled, last_heartbeat_msg_time
-    while True:
-        # handle all messages since the last receive was called
-        canDevice.receive_messages()
-
-        led.value = not led.value
-
-        # if it's been more than 100ms since the last heartbeat, immediately disable device
-        heartbeat_elapsed_time = supervisor.ticks_ms() - last_heartbeat_msg_time
-        if heartbeat_elapsed_time > 100 and is_enabled == True:
-            print("No heartbeat in more than 100ms - Disabling Device")
-            is_enabled = False
-            set_status(None)
-
-        # processes messages every 20ms.
-        await asyncio.sleep(0.02)
-
-async def button_monitor():
-    while True:
-        event = keys.events.get()
-        # event will be None if nothing has happened.
-        if event:
-            if event.pressed:
-                print(event.key_number, "Pressed")
-                canDevice.send_message_simple(API_ID.ButtonPress, message=bytes(f"Button{event.key_number}", "utf-8"))
-            
-            if event.released:
-                print(event.key_number, "Released")
-
-        # monitor buttons every 20ms.
-        await asyncio.sleep(0.02)
+    # handle all messages since the last receive was called
+    canDevice.receive_messages()
+
+    led.value = not led.value
+
+    # keep the status reply current, one page per pass
+    status_reply.refresh()
+
+    # if it's been more than 100ms since the last heartbeat, immediately disable device
+    heartbeat_elapsed_time = supervisor.ticks_ms() - last_heartbeat_msg_time
+    if heartbeat_elapsed_time > 100 and is_enabled == True:
+        log.warning(APP_EVENT.HeartbeatLost, heartbeat_elapsed_time)
+        is_enabled = False
+        set_status(None)
+
+
+def log_update():
+    # format a few log records at a time so printing over USB
+    # never holds up message handling for long
+    log.drain(limit=4)
+
+
+# tasks that send frames declare them, a warning is logged when the periodic
+# frames would use more than the device's share of the bus
+scheduler = Scheduler(bus_load=canDevice.bus_load)
+# CAN servicing also cuts in ahead of the other tasks whenever frames are waiting
+CAN_PERIOD_MS = 20
+scheduler.add(
+    "can", message_update, period_ms=CAN_PERIOD_MS, priority=3, pending=canDevice.frames_pending
+)
+# Enumerate replies are sent from the CAN task, one slot per period
+canDevice.set_receive_period(CAN_PERIOD_MS)
+scheduler.add(
+    "buttons",
+    inputs.poll,
+    period_ms=20,
+    priority=2,
+    can_frames=1,
+    can_period_ms=inputs.min_interval_ms,
+)
+scheduler.add("leds", status_update, period_ms=20, priority=1)
+if io is not None:
+    # fixed rate sampling, ahead of the LEDs so jitter stays low
+    scheduler.add(
+        "io",
+        io.sample,
+        period_ms=io.sample_period_ms,
+        priority=2,
+        can_frames=io.publish_frames,
+        can_period_ms=io.publish_period_ms,
+    )
+scheduler.add("log", log_update, period_ms=100, priority=0)
+
+# measures how late the event loop wakes up, reported in the log and telemetry
+loop_monitor = LoopMonitor(device=canDevice, scheduler=scheduler)
 
 
 async def main():
-    # setup the cooperative multitasking tasks
-    status_task = asyncio.create_task(status_update())
-    message_task = asyncio.create_task(message_update())
-    button_task = asyncio.create_task(button_monitor())
-    await asyncio.gather(status_task, message_task)
+    # run every task from the deadline scheduler, dump timing with scheduler.dump()
+    # and loop_monitor.dump()
+    await asyncio.gather(scheduler.run(), loop_monitor.run())
     print("Done")
 
 
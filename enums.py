@@ -3,6 +3,7 @@ class API_ID:
     StatusReply: int = 0x01
     SetDeviceNumber: int = 0x10
     InitPixelArray: int = 0x11
+    DefineSegment: int = 0x12
 
     PatternChaos:int = 0x20
     PatternRainbow:int = 0x21
@@ -14,3 +15,26 @@ class API_ID:
     PatternChase:int = 0x27
 
     ButtonPress:int = 0x30
+
+    StreamPalette: int = 0x40
+    StreamRun: int = 0x41
+    StreamLiteral: int = 0x42
+    StreamIndexed: int = 0x43
+    StreamCommit: int = 0x44
+    StreamStatsRequest: int = 0x45
+    StreamStatsReply: int = 0x46
+
+    # periodic IO breakout status, analog channels 4 per frame
+    IOAnalogStatus0: int = 0x50
+    IOAnalogStatus1: int = 0x51
+    IODigitalStatus: int = 0x52
+
+
+class APP_EVENT:
+    # RingLogger event codes used by code.py (library events are below 64)
+    InitPixelArray: int = 64
+    PatternChange: int = 65
+    StatusEnabled: int = 66
+    StatusDisabled: int = 67
+    HeartbeatLost: int = 68
+    DefineSegment: int = 71
@@ -0,0 +1,307 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+Change tracking LED rendering.
+
+Writing a NeoPixel strip blocks the CPU for about 30us per pixel, so a frame is
+only pushed to the strip when an animation actually changed a pixel.
+"""
+
+
+def color_rgb(color):
+    """Split an int (0xRRGGBB) or tuple color into r, g, b"""
+    if isinstance(color, int):
+        return (color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF
+    return color[0], color[1], color[2]
+
+
+def fill_bytes(view, first, second, third):
+    """Repeat three bytes over a memoryview, copying in doubling steps"""
+    total = len(view)
+    if total < 3:
+        return
+    view[0] = first
+    view[1] = second
+    view[2] = third
+    size = 3
+    while size < total:
+        step = min(size, total - size)
+        view[size : size + step] = view[0:step]
+        size += step
+
+
+def build_lut(lut, brightness: float, gamma: float = 1.0):
+    """Fill a 256 entry table mapping a color channel to its output value"""
+    scale = 255 * max(0.0, min(brightness, 1.0))
+    for value in range(256):
+        lut[value] = int(scale * (value / 255) ** gamma + 0.5)
+
+
+class PixelFrame:
+    """NeoPixel strip that only writes the pixels when they changed.
+
+    Animations draw into this object just like a NeoPixel. The colors they write
+    are kept as is for change detection and ``[]`` reads, and mapped through a
+    256 entry brightness x gamma table into the buffer sent to the strip, so
+    drawing a frame is integer only. Changing the brightness only rebuilds the
+    table and remaps the buffer once. `show()` only writes to the strip when
+    something is different.
+    """
+
+    def __init__(self, pin, n: int, brightness: float = 1.0, gamma: float = 1.0, pixel_order="GRB"):
+        # pylint: disable=import-outside-toplevel
+        import digitalio
+        import neopixel_write
+
+        self.write = neopixel_write.neopixel_write
+        self.pin = digitalio.DigitalInOut(pin)
+        self.pin.direction = digitalio.Direction.OUTPUT
+
+        self.n = n
+        # strip byte offset of r, g and b, and which channel goes in each byte
+        self.order = (pixel_order.index("R"), pixel_order.index("G"), pixel_order.index("B"))
+        self.channels = tuple("RGB".index(channel) for channel in pixel_order)
+        # colors as drawn, r g b
+        self.shadow = bytearray(3 * n)
+        self.shadow_view = memoryview(self.shadow)
+        # colors after brightness and gamma, in strip order
+        self.wire = bytearray(3 * n)
+        self.wire_view = memoryview(self.wire)
+
+        self.gamma = gamma
+        self.brightness_value = brightness
+        self.lut = bytearray(256)
+        build_lut(self.lut, brightness, gamma)
+
+        self.dirty = True
+        # color of the last fill() while no single pixel has changed since
+        self.fill_color = None
+        self.shown = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return self.n
+
+    def set_pixel(self, index: int, r: int, g: int, b: int):
+        """Set one pixel from r, g, b ints, returns True if it changed"""
+        offset = 3 * index
+        shadow = self.shadow
+        if shadow[offset] == r and shadow[offset + 1] == g and shadow[offset + 2] == b:
+            return False
+        shadow[offset] = r
+        shadow[offset + 1] = g
+        shadow[offset + 2] = b
+        lut = self.lut
+        wire = self.wire
+        r_offset, g_offset, b_offset = self.order
+        wire[offset + r_offset] = lut[r]
+        wire[offset + g_offset] = lut[g]
+        wire[offset + b_offset] = lut[b]
+        self.dirty = True
+        self.fill_color = None
+        return True
+
+    def __setitem__(self, index, color):
+        if isinstance(index, slice):
+            for pixel, value in zip(range(*index.indices(self.n)), color):
+                self.set_pixel(pixel, *color_rgb(value))
+        else:
+            if index < 0:
+                index += self.n
+            self.set_pixel(index, *color_rgb(color))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[pixel] for pixel in range(*index.indices(self.n))]
+        if index < 0:
+            index += self.n
+        offset = 3 * index
+        return (self.shadow[offset], self.shadow[offset + 1], self.shadow[offset + 2])
+
+    def fill(self, color):
+        """Set every pixel to one color"""
+        rgb = color_rgb(color)
+        if rgb == self.fill_color:
+            return
+        self.fill_buffers(0, self.n, rgb)
+        self.fill_color = rgb
+        self.dirty = True
+
+    def fill_range(self, start: int, end: int, color):
+        """Set pixels start to end - 1 to one color"""
+        r, g, b = color_rgb(color)
+        shadow = self.shadow
+        for index in range(start, end):
+            offset = 3 * index
+            if shadow[offset] != r or shadow[offset + 1] != g or shadow[offset + 2] != b:
+                self.fill_buffers(start, end, (r, g, b))
+                self.dirty = True
+                self.fill_color = None
+                return
+
+    def fill_buffers(self, start: int, end: int, rgb):
+        """Write one color into both buffers for pixels start to end - 1"""
+        fill_bytes(self.shadow_view[3 * start : 3 * end], rgb[0], rgb[1], rgb[2])
+        lut = self.lut
+        first, second, third = self.channels
+        fill_bytes(
+            self.wire_view[3 * start : 3 * end], lut[rgb[first]], lut[rgb[second]], lut[rgb[third]]
+        )
+
+    def remap(self):
+        """Rebuild the output buffer from the drawn colors through the current table"""
+        lut = self.lut
+        shadow = self.shadow
+        wire = self.wire
+        r_offset, g_offset, b_offset = self.order
+        for offset in range(0, 3 * self.n, 3):
+            wire[offset + r_offset] = lut[shadow[offset]]
+            wire[offset + g_offset] = lut[shadow[offset + 1]]
+            wire[offset + b_offset] = lut[shadow[offset + 2]]
+        self.dirty = True
+
+    @property
+    def brightness(self):
+        """brightness property, 0.0 - 1.0"""
+        return self.brightness_value
+
+    @brightness.setter
+    def brightness(self, value):
+        if value == self.brightness_value:
+            return
+        self.brightness_value = value
+        build_lut(self.lut, value, self.gamma)
+        self.remap()
+
+    @property
+    def auto_write(self):
+        """auto_write property, always False so writes are batched until show()"""
+        return False
+
+    @auto_write.setter
+    def auto_write(self, value):
+        # animations set it to False when they're constructed
+        return
+
+    def show(self):
+        """Write the frame to the strip if it changed, returns True if it was written"""
+        if not self.dirty:
+            self.skipped += 1
+            return False
+        self.write(self.pin, self.wire)
+        self.dirty = False
+        self.shown += 1
+        return True
+
+    def deinit(self):
+        """Turn the pixels off and release the pin"""
+        for index in range(len(self.wire)):
+            self.wire[index] = 0
+        self.write(self.pin, self.wire)
+        self.pin.deinit()
+
+
+class PixelSegment:
+    """A contiguous run of pixels in a `PixelFrame` that an animation can draw to.
+
+    Works like ``adafruit_led_animation.helper.PixelSubset`` but writes straight
+    into the frame, and ``show()`` is left to the renderer so the whole strip is
+    written once per tick no matter how many segments it has.
+    """
+
+    def __init__(self, frame: PixelFrame, start: int, end: int) -> None:
+        self.frame = frame
+        self.start = start
+        self.end = end
+        self.n = end - start
+        # color of the last fill() while no single pixel has changed since
+        self.fill_color = None
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, color):
+        self.fill_color = None
+        if isinstance(index, slice):
+            for pixel, value in zip(range(*index.indices(self.n)), color):
+                self.frame.set_pixel(self.start + pixel, *color_rgb(value))
+        else:
+            if index < 0:
+                index += self.n
+            self.frame.set_pixel(self.start + index, *color_rgb(color))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[pixel] for pixel in range(*index.indices(self.n))]
+        if index < 0:
+            index += self.n
+        return self.frame[self.start + index]
+
+    def fill(self, color):
+        """Set every pixel in the segment to one color"""
+        rgb = color_rgb(color)
+        if rgb == self.fill_color:
+            return
+        self.frame.fill_range(self.start, self.end, rgb)
+        self.fill_color = rgb
+
+    @property
+    def brightness(self):
+        """brightness property, shared by the whole strip"""
+        return self.frame.brightness
+
+    @brightness.setter
+    def brightness(self, value):
+        self.frame.brightness = value
+
+    @property
+    def auto_write(self):
+        """auto_write property"""
+        return False
+
+    @auto_write.setter
+    def auto_write(self, value):
+        return
+
+    def show(self):
+        """Nothing to do, the renderer shows the whole frame once per tick"""
+        return
+
+
+class LEDRenderer:
+    """Drives animations that draw into `PixelFrame` objects.
+
+    Animations are run with ``show=False`` and the frame decides whether the
+    strip actually needs writing.
+    """
+
+    def __init__(self) -> None:
+        self.frames_rendered = 0
+        self.frames_skipped = 0
+
+    def render(self, animation, frame: PixelFrame):
+        """Advance the animation and show its frame if any pixel changed"""
+        animation.animate(show=False)
+        if frame.show():
+            self.frames_rendered += 1
+        else:
+            self.frames_skipped += 1
+
+    def render_segments(self, frame: PixelFrame, animations):
+        """Advance one animation per segment, then show the frame once"""
+        for animation in animations:
+            if animation is not None:
+                animation.animate(show=False)
+        if frame.show():
+            self.frames_rendered += 1
+        else:
+            self.frames_skipped += 1
+
+    def reset_stats(self):
+        """reset_stats function"""
+        self.frames_rendered = 0
+        self.frames_skipped = 0
+
+    def __repr__(self) -> str:
+        return f"LEDRenderer(rendered={self.frames_rendered}, skipped={self.frames_skipped})"
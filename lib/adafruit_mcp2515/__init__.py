@@ -135,6 +135,7 @@ _MODE_MASK = const(0xE0)
 _RXB_RX_MASK = const(0x60)
 _RXB_BUKT_MASK = const((1 << 2))
 _RXB_RX_STDEXT = const(0x00)
+_RXB_RX_ANY = const(0x60)
 
 _STAT_RXIF_MASK = const(0x03)
 _RTR_MASK = const(0x40)
@@ -278,6 +279,8 @@ class MCP2515:  # pylint:disable=too-many-instance-attributes
         if `auto_restart` is set to `True`** If `True`, will restart communications after entering\
         bus-off state. Defaults to `False`.
         :param bool debug: If `True`, will enable printing debug information. Defaults to `False`.
+        :param int spi_baudrate: SPI clock in Hz, the MCP2515 runs up to 10MHz. Defaults to\
+        100000.
         """
 
     def __init__(
@@ -291,6 +294,7 @@ class MCP2515:  # pylint:disable=too-many-instance-attributes
         silent: bool = False,
         auto_restart: bool = False,
         debug: bool = False,
+        spi_baudrate: int = 100000,
     ):
 
         if loopback and not silent:
@@ -300,7 +304,7 @@ class MCP2515:  # pylint:disable=too-many-instance-attributes
 
         self._auto_restart = auto_restart
         self._debug = debug
-        self._bus_device_obj = spi_device.SPIDevice(spi_bus, cs_pin)
+        self._bus_device_obj = spi_device.SPIDevice(spi_bus, cs_pin, baudrate=spi_baudrate)
         self._cs_pin = cs_pin
         self._buffer = bytearray(20)
         self._id_buffer = bytearray(4)
@@ -309,6 +313,8 @@ class MCP2515:  # pylint:disable=too-many-instance-attributes
         self._tx_buffers = []
         self._rx0_overflow = False
         self._rx1_overflow = False
+        self._rx_overflow_count = 0
+        self._bus_state_transition_count = 0
         self._masks_in_use = []
         self._filters_in_use = [[], []]
         self._mode = None
@@ -474,6 +480,49 @@ class MCP2515:  # pylint:disable=too-many-instance-attributes
         if status & 0b10:
             self._read_rx_buffer(_READ_RX1)
 
+    def read_raw_frames(self, buffer, start=0, end=None, stride=13):
+        """Burst read every full receive buffer as raw register images, without creating
+        `canio.Message` objects.
+
+        Each frame is the 13 bytes SIDH, SIDL, EID8, EID0, DLC, D0-D7 of its receive buffer,
+        written to ``buffer`` at ``start``, ``start + stride`` and so on. RXB0 and RXB1 are
+        read until both are empty or ``end`` is reached (RXB0 rolls over into RXB1, so both
+        fill up at high bus load). Returns the offset after the last frame.
+
+        Args:
+            buffer (bytearray): Where the frames go
+            start (int): Offset of the first frame
+            end (int, optional): Offset no frame may reach past. Defaults to the buffer length.
+            stride (int, optional): Offset from one frame to the next, at least 13. Defaults\
+                to 13.
+        """
+        if end is None:
+            end = len(buffer)
+        command = self._buffer
+        bus_device = self._bus_device_obj
+        while start + 13 <= end:
+            command[0] = _READ_STATUS
+            with bus_device as spi:
+                spi.write(command, end=1)
+                spi.readinto(command, start=0, end=1)
+            status = command[0] & 0x03
+            if not status:
+                break
+            # READ RX BUFFER clears the buffer's interrupt flag when CS goes high
+            if status & 0x01:
+                command[0] = _READ_RX0
+                with bus_device as spi:
+                    spi.write(command, end=1)
+                    spi.readinto(buffer, start=start, end=start + 13)
+                start += stride
+            if status & 0x02 and start + 13 <= end:
+                command[0] = _READ_RX1
+                with bus_device as spi:
+                    spi.write(command, end=1)
+                    spi.readinto(buffer, start=start, end=start + 13)
+                start += stride
+        return start
+
     def _write_message(self, tx_buffer, message_obj):
 
         if tx_buffer is None:
@@ -760,19 +809,24 @@ class MCP2515:  # pylint:disable=too-many-instance-attributes
             self._rx0_overflow,
             self._rx1_overflow,
         ) = flags
-        if self._rx0_overflow or self._rx0_overflow:
+        if self._rx0_overflow or self._rx1_overflow:
+            self._rx_overflow_count += self._rx0_overflow + self._rx1_overflow
             self._mod_register(
                 _EFLG, 0xC0, 0
             )  # clear overflow bits now that we've recorded them
 
         if buss_off:
-            self._bus_state = BusState.BUS_OFF
+            bus_state = BusState.BUS_OFF
         elif tx_error_passive or rx_error_passive:
-            self._bus_state = BusState.ERROR_PASSIVE
+            bus_state = BusState.ERROR_PASSIVE
         elif error_warn:
-            self._bus_state = BusState.ERROR_WARNING
+            bus_state = BusState.ERROR_WARNING
         else:
-            self._bus_state = BusState.ERROR_ACTIVE
+            bus_state = BusState.ERROR_ACTIVE
+
+        if bus_state != self._bus_state:
+            self._bus_state_transition_count += 1
+        self._bus_state = bus_state
 
     def _create_mask(self, match):
         mask = match.mask
@@ -813,11 +867,15 @@ class MCP2515:  # pylint:disable=too-many-instance-attributes
     def deinit_filtering_registers(self):
         """Clears the Receive Mask and Filter Registers"""
 
+        # the registers can only be written in configuration mode
+        current_mode = self._mode
+        self._set_mode(_MODE_CONFIG)
         for mask_index, mask_reg in enumerate(MASKS):
             self._set_register(mask_reg, 0)
 
             for filter_reg in FILTERS[mask_index]:
                 self._set_register(filter_reg, 0)
+        self._set_mode(current_mode)
         self._masks_in_use = []
         self._filters_in_use = [[], []]
 
@@ -841,6 +899,28 @@ class MCP2515:  # pylint:disable=too-many-instance-attributes
          called REC."""
         return self._read_register(_REC)
 
+    @property
+    def error_counts(self):
+        """TEC and REC as a ``(transmit, receive)`` tuple (read-only). The two counters are\
+            adjacent registers so they are read in a single SPI transaction."""
+        self._buffer[0] = _READ
+        self._buffer[1] = _TEC
+        with self._bus_device_obj as spi:
+            spi.write(self._buffer, end=2)
+            spi.readinto(self._buffer, start=0, end=2)
+        return (self._buffer[0], self._buffer[1])
+
+    @property
+    def rx_overflow_count(self):
+        """The number of receive buffer overflows seen since initialization (read-only).\
+            Overflows are only detected when the bus status is read, e.g. through `state`."""
+        return self._rx_overflow_count
+
+    @property
+    def bus_state_transition_count(self):
+        """The number of bus state changes seen since initialization (read-only)."""
+        return self._bus_state_transition_count
+
     @property
     def error_warning_state_count(self):
         """Not supported by hardware. Raises an `AttributeError` if called"""
@@ -910,13 +990,19 @@ class MCP2515:  # pylint:disable=too-many-instance-attributes
                 `silent`==`True` and `loopback` == `False`"
             )
 
+        # no matches turns the filters off, every standard and extended frame is received
+        receive_mode = _RXB_RX_STDEXT if matches else _RXB_RX_ANY
+        self._mod_register(_RXB0CTRL, _RXB_RX_MASK, receive_mode)
+        self._mod_register(_RXB1CTRL, _RXB_RX_MASK, receive_mode)
+
         for match in matches:
             self._dbg("match:", match)
             mask_index_used = self._create_mask(match)
             self._create_filter(match, mask_index=mask_index_used)
 
-        self._dbg("Mask 0", bin(self._masks_in_use[0]))
-        self._dbg("Mask 1", bin(self._masks_in_use[1]))
+        # no matches leaves the masks unused
+        for mask_index, mask in enumerate(self._masks_in_use):
+            self._dbg("Mask", mask_index, bin(mask))
 
         used_masks = len(self._masks_in_use)
         # if matches were made and there are unused masks
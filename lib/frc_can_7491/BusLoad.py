@@ -0,0 +1,267 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.BusLoad`
+====================================================
+Bit accurate CAN frame lengths and bus load accounting.
+
+* Author(s): Karl Fleischmann
+"""
+from .CANTransport import RemoteTransmissionRequest
+from .RingLogger import LogEvent
+from .Ticks import ticks_ms, ticks_diff
+
+BIT_RATE = 1_000_000
+
+# start of frame, arbitration, control and CRC fields, the part that gets stuffed
+STUFFED_BITS_EXTENDED = 1 + 11 + 1 + 1 + 18 + 1 + 2 + 4 + 15
+STUFFED_BITS_STANDARD = 1 + 11 + 3 + 4 + 15
+# CRC delimiter, ACK slot and delimiter, end of frame and intermission
+# follow the stuffed part of every frame
+FRAME_TAIL_BITS = 1 + 2 + 7 + 3
+
+CRC15_POLYNOMIAL = 0x4599
+
+# built on first use, see _tables()
+_CRC_TABLE = None
+_STUFF_TABLE = None
+# (frame id, extended, rtr, dlc) -> CRC, stuffing state, stuff bits and bit
+# count after the control field, a device only sends a handful of ids
+_HEADERS = {}
+_HEADERS_MAX = 64
+
+
+def crc15(bits) -> int:
+    """CAN CRC-15 of a bit sequence"""
+    crc = 0
+    for bit in bits:
+        feedback = bit ^ ((crc >> 14) & 1)
+        crc = (crc << 1) & 0x7FFF
+        if feedback:
+            crc ^= CRC15_POLYNOMIAL
+    return crc
+
+
+def _stuff_bit(state: int, bit: int):
+    """Stuffing state after one more bit, and the stuff bits that added.
+    state is the run's bit << 2 | run length - 1 (a run is 1 to 4 bits long)."""
+    run_bit = state >> 2
+    run = (state & 0x03) + 1
+    if bit != run_bit:
+        return bit << 2, 0
+    if run == 4:
+        # 5 equal bits, a complementary bit follows and starts the next run
+        return (1 - bit) << 2, 1
+    return state + 1, 0
+
+
+def _tables():
+    """CRC-15 lookup table per byte, and bit stuffing lookup tables per byte
+    and per 7 bits (the end of the CRC)"""
+    # pylint: disable=global-statement
+    global _CRC_TABLE, _STUFF_TABLE
+    if _CRC_TABLE is not None:
+        return _CRC_TABLE, _STUFF_TABLE
+
+    crc_table = [0] * 256
+    for value in range(256):
+        crc = value << 7
+        for _ in range(8):
+            crc = ((crc << 1) ^ CRC15_POLYNOMIAL) if crc & 0x4000 else crc << 1
+        crc_table[value] = crc & 0x7FFF
+
+    # state << 8 | byte -> next state | stuff bits << 3,
+    # then 2048 + (state << 7 | 7 bits) the same way
+    stuff_table = bytearray(8 * 256 + 8 * 128)
+    for width, base in ((8, 0), (7, 8 * 256)):
+        for start in range(8):
+            for value in range(1 << width):
+                state = start
+                stuffed = 0
+                for shift in range(width - 1, -1, -1):
+                    state, added = _stuff_bit(state, (value >> shift) & 1)
+                    stuffed += added
+                stuff_table[base + (start << width | value)] = state | stuffed << 3
+
+    _CRC_TABLE = crc_table
+    _STUFF_TABLE = stuff_table
+    return crc_table, stuff_table
+
+
+def _header(frame_id: int, extended: bool, rtr: bool, dlc: int):
+    """(CRC, stuffing state, stuff bits, bits) from the start of frame to the
+    end of the control field"""
+    key = (frame_id, extended, rtr, dlc)
+    header = _HEADERS.get(key)
+    if header is not None:
+        return header
+
+    if extended:
+        value = (frame_id >> 18) & 0x7FF
+        value = (value << 2 | 0x03) << 18 | (frame_id & 0x3FFFF)  # SRR, IDE
+        value = (value << 3 | (0x04 if rtr else 0)) << 4 | dlc  # RTR, r1, r0
+        count = STUFFED_BITS_EXTENDED - 16
+    else:
+        value = ((frame_id & 0x7FF) << 3 | (0x04 if rtr else 0)) << 4 | dlc  # RTR, IDE, r0
+        count = STUFFED_BITS_STANDARD - 16
+
+    # the start of frame bit is 0: it leaves the CRC at 0 and begins a run of one 0
+    crc = 0
+    state = 0
+    stuffed = 0
+    for shift in range(count - 1, -1, -1):
+        bit = (value >> shift) & 1
+        feedback = bit ^ ((crc >> 14) & 1)
+        crc = (crc << 1) & 0x7FFF
+        if feedback:
+            crc ^= CRC15_POLYNOMIAL
+        state, added = _stuff_bit(state, bit)
+        stuffed += added
+
+    if len(_HEADERS) >= _HEADERS_MAX:
+        _HEADERS.clear()
+    header = (crc, state, stuffed, 1 + count)
+    _HEADERS[key] = header
+    return header
+
+
+def frame_bits(
+    frame_id: int, data: bytes = b"", extended: bool = True, rtr: bool = False, length: int = None
+) -> int:
+    """Bits a frame occupies on the bus with its actual stuff bits, intermission
+    included. Remote frames take their DLC from length."""
+    # pylint: disable=too-many-arguments
+    crc_table, stuff_table = _tables()
+    if rtr:
+        data = b""
+        dlc = length or 0
+    else:
+        dlc = len(data)
+    crc, state, stuffed, count = _header(frame_id, extended, rtr, dlc)
+
+    for value in data:
+        crc = ((crc << 8) & 0x7FFF) ^ crc_table[((crc >> 7) ^ value) & 0xFF]
+        entry = stuff_table[state << 8 | value]
+        state = entry & 0x07
+        stuffed += entry >> 3
+
+    # the CRC is stuffed too, its top 8 bits then the other 7
+    entry = stuff_table[state << 8 | crc >> 7]
+    stuffed += entry >> 3
+    entry = stuff_table[2048 + ((entry & 0x07) << 7 | (crc & 0x7F))]
+    stuffed += entry >> 3
+    return count + len(data) * 8 + 15 + stuffed + FRAME_TAIL_BITS
+
+
+def frame_bits_bounds(length: int, extended: bool = True, rtr: bool = False):
+    """(fewest, most) bits a frame with length data bytes can occupy: without
+    stuff bits and with a stuff bit after the first 5 bits and every 4 after"""
+    stuffed = (STUFFED_BITS_EXTENDED if extended else STUFFED_BITS_STANDARD) + (0 if rtr else length * 8)
+    return stuffed + FRAME_TAIL_BITS, stuffed + (stuffed - 1) // 4 + FRAME_TAIL_BITS
+
+
+def message_bits(message) -> int:
+    """frame_bits of a canio Message or RemoteTransmissionRequest"""
+    if isinstance(message, RemoteTransmissionRequest):
+        return frame_bits(message.id, b"", message.extended, True, message.length)
+    return frame_bits(message.id, message.data, message.extended)
+
+
+class BusLoad:
+    """BusLoad Class
+
+    Bus time used by one device. `add` counts every frame sent with its exact
+    length, `load` reports the share of the bus since the previous call.
+
+    Periodic frames are declared up front with `add_periodic` (`CANDevice`
+    telemetry and `Scheduler` tasks do this) at their worst case length. When
+    they add up to more than ``budget_pct`` of the bus a ``BusBudget`` warning
+    is logged, so status rates can be sized before the robot is on the field.
+    """
+
+    def __init__(self, bit_rate: int = BIT_RATE, budget_pct: int = 10, logger=None) -> None:
+        self.bit_rate = bit_rate
+        self.budget_pct = budget_pct
+        self.logger = logger
+        if logger is not None:
+            logger.register(
+                LogEvent.BusBudget,
+                "Periodic frames use {0}/1000 of the bus, over the {1}% budget (last added {2}/1000)",
+            )
+        self.frames = 0
+        self.bits = 0
+        self.window_ticks = ticks_ms()
+        self.window_bits = 0
+        # name -> worst case bits per second
+        self.periodic = {}
+
+    def add(self, message) -> int:
+        """Count a frame put on the bus, returns its bits"""
+        bits = message_bits(message)
+        self.frames += 1
+        self.bits += bits
+        return bits
+
+    def peek(self):
+        """Bits per second and percent of the bus used since the last `load`
+        call, without starting a new window (for diagnostics)"""
+        elapsed_ms = max(ticks_diff(ticks_ms(), self.window_ticks), 1)
+        bits_per_s = (self.bits - self.window_bits) * 1000 // elapsed_ms
+        return bits_per_s, bits_per_s * 100 / self.bit_rate
+
+    def load(self):
+        """Bits per second and percent of the bus used since the last call"""
+        result = self.peek()
+        self.window_ticks = ticks_ms()
+        self.window_bits = self.bits
+        return result
+
+    def frame_time_us(self, bits: int) -> int:
+        """Microseconds bits take at the bus bit rate"""
+        return bits * 1_000_000 // self.bit_rate
+
+    @property
+    def periodic_bits_per_s(self) -> int:
+        """Worst case bits per second of every declared periodic frame"""
+        return sum(self.periodic.values())
+
+    @property
+    def periodic_load_pct(self) -> float:
+        """Worst case share of the bus of every declared periodic frame"""
+        return self.periodic_bits_per_s * 100 / self.bit_rate
+
+    def add_periodic(
+        self, name: str, frames: int, period_ms: int, length: int = 8, extended: bool = True
+    ) -> bool:
+        """Declare frames sent every period_ms (replacing an earlier declaration
+        with the same name), returns False and logs a warning when the periodic
+        frames no longer fit the budget"""
+        # pylint: disable=too-many-arguments
+        if frames <= 0 or period_ms <= 0:
+            self.periodic.pop(name, None)
+            return True
+        worst_case = frame_bits_bounds(length, extended)[1]
+        self.periodic[name] = frames * worst_case * 1000 // period_ms
+        total = self.periodic_bits_per_s
+        if total * 100 <= self.budget_pct * self.bit_rate:
+            return True
+        if self.logger is not None:
+            self.logger.warning(
+                LogEvent.BusBudget,
+                total * 1000 // self.bit_rate,
+                self.budget_pct,
+                self.periodic[name] * 1000 // self.bit_rate,
+            )
+        return False
+
+    def remove_periodic(self, name: str):
+        """Drop a periodic frame declaration"""
+        self.periodic.pop(name, None)
+
+    def reset_stats(self):
+        """reset_stats function"""
+        self.frames = 0
+        self.bits = 0
+        self.window_ticks = ticks_ms()
+        self.window_bits = 0
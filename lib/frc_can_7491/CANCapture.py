@@ -0,0 +1,219 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.CANCapture`
+====================================================
+Binary capture of CAN traffic, candump export/import and replay.
+
+* Author(s): Karl Fleischmann
+"""
+from time import monotonic_ns, sleep
+from struct import pack, pack_into, unpack_from
+
+from .CANTransport import RemoteTransmissionRequest
+
+# same flag bits as SocketCAN can_id
+CAPTURE_EXTENDED = 0x80000000
+CAPTURE_RTR = 0x40000000
+CAPTURE_ID_MASK = 0x1FFFFFFF
+
+# record flags
+CAPTURE_TX = 0x01
+
+
+class CANCapture:
+    """CANCapture Class
+
+    Fixed size records ``<IIBB2x8s`` (20 bytes): timestamp in microseconds
+    (wraps after about 71 minutes, unwrapped when read), CAN id with the
+    extended (bit 31) and RTR (bit 30) flags, DLC, flags (``CAPTURE_TX`` for
+    frames this device sent) and the data padded to 8 bytes.
+
+    Records go into a preallocated ring of ``capacity`` records, the oldest are
+    overwritten. ``write_to()`` saves them, oldest first, after an 8 byte
+    header ``<4sHH``: ``b"FCAP"``, version and record size.
+    """
+
+    MAGIC = b"FCAP"
+    VERSION = 1
+    HEADER_FORMAT = "<4sHH"
+    HEADER_SIZE = 8
+    RECORD_FORMAT = "<IIBB2x8s"
+    RECORD_SIZE = 20
+
+    def __init__(self, capacity: int = 256) -> None:
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * CANCapture.RECORD_SIZE)
+        self.head = 0
+        self.count = 0
+        self.recording = True
+
+    def record(self, message, tx: bool = False):
+        """Add a received (or sent, tx=True) canio Message/RemoteTransmissionRequest"""
+        if not self.recording:
+            return
+        can_id = message.id
+        if message.extended:
+            can_id |= CAPTURE_EXTENDED
+        if isinstance(message, RemoteTransmissionRequest):
+            can_id |= CAPTURE_RTR
+            dlc = message.length
+            data = b""
+        else:
+            data = message.data
+            dlc = len(data)
+        pack_into(
+            CANCapture.RECORD_FORMAT,
+            self.buffer,
+            self.head * CANCapture.RECORD_SIZE,
+            (monotonic_ns() // 1000) & 0xFFFFFFFF,
+            can_id,
+            dlc,
+            CAPTURE_TX if tx else 0,
+            data,
+        )
+        self.head = (self.head + 1) % self.capacity
+        self.count += 1
+
+    @property
+    def overwritten(self):
+        """Records lost to the ring wrapping"""
+        return max(0, self.count - self.capacity)
+
+    def clear(self):
+        """Drop every record"""
+        self.head = 0
+        self.count = 0
+
+    def write_to(self, stream):
+        """Write the header and every record, oldest first"""
+        stream.write(
+            pack(
+                CANCapture.HEADER_FORMAT,
+                CANCapture.MAGIC,
+                CANCapture.VERSION,
+                CANCapture.RECORD_SIZE,
+            )
+        )
+        view = memoryview(self.buffer)
+        size = CANCapture.RECORD_SIZE
+        if self.count > self.capacity:
+            stream.write(view[self.head * size :])
+        stream.write(view[: self.head * size])
+
+    def save(self, path: str):
+        """Write the capture to a file"""
+        with open(path, "wb") as stream:
+            self.write_to(stream)
+
+
+def read_capture(stream):
+    """Records of a capture file as (timestamp us, id, extended, rtr, dlc, data, tx)"""
+    header = stream.read(CANCapture.HEADER_SIZE)
+    magic, version, size = unpack_from(CANCapture.HEADER_FORMAT, header)
+    if magic != CANCapture.MAGIC or version != CANCapture.VERSION:
+        raise ValueError("Not a CAN capture file")
+
+    last = None
+    wraps = 0
+    record = bytearray(size)
+    while stream.readinto(record) == size:
+        timestamp, can_id, dlc, flags, data = unpack_from(CANCapture.RECORD_FORMAT, record)
+        if last is not None and timestamp < last:
+            wraps += 1
+        last = timestamp
+        rtr = bool(can_id & CAPTURE_RTR)
+        yield (
+            timestamp + (wraps << 32),
+            can_id & CAPTURE_ID_MASK,
+            bool(can_id & CAPTURE_EXTENDED),
+            rtr,
+            dlc,
+            b"" if rtr else data[: min(dlc, 8)],
+            bool(flags & CAPTURE_TX),
+        )
+
+
+def to_candump(records, out, interface: str = "can0", start_s: float = 0.0):
+    """Write records as ``candump -L`` lines: (seconds.micros) interface ID#DATA"""
+    for timestamp, frame_id, extended, rtr, dlc, data, _ in records:
+        seconds = start_s + timestamp / 1_000_000
+        frame = f"{frame_id:08X}" if extended else f"{frame_id:03X}"
+        payload = f"R{dlc}" if rtr else data.hex().upper()
+        out.write(f"({seconds:.6f}) {interface} {frame}#{payload}\n")
+
+
+def from_candump(lines):
+    """Records from ``candump -L`` lines, timestamps relative to the first frame"""
+    first = None
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("("):
+            continue
+        stamp, _, frame = line.split()[:3]
+        seconds = float(stamp[1:-1])
+        if first is None:
+            first = seconds
+        frame_id, payload = frame.split("#", 1)
+        extended = len(frame_id) > 3
+        rtr = payload.startswith("R")
+        if rtr:
+            dlc = int(payload[1:] or 0)
+            data = b""
+        else:
+            data = bytes.fromhex(payload)
+            dlc = len(data)
+        yield (
+            round((seconds - first) * 1_000_000),
+            int(frame_id, 16),
+            extended,
+            rtr,
+            dlc,
+            data,
+            False,
+        )
+
+
+class CANReplay:
+    """CANReplay Class
+
+    Feeds captured records to ``inject(frame_id, data, extended)``, e.g.
+    `VirtualBus.inject`. ``speed`` 1.0 keeps the original timing, 2.0 is twice as
+    fast and 0 sends as fast as possible. ``poll`` (e.g. a device's
+    ``receive_messages``) runs after every frame. Frames the capture marks as
+    sent by the device are skipped unless ``include_tx`` is set, remote requests
+    are skipped.
+    """
+
+    def __init__(self, records, inject, speed: float = 1.0, poll=None, include_tx=False):
+        # pylint: disable=too-many-arguments
+        self.records = records
+        self.inject = inject
+        self.speed = speed
+        self.poll = poll
+        self.include_tx = include_tx
+        self.frames = 0
+        self.late_max_us = 0
+
+    def run(self):
+        """Replay every record, returns the number of frames sent"""
+        started_ns = monotonic_ns()
+        first = None
+        for timestamp, frame_id, extended, rtr, _, data, tx in self.records:
+            if rtr or (tx and not self.include_tx):
+                continue
+            if first is None:
+                first = timestamp
+            if self.speed > 0:
+                due_us = (timestamp - first) / self.speed
+                wait_us = due_us - (monotonic_ns() - started_ns) / 1000
+                if wait_us > 0:
+                    sleep(wait_us / 1_000_000)
+                else:
+                    self.late_max_us = max(self.late_max_us, int(-wait_us))
+            self.inject(frame_id, data, extended)
+            self.frames += 1
+            if self.poll is not None:
+                self.poll()
+        return self.frames
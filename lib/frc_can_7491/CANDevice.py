@@ -8,33 +8,55 @@ FRC CAN Bus CAN Device class.
 
 * Author(s): Karl Fleischmann
 """
-import sys
-import board
-from digitalio import DigitalInOut
+from time import monotonic_ns
 
 try:
     from typing import Callable
 except ImportError:
     pass
 
-from adafruit_mcp2515 import MCP2515 as CAN
-from adafruit_mcp2515.canio import Message, RemoteTransmissionRequest, Match, BusState
-
-from .FRCConsts import FRCAppId, FRCFilter, FRCMask
+from .CANTransport import (
+    BusState,
+    Match,
+    MCP2515Transport,
+    Message,
+    RemoteTransmissionRequest,
+)
+from .FRCConsts import FRCAppId, FRCBroadcast, FRCFilter, FRCMask, FRCReservedApi
 from .CANMessage import CANMessage, CANMessageType
+from .BusLoad import BusLoad
+from .CANCapture import CANCapture
+from .CANProfiler import CANProfiler
+from .CANTelemetry import CANTelemetry
+from .RingLogger import RingLogger, LogEvent
+from .Ticks import ticks_ms, ticks_add, ticks_diff
 
 # CAN Device Class
 class CANDevice:  # pylint: disable=too-many-arguments
     """CANDevice Class"""
+
+    # Enumerate/DeviceQuery replies are delayed by device number * slot so that
+    # every device on the robot answers in its own window instead of all at once.
+    # Device numbers are 6 bits, so discovery completes within 64 slots.
+    # Replies only go out from receive_messages(), so a slot is one receive
+    # period (20ms in code.py), set with set_receive_period().
+    ENUMERATE_SLOTS = 64
+    ENUMERATE_SLOT_MS = 20
+    ENUMERATE_WINDOW_MS = ENUMERATE_SLOTS * ENUMERATE_SLOT_MS
+    # most frames handled per receive_messages() call, the rest wait for the next pass
+    RX_BATCH = 32
+
     def __init__(
         self,
         dev_type: int,
         dev_manufacturer: int,
         dev_number: int,
         baud_rate=1_000_000,
-        spi=board.SPI(),
-        chip_select=board.CAN_CS,
+        spi=None,
+        chip_select=None,
         debug=False,
+        logger=None,
+        transport=None,
     ) -> None:
 
         print("******************************************************")
@@ -46,24 +68,63 @@ class CANDevice:  # pylint: disable=too-many-arguments
         print("******************************************************")
         print("")
 
-        # setup the CAN Bus
-        self.chip_select = DigitalInOut(chip_select)
-        self.chip_select.switch_to_output()
-        self.can_bus = CAN(spi, self.chip_select, baudrate=baud_rate, debug=debug)
+        # setup the CAN Bus, the MCP2515 unless another transport is given
+        # (e.g. VirtualBus or SocketCANTransport when running on a host)
+        if transport is None:
+            transport = MCP2515Transport(spi, chip_select, baud_rate=baud_rate, debug=debug)
+        self.transport = transport
 
         self.handlers = {}
-        self.listener = None
+        self.listening = False
+        self.rx_batch = [None] * CANDevice.RX_BATCH
         self.dev_mfg = dev_manufacturer
         self.dev_type = dev_type
         self.dev_num = dev_number
 
         self.debug = debug
         self.enabled = False
-
-        CANDevice.device_filter = CANDevice.build_device_filter(
+        self.profiler = None
+        self.telemetry = None
+        self.loop_monitor = None
+        self.capture = None
+        # nothing in the receive/send path prints, records go here and are
+        # formatted when the application drains the log
+        self.log = logger if logger is not None else RingLogger()
+        # bus time of every frame sent, and the periodic frame budget
+        self.bus_load = BusLoad(baud_rate, logger=self.log)
+
+        # health counters, read by CANTelemetry
+        self.rx_count = 0
+        self.tx_count = 0
+        self.tx_fail_count = 0
+        self.unrouted_count = 0
+        self.rx_queue_max = 0
+        self.loop_period_max_us = 0
+        self.loop_busy_max_us = 0
+        self.loop_last_ns = None
+        # longest loop period since boot, not cleared by reset_loop_stats()
+        self.loop_period_peak_us = 0
+
+        self.device_filter = CANDevice.build_device_filter(
             dev_manufacturer, dev_type, dev_number
         )
 
+        # the enumerate reply never changes, so build the frame once up front
+        self.enumerate_reply = Message(
+            id=CANMessage.assemble_message_id_short(
+                dev_type, dev_manufacturer, FRCReservedApi.EnumerateReply, dev_number
+            ),
+            data=bytes((dev_type, dev_manufacturer, dev_number)),
+            extended=True,
+        )
+        self.enumerate_slot_ms = CANDevice.ENUMERATE_SLOT_MS
+        self.enumerate_window_ms = CANDevice.ENUMERATE_WINDOW_MS
+        self.enumerate_delay_ms = dev_number * self.enumerate_slot_ms
+        self.enumerate_due = None
+        self.enumerate_request_ticks = 0
+        self.enumerate_latency_ms = None
+        self.enumerate_count = 0
+
     # create a device filter (type, mfg and number)to use when listening for packets
     # this will ignore the API_ID portion of the extended CAN id used by FRC
     # see https://docs.wpilib.org/en/stable/docs/software/can-devices/can-addressing.html
@@ -77,6 +138,13 @@ class CANDevice:  # pylint: disable=too-many-arguments
         """get_device_filter_bin function"""
         return bin(self.device_filter)
 
+    def set_receive_period(self, period_ms: int):
+        """Period receive_messages() is run at, the enumerate slot follows it so
+        neighbouring device numbers reply from different polls"""
+        self.enumerate_slot_ms = max(1, period_ms)
+        self.enumerate_window_ms = CANDevice.ENUMERATE_SLOTS * self.enumerate_slot_ms
+        self.enumerate_delay_ms = self.dev_num * self.enumerate_slot_ms
+
     def route(
         self,
         api_id: int = FRCAppId.heartbeat,
@@ -105,6 +173,86 @@ class CANDevice:  # pylint: disable=too-many-arguments
 
         return route_decorator
 
+    def enable_profiling(self):
+        """Start recording handler timing, see `CANProfiler`.
+
+        Also adds a route so the stats can be queried over CAN: send
+        ProfileQuery with the stats index in data[0] (0 = dequeue latency,
+        1..N = routes) and a ProfileReply is sent back.
+        """
+        if self.profiler is None:
+            self.profiler = CANProfiler()
+            self.handlers[CANMessage(FRCReservedApi.ProfileQuery, CANMessageType.Device)] = (
+                self.__profile_query
+            )
+        return self.profiler
+
+    def disable_profiling(self):
+        """Stop recording handler timing and drop the collected stats"""
+        self.profiler = None
+        self.handlers.pop(CANMessage(FRCReservedApi.ProfileQuery, CANMessageType.Device), None)
+
+    def __profile_query(self, message: CANMessage):
+        """__profile_query function"""
+        index = message.data[0] if message.data else 0
+        reply = self.profiler.pack_reply(index)
+        if reply is not None:
+            self.send_message_simple(FRCReservedApi.ProfileReply, bytes(reply))
+
+    def enable_telemetry(self, period_ms: int = 1000):
+        """Publish bus and loop health frames every period_ms, see `CANTelemetry`.
+
+        A period of 0 only publishes when a TelemetryRequest is received.
+        """
+        if self.telemetry is None:
+            self.telemetry = CANTelemetry(self, period_ms)
+            self.handlers[CANMessage(FRCReservedApi.TelemetryRequest, CANMessageType.Device)] = (
+                self.__telemetry_request
+            )
+        self.telemetry.period_ms = period_ms
+        self.__declare_telemetry()
+        return self.telemetry
+
+    def attach_loop_monitor(self, loop_monitor):
+        """Publish a `LoopMonitor`'s TelemetryLag frame with the telemetry"""
+        self.loop_monitor = loop_monitor
+        if self.telemetry is not None:
+            self.__declare_telemetry()
+
+    def __declare_telemetry(self):
+        """Declare the telemetry frames to the bus load budget: bus and loop,
+        plus lag with a LoopMonitor attached"""
+        frames = 2 if self.loop_monitor is None else 3
+        self.bus_load.add_periodic("telemetry", frames, self.telemetry.period_ms)
+
+    def disable_telemetry(self):
+        """Stop publishing telemetry frames"""
+        self.telemetry = None
+        self.bus_load.remove_periodic("telemetry")
+        self.handlers.pop(
+            CANMessage(FRCReservedApi.TelemetryRequest, CANMessageType.Device), None
+        )
+
+    def __telemetry_request(self, message: CANMessage):  # pylint: disable=unused-argument
+        """__telemetry_request function"""
+        self.telemetry.publish()
+
+    def enable_capture(self, capacity: int = 256):
+        """Record every received and sent frame, see `CANCapture`"""
+        if self.capture is None or self.capture.capacity != capacity:
+            self.capture = CANCapture(capacity)
+        return self.capture
+
+    def disable_capture(self):
+        """Stop recording frames and drop the capture"""
+        self.capture = None
+
+    def reset_loop_stats(self):
+        """Clear the windowed maximums (queue depth and loop timing)"""
+        self.rx_queue_max = 0
+        self.loop_period_max_us = 0
+        self.loop_busy_max_us = 0
+
     def send_message(self, api_class: int, api_index: int, message: bytes):
         """send_message function"""
         msg_id = CANMessage.assemble_message_id(
@@ -123,23 +271,37 @@ class CANDevice:  # pylint: disable=too-many-arguments
 
     def __send_can_message(self, msg_id, message):
         """__send_can_message function"""
-        # construct MCP2515 message
+        # construct the canio message
         can_message = Message(id=msg_id, data=message, extended=True)
 
+        return self.__send_frame(can_message)
+
+    def __send_frame(self, can_message):
+        """__send_frame function"""
+        send_success = False
+
         # depending on the can bus state, send the message
-        if self.can_bus.state in (BusState.ERROR_ACTIVE, BusState.ERROR_WARNING):
+        bus_state = self.transport.state
+        if bus_state in (BusState.ERROR_ACTIVE, BusState.ERROR_WARNING):
             try:
-                send_success = self.can_bus.send(can_message)
-            except RuntimeError as ex:
-                print("Unexpected error:", ex)
+                send_success = self.transport.send(can_message)
+            except RuntimeError:
+                self.log.error(LogEvent.SendError, can_message.id)
         else:
-            print("CAN Bus is not active. Bus State:", self.can_bus.state)
+            self.log.warning(LogEvent.BusInactive, bus_state)
 
+        if send_success:
+            self.tx_count += 1
+            self.bus_load.add(can_message)
+            if self.capture is not None:
+                self.capture.record(can_message, tx=True)
+        else:
+            self.tx_fail_count += 1
         return send_success
 
     def start_listener(self):
         """
-        Setup the listener on the CAN bus using the MCP2515 library.
+        Setup the listener on the CAN bus, the matches become the transport's filters.
 
         The MCP2515 has slots for 2 masks and 6 filters.
         Mask-0 has 2 filter slots, Mask-1 has 4 filter slots.
@@ -151,8 +313,8 @@ class CANDevice:  # pylint: disable=too-many-arguments
 
         Read the MCP2515 datasheet for more details on masks and filters.
         """
-        self.listener = self.can_bus.listen(
-            matches=[
+        self.transport.set_filters(
+            [
                 # Match FRC RoboRIO Heartbeat using default mask (exact match)
                 Match(
                     FRCFilter.heartbeat,
@@ -175,47 +337,107 @@ class CANDevice:  # pylint: disable=too-many-arguments
                     mask=FRCMask.type_mfg_num,
                     extended=True,
                 ),
-            ],
-            timeout=0.9,
+            ]
         )
+        self.listening = True
         print("***  Listening for Broadcast, Heartbeat and Device specific messages")
         print()
 
+    def __schedule_enumerate_reply(self):
+        """Queue the enumerate reply for this device's slot (repeat requests are merged)"""
+        if self.enumerate_due is None:
+            self.enumerate_request_ticks = ticks_ms()
+            self.enumerate_due = ticks_add(self.enumerate_request_ticks, self.enumerate_delay_ms)
+
+    def __service_enumerate_reply(self):
+        """Send the queued enumerate reply once its slot has arrived"""
+        now = ticks_ms()
+        if ticks_diff(now, self.enumerate_due) < 0:
+            return
+
+        self.enumerate_due = None
+        if self.__send_frame(self.enumerate_reply):
+            self.enumerate_latency_ms = ticks_diff(now, self.enumerate_request_ticks)
+            self.enumerate_count += 1
+
+    def frames_pending(self):
+        """True if received frames are waiting to be handled"""
+        return self.listening and self.transport.pending()
+
     def receive_messages(self):
         """receive_messages function"""
+        loop_started_ns = monotonic_ns()
+        if self.loop_last_ns is not None:
+            loop_period_us = (loop_started_ns - self.loop_last_ns) // 1000
+            if loop_period_us > self.loop_period_max_us:
+                self.loop_period_max_us = loop_period_us
+                if loop_period_us > self.loop_period_peak_us:
+                    self.loop_period_peak_us = loop_period_us
+        self.loop_last_ns = loop_started_ns
+
         # receive CAN messages and split out the device, api and data values
-        message_count = self.listener.in_waiting()
+        batch = self.rx_batch
+        message_count = self.transport.receive_batch(batch)
+        # the whole batch left the receive queue here, so a frame's wait before
+        # its handler includes the frames handled ahead of it
+        dequeued_ns = monotonic_ns()
         # print(message_count, "messages received")
-
-        for _i in range(message_count):
-            msg = self.listener.receive()
+        self.rx_count += message_count
+        if message_count > self.rx_queue_max:
+            self.rx_queue_max = message_count
+        profiler = self.profiler
+        capture = self.capture
+
+        for index in range(message_count):
+            msg = batch[index]
+            batch[index] = None
+            if capture is not None:
+                capture.record(msg)
 
             # Regular CAN Messages...
             if isinstance(msg, Message):
                 message = CANMessage(raw_msg_id=msg.id, raw_msg_data=msg.data)
 
+                # Discovery broadcasts are answered by the library itself
+                if message.msg_type == CANMessageType.Broadcast and message.api_index in (
+                    FRCBroadcast.Enumerate,
+                    FRCBroadcast.DeviceQuery,
+                ):
+                    self.__schedule_enumerate_reply()
+                    continue
+
                 # Does a routes exists for this message...
                 route = self.handlers.get(message)
                 if route:
                     # call it
-                    route(message)
+                    if profiler is None:
+                        route(message)
+                    else:
+                        started_ns = monotonic_ns()
+                        route(message)
+                        profiler.record(message, dequeued_ns, started_ns, monotonic_ns())
                 else:
+                    self.unrouted_count += 1
                     # If not log an error.
                     if message.api_id_p == FRCAppId.heartbeat:
-                        print("Handler Not Defined for FRC Heartbeat messages")
-                        print(bin(msg.id), bin(int.from_bytes(msg.data, sys.byteorder)))
+                        self.log.info(LogEvent.UnroutedHeartbeat, msg.id)
                     elif message.api_class_id == FRCAppId.broadcast:
-                        print("Handler Not Defined for FRC Broadcast messages")
-                        print(bin(msg.id), bin(int.from_bytes(msg.data, sys.byteorder)))
+                        self.log.info(LogEvent.UnroutedBroadcast, msg.id, message.api_index)
                     else:
-                        print(
-                            "Handler Not Defined. API ID:",
-                            hex(message.api_id_p),
-                            "Message Type:",
-                            message.msg_type,
-                            bin(msg.id),
+                        self.log.info(
+                            LogEvent.UnroutedDevice, msg.id, message.api_id_p, message.msg_type
                         )
 
             # Remote Transmission Requests (these don't have can data?)
             if isinstance(msg, RemoteTransmissionRequest):
-                print("RTR length:", msg.length)
+                self.log.info(LogEvent.RemoteRequest, msg.id, msg.length)
+
+        if self.enumerate_due is not None:
+            self.__service_enumerate_reply()
+
+        if self.telemetry is not None:
+            self.telemetry.service()
+
+        busy_us = (monotonic_ns() - loop_started_ns) // 1000
+        if busy_us > self.loop_busy_max_us:
+            self.loop_busy_max_us = busy_us
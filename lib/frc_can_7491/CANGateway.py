@@ -0,0 +1,582 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.CANGateway`
+====================================================
+USB to CAN adapter: SLCAN (Lawicel) text protocol and a binary variant, between
+a serial stream (e.g. ``usb_cdc.data``) and a `CANTransport`.
+
+* Author(s): Karl Fleischmann
+"""
+from binascii import unhexlify
+from struct import pack_into, unpack_from
+
+from .CANTransport import (
+    REGISTER_FRAME_SIZE,
+    BusState,
+    Match,
+    Message,
+    RemoteTransmissionRequest,
+    register_header,
+    unpack_registers,
+)
+from .CANSniffer import CANSniffer
+from .Ticks import ticks_ms, ticks_diff
+
+HEX_DIGITS = b"0123456789ABCDEF"
+
+# SLCAN S0-S8
+SLCAN_BIT_RATES = (10_000, 20_000, 50_000, 100_000, 125_000, 250_000, 500_000, 800_000, 1_000_000)
+
+# SLCAN F status flags
+SLCAN_FLAG_DATA_OVERRUN = 0x08
+SLCAN_FLAG_ERROR_WARNING = 0x04
+SLCAN_FLAG_ERROR_PASSIVE = 0x20
+SLCAN_FLAG_BUS_ERROR = 0x80
+
+
+class CANGateway:
+    """CANGateway Class
+
+    What the SLCAN and binary gateways share: the channel is opened and closed
+    by the host, filters from the host go to the transport's ``set_filters``
+    (the MCP2515 masks and filters), frames from the bus are burst read in the
+    MCP2515 register layout and everything for the host is collected in one
+    preallocated buffer and written once per `poll`.
+
+    A frame from the host is retried ``tx_retries`` times while every transmit
+    buffer is busy (the MCP2515 has 3), since a batch from the host arrives
+    faster than the bus takes it.
+
+    Counters: ``rx_frames`` bus to host, ``tx_frames`` host to bus,
+    ``tx_failed`` frames the transport would not queue, ``host_dropped``
+    frames that arrived while the host was not connected. Receive buffer
+    overflows come from the transport.
+
+    On its own it speaks no protocol: bytes from the host are ignored and no
+    bus frames are forwarded. Subclasses override `handle_host` and
+    `forward_bus`.
+    """
+
+    def __init__(
+        self, transport, stream, max_frames: int = 32, out_size: int = 1024, tx_retries: int = 20
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self.transport = transport
+        self.stream = stream
+        self.max_frames = max_frames
+        self.tx_retries = tx_retries
+        self.frames = bytearray(max_frames * REGISTER_FRAME_SIZE)
+        self.host_in = bytearray(out_size)
+        self.host_in_view = memoryview(self.host_in)
+        self.host_out = bytearray(out_size)
+        self.host_out_view = memoryview(self.host_out)
+        self.out_end = 0
+        self.open = False
+        self.listen_only = False
+        self.matches = None
+
+        self.rx_frames = 0
+        self.tx_frames = 0
+        self.tx_failed = 0
+        self.host_dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.stats_ticks = ticks_ms()
+        self.stats_rx_frames = 0
+        self.stats_tx_frames = 0
+
+    def open_channel(self, listen_only: bool = False):
+        """Start passing frames, with the filters the host set"""
+        self.transport.set_filters(self.matches)
+        self.open = True
+        self.listen_only = listen_only
+
+    def close_channel(self):
+        """Stop passing frames"""
+        self.open = False
+
+    def set_filters(self, matches):
+        """Filters for the next open, None receives everything. When the channel
+        is open and the transport refuses them the previous filters are kept."""
+        matches = matches or None
+        if self.open:
+            self.transport.set_filters(matches)
+        self.matches = matches
+
+    def send(self, message) -> bool:
+        """Put a frame from the host on the bus"""
+        if not self.open or self.listen_only:
+            return False
+        sent = False
+        for _ in range(self.tx_retries + 1):
+            try:
+                sent = self.transport.send(message)
+            except RuntimeError:
+                # every TX buffer busy
+                sent = False
+            if sent:
+                break
+        if sent:
+            self.tx_frames += 1
+        else:
+            self.tx_failed += 1
+        return sent
+
+    def throughput(self):
+        """Frames per second bus to host and host to bus since the last call"""
+        now = ticks_ms()
+        elapsed = max(ticks_diff(now, self.stats_ticks), 1)
+        rx_rate = (self.rx_frames - self.stats_rx_frames) * 1000 // elapsed
+        tx_rate = (self.tx_frames - self.stats_tx_frames) * 1000 // elapsed
+        self.stats_ticks = now
+        self.stats_rx_frames = self.rx_frames
+        self.stats_tx_frames = self.tx_frames
+        return rx_rate, tx_rate
+
+    def read_host(self):
+        """Bytes the host sent since the last call, as a view into host_in"""
+        stream = self.stream
+        waiting = stream.in_waiting
+        if not waiting:
+            return None
+        count = stream.readinto(self.host_in_view[: min(waiting, len(self.host_in))])
+        if not count:
+            return None
+        self.bytes_in += count
+        return self.host_in_view[:count]
+
+    def write_host(self):
+        """Send everything collected for the host in one write"""
+        if not self.out_end:
+            return
+        if getattr(self.stream, "connected", True):
+            self.stream.write(self.host_out_view[: self.out_end])
+            self.bytes_out += self.out_end
+        self.out_end = 0
+
+    def read_bus(self, limit: int) -> int:
+        """Burst read up to limit frames into frames, returns how many"""
+        if not self.open or limit <= 0:
+            return 0
+        limit = min(limit, self.max_frames)
+        end = self.transport.read_raw_frames(self.frames, 0, limit * REGISTER_FRAME_SIZE)
+        return end // REGISTER_FRAME_SIZE
+
+    def handle_host(self, data):
+        """Act on bytes from the host, ignored without a protocol"""
+
+    def forward_bus(self):
+        """Move frames from the bus into host_out, nothing without a protocol"""
+
+    def poll(self):
+        """Host commands and frames to the bus, bus frames to the host"""
+        data = self.read_host()
+        if data is not None:
+            self.handle_host(data)
+        self.forward_bus()
+        self.write_host()
+
+    def run(self):
+        """Run the gateway forever"""
+        while True:
+            self.poll()
+
+
+class SLCANGateway(CANGateway):
+    """SLCANGateway Class
+
+    The Lawicel SLCAN protocol as used by slcand (``slcand -o -s8 /dev/ttyACM1``),
+    python-can's ``slcan`` interface and CANHacker: ``O``/``L``/``C`` open,
+    open listen-only and close, ``S0``-``S8`` must match the transport's bit
+    rate, ``t``/``T``/``r``/``R`` send, ``Z1`` adds a millisecond time stamp to
+    received frames, ``V``/``N``/``F`` version, serial number and status flags.
+
+    ``M``/``m`` set one acceptance code and mask on the 29 bit id of extended
+    frames (not the SJA1000 register layout): mask bits set to 1 are don't care,
+    ``m1FFFFFFF`` (the default) receives everything. They apply at the next
+    ``O``. ``Q`` (not in SLCAN) replies
+    ``Q<rx frames/s>,<tx frames/s>,<tx failed>,<overflows>,<dropped>`` in hex.
+    """
+
+    # T + 8 id digits + dlc + 16 data digits + 4 time stamp digits + \r
+    LINE_MAX = 30
+
+    def __init__(
+        self, transport, stream, max_frames: int = 32, out_size: int = 1024, tx_retries: int = 20
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        super().__init__(transport, stream, max_frames, out_size, tx_retries)
+        self.line = bytearray(SLCANGateway.LINE_MAX)
+        self.line_length = 0
+        self.timestamps = False
+        self.acceptance_code = 0
+        self.acceptance_mask = 0x1FFFFFFF
+        self.overflows_reported = 0
+        self.dropped_reported = 0
+
+    def put(self, value: bytes):
+        """Add a reply for the host"""
+        end = self.out_end + len(value)
+        if end > len(self.host_out):
+            self.write_host()
+            end = len(value)
+        self.host_out[end - len(value) : end] = value
+        self.out_end = end
+
+    def put_hex(self, value: int, digits: int):
+        """Add value as hex digits, host_out must have room"""
+        out = self.host_out
+        end = self.out_end + digits
+        for position in range(end - 1, self.out_end - 1, -1):
+            out[position] = HEX_DIGITS[value & 0x0F]
+            value >>= 4
+        self.out_end = end
+
+    def handle_host(self, data):
+        """Split the host bytes into \\r terminated commands"""
+        line = self.line
+        length = self.line_length
+        for value in data:
+            if value == 0x0D:
+                self.command(memoryview(line)[:length])
+                length = 0
+            elif length < SLCANGateway.LINE_MAX:
+                line[length] = value
+                length += 1
+        self.line_length = length
+
+    def command(self, line):
+        """Run one command and reply \\r (OK) or \\a (error)"""
+        # pylint: disable=too-many-branches,too-many-return-statements
+        if not line:
+            self.put(b"\r")
+            return
+        code = line[0]
+        if code in b"tTrR":
+            self.put(self.send_command(line))
+        elif code == ord("O") or code == ord("L"):
+            if self.open:
+                self.put(b"\a")
+                return
+            if self.acceptance_mask & 0x1FFFFFFF == 0x1FFFFFFF:
+                self.matches = None
+            else:
+                # canio masks are the bits that have to match
+                self.matches = [
+                    Match(
+                        self.acceptance_code & 0x1FFFFFFF,
+                        mask=~self.acceptance_mask & 0x1FFFFFFF,
+                        extended=True,
+                    )
+                ]
+            try:
+                self.open_channel(listen_only=code == ord("L"))
+            except (RuntimeError, ValueError):
+                # more filters than the hardware has
+                self.put(b"\a")
+                return
+            self.put(b"\r")
+        elif code == ord("C"):
+            self.close_channel()
+            self.put(b"\r")
+        elif code == ord("S"):
+            rate = line[1] - ord("0") if len(line) == 2 else -1
+            baud_rate = getattr(self.transport, "baud_rate", None)
+            if self.open or not 0 <= rate < len(SLCAN_BIT_RATES):
+                self.put(b"\a")
+            elif baud_rate is not None and SLCAN_BIT_RATES[rate] != baud_rate:
+                # the bit rate is set when the controller is created
+                self.put(b"\a")
+            else:
+                self.put(b"\r")
+        elif code == ord("Z") and len(line) == 2:
+            self.timestamps = line[1] == ord("1")
+            self.put(b"\r")
+        elif code in b"Mm" and len(line) == 9:
+            try:
+                value = int.from_bytes(unhexlify(bytes(line[1:9])), "big")
+            except ValueError:
+                self.put(b"\a")
+                return
+            if code == ord("M"):
+                self.acceptance_code = value
+            else:
+                self.acceptance_mask = value
+            self.put(b"\r")
+        elif code == ord("V"):
+            self.put(b"V0101\r")
+        elif code == ord("N"):
+            self.put(b"N7491\r")
+        elif code == ord("F"):
+            self.put(b"F")
+            self.put_hex(self.status_flags(), 2)
+            self.put(b"\r")
+        elif code == ord("Q"):
+            self.put_stats()
+        else:
+            self.put(b"\a")
+
+    def send_command(self, line) -> bytes:
+        """t/T/r/R: send a frame, returns the reply"""
+        code = line[0]
+        extended = code in b"TR"
+        id_digits = 8 if extended else 3
+        if len(line) < id_digits + 2:
+            return b"\a"
+        try:
+            frame_id = int(bytes(line[1 : 1 + id_digits]), 16)
+            length = line[1 + id_digits] - ord("0")
+            if not 0 <= length <= 8:
+                return b"\a"
+            if code in b"rR":
+                message = RemoteTransmissionRequest(frame_id, length, extended=extended)
+            else:
+                start = 2 + id_digits
+                data = unhexlify(bytes(line[start : start + 2 * length]))
+                if len(data) != length:
+                    return b"\a"
+                message = Message(frame_id, data, extended)
+        except ValueError:
+            return b"\a"
+        if not self.send(message):
+            return b"\a"
+        return b"Z\r" if extended else b"z\r"
+
+    def status_flags(self) -> int:
+        """F status flags, overruns since the last F"""
+        flags = 0
+        state = self.transport.state
+        if state == BusState.ERROR_WARNING:
+            flags |= SLCAN_FLAG_ERROR_WARNING
+        elif state == BusState.ERROR_PASSIVE:
+            flags |= SLCAN_FLAG_ERROR_PASSIVE
+        elif state == BusState.BUS_OFF:
+            flags |= SLCAN_FLAG_BUS_ERROR
+        overflows = self.transport.rx_overflow_count
+        if overflows != self.overflows_reported or self.host_dropped != self.dropped_reported:
+            flags |= SLCAN_FLAG_DATA_OVERRUN
+        self.overflows_reported = overflows
+        self.dropped_reported = self.host_dropped
+        return flags
+
+    def put_stats(self):
+        """Q reply"""
+        rx_rate, tx_rate = self.throughput()
+        if self.out_end + 48 > len(self.host_out):
+            self.write_host()
+        self.put(b"Q")
+        for index, value in enumerate(
+            (rx_rate, tx_rate, self.tx_failed, self.transport.rx_overflow_count, self.host_dropped)
+        ):
+            if index:
+                self.put(b",")
+            self.put_hex(value & 0xFFFFFFFF, 8)
+        self.put(b"\r")
+
+    def forward_bus(self):
+        """Received frames as t/T/r/R lines"""
+        # room left for whole lines, the longest is LINE_MAX
+        room = (len(self.host_out) - self.out_end) // SLCANGateway.LINE_MAX
+        count = self.read_bus(room)
+        if not count:
+            return
+        if not getattr(self.stream, "connected", True):
+            self.host_dropped += count
+            return
+        frames = self.frames
+        out = self.host_out
+        stamp = ticks_ms() % 60000
+        for offset in range(0, count * REGISTER_FRAME_SIZE, REGISTER_FRAME_SIZE):
+            frame_id, extended, rtr, dlc = register_header(frames, offset)
+            if extended:
+                out[self.out_end] = 0x52 if rtr else 0x54  # R / T
+                self.out_end += 1
+                self.put_hex(frame_id, 8)
+            else:
+                out[self.out_end] = 0x72 if rtr else 0x74  # r / t
+                self.out_end += 1
+                self.put_hex(frame_id, 3)
+            out[self.out_end] = 0x30 + dlc
+            self.out_end += 1
+            if not rtr:
+                for index in range(offset + 5, offset + 5 + dlc):
+                    self.put_hex(frames[index], 2)
+            if self.timestamps:
+                self.put_hex(stamp, 4)
+            out[self.out_end] = 0x0D
+            self.out_end += 1
+        self.rx_frames += count
+
+
+class BinaryGateway(CANGateway):
+    """BinaryGateway Class
+
+    Bus to host: `CANSniffer` packets (``tools/sniff.py`` reads them), so received
+    frames cost 15 bytes and no formatting on the Feather.
+
+    Host to bus: packets ``<HBB`` magic 0x7492, command and count, then
+
+    * ``FRAMES``: count frames in the MCP2515 register layout (13 bytes each,
+      see `pack_registers`)
+    * ``FILTERS``: count ``<IIB`` address, mask (bits that have to match, like
+      ``canio.Match``) and extended flag, 0 receives everything
+    * ``OPEN``, ``OPEN_LISTEN_ONLY``, ``CLOSE``
+    * ``STATS``: replied with ``<HBB`` magic 0x7493, version, packets refused
+      (saturates at 255) and ``<IIIIII`` rx and tx frames per second, tx frames
+      failed, receive buffer overflows, frames dropped while the host was away
+      and bytes from the host
+
+    ``FILTERS`` and ``OPEN`` are refused, and counted in ``refused``, when the
+    transport can't take the filters (the MCP2515 has 2 masks and 6 filters).
+    A refused ``FILTERS`` keeps the previous filters, a refused ``OPEN`` leaves
+    the channel closed.
+    """
+
+    MAGIC = 0x7492
+    STATS_MAGIC = 0x7493
+    HEADER_FORMAT = "<HBB"
+    HEADER_SIZE = 4
+    FILTER_FORMAT = "<IIB"
+    FILTER_SIZE = 9
+    STATS_FORMAT = "<HBBIIIIII"
+    STATS_SIZE = 28
+
+    FRAMES = 0
+    FILTERS = 1
+    OPEN = 2
+    OPEN_LISTEN_ONLY = 3
+    CLOSE = 4
+    STATS = 5
+
+    def __init__(
+        self, transport, stream, max_frames: int = 32, out_size: int = 1024, flush_ms: int = 5
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        super().__init__(transport, stream, max_frames, out_size)
+        self.sniffer = CANSniffer(transport, stream, max_frames, flush_ms)
+        self.pending = bytearray(BinaryGateway.HEADER_SIZE + 255 * REGISTER_FRAME_SIZE)
+        self.pending_length = 0
+        # sniffer totals already added to the gateway counters
+        self.sniffer_frames = 0
+        self.sniffer_packets = 0
+        self.sniffer_dropped = 0
+        self.refused = 0
+
+    def handle_host(self, data):
+        """Collect host packets, run each once it is complete"""
+        pending = self.pending
+        position = 0
+        while position < len(data):
+            # header first, then as much of the body as it needs
+            needed = BinaryGateway.HEADER_SIZE
+            if self.pending_length >= BinaryGateway.HEADER_SIZE:
+                needed += self.body_size()
+            take = min(needed - self.pending_length, len(data) - position)
+            pending[self.pending_length : self.pending_length + take] = data[position : position + take]
+            self.pending_length += take
+            position += take
+
+            if self.pending_length == BinaryGateway.HEADER_SIZE:
+                magic = unpack_from("<H", pending)[0]
+                if magic != BinaryGateway.MAGIC:
+                    # out of step, drop a byte and look again
+                    pending[0 : BinaryGateway.HEADER_SIZE - 1] = pending[1 : BinaryGateway.HEADER_SIZE]
+                    self.pending_length -= 1
+                    continue
+            if self.pending_length >= BinaryGateway.HEADER_SIZE and (
+                self.pending_length == BinaryGateway.HEADER_SIZE + self.body_size()
+            ):
+                self.command()
+                self.pending_length = 0
+
+    def body_size(self) -> int:
+        """Bytes after the header of the pending packet"""
+        command = self.pending[2]
+        count = self.pending[3]
+        if command == BinaryGateway.FRAMES:
+            return count * REGISTER_FRAME_SIZE
+        if command == BinaryGateway.FILTERS:
+            return count * BinaryGateway.FILTER_SIZE
+        return 0
+
+    def command(self):
+        """Run the pending packet"""
+        pending = self.pending
+        command = pending[2]
+        count = pending[3]
+        if command == BinaryGateway.FRAMES:
+            for offset in range(
+                BinaryGateway.HEADER_SIZE,
+                BinaryGateway.HEADER_SIZE + count * REGISTER_FRAME_SIZE,
+                REGISTER_FRAME_SIZE,
+            ):
+                frame_id, extended, rtr, dlc, data = unpack_registers(pending, offset)
+                if rtr:
+                    self.send(RemoteTransmissionRequest(frame_id, dlc, extended=extended))
+                else:
+                    self.send(Message(frame_id, data, extended))
+        elif command == BinaryGateway.FILTERS:
+            matches = []
+            for offset in range(
+                BinaryGateway.HEADER_SIZE,
+                BinaryGateway.HEADER_SIZE + count * BinaryGateway.FILTER_SIZE,
+                BinaryGateway.FILTER_SIZE,
+            ):
+                address, mask, extended = unpack_from(BinaryGateway.FILTER_FORMAT, pending, offset)
+                matches.append(Match(address, mask=mask, extended=bool(extended)))
+            try:
+                self.set_filters(matches)
+            except (RuntimeError, ValueError):
+                # more filters than the hardware has
+                self.refused += 1
+        elif command in (BinaryGateway.OPEN, BinaryGateway.OPEN_LISTEN_ONLY):
+            try:
+                self.open_channel(listen_only=command == BinaryGateway.OPEN_LISTEN_ONLY)
+            except (RuntimeError, ValueError):
+                self.refused += 1
+        elif command == BinaryGateway.CLOSE:
+            self.close_channel()
+        elif command == BinaryGateway.STATS:
+            # after the frames already collected, so packets stay whole
+            self.sniffer.flush()
+            self.count_sniffer()
+            if self.out_end + BinaryGateway.STATS_SIZE > len(self.host_out):
+                self.write_host()
+            rx_rate, tx_rate = self.throughput()
+            pack_into(
+                BinaryGateway.STATS_FORMAT,
+                self.host_out,
+                self.out_end,
+                BinaryGateway.STATS_MAGIC,
+                CANSniffer.VERSION,
+                min(self.refused, 0xFF),
+                rx_rate,
+                tx_rate,
+                self.tx_failed,
+                self.transport.rx_overflow_count,
+                self.host_dropped,
+                self.bytes_in,
+            )
+            self.out_end += BinaryGateway.STATS_SIZE
+            self.write_host()
+
+    def forward_bus(self):
+        """Received frames go out as sniffer packets"""
+        if not self.open:
+            return
+        self.sniffer.poll()
+        self.count_sniffer()
+
+    def count_sniffer(self):
+        """Add what the sniffer sent since the last call to the gateway counters"""
+        sniffer = self.sniffer
+        frames = sniffer.frames - self.sniffer_frames
+        packets = sniffer.packets - self.sniffer_packets
+        self.rx_frames += frames
+        self.bytes_out += frames * CANSniffer.RECORD_SIZE + packets * CANSniffer.HEADER_SIZE
+        self.host_dropped += sniffer.stream_dropped - self.sniffer_dropped
+        self.sniffer_frames = sniffer.frames
+        self.sniffer_packets = sniffer.packets
+        self.sniffer_dropped = sniffer.stream_dropped
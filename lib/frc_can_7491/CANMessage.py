@@ -9,7 +9,28 @@ FRC CAN Bus CAN Message class.
 * Author(s): Karl Fleischmann
 """
 import sys
-from .FRCConsts import FRCManufacturer
+from .FRCConsts import FRCManufacturer, FRCHeartbeatMask
+from .MessageSchema import Field, MessageSchema
+
+# the roboRIO heartbeat, for host tools and encoding (RobotHeartbeat decodes
+# with its own literals, same bits)
+HEARTBEAT_SCHEMA = MessageSchema(
+    "RobotHeartbeat",
+    (
+        Field("match_time", bit=FRCHeartbeatMask.match_time_shift, bits=8),
+        Field("match_number", bit=FRCHeartbeatMask.match_number_shift, bits=10),
+        Field("replay_number", bit=FRCHeartbeatMask.replay_number_shift, bits=6),
+        Field("tournament_type", bit=FRCHeartbeatMask.tournament_type_shift, bits=3),
+        Field("system_watchdog", bit=FRCHeartbeatMask.system_watchdog_shift, bits=1),
+        Field("test_mode", bit=FRCHeartbeatMask.test_mode_shift, bits=1),
+        Field("auto_mode", bit=FRCHeartbeatMask.auto_mode_shift, bits=1),
+        Field("enabled", bit=FRCHeartbeatMask.enabled_shift, bits=1),
+        Field("red_alliance", bit=FRCHeartbeatMask.red_alliance_shift, bits=1),
+        # bits 31-0 hold the date and time
+        Field("date_time", bit=0, bits=32),
+    ),
+)
+
 
 class RobotHeartbeat:
     """RobotHeartbeat Class"""
@@ -39,6 +60,7 @@ class RobotHeartbeat:
     @staticmethod
     def __parse_heartbeat(bytes_in):  # pylint: disable=too-many-locals, line-too-long
         # Bit masks for spliting out a 64bit binary field for heartbeat
+        # (kept as literals on this hot path, same values as FRCHeartbeatMask)
         # see https://docs.wpilib.org/en/stable/docs/software/can-devices/can-addressing.html
         # for more details
         # bits 64-57 8 bits
@@ -216,14 +238,15 @@ class CANMessage:
     def __parse_raw_msg_id(bytes_in):
         """__parse_raw_msg_id function"""
         # Bit masks for spliting out a 32bit binary field
+        # (kept as literals on this hot path, same values as FRCMask)
         # see https://docs.wpilib.org/en/stable/docs/software/can-devices/can-addressing.html
         # for more details
-        device_type = 0b1111100000000000000000000000  # bits 28-24
-        mfg_code = 0b0000011111111000000000000000  # bits 23-16
-        api = 0b0000000000000111111111100000  # bits 15-6
-        api_class = 0b0000000000000111111000000000  # bits 15-10
-        api_index = 0b0000000000000000000111100000  # bits 9-6
-        device_number = 0b0000000000000000000000011111  # bits 5-0
+        device_type = 0b11111000000000000000000000000  # bits 28-24
+        mfg_code = 0b00000111111110000000000000000  # bits 23-16
+        api = 0b00000000000001111111111000000  # bits 15-6
+        api_class = 0b00000000000001111110000000000  # bits 15-10
+        api_index = 0b00000000000000000001111000000  # bits 9-6
+        device_number = 0b00000000000000000000000111111  # bits 5-0
 
         # split the message id using bitwise AND with right shift
         device_type = (bytes_in & device_type) >> 24
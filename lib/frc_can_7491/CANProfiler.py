@@ -0,0 +1,143 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.CANProfiler`
+====================================================
+FRC CAN Bus route handler profiler.
+
+* Author(s): Karl Fleischmann
+"""
+from struct import pack_into
+
+# Histogram bucket upper limits in microseconds.
+# The last bucket counts everything slower than the final limit.
+BUCKET_LIMITS_US = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# key reported over CAN for the dequeue-to-handler latency stats
+DEQUEUE_KEY = 0xFFFF
+
+
+class RouteStats:
+    """RouteStats Class"""
+
+    def __init__(self, key: int) -> None:
+        self.key = key
+        self.count = 0
+        self.min_us = 0
+        self.max_us = 0
+        self.total_us = 0
+        self.histogram = [0] * (len(BUCKET_LIMITS_US) + 1)
+
+    def record(self, duration_us: int):
+        """record function"""
+        if self.count == 0 or duration_us < self.min_us:
+            self.min_us = duration_us
+        if duration_us > self.max_us:
+            self.max_us = duration_us
+        self.count += 1
+        self.total_us += duration_us
+
+        bucket = 0
+        for limit in BUCKET_LIMITS_US:
+            if duration_us <= limit:
+                break
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    @property
+    def mean_us(self):
+        """mean_us property"""
+        if self.count == 0:
+            return 0
+        return self.total_us // self.count
+
+    def __repr__(self) -> str:
+        """__repr__ function"""
+        return (
+            f"RouteStats(key={hex(self.key)}, count={self.count}, min_us={self.min_us},"
+            f" mean_us={self.mean_us}, max_us={self.max_us})"
+        )
+
+
+class CANProfiler:
+    """CANProfiler Class
+
+    Records per-route handler run time and the time each frame waits between being
+    dequeued from the listener and its handler starting. A whole batch is dequeued
+    at once, so that wait includes the handlers of the frames ahead of it. Times
+    are in nanoseconds from ``time.monotonic_ns()`` and are stored in microseconds.
+    """
+
+    # reply layout: key, count, mean_us, max_us (all saturating u16)
+    REPLY_FORMAT = "<HHHH"
+
+    def __init__(self) -> None:
+        self.dequeue = RouteStats(DEQUEUE_KEY)
+        self.routes = {}
+        # first-seen order, so route indexes stay stable for CAN queries
+        self.route_list = []
+        self.reply_buffer = bytearray(8)
+
+    @staticmethod
+    def route_key(message) -> int:
+        """route_key function, API ID in bits 9-0 and message type above it"""
+        return (message.msg_type << 10) | message.api_id
+
+    def record(self, message, dequeued_ns: int, started_ns: int, finished_ns: int):
+        """record function"""
+        self.dequeue.record((started_ns - dequeued_ns) // 1000)
+
+        stats = self.routes.get(message)
+        if stats is None:
+            stats = RouteStats(CANProfiler.route_key(message))
+            self.routes[message] = stats
+            self.route_list.append(stats)
+        stats.record((finished_ns - started_ns) // 1000)
+
+    def reset(self):
+        """reset function"""
+        self.dequeue = RouteStats(DEQUEUE_KEY)
+        self.routes = {}
+        self.route_list = []
+
+    def stats_at(self, index: int):
+        """Stats by query index, 0 is the dequeue latency and 1..N are routes"""
+        if index == 0:
+            return self.dequeue
+        if 0 < index <= len(self.route_list):
+            return self.route_list[index - 1]
+        return None
+
+    def pack_reply(self, index: int):
+        """Pack the stats at index into the reply buffer, returns None if out of range"""
+        stats = self.stats_at(index)
+        if stats is None:
+            return None
+
+        pack_into(
+            CANProfiler.REPLY_FORMAT,
+            self.reply_buffer,
+            0,
+            stats.key,
+            min(stats.count, 0xFFFF),
+            min(stats.mean_us, 0xFFFF),
+            min(stats.max_us, 0xFFFF),
+        )
+        return self.reply_buffer
+
+    def dump(self):
+        """Print all of the collected stats to the serial console"""
+        limits = " ".join(f"<={limit}" for limit in BUCKET_LIMITS_US)
+        print("******************************************************")
+        print("***  FRC CAN Handler Profile (us)")
+        print("******************************************************")
+        print(f"***  Buckets: {limits} >{BUCKET_LIMITS_US[-1]}")
+        for stats in [self.dequeue] + self.route_list:
+            name = "dequeue" if stats.key == DEQUEUE_KEY else hex(stats.key)
+            print(
+                f"***  {name:>7} n={stats.count} min={stats.min_us}"
+                f" mean={stats.mean_us} max={stats.max_us}"
+            )
+            print(f"***          {stats.histogram}")
+        print("******************************************************")
@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.CANSniffer`
+====================================================
+Listen-only bus monitor streaming every received frame over USB serial.
+
+* Author(s): Karl Fleischmann
+"""
+from time import monotonic_ns
+from struct import pack_into
+
+from .CANTransport import REGISTER_FRAME_SIZE
+
+
+class CANSniffer:
+    """CANSniffer Class
+
+    Drains the transport in bursts (`CANTransport.read_raw_frames`) straight into a
+    preallocated packet and writes it to ``stream`` (e.g. ``usb_cdc.data``) when
+    ``max_frames`` frames are in it or the oldest is ``flush_ms`` old.
+
+    Packet header ``<HBBHHHBxI`` (16 bytes): magic 0x7491, version, frame count,
+    sequence number, receive buffer overflows and frames dropped because the
+    stream was not connected (both running totals mod 65536), ``BusState`` and the
+    time of the first frame in microseconds. Each frame follows as 15 bytes: the 13
+    MCP2515 receive buffer registers (see `unpack_registers`) and the ``<H``
+    microseconds since the packet time.
+
+    Frames are not decoded on the Feather, ``tools/sniff.py`` does that on the host.
+    """
+
+    MAGIC = 0x7491
+    VERSION = 1
+    HEADER_FORMAT = "<HBBHHHBxI"
+    HEADER_SIZE = 16
+    RECORD_SIZE = REGISTER_FRAME_SIZE + 2
+    MAX_FRAMES = 255
+
+    def __init__(self, transport, stream, max_frames: int = 32, flush_ms: int = 5) -> None:
+        self.transport = transport
+        self.stream = stream
+        self.max_frames = min(max_frames, CANSniffer.MAX_FRAMES)
+        # frame times are 16 bit offsets from the packet time
+        self.flush_us = min(flush_ms * 1000, 0xFFFF)
+        self.packet = bytearray(CANSniffer.HEADER_SIZE + self.max_frames * CANSniffer.RECORD_SIZE)
+        self.packet_view = memoryview(self.packet)
+        self.end = CANSniffer.HEADER_SIZE
+        self.count = 0
+        self.base_us = 0
+        self.sequence = 0
+        self.frames = 0
+        self.packets = 0
+        self.stream_dropped = 0
+
+        # no filters, every frame on the bus
+        transport.set_filters(None)
+
+    def poll(self):
+        """Read every waiting frame, send the packet once it is full or old enough"""
+        now_us = monotonic_ns() // 1000
+        if self.count and now_us - self.base_us >= self.flush_us:
+            self.flush()
+        start = self.end
+        end = self.transport.read_raw_frames(
+            self.packet, start, len(self.packet) - 2, CANSniffer.RECORD_SIZE
+        )
+        if end == start:
+            return
+        if not self.count:
+            self.base_us = now_us
+        offset = now_us - self.base_us
+        packet = self.packet
+        for position in range(start + REGISTER_FRAME_SIZE, end, CANSniffer.RECORD_SIZE):
+            packet[position] = offset & 0xFF
+            packet[position + 1] = offset >> 8
+        self.count += (end - start) // CANSniffer.RECORD_SIZE
+        self.end = end
+        if self.count >= self.max_frames:
+            self.flush()
+
+    def flush(self):
+        """Send the packet"""
+        if not self.count:
+            return
+        transport = self.transport
+        # reading the state also picks up overflows from the error flags
+        state = transport.state
+        pack_into(
+            CANSniffer.HEADER_FORMAT,
+            self.packet,
+            0,
+            CANSniffer.MAGIC,
+            CANSniffer.VERSION,
+            self.count,
+            self.sequence,
+            transport.rx_overflow_count & 0xFFFF,
+            self.stream_dropped & 0xFFFF,
+            state,
+            self.base_us & 0xFFFFFFFF,
+        )
+        if getattr(self.stream, "connected", True):
+            self.stream.write(self.packet_view[: self.end])
+            self.frames += self.count
+            self.packets += 1
+        else:
+            self.stream_dropped += self.count
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        self.count = 0
+        self.end = CANSniffer.HEADER_SIZE
+
+    def run(self):
+        """Sniff forever"""
+        while True:
+            self.poll()
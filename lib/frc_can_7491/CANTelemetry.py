@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.CANTelemetry`
+====================================================
+FRC CAN Bus device and bus health telemetry.
+
+* Author(s): Karl Fleischmann
+"""
+from struct import pack_into
+
+from .FRCConsts import FRCReservedApi
+from .Ticks import ticks_ms, ticks_add, ticks_diff
+
+
+def _u8(value):
+    return value if value < 0xFF else 0xFF
+
+
+def _u16(value):
+    return value if value < 0xFFFF else 0xFFFF
+
+
+class CANTelemetry:
+    """CANTelemetry Class
+
+    Samples the counters kept by `CANDevice` and its transport and packs them
+    into two 8 byte frames:
+
+    TelemetryBus  ``<HHBBBB``
+        rx frames/s, tx frames/s, TEC, REC, rx overflows,
+        bus state (bits 2-0) | bus state transitions (bits 7-3)
+    TelemetryLoop ``<BBHHH``
+        max receive queue depth, unrouted frames, max loop period (ms),
+        max receive_messages() time (us), tx failures
+
+    Counts and maximums cover the window since the previous publish and saturate
+    at the field width. When a `LoopMonitor` is attached to the device, its
+    TelemetryLag frame is published as well.
+    """
+
+    BUS_FORMAT = "<HHBBBB"
+    LOOP_FORMAT = "<BBHHH"
+
+    def __init__(self, device, period_ms: int = 1000) -> None:
+        self.device = device
+        self.period_ms = period_ms
+        self.bus_frame = bytearray(8)
+        self.loop_frame = bytearray(8)
+
+        self.last_ticks = ticks_ms()
+        self.next_due = ticks_add(self.last_ticks, period_ms)
+        self.last_rx_count = device.rx_count
+        self.last_tx_count = device.tx_count
+        self.last_tx_fail_count = device.tx_fail_count
+        self.last_unrouted_count = device.unrouted_count
+        self.last_overflow_count = 0
+        self.last_transition_count = 0
+        self.publish_count = 0
+
+    def sample(self):
+        """Refresh both telemetry frames from the current counters"""
+        device = self.device
+        transport = device.transport
+        now = ticks_ms()
+        elapsed_ms = max(1, ticks_diff(now, self.last_ticks))
+        self.last_ticks = now
+
+        # reading the state also collects the overflow flags in the driver
+        bus_state = transport.state
+        tec, rec = transport.error_counts
+        overflow_count = transport.rx_overflow_count
+        transition_count = transport.bus_state_transition_count
+
+        rx_count = device.rx_count
+        tx_count = device.tx_count
+        pack_into(
+            CANTelemetry.BUS_FORMAT,
+            self.bus_frame,
+            0,
+            _u16((rx_count - self.last_rx_count) * 1000 // elapsed_ms),
+            _u16((tx_count - self.last_tx_count) * 1000 // elapsed_ms),
+            tec,
+            rec,
+            _u8(overflow_count - self.last_overflow_count),
+            (bus_state & 0x07) | (min(transition_count - self.last_transition_count, 0x1F) << 3),
+        )
+        pack_into(
+            CANTelemetry.LOOP_FORMAT,
+            self.loop_frame,
+            0,
+            _u8(device.rx_queue_max),
+            _u8(device.unrouted_count - self.last_unrouted_count),
+            _u16(device.loop_period_max_us // 1000),
+            _u16(device.loop_busy_max_us),
+            _u16(device.tx_fail_count - self.last_tx_fail_count),
+        )
+
+        self.last_rx_count = rx_count
+        self.last_tx_count = tx_count
+        self.last_tx_fail_count = device.tx_fail_count
+        self.last_unrouted_count = device.unrouted_count
+        self.last_overflow_count = overflow_count
+        self.last_transition_count = transition_count
+        device.reset_loop_stats()
+
+    def publish(self):
+        """Sample and send both telemetry frames now"""
+        self.sample()
+        self.device.send_message_simple(FRCReservedApi.TelemetryBus, bytes(self.bus_frame))
+        self.device.send_message_simple(FRCReservedApi.TelemetryLoop, bytes(self.loop_frame))
+        if self.device.loop_monitor is not None:
+            self.device.send_message_simple(
+                FRCReservedApi.TelemetryLag, bytes(self.device.loop_monitor.pack())
+            )
+        self.publish_count += 1
+
+    def service(self):
+        """Publish if the configured period has passed, a period of 0 only publishes on request"""
+        if self.period_ms <= 0:
+            return
+        now = ticks_ms()
+        if ticks_diff(now, self.next_due) >= 0:
+            self.next_due = ticks_add(now, self.period_ms)
+            self.publish()
@@ -0,0 +1,301 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.CANTransport`
+====================================================
+CAN transports used by `CANDevice`: the MCP2515 FeatherWing, plus the frame
+classes shared by every transport.
+
+* Author(s): Karl Fleischmann
+"""
+
+try:
+    from adafruit_mcp2515.canio import Message, RemoteTransmissionRequest, Match, BusState
+except ImportError:
+    # Not on a Feather (e.g. CPython on a coprocessor or laptop), same API as
+    # adafruit_mcp2515.canio so handlers and transports work unchanged.
+
+    class Message:  # pylint: disable=too-few-public-methods
+        """Message Class"""
+
+        def __init__(self, id: int, data: bytes, extended: bool = False):  # pylint: disable=redefined-builtin
+            if len(data) > 8:
+                raise AttributeError("`canio.Message` object data must be of length 8 or less")
+            self.id = id
+            self.data = data
+            self.extended = extended
+
+    class RemoteTransmissionRequest:  # pylint: disable=too-few-public-methods
+        """RemoteTransmissionRequest Class"""
+
+        def __init__(self, id: int, length: int, *, extended: bool = False):  # pylint: disable=redefined-builtin
+            self.id = id
+            self.length = length
+            self.extended = extended
+
+    class Match:  # pylint: disable=too-few-public-methods
+        """Match Class"""
+
+        def __init__(self, address: int, *, mask: int = 0, extended: bool = False):
+            self.address = address
+            self.mask = mask
+            self.extended = extended
+
+    class BusState:  # pylint: disable=too-few-public-methods
+        """BusState Class"""
+
+        ERROR_ACTIVE = 0
+        ERROR_WARNING = 1
+        ERROR_PASSIVE = 2
+        BUS_OFF = 3
+
+
+def match_frame(matches, frame_id: int, extended: bool) -> bool:
+    """True if the frame id passes any of the matches, like the MCP2515 acceptance filters.
+    No matches accepts everything."""
+    if not matches:
+        return True
+    for match in matches:
+        if match.extended != extended:
+            continue
+        # like canio, a mask of 0 is an exact match
+        mask = match.mask
+        if not mask:
+            mask = 0x1FFFFFFF if extended else 0x7FF
+        if (frame_id ^ match.address) & mask == 0:
+            return True
+    return False
+
+
+# a received frame as the MCP2515 holds it: SIDH, SIDL, EID8, EID0, DLC, D0-D7
+REGISTER_FRAME_SIZE = 13
+
+
+def pack_registers(frame, buffer, offset: int = 0):
+    """Write a Message/RemoteTransmissionRequest in the MCP2515 receive buffer layout"""
+    frame_id = frame.id
+    if frame.extended:
+        # SID10-3 | SID2-0, EXIDE, EID17-16 | EID15-8 | EID7-0
+        buffer[offset] = (frame_id >> 21) & 0xFF
+        buffer[offset + 1] = ((frame_id >> 13) & 0xE0) | 0x08 | ((frame_id >> 16) & 0x03)
+        buffer[offset + 2] = (frame_id >> 8) & 0xFF
+        buffer[offset + 3] = frame_id & 0xFF
+    else:
+        buffer[offset] = (frame_id >> 3) & 0xFF
+        buffer[offset + 1] = (frame_id << 5) & 0xE0
+        buffer[offset + 2] = 0
+        buffer[offset + 3] = 0
+    if isinstance(frame, RemoteTransmissionRequest):
+        # RTR in the DLC register, and SRR for a standard frame
+        buffer[offset + 4] = 0x40 | frame.length
+        if not frame.extended:
+            buffer[offset + 1] |= 0x10
+    else:
+        data = frame.data
+        buffer[offset + 4] = len(data)
+        buffer[offset + 5 : offset + 5 + len(data)] = data
+
+
+def register_header(buffer, offset: int = 0):
+    """(id, extended, rtr, dlc) of a frame in the MCP2515 receive buffer layout,
+    the data follows at offset + 5"""
+    sidh = buffer[offset]
+    sidl = buffer[offset + 1]
+    dlc = min(buffer[offset + 4] & 0x0F, 8)
+    frame_id = (sidh << 3) | (sidl >> 5)
+    extended = bool(sidl & 0x08)
+    # RTR in the DLC register, SRR for a standard frame
+    rtr = bool(buffer[offset + 4] & 0x40)
+    if extended:
+        frame_id = (
+            (frame_id << 18) | ((sidl & 0x03) << 16) | (buffer[offset + 2] << 8) | buffer[offset + 3]
+        )
+    else:
+        rtr = rtr or bool(sidl & 0x10)
+    return frame_id, extended, rtr, dlc
+
+
+def unpack_registers(buffer, offset: int = 0):
+    """(id, extended, rtr, dlc, data) of a frame in the MCP2515 receive buffer layout"""
+    frame_id, extended, rtr, dlc = register_header(buffer, offset)
+    data = b"" if rtr else bytes(buffer[offset + 5 : offset + 5 + dlc])
+    return frame_id, extended, rtr, dlc, data
+
+
+class CANTransport:
+    """CANTransport Class
+
+    What `CANDevice` needs from a CAN controller:
+
+    * ``send(message)`` returns True once the frame is queued for the bus
+    * ``receive_batch(frames)`` fills the list with received ``Message`` /
+      ``RemoteTransmissionRequest`` objects and returns how many it filled
+    * ``set_filters(matches)`` starts receiving frames that pass any of the
+      ``Match`` objects
+    * ``state`` is a ``BusState`` value
+    * ``read_raw_frames(buffer, start, end, stride)`` is what `CANSniffer` reads, frames
+      in the MCP2515 register layout (see `unpack_registers`)
+
+    The health counters (``error_counts``, ``rx_overflow_count`` and
+    ``bus_state_transition_count``) read by `CANTelemetry` default to zero.
+
+    On its own it is a transport with no bus attached: every send fails and
+    nothing is ever received. Subclasses override ``send``, ``set_filters``,
+    ``in_waiting`` and ``receive``.
+    """
+
+    error_counts = (0, 0)
+    rx_overflow_count = 0
+    bus_state_transition_count = 0
+
+    @property
+    def state(self):
+        """Bus state, see BusState"""
+        return BusState.ERROR_ACTIVE
+
+    def send(self, message) -> bool:  # pylint: disable=unused-argument
+        """Queue a frame for the bus, False as there is no bus"""
+        return False
+
+    def set_filters(self, matches):
+        """Receive only frames passing one of the matches, ignored as nothing is received"""
+
+    def in_waiting(self) -> int:
+        """Number of received frames waiting, always 0"""
+        return 0
+
+    def receive(self):
+        """The next received frame, always None"""
+        return None
+
+    def receive_batch(self, frames) -> int:
+        """Fill frames with the waiting frames, returns the number filled"""
+        count = min(self.in_waiting(), len(frames))
+        for index in range(count):
+            frames[index] = self.receive()
+        return count
+
+    def pending(self) -> bool:
+        """True if received frames are waiting"""
+        return self.in_waiting() > 0
+
+    def read_raw_frames(self, buffer, start=0, end=None, stride=REGISTER_FRAME_SIZE) -> int:
+        """Write waiting frames in the MCP2515 register layout to buffer every stride bytes
+        from start, returns the offset after the last one"""
+        if end is None:
+            end = len(buffer)
+        while start + REGISTER_FRAME_SIZE <= end and self.in_waiting():
+            pack_registers(self.receive(), buffer, start)
+            start += stride
+        return start
+
+    def deinit(self):
+        """Release the controller"""
+
+
+class MCP2515Transport(CANTransport):
+    """MCP2515Transport Class
+
+    The Adafruit CAN Bus FeatherWing / Feather M4 CAN Express MCP2515. Defaults to
+    ``board.SPI()`` and ``board.CAN_CS``, or wraps the ``can_bus`` driver passed in.
+    ``silent`` opens the controller listen-only: it never transmits or acknowledges.
+    """
+
+    def __init__(
+        self,
+        spi=None,
+        chip_select=None,
+        baud_rate=1_000_000,
+        debug=False,
+        can_bus=None,
+        silent=False,
+        spi_baudrate=100000,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self.listener = None
+        if can_bus is not None:
+            # an already constructed driver, e.g. on a simulated SPI bus
+            self.can_bus = can_bus
+            return
+
+        # pylint: disable=import-outside-toplevel
+        import board
+        from digitalio import DigitalInOut
+        from adafruit_mcp2515 import MCP2515
+
+        if spi is None:
+            spi = board.SPI()
+        if chip_select is None:
+            chip_select = board.CAN_CS
+
+        self.chip_select = DigitalInOut(chip_select)
+        self.chip_select.switch_to_output()
+        self.can_bus = MCP2515(
+            spi,
+            self.chip_select,
+            baudrate=baud_rate,
+            silent=silent,
+            debug=debug,
+            spi_baudrate=spi_baudrate,
+        )
+
+    @property
+    def state(self):
+        """Bus state, see BusState"""
+        return self.can_bus.state
+
+    @property
+    def baud_rate(self):
+        """Bus bit rate"""
+        return self.can_bus.baudrate
+
+    @property
+    def error_counts(self):
+        """TEC and REC"""
+        return self.can_bus.error_counts
+
+    @property
+    def rx_overflow_count(self):
+        """Receive buffer overflows since initialization"""
+        return self.can_bus.rx_overflow_count
+
+    @property
+    def bus_state_transition_count(self):
+        """Bus state changes since initialization"""
+        return self.can_bus.bus_state_transition_count
+
+    def send(self, message) -> bool:
+        """Queue a frame for the bus"""
+        return self.can_bus.send(message)
+
+    def set_filters(self, matches):
+        """Receive only frames passing one of the matches.
+
+        The MCP2515 has slots for 2 masks and 6 filters, see `CANDevice.start_listener`.
+        """
+        if self.listener is not None:
+            # start from free mask and filter slots
+            self.can_bus.deinit_filtering_registers()
+        self.listener = self.can_bus.listen(matches=matches, timeout=0.9)
+
+    def in_waiting(self) -> int:
+        """Number of received frames waiting"""
+        if self.listener is None:
+            return 0
+        return self.listener.in_waiting()
+
+    def receive(self):
+        """The next received frame, None when there is none"""
+        return self.listener.receive()
+
+    def read_raw_frames(self, buffer, start=0, end=None, stride=REGISTER_FRAME_SIZE) -> int:
+        """Burst read both receive buffers straight into buffer, see `CANTransport`"""
+        return self.can_bus.read_raw_frames(buffer, start, end, stride)
+
+    def deinit(self):
+        """Release the controller"""
+        if self.listener is not None:
+            self.listener.deinit()
+            self.listener = None
+        self.can_bus.deinit()
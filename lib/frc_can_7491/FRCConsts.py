@@ -6,6 +6,20 @@ class FRCAppId:  # pylint: disable=too-few-public-methods
     heartbeat: int = 0x61
 
 
+class FRCReservedApi:  # pylint: disable=too-few-public-methods
+    """FRCReservedApi Class"""
+
+    # API IDs at the top of the 10 bit range are used by this library.
+    # Keep application API IDs below these.
+    EnumerateReply: int = 0x3F0
+    ProfileQuery: int = 0x3F1
+    ProfileReply: int = 0x3F2
+    TelemetryRequest: int = 0x3F3
+    TelemetryBus: int = 0x3F4
+    TelemetryLoop: int = 0x3F5
+    TelemetryLag: int = 0x3F6
+
+
 class FRCDeviceType:  # pylint: disable=too-few-public-methods
     """FRCDeviceType Class"""
 
@@ -69,11 +83,50 @@ class FRCMask:  # pylint: disable=too-few-public-methods
     #   1 = must match filter on this bit
     #   0 = ignore this bit
     type_mfg_num = (
-        0b1111111111110000000000111111  # match everything but Class and Index
+        0b11111111111110000000000111111  # match everything but Class and Index
     )
-    num_mask = 0b0000000000000000000000111111  # match only device number
-    api_class = 0b0000000000001111110000000000  # match only Class
-    # exact_match      = 0b1111111111111111111111111111 # match everything exactly
+    num_mask = 0b00000000000000000000000111111  # match only device number
+    api_class = 0b00000000000001111110000000000  # match only Class
+    # exact_match      = 0b11111111111111111111111111111 # match everything exactly
+
+    # fields of the 29 bit id, split with (id & mask) >> shift
+    # see https://docs.wpilib.org/en/stable/docs/software/can-devices/can-addressing.html
+    device_type = 0b11111000000000000000000000000  # bits 28-24
+    mfg_code = 0b00000111111110000000000000000  # bits 23-16
+    api = 0b00000000000001111111111000000  # bits 15-6
+    api_index = 0b00000000000000000001111000000  # bits 9-6
+    device_number = 0b00000000000000000000000111111  # bits 5-0
+    device_type_shift = 24
+    mfg_code_shift = 16
+    api_shift = 6
+    api_class_shift = 10
+    api_index_shift = 6
+
+
+class FRCHeartbeatMask:  # pylint: disable=too-few-public-methods
+    """FRCHeartbeatMask Class"""
+
+    # fields of the 8 byte heartbeat read as one little endian integer,
+    # split with (data & mask) >> shift
+    match_time = 0xFF << 56  # bits 63-56
+    match_number = 0x3FF << 46  # bits 55-46
+    replay_number = 0x3F << 40  # bits 45-40
+    tournament_type = 0x7 << 37  # bits 39-37
+    system_watchdog = 1 << 36
+    test_mode = 1 << 35
+    auto_mode = 1 << 34
+    enabled = 1 << 33
+    red_alliance = 1 << 32
+    # bits 31-0 hold the date and time, not decoded
+    match_time_shift = 56
+    match_number_shift = 46
+    replay_number_shift = 40
+    tournament_type_shift = 37
+    system_watchdog_shift = 36
+    test_mode_shift = 35
+    auto_mode_shift = 34
+    enabled_shift = 33
+    red_alliance_shift = 32
 
 
 class FRCFilter:  # pylint: disable=too-few-public-methods
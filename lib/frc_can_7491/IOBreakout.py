@@ -0,0 +1,220 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.IOBreakout`
+====================================================
+IO breakout profile: sample analog and digital pins at a fixed rate and publish
+them as packed status frames.
+
+* Author(s): Karl Fleischmann
+"""
+from array import array
+from struct import pack_into
+
+from .Ticks import ticks_ms, ticks_add, ticks_diff
+
+
+class IOBreakout:  # pylint: disable=too-many-instance-attributes
+    """IOBreakout Class
+
+    ``sample()`` is called every ``sample_period_ms`` (as a scheduler task). Every
+    ``decimation`` samples are reduced to one, averaged or the latest sample, and
+    stored in a preallocated ring buffer of ``history`` entries.
+
+    Every ``publish_period_ms`` the newest entry is sent: analog channels four
+    per frame as ``<HHHH`` on ``analog_api``, ``analog_api + 1``, ... and the
+    digital inputs as ``<HHHBB`` on ``digital_api``: state (bit n = input n
+    high), rising and falling edges seen since the last frame, sequence and the
+    number of samples taken since the last frame. Edges are latched so a beam
+    break shorter than the publish period is still reported.
+    """
+
+    ANALOG_FORMAT = "<HHHH"
+    DIGITAL_FORMAT = "<HHHBB"
+    CHANNELS_PER_FRAME = 4
+    MAX_DIGITAL = 16
+
+    def __init__(
+        self,
+        device,
+        analog_pins=(),
+        digital_pins=(),
+        analog_api: int = None,
+        digital_api: int = None,
+        sample_period_ms: int = 5,
+        decimation: int = 1,
+        average: bool = True,
+        publish_period_ms: int = 20,
+        history: int = 32,
+    ) -> None:
+        # pylint: disable=import-outside-toplevel
+        from analogio import AnalogIn
+        from digitalio import DigitalInOut, Direction, Pull
+
+        if len(digital_pins) > IOBreakout.MAX_DIGITAL:
+            raise ValueError("At most 16 digital inputs")
+
+        self.device = device
+        self.analog = [AnalogIn(pin) for pin in analog_pins]
+        self.digital = []
+        for pin in digital_pins:
+            digital = DigitalInOut(pin)
+            digital.direction = Direction.INPUT
+            digital.pull = Pull.UP
+            self.digital.append(digital)
+
+        self.analog_api = analog_api
+        self.digital_api = digital_api
+        self.sample_period_ms = sample_period_ms
+        self.decimation = max(1, decimation)
+        self.average = average
+        self.publish_period_ms = publish_period_ms
+
+        channels = len(self.analog)
+        self.channels = channels
+        self.history = history
+        self.analog_ring = array("H", [0] * (channels * history))
+        self.digital_ring = array("H", [0] * history)
+        self.head = 0
+        self.count = 0
+
+        # decimation accumulators
+        self.sums = array("L", [0] * channels)
+        self.accumulated = 0
+
+        self.state = 0
+        self.rising = 0
+        self.falling = 0
+        self.samples_since_publish = 0
+        self.sequence = 0
+        self.next_publish = ticks_ms()
+
+        self.analog_frames = [bytearray(8) for _ in range((channels + 3) // 4)]
+        self.digital_frame = bytearray(8)
+        self.values = [0, 0, 0, 0]
+        self.samples = 0
+        self.frames_sent = 0
+
+    def read_digital(self) -> int:
+        """Read every digital input into one bitfield"""
+        state = 0
+        bit = 1
+        for digital in self.digital:
+            if digital.value:
+                state |= bit
+            bit <<= 1
+        return state
+
+    def sample(self):
+        """Take one sample of every input, store and publish when due"""
+        state = self.read_digital()
+        changed = state ^ self.state
+        self.rising |= changed & state
+        self.falling |= changed & self.state
+        self.state = state
+
+        sums = self.sums
+        if self.average:
+            for index, analog in enumerate(self.analog):
+                sums[index] += analog.value
+        elif self.accumulated == self.decimation - 1:
+            # only the sample that is kept needs reading
+            for index, analog in enumerate(self.analog):
+                sums[index] = analog.value
+        self.accumulated += 1
+        self.samples += 1
+        self.samples_since_publish += 1
+
+        if self.accumulated >= self.decimation:
+            self.store()
+
+        now = ticks_ms()
+        if ticks_diff(now, self.next_publish) >= 0:
+            self.publish()
+            self.next_publish = ticks_add(now, self.publish_period_ms)
+
+    def store(self):
+        """Reduce the accumulated samples into the next ring buffer entry"""
+        sums = self.sums
+        channels = self.channels
+        offset = self.head * channels
+        divisor = self.accumulated if self.average else 1
+        for index in range(channels):
+            self.analog_ring[offset + index] = sums[index] // divisor
+            sums[index] = 0
+        self.digital_ring[self.head] = self.state
+        self.accumulated = 0
+        self.head = (self.head + 1) % self.history
+        if self.count < self.history:
+            self.count += 1
+
+    @property
+    def publish_frames(self) -> int:
+        """Frames sent every publish_period_ms"""
+        frames = len(self.analog_frames) if self.analog_api is not None else 0
+        if self.digital_api is not None and self.digital:
+            frames += 1
+        return frames
+
+    def latest(self, channel: int) -> int:
+        """Newest stored value of an analog channel"""
+        if not self.count:
+            return 0
+        return self.analog_ring[((self.head - 1) % self.history) * self.channels + channel]
+
+    def read_history(self, channel: int, out) -> int:
+        """Copy stored values of an analog channel (or the digital state for -1),
+        oldest first, into out. Returns the number copied"""
+        count = min(self.count, len(out))
+        start = self.head - count
+        for index in range(count):
+            entry = (start + index) % self.history
+            if channel < 0:
+                out[index] = self.digital_ring[entry]
+            else:
+                out[index] = self.analog_ring[entry * self.channels + channel]
+        return count
+
+    def publish(self):
+        """Send the newest values"""
+        if not self.count:
+            return
+        if self.analog_api is not None:
+            offset = ((self.head - 1) % self.history) * self.channels
+            ring = self.analog_ring
+            for page, frame in enumerate(self.analog_frames):
+                first = page * IOBreakout.CHANNELS_PER_FRAME
+                values = self.values
+                for index in range(4):
+                    channel = first + index
+                    values[index] = ring[offset + channel] if channel < self.channels else 0
+                pack_into(IOBreakout.ANALOG_FORMAT, frame, 0, *values)
+                self.device.send_message_simple(self.analog_api + page, frame)
+                self.frames_sent += 1
+
+        if self.digital_api is not None and self.digital:
+            pack_into(
+                IOBreakout.DIGITAL_FORMAT,
+                self.digital_frame,
+                0,
+                self.state,
+                self.rising,
+                self.falling,
+                self.sequence,
+                min(self.samples_since_publish, 0xFF),
+            )
+            self.device.send_message_simple(self.digital_api, self.digital_frame)
+            self.frames_sent += 1
+
+        self.rising = 0
+        self.falling = 0
+        self.samples_since_publish = 0
+        self.sequence = (self.sequence + 1) & 0xFF
+
+    def deinit(self):
+        """Release the pins"""
+        for pin in self.analog:
+            pin.deinit()
+        for pin in self.digital:
+            pin.deinit()
@@ -0,0 +1,160 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.InputMonitor`
+====================================================
+Button and digital input events packed into compact CAN frames.
+
+* Author(s): Karl Fleischmann
+"""
+from struct import pack_into
+
+try:
+    import keypad
+except ImportError:
+    keypad = None
+
+from .Ticks import ticks_ms, ticks_add, ticks_diff
+
+
+class InputFlags:  # pylint: disable=too-few-public-methods
+    """InputFlags Class"""
+
+    Press = 0x01
+    Release = 0x02
+    LongPress = 0x04
+    DoublePress = 0x08
+
+
+class InputMonitor:  # pylint: disable=too-many-instance-attributes
+    """InputMonitor Class
+
+    Reads events from a ``keypad`` scanner (``Keys``, ``KeyMatrix`` or
+    ``ShiftRegisterKeys``, which also debounce the inputs) and classifies them as
+    press, release, long press (held for ``long_press_ms``) and double press (a
+    second press within ``double_press_ms`` of the previous one), timed with the
+    ``keypad`` event timestamps rather than when they were polled.
+
+    Everything that happens in a change window goes out as one frame ``<HHHH``
+    of bit masks, bit n for input n: state (pressed), changed (pressed or
+    released in the window), long press and double press. A burst on any number
+    of inputs costs one frame. Windows are sent at most once every
+    ``min_interval_ms``, which should be longer than the poll period so events
+    from several polls share a frame. Up to 16 inputs are reported.
+    """
+
+    FRAME_FORMAT = "<HHHH"
+    MAX_INPUTS = 16
+
+    def __init__(
+        self,
+        device,
+        api_id: int,
+        keys,
+        long_press_ms: int = 600,
+        double_press_ms: int = 300,
+        min_interval_ms: int = 50,
+    ) -> None:
+        self.device = device
+        self.api_id = api_id
+        self.keys = keys
+        self.event = keypad.Event() if keypad is not None else None
+        self.long_press_ms = long_press_ms
+        self.double_press_ms = double_press_ms
+        self.min_interval_ms = min_interval_ms
+
+        self.state = 0
+        self.pressed_at = [None] * InputMonitor.MAX_INPUTS
+        self.long_sent = 0
+        self.last_press = [None] * InputMonitor.MAX_INPUTS
+
+        # inputs with each kind of event in the current window
+        self.changed = 0
+        self.long_pressed = 0
+        self.double_pressed = 0
+        self.next_send = ticks_ms()
+        self.frame = bytearray(8)
+        self.frames_sent = 0
+        self.events_seen = 0
+
+    def note(self, key: int, flag: int):
+        """Add an event to the current change window"""
+        bit = 1 << key
+        if flag & (InputFlags.Press | InputFlags.Release):
+            self.changed |= bit
+        if flag & InputFlags.LongPress:
+            self.long_pressed |= bit
+        if flag & InputFlags.DoublePress:
+            self.double_pressed |= bit
+        self.events_seen += 1
+
+    def handle(self, key: int, pressed: bool, when: int):
+        """Classify one key event, when is the event's timestamp"""
+        if key >= InputMonitor.MAX_INPUTS:
+            return
+        bit = 1 << key
+        if pressed:
+            self.state |= bit
+            self.pressed_at[key] = when
+            self.long_sent &= ~bit
+            flag = InputFlags.Press
+            last = self.last_press[key]
+            if last is not None and ticks_diff(when, last) <= self.double_press_ms:
+                flag |= InputFlags.DoublePress
+                # a third quick press starts a new pair
+                self.last_press[key] = None
+            else:
+                self.last_press[key] = when
+            self.note(key, flag)
+        else:
+            self.state &= ~bit
+            self.pressed_at[key] = None
+            self.note(key, InputFlags.Release)
+
+    def poll(self):
+        """Read pending input events, check long presses and send a frame if one is due"""
+        now = ticks_ms()
+        event = self.event
+        events = self.keys.events
+        if event is not None:
+            while events.get_into(event):
+                self.handle(event.key_number, event.pressed, event.timestamp)
+        else:
+            event = events.get()
+            while event:
+                self.handle(event.key_number, event.pressed, event.timestamp)
+                event = events.get()
+
+        # long presses are reported once, while the input is still held
+        held = self.state & ~self.long_sent
+        key = 0
+        while held:
+            if held & 1:
+                pressed_at = self.pressed_at[key]
+                if pressed_at is not None and ticks_diff(now, pressed_at) >= self.long_press_ms:
+                    self.long_sent |= 1 << key
+                    self.note(key, InputFlags.LongPress)
+            held >>= 1
+            key += 1
+
+        if (self.changed or self.long_pressed) and ticks_diff(now, self.next_send) >= 0:
+            self.send(now)
+
+    def send(self, now: int):
+        """Send the change window as one frame"""
+        pack_into(
+            InputMonitor.FRAME_FORMAT,
+            self.frame,
+            0,
+            self.state,
+            self.changed,
+            self.long_pressed,
+            self.double_pressed,
+        )
+        self.device.send_message_simple(self.api_id, self.frame)
+        self.frames_sent += 1
+        self.changed = 0
+        self.long_pressed = 0
+        self.double_pressed = 0
+        self.next_send = ticks_add(now, self.min_interval_ms)
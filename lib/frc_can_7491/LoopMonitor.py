@@ -0,0 +1,165 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.LoopMonitor`
+====================================================
+asyncio event loop lag and task overrun monitor.
+
+* Author(s): Karl Fleischmann
+"""
+import asyncio
+from struct import pack_into
+
+from .RingLogger import LogEvent
+from .Ticks import ticks_ms, ticks_add, ticks_diff
+
+# lag histogram bucket upper limits in ms, the last bucket counts everything above
+LAG_LIMITS_MS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class LoopMonitor:
+    """LoopMonitor Class
+
+    Sleeps for ``period_ms`` at a time and measures how late it wakes up. A late
+    wake means something held the loop (a long ``show()``, a print over USB, a slow
+    handler). Recording a sample is one histogram increment, percentiles are only
+    worked out when the stats are read.
+
+    If a `Scheduler` is given, the task with the longest run time and the total
+    overruns are reported with the lag.
+
+    Attaching to a `CANDevice` logs lag over ``warn_ms`` to the device's log and
+    adds a TelemetryLag frame to its telemetry ``<HBBBBH``: max lag (ms),
+    p50 lag (ms), p99 lag (ms), index of the slowest task, slowest task max run
+    time (ms), task overruns. Every field covers the window since the previous
+    frame, like the other telemetry frames.
+    """
+
+    LAG_FORMAT = "<HBBBBH"
+
+    def __init__(self, device=None, scheduler=None, period_ms: int = 10, warn_ms: int = 50):
+        self.device = device
+        self.scheduler = scheduler
+        self.period_ms = period_ms
+        self.warn_ms = warn_ms
+        self.histogram = [0] * (len(LAG_LIMITS_MS) + 1)
+        self.samples = 0
+        self.lag_max_ms = 0
+        # scheduler overruns when the window started
+        self.overruns_seen = 0
+        self.lag_frame = bytearray(8)
+        if device is not None:
+            device.attach_loop_monitor(self)
+            device.log.register(LogEvent.LoopLag, "Event loop lag {0}ms (period {1}ms)")
+            device.log.set_rate_limit(LogEvent.LoopLag, 1000)
+
+    def record(self, lag_ms: int):
+        """Add one lag sample"""
+        self.samples += 1
+        if lag_ms > self.lag_max_ms:
+            self.lag_max_ms = lag_ms
+        bucket = 0
+        for limit in LAG_LIMITS_MS:
+            if lag_ms <= limit:
+                break
+            bucket += 1
+        self.histogram[bucket] += 1
+
+        if lag_ms > self.warn_ms and self.device is not None:
+            self.device.log.warning(LogEvent.LoopLag, lag_ms, self.period_ms)
+
+    def percentile(self, percent: int):
+        """Upper bound of the bucket holding the given percentile of lag samples (ms)"""
+        if self.samples == 0:
+            return 0
+        wanted = (self.samples * percent + 99) // 100
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= wanted:
+                if bucket < len(LAG_LIMITS_MS):
+                    return min(LAG_LIMITS_MS[bucket], self.lag_max_ms)
+                return self.lag_max_ms
+        return self.lag_max_ms
+
+    def slowest_task(self):
+        """(index, task) of the scheduler task with the longest run in the window, or (0, None)"""
+        if self.scheduler is None:
+            return 0, None
+        slowest = None
+        slowest_index = 0
+        for index, task in enumerate(self.scheduler.tasks):
+            if slowest is None or task.window_max_us > slowest.window_max_us:
+                slowest = task
+                slowest_index = index
+        return slowest_index, slowest
+
+    def total_overruns(self) -> int:
+        """Overruns of every scheduler task since its stats were reset"""
+        overruns = 0
+        if self.scheduler is not None:
+            for task in self.scheduler.tasks:
+                overruns += task.overruns
+        return overruns
+
+    def window_overruns(self) -> int:
+        """Task overruns in the current window"""
+        overruns = self.total_overruns()
+        if overruns < self.overruns_seen:
+            # the scheduler's stats were reset in the window
+            return overruns
+        return overruns - self.overruns_seen
+
+    def reset(self):
+        """Start a new window"""
+        self.histogram = [0] * (len(LAG_LIMITS_MS) + 1)
+        self.samples = 0
+        self.lag_max_ms = 0
+        self.overruns_seen = self.total_overruns()
+        if self.scheduler is not None:
+            for task in self.scheduler.tasks:
+                task.window_max_us = 0
+
+    def pack(self):
+        """Pack the lag frame for the current window, then start a new one"""
+        index, task = self.slowest_task()
+        pack_into(
+            LoopMonitor.LAG_FORMAT,
+            self.lag_frame,
+            0,
+            min(self.lag_max_ms, 0xFFFF),
+            min(self.percentile(50), 0xFF),
+            min(self.percentile(99), 0xFF),
+            index,
+            0 if task is None else min(task.window_max_us // 1000, 0xFF),
+            min(self.window_overruns(), 0xFFFF),
+        )
+        self.reset()
+        return self.lag_frame
+
+    async def run(self):
+        """Monitor task, run it next to the tasks being watched"""
+        expected = ticks_add(ticks_ms(), self.period_ms)
+        while True:
+            await asyncio.sleep(self.period_ms / 1000)
+            now = ticks_ms()
+            self.record(max(0, ticks_diff(now, expected)))
+            expected = ticks_add(now, self.period_ms)
+
+    def dump(self):
+        """Print the lag stats for the current window to the serial console"""
+        limits = " ".join(f"<={limit}" for limit in LAG_LIMITS_MS)
+        print("******************************************************")
+        print("***  Event Loop Lag (ms)")
+        print("******************************************************")
+        print(f"***  Buckets: {limits} >{LAG_LIMITS_MS[-1]}")
+        print(f"***  {self.histogram}")
+        print(
+            f"***  n={self.samples} max={self.lag_max_ms}"
+            f" p50={self.percentile(50)} p99={self.percentile(99)}"
+        )
+        index, task = self.slowest_task()
+        if task is not None:
+            print(f"***  slowest task: {index} {task}")
+        print("******************************************************")
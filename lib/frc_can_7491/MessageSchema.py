@@ -0,0 +1,234 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.MessageSchema`
+====================================================
+Declarative CAN payload layouts, compiled once into encode/decode tables.
+
+* Author(s): Karl Fleischmann
+"""
+from struct import pack_into, unpack_from
+
+# bytes taken by each struct code, "rgb" is 3 bytes r, g, b read as 0xRRGGBB
+FIELD_SIZES = {"B": 1, "b": 1, "H": 2, "h": 2, "I": 4, "i": 4, "Q": 8, "q": 8, "rgb": 3}
+
+# where a compiled field comes from
+_STRUCT = 0
+_RGB = 1
+_BITS = 2
+
+
+class Field:  # pylint: disable=too-few-public-methods
+    """Field Class
+
+    One payload field, either a little endian struct code (``"B"``, ``"H"``,
+    ``"i"``, ... or ``"rgb"``) at a byte ``offset`` (after the previous byte
+    field when left out), or ``bits`` wide at ``bit`` of the payload read as one
+    little endian integer (the roboRIO heartbeat layout).
+
+    Decoded values are multiplied by ``scale``, a raw 0 decodes as ``default``
+    when one is given (so short payloads pick the defaults).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        code: str = "B",
+        offset: int = None,
+        *,
+        bit: int = None,
+        bits: int = None,
+        scale=None,
+        default=None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        if bit is None and code not in FIELD_SIZES:
+            raise ValueError(f"Unknown field code {code}")
+        self.name = name
+        self.code = code
+        self.offset = offset
+        self.bit = bit
+        self.bits = bits
+        self.scale = scale
+        self.default = default
+
+
+class MessageSchema:
+    """MessageSchema Class
+
+    Compiles a field list into one struct format for the byte fields (pad bytes
+    where there are gaps) and a (source, position, mask, scaling) plan per field,
+    the layouts of the firmware's messages are declared with it in
+    `message_schemas`. ``decode`` fills one reused list, ``encode_into`` packs
+    straight into a caller's buffer.
+
+    Payloads shorter than the schema are zero padded before decoding. The
+    fields are only read, the byte offset the schema placed each one at is in
+    ``offsets`` (None for bit fields), so one field list can go in several
+    schemas.
+    """
+
+    def __init__(self, name: str, fields=()) -> None:
+        self.name = name
+        self.fields = tuple(fields)
+        self.names = tuple(field.name for field in self.fields)
+
+        # byte offset of every byte field, after the previous one when left out
+        offsets = []
+        ends = [0]
+        position = 0
+        for field in self.fields:
+            if field.bit is not None:
+                offsets.append(None)
+                ends.append((field.bit + field.bits + 7) // 8)
+                continue
+            offset = position if field.offset is None else field.offset
+            offsets.append(offset)
+            position = offset + FIELD_SIZES[field.code]
+            ends.append(position)
+        self.offsets = tuple(offsets)
+        # byte fields in payload order
+        byte_fields = sorted(
+            (number for number, offset in enumerate(offsets) if offset is not None),
+            key=lambda number: offsets[number],
+        )
+
+        fmt = "<"
+        position = 0
+        index = {}
+        count = 0
+        for number in byte_fields:
+            field = self.fields[number]
+            offset = offsets[number]
+            if offset < position:
+                raise ValueError(f"{name}: {field.name} overlaps the field before it")
+            fmt += "x" * (offset - position)
+            fmt += "BBB" if field.code == "rgb" else field.code
+            index[number] = count
+            count += 3 if field.code == "rgb" else 1
+            position = offset + FIELD_SIZES[field.code]
+        self.format = fmt if count else None
+        self.struct_size = position
+        self.size = max(ends)
+        self.has_bits = any(field.bit is not None for field in self.fields)
+
+        plan = []
+        for number, field in enumerate(self.fields):
+            # a scale like 0.01 is applied as / 100, so 7 decodes as 0.07 exactly
+            multiplier = field.scale
+            divisor = None
+            if multiplier is not None and 0 < multiplier < 1:
+                inverse = round(1 / multiplier)
+                if abs(inverse * multiplier - 1) < 1e-9:
+                    multiplier = None
+                    divisor = inverse
+            if field.bit is not None:
+                source, position, mask = _BITS, field.bit, (1 << field.bits) - 1
+            else:
+                source, position, mask = (_RGB if field.code == "rgb" else _STRUCT), index[number], 0
+            plan.append((source, position, mask, multiplier, divisor, field.default))
+        self.plan = tuple(plan)
+
+        self.values = [0] * len(self.fields)
+        self.raw = [0] * count
+        self.padded = bytearray(max(self.size, 8))
+
+    def pad(self, data):
+        """Copy data into the zero padded scratch buffer"""
+        padded = self.padded
+        length = min(len(data), len(padded))
+        for i in range(len(padded)):
+            padded[i] = data[i] if i < length else 0
+        return padded
+
+    def decode(self, data):
+        """Field values in declaration order, in a list shared by every call"""
+        if len(data) < self.size:
+            data = self.pad(data)
+        raw = unpack_from(self.format, data) if self.format is not None else ()
+        bits = int.from_bytes(data, "little") if self.has_bits else 0
+        values = self.values
+        index = 0
+        for source, position, mask, multiplier, divisor, default in self.plan:
+            if source == _STRUCT:
+                value = raw[position]
+            elif source == _RGB:
+                value = (raw[position] << 16) | (raw[position + 1] << 8) | raw[position + 2]
+            else:
+                value = (bits >> position) & mask
+            if not value and default is not None:
+                value = default
+            elif divisor is not None:
+                value = value / divisor
+            elif multiplier is not None:
+                value = value * multiplier
+            values[index] = value
+            index += 1
+        return values
+
+    def decode_into(self, data, target):
+        """Set every field as an attribute of target, returns target"""
+        values = self.decode(data)
+        index = 0
+        for name in self.names:
+            setattr(target, name, values[index])
+            index += 1
+        return target
+
+    def encode_into(self, buffer, offset: int, *values) -> int:
+        """Pack the field values (declaration order, None for 0) into buffer at
+        offset, returns the payload size"""
+        raw = self.raw
+        bits = 0
+        index = 0
+        for source, position, mask, multiplier, divisor, _ in self.plan:
+            value = values[index]
+            index += 1
+            if value is None:
+                value = 0
+            elif divisor is not None:
+                value = int(round(value * divisor))
+            elif multiplier is not None:
+                value = int(round(value / multiplier))
+            if source == _STRUCT:
+                raw[position] = value
+            elif source == _RGB:
+                raw[position] = (value >> 16) & 0xFF
+                raw[position + 1] = (value >> 8) & 0xFF
+                raw[position + 2] = value & 0xFF
+            else:
+                bits |= (value & mask) << position
+
+        size = self.size
+        if self.format is not None:
+            pack_into(self.format, buffer, offset, *raw)
+            # the struct format ends at the last byte field
+            for position in range(offset + self.struct_size, offset + size):
+                buffer[position] = 0
+        else:
+            for position in range(offset, offset + size):
+                buffer[position] = 0
+        if self.has_bits:
+            for position in range(size):
+                buffer[offset + position] |= (bits >> (8 * position)) & 0xFF
+        return size
+
+    def encode(self, *values) -> bytes:
+        """The payload as bytes, for host tools and tests"""
+        buffer = bytearray(self.size)
+        self.encode_into(buffer, 0, *values)
+        return bytes(buffer)
+
+    def __repr__(self) -> str:
+        """__repr__ function"""
+        return f"MessageSchema({self.name}, {self.size} bytes, {', '.join(self.names)})"
+
+
+def compile_schemas(ids, declarations: dict) -> dict:
+    """Compile {name: fields} into {id: MessageSchema}, the ids looked up by
+    name on ids (e.g. ``enums.API_ID``)"""
+    schemas = {}
+    for name, fields in declarations.items():
+        schemas[getattr(ids, name)] = MessageSchema(name, fields)
+    return schemas
@@ -0,0 +1,179 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.RingLogger`
+====================================================
+Deferred binary ring buffer logger.
+
+Logging a record only packs a timestamp, an event code, a level and three ints
+into a preallocated buffer. Text is formatted later, when the buffer is drained
+from a task that isn't in the CAN receive path.
+
+* Author(s): Karl Fleischmann
+"""
+from struct import pack_into, unpack_from
+
+from .Ticks import ticks_ms, ticks_diff
+
+
+def _i32(value):
+    if value > 0x7FFFFFFF:
+        return 0x7FFFFFFF
+    if value < -0x80000000:
+        return -0x80000000
+    return value
+
+
+class LogLevel:  # pylint: disable=too-few-public-methods
+    """LogLevel Class"""
+
+    DEBUG = 0
+    INFO = 1
+    WARNING = 2
+    ERROR = 3
+
+    names = ("DEBUG", "INFO", "WARN", "ERROR")
+
+
+class LogEvent:  # pylint: disable=too-few-public-methods
+    """LogEvent Class
+
+    Event codes used by the library. Applications should use codes 64 and up.
+    """
+
+    UnroutedHeartbeat = 1
+    UnroutedBroadcast = 2
+    UnroutedDevice = 3
+    RemoteRequest = 4
+    SendError = 5
+    BusInactive = 6
+    LoopLag = 7
+    BusBudget = 8
+
+
+class RingLogger:
+    """RingLogger Class"""
+
+    # ticks_ms, event, level, a, b, c
+    RECORD_FORMAT = "<IBBxxiii"
+    RECORD_SIZE = 20
+
+    def __init__(self, capacity: int = 64, level: int = LogLevel.INFO) -> None:
+        self.capacity = capacity
+        self.level = level
+        self.buffer = bytearray(capacity * RingLogger.RECORD_SIZE)
+        self.head = 0
+        self.count = 0
+        self.overwritten = 0
+
+        self.formats = {}
+        self.rate_limits = {}
+        self.last_logged = {}
+        self.suppressed = {}
+
+        self.register(LogEvent.UnroutedHeartbeat, "Handler Not Defined for FRC Heartbeat messages")
+        self.register(
+            LogEvent.UnroutedBroadcast,
+            "Handler Not Defined for FRC Broadcast messages. Index: {1}",
+        )
+        self.register(
+            LogEvent.UnroutedDevice,
+            "Handler Not Defined. API ID: {1:#x} Message Type: {2} ID: {0:#x}",
+        )
+        self.register(LogEvent.RemoteRequest, "RTR ID: {0:#x} length: {1}")
+        self.register(LogEvent.SendError, "Unexpected error sending ID: {0:#x}")
+        self.register(LogEvent.BusInactive, "CAN Bus is not active. Bus State: {0}")
+        for event in (
+            LogEvent.UnroutedHeartbeat,
+            LogEvent.UnroutedBroadcast,
+            LogEvent.UnroutedDevice,
+        ):
+            self.set_rate_limit(event, 1000)
+
+    def register(self, event: int, fmt: str):
+        """Set the format string used when an event is drained.
+        ``{0}``, ``{1}`` and ``{2}`` are the record's three ints."""
+        self.formats[event] = fmt
+
+    def set_rate_limit(self, event: int, interval_ms: int):
+        """Log an event at most once every interval_ms, extra records are only counted"""
+        self.rate_limits[event] = interval_ms
+
+    def log(self, level: int, event: int, a: int = 0, b: int = 0, c: int = 0):
+        """Add a record to the ring, overwriting the oldest one when full.
+        The ints saturate at the 32 bit signed range of the record."""
+        if level < self.level:
+            return
+
+        now = ticks_ms()
+        interval_ms = self.rate_limits.get(event)
+        if interval_ms is not None:
+            last = self.last_logged.get(event)
+            if last is not None and ticks_diff(now, last) < interval_ms:
+                self.suppressed[event] = self.suppressed.get(event, 0) + 1
+                return
+            self.last_logged[event] = now
+
+        index = (self.head + self.count) % self.capacity
+        if self.count == self.capacity:
+            self.head = (self.head + 1) % self.capacity
+            self.overwritten += 1
+        else:
+            self.count += 1
+        pack_into(
+            RingLogger.RECORD_FORMAT,
+            self.buffer,
+            index * RingLogger.RECORD_SIZE,
+            now,
+            event,
+            level,
+            _i32(a),
+            _i32(b),
+            _i32(c),
+        )
+
+    def debug(self, event: int, a: int = 0, b: int = 0, c: int = 0):
+        """debug function"""
+        self.log(LogLevel.DEBUG, event, a, b, c)
+
+    def info(self, event: int, a: int = 0, b: int = 0, c: int = 0):
+        """info function"""
+        self.log(LogLevel.INFO, event, a, b, c)
+
+    def warning(self, event: int, a: int = 0, b: int = 0, c: int = 0):
+        """warning function"""
+        self.log(LogLevel.WARNING, event, a, b, c)
+
+    def error(self, event: int, a: int = 0, b: int = 0, c: int = 0):
+        """error function"""
+        self.log(LogLevel.ERROR, event, a, b, c)
+
+    def format_record(self, ticks: int, event: int, level: int, a: int, b: int, c: int):
+        """Format a single record as text"""
+        fmt = self.formats.get(event)
+        if fmt is None:
+            text = f"event {event}: {a} {b} {c}"
+        else:
+            text = fmt.format(a, b, c)
+        suppressed = self.suppressed.pop(event, 0)
+        if suppressed:
+            text += f" (+{suppressed} suppressed)"
+        return f"{ticks:>10} {LogLevel.names[level]:<5} {text}"
+
+    def drain(self, limit: int = 0, out=print):
+        """Format and output up to limit records (0 = all), returns the number drained"""
+        if self.overwritten:
+            out(f"{ticks_ms():>10} WARN  log overflow, {self.overwritten} records lost")
+            self.overwritten = 0
+
+        drained = 0
+        while self.count and (limit <= 0 or drained < limit):
+            record = unpack_from(
+                RingLogger.RECORD_FORMAT, self.buffer, self.head * RingLogger.RECORD_SIZE
+            )
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+            out(self.format_record(*record))
+            drained += 1
+        return drained
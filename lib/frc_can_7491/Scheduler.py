@@ -0,0 +1,231 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.Scheduler`
+====================================================
+Deadline based cooperative scheduler for firmware tasks.
+
+* Author(s): Karl Fleischmann
+"""
+from time import monotonic_ns
+import asyncio
+
+from .Ticks import ticks_ms, ticks_add, ticks_diff
+
+
+class ScheduledTask:  # pylint: disable=too-many-instance-attributes
+    """ScheduledTask Class"""
+
+    def __init__(
+        self,
+        name: str,
+        func,
+        period_ms: int,
+        priority: int = 0,
+        deadline_ms: int = None,
+        pending=None,
+    ) -> None:
+        self.name = name
+        self.func = func
+        self.period_ms = period_ms
+        self.priority = priority
+        self.deadline_ms = period_ms if deadline_ms is None else deadline_ms
+        # optional callable, True when the task has work waiting before its release
+        self.pending = pending
+        self.next_release = ticks_ms()
+
+        self.runs = 0
+        self.early_runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.late_max_ms = 0
+        self.run_max_us = 0
+        self.run_total_us = 0
+        # longest run since the window was last reset (LoopMonitor's lag frame)
+        self.window_max_us = 0
+
+    @property
+    def run_mean_us(self):
+        """run_mean_us property"""
+        if self.runs == 0:
+            return 0
+        return self.run_total_us // self.runs
+
+    def reset_stats(self):
+        """reset_stats function"""
+        self.runs = 0
+        self.early_runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.late_max_ms = 0
+        self.run_max_us = 0
+        self.run_total_us = 0
+        self.window_max_us = 0
+
+    def __repr__(self) -> str:
+        """__repr__ function"""
+        return (
+            f"ScheduledTask({self.name}, runs={self.runs}, overruns={self.overruns},"
+            f" skipped={self.skipped}, late_max_ms={self.late_max_ms},"
+            f" run_mean_us={self.run_mean_us}, run_max_us={self.run_max_us})"
+        )
+
+
+class Scheduler:
+    """Scheduler Class
+
+    Runs periodic tasks from a single asyncio task. Each task is released every
+    ``period_ms`` on a fixed grid, so time spent running doesn't add drift, and
+    should finish within ``deadline_ms`` of its release. When several tasks are
+    released the highest priority one runs first, ties go to the earliest deadline.
+
+    Between tasks, a higher priority task whose ``pending()`` returns True is run
+    straight away even if it isn't released yet. Used with
+    `CANDevice.frames_pending` this lets CAN servicing cut in ahead of LED
+    rendering whenever frames are waiting.
+
+    With a `BusLoad` (e.g. ``CANDevice.bus_load``), tasks that send frames
+    declare them with ``can_frames`` (per ``can_period_ms``, the task period
+    by default) and a warning is logged when they would exceed the bus budget.
+    """
+
+    def __init__(self, bus_load=None) -> None:
+        self.tasks = []
+        self.bus_load = bus_load
+
+    def add(
+        self,
+        name: str,
+        func,
+        period_ms: int,
+        priority: int = 0,
+        deadline_ms: int = None,
+        pending=None,
+        can_frames: int = 0,
+        can_period_ms: int = None,
+    ) -> ScheduledTask:
+        """Add a task, func is called with no arguments"""
+        # pylint: disable=too-many-arguments
+        task = ScheduledTask(name, func, period_ms, priority, deadline_ms, pending)
+        if can_frames and self.bus_load is not None:
+            self.bus_load.add_periodic(
+                name, can_frames, period_ms if can_period_ms is None else can_period_ms
+            )
+        self.tasks.append(task)
+        # keep the list in priority order so the first released task wins ties
+        self.tasks.sort(key=lambda item: -item.priority)
+        return task
+
+    def next_task(self, now: int):
+        """Pick the task to run next, or None if nothing is released"""
+        best = None
+        best_deadline = 0
+        for task in self.tasks:
+            if ticks_diff(now, task.next_release) < 0:
+                continue
+            deadline = ticks_diff(ticks_add(task.next_release, task.deadline_ms), now)
+            if best is None or (task.priority == best.priority and deadline < best_deadline):
+                best = task
+                best_deadline = deadline
+            elif task.priority < best.priority:
+                break
+        return best
+
+    def urgent_task(self, priority: int):
+        """A higher priority task with work pending, checked at task boundaries"""
+        for task in self.tasks:
+            if task.priority <= priority:
+                return None
+            if task.pending is not None and task.pending():
+                return task
+        return None
+
+    @staticmethod
+    def run_task(task: ScheduledTask, now: int, released: bool):
+        """Run one task and update its stats"""
+        started_ns = monotonic_ns()
+        task.func()
+        run_us = (monotonic_ns() - started_ns) // 1000
+        finished = ticks_ms()
+
+        task.runs += 1
+        task.run_total_us += run_us
+        if run_us > task.window_max_us:
+            task.window_max_us = run_us
+            if run_us > task.run_max_us:
+                task.run_max_us = run_us
+
+        if not released:
+            task.early_runs += 1
+            return
+
+        late_ms = ticks_diff(now, task.next_release)
+        if late_ms > task.late_max_ms:
+            task.late_max_ms = late_ms
+        if ticks_diff(finished, ticks_add(task.next_release, task.deadline_ms)) > 0:
+            task.overruns += 1
+
+        # release on a fixed grid, a task finishing after its next release runs
+        # late on the next pass, whole periods it missed are skipped rather than
+        # caught up on
+        task.next_release = ticks_add(task.next_release, task.period_ms)
+        behind = ticks_diff(finished, task.next_release)
+        if behind >= task.period_ms:
+            missed = behind // task.period_ms
+            task.skipped += missed
+            task.next_release = ticks_add(task.next_release, missed * task.period_ms)
+
+    def wait_ms(self, now: int):
+        """Time until the next release"""
+        wait = None
+        for task in self.tasks:
+            until = ticks_diff(task.next_release, now)
+            if wait is None or until < wait:
+                wait = until
+        return max(0, wait or 0)
+
+    async def run(self):
+        """Run the tasks forever"""
+        now = ticks_ms()
+        for task in self.tasks:
+            task.next_release = now
+
+        while True:
+            now = ticks_ms()
+            task = self.next_task(now)
+            if task is None:
+                await asyncio.sleep(self.wait_ms(now) / 1000)
+                continue
+
+            urgent = self.urgent_task(task.priority)
+            if urgent is not None:
+                Scheduler.run_task(urgent, now, ticks_diff(now, urgent.next_release) >= 0)
+                now = ticks_ms()
+
+            Scheduler.run_task(task, now, True)
+            # task boundary, let anything else on the asyncio loop run
+            await asyncio.sleep(0)
+
+    def dump(self):
+        """Print the per task timing stats to the serial console"""
+        print("******************************************************")
+        print("***  Scheduler Tasks")
+        print("******************************************************")
+        for task in self.tasks:
+            print(
+                f"***  {task.name:<10} p={task.priority} period={task.period_ms}ms"
+                f" runs={task.runs} early={task.early_runs} overruns={task.overruns}"
+                f" skipped={task.skipped} late_max={task.late_max_ms}ms"
+                f" run_mean={task.run_mean_us}us run_max={task.run_max_us}us"
+            )
+        if self.bus_load is not None:
+            bus_load = self.bus_load
+            # peek so printing doesn't restart the window load() reports
+            bits_per_s, load_pct = bus_load.peek()
+            print(
+                f"***  bus        sent={bus_load.frames} frames {bits_per_s}bit/s ({load_pct:.1f}%)"
+                f" periodic worst case {bus_load.periodic_load_pct:.1f}%"
+                f" of {bus_load.budget_pct}% budget"
+            )
+        print("******************************************************")
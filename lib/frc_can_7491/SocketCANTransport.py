@@ -0,0 +1,162 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.SocketCANTransport`
+====================================================
+Linux SocketCAN transport (can0, vcan0, ...) for running `CANDevice` on a
+coprocessor or a laptop.
+
+* Author(s): Karl Fleischmann
+"""
+import socket
+from collections import deque
+from struct import pack, pack_into, unpack_from
+
+from .CANTransport import CANTransport, Message, RemoteTransmissionRequest, BusState
+
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_SFF_MASK = 0x000007FF
+
+# linux/can/raw.h, the socket module doesn't export it
+CAN_RAW_ERR_FILTER = 2
+
+# CAN_ERR_CRTL in can_id, controller status in data[1]
+CAN_ERR_CRTL = 0x00000004
+CAN_ERR_BUSOFF = 0x00000040
+CAN_ERR_CRTL_RX_OVERFLOW = 0x01
+CAN_ERR_CRTL_RX_WARNING = 0x04
+CAN_ERR_CRTL_TX_WARNING = 0x08
+CAN_ERR_CRTL_RX_PASSIVE = 0x10
+CAN_ERR_CRTL_TX_PASSIVE = 0x20
+CAN_ERR_CRTL_ACTIVE = 0x40
+
+
+class SocketCANTransport(CANTransport):
+    """SocketCANTransport Class
+
+    Raw CAN socket bound to ``channel``. Filters are installed in the kernel
+    (``CAN_RAW_FILTER``), error frames are used to follow the bus state.
+    Non-blocking, frames are read into a queue when ``in_waiting()`` is called.
+    """
+
+    FRAME_FORMAT = "=IB3x8s"
+    FRAME_SIZE = 16
+
+    def __init__(self, channel: str = "vcan0") -> None:
+        self.channel = channel
+        self.socket = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        self.socket.setsockopt(
+            socket.SOL_CAN_RAW, CAN_RAW_ERR_FILTER, pack("=I", CAN_ERR_CRTL | CAN_ERR_BUSOFF)
+        )
+        self.socket.bind((channel,))
+        self.socket.setblocking(False)
+
+        self.queue = deque()
+        self.tx_frame = bytearray(SocketCANTransport.FRAME_SIZE)
+        self.rx_frame = bytearray(SocketCANTransport.FRAME_SIZE)
+        self.bus_state = BusState.ERROR_ACTIVE
+        self.rx_overflow_count = 0
+        self.bus_state_transition_count = 0
+
+    @property
+    def state(self):
+        """Bus state, from the controller error frames"""
+        return self.bus_state
+
+    def set_bus_state(self, bus_state):
+        """set_bus_state function"""
+        if bus_state != self.bus_state:
+            self.bus_state = bus_state
+            self.bus_state_transition_count += 1
+
+    def send(self, message) -> bool:
+        """Queue a frame for the bus, False if the socket buffer is full"""
+        can_id = message.id
+        if message.extended:
+            can_id |= CAN_EFF_FLAG
+        if isinstance(message, RemoteTransmissionRequest):
+            can_id |= CAN_RTR_FLAG
+            data = b""
+            length = message.length
+        else:
+            data = message.data
+            length = len(data)
+        pack_into(SocketCANTransport.FRAME_FORMAT, self.tx_frame, 0, can_id, length, data)
+        try:
+            self.socket.send(self.tx_frame)
+        except (BlockingIOError, OSError):
+            return False
+        return True
+
+    def set_filters(self, matches):
+        """Install the matches as kernel filters, no matches receives everything"""
+        filters = bytearray()
+        for match in matches or ():
+            # a mask of 0 is an exact match
+            if match.extended:
+                can_id = match.address | CAN_EFF_FLAG
+                mask = (match.mask or CAN_EFF_MASK) | CAN_EFF_FLAG
+            else:
+                can_id = match.address
+                mask = (match.mask or CAN_SFF_MASK) | CAN_EFF_FLAG
+            filters += pack("=II", can_id, mask)
+        if not filters:
+            # the kernel's default filter, an empty list would receive nothing
+            filters = pack("=II", 0, 0)
+        self.socket.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER, bytes(filters))
+
+    def error_frame(self, can_id: int, data):
+        """Follow the bus state from a controller error frame"""
+        if can_id & CAN_ERR_BUSOFF:
+            self.set_bus_state(BusState.BUS_OFF)
+        elif can_id & CAN_ERR_CRTL:
+            status = data[1]
+            if status & CAN_ERR_CRTL_RX_OVERFLOW:
+                self.rx_overflow_count += 1
+            if status & (CAN_ERR_CRTL_RX_PASSIVE | CAN_ERR_CRTL_TX_PASSIVE):
+                self.set_bus_state(BusState.ERROR_PASSIVE)
+            elif status & (CAN_ERR_CRTL_RX_WARNING | CAN_ERR_CRTL_TX_WARNING):
+                self.set_bus_state(BusState.ERROR_WARNING)
+            elif status & CAN_ERR_CRTL_ACTIVE:
+                self.set_bus_state(BusState.ERROR_ACTIVE)
+
+    def read_socket(self):
+        """Move every frame waiting in the socket into the queue"""
+        frame = self.rx_frame
+        while True:
+            try:
+                if self.socket.recv_into(frame) < SocketCANTransport.FRAME_SIZE:
+                    continue
+            except (BlockingIOError, InterruptedError):
+                return
+            can_id, length, data = unpack_from(SocketCANTransport.FRAME_FORMAT, frame)
+            if can_id & CAN_ERR_FLAG:
+                self.error_frame(can_id, data)
+                continue
+            extended = bool(can_id & CAN_EFF_FLAG)
+            frame_id = can_id & (CAN_EFF_MASK if extended else CAN_SFF_MASK)
+            if can_id & CAN_RTR_FLAG:
+                self.queue.append(RemoteTransmissionRequest(frame_id, length, extended=extended))
+            else:
+                self.queue.append(Message(id=frame_id, data=data[:length], extended=extended))
+
+    def in_waiting(self) -> int:
+        """Number of received frames waiting"""
+        self.read_socket()
+        return len(self.queue)
+
+    def receive(self):
+        """The next received frame, None when there is none"""
+        if not self.queue:
+            self.read_socket()
+            if not self.queue:
+                return None
+        return self.queue.popleft()
+
+    def deinit(self):
+        """Close the socket"""
+        self.socket.close()
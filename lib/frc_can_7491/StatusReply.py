@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.StatusReply`
+====================================================
+Binary device status snapshot sent in reply to a status request.
+
+* Author(s): Karl Fleischmann
+"""
+import gc
+from struct import pack_into
+from time import monotonic_ns
+
+from .Ticks import ticks_ms, ticks_diff
+
+
+class StatusReply:
+    """StatusReply Class
+
+    The reply is split into pages, one 8 byte frame each. Byte 0 of every page is
+    ``page index | page count << 4``.
+
+    Page 0 ``<BBHHH``
+        header, flags (bit 0 enabled, bit 1 heartbeat seen), heartbeat age (ms),
+        max loop period since boot (ms), firmware version (major << 8 | minor)
+    Page 1 ``<BBHHH``
+        header, rx overflows, rx frames, tx frames, tx failures
+    Page 2 ``<BBHI``
+        header, reserved, free memory (KiB), uptime (ms, from ``monotonic_ns()``
+        so it doesn't jump when ``ticks_ms()`` wraps after ~6.2 days)
+
+    Counters wrap and other fields saturate at the field width. Call `refresh()`
+    regularly, each call repacks one page so the cost is the same every time, and
+    `send()` only sends the already packed pages.
+    """
+
+    PAGE_FORMATS = ("<BBHHH", "<BBHHH", "<BBHI")
+    PAGE_COUNT = 3
+
+    FLAG_ENABLED = 0x01
+    FLAG_HEARTBEAT = 0x02
+
+    def __init__(self, device, api_id: int, firmware_version=(0, 0)) -> None:
+        self.device = device
+        self.api_id = api_id
+        self.version = ((firmware_version[0] & 0xFF) << 8) | (firmware_version[1] & 0xFF)
+        self.pages = [bytearray(8) for _ in range(StatusReply.PAGE_COUNT)]
+        self.next_page = 0
+
+        self.enabled = False
+        self.heartbeat_seen = False
+        # None once the age saturates, so the ticks wrap can't make it look recent
+        self.heartbeat_ticks = None
+
+        for _ in range(StatusReply.PAGE_COUNT):
+            self.refresh()
+
+    def set_enabled(self, enabled: bool):
+        """set_enabled function"""
+        self.enabled = enabled
+
+    def heartbeat(self):
+        """Record that a robot heartbeat was just received"""
+        self.heartbeat_seen = True
+        self.heartbeat_ticks = ticks_ms()
+
+    def refresh(self):
+        """Repack the next page from the current device state"""
+        page = self.next_page
+        self.next_page = (page + 1) % StatusReply.PAGE_COUNT
+        header = page | (StatusReply.PAGE_COUNT << 4)
+        device = self.device
+
+        if page == 0:
+            flags = StatusReply.FLAG_ENABLED if self.enabled else 0
+            if self.heartbeat_seen:
+                flags |= StatusReply.FLAG_HEARTBEAT
+            heartbeat_age_ms = 0xFFFF
+            if self.heartbeat_ticks is not None:
+                age_ms = ticks_diff(ticks_ms(), self.heartbeat_ticks)
+                if 0 <= age_ms < 0xFFFF:
+                    heartbeat_age_ms = age_ms
+                else:
+                    # saturated (ticks_diff goes negative past half the ticks range)
+                    self.heartbeat_ticks = None
+            pack_into(
+                StatusReply.PAGE_FORMATS[0],
+                self.pages[0],
+                0,
+                header,
+                flags,
+                heartbeat_age_ms,
+                min(device.loop_period_peak_us // 1000, 0xFFFF),
+                self.version,
+            )
+        elif page == 1:
+            pack_into(
+                StatusReply.PAGE_FORMATS[1],
+                self.pages[1],
+                0,
+                header,
+                min(device.transport.rx_overflow_count, 0xFF),
+                device.rx_count & 0xFFFF,
+                device.tx_count & 0xFFFF,
+                device.tx_fail_count & 0xFFFF,
+            )
+        else:
+            try:
+                free_kib = min(gc.mem_free() // 1024, 0xFFFF)
+            except AttributeError:
+                # CPython's gc has no mem_free()
+                free_kib = 0
+            pack_into(
+                StatusReply.PAGE_FORMATS[2],
+                self.pages[2],
+                0,
+                header,
+                0,
+                free_kib,
+                (monotonic_ns() // 1_000_000) & 0xFFFFFFFF,
+            )
+
+    def send(self):
+        """Send every page, page 0 first"""
+        for page in self.pages:
+            self.device.send_message_simple(self.api_id, page)
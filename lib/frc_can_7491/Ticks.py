@@ -0,0 +1,35 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.Ticks`
+====================================================
+Wrapping millisecond tick helpers used for FRC CAN timing.
+
+* Author(s): Karl Fleischmann
+"""
+try:
+    from supervisor import ticks_ms
+except ImportError:
+    from time import monotonic_ns
+
+    def ticks_ms():
+        """ticks_ms function (host fallback, wraps like supervisor.ticks_ms)"""
+        return (monotonic_ns() // 1_000_000) & TICKS_MAX
+
+
+# supervisor.ticks_ms() wraps every 2**29 ms (~6.2 days)
+TICKS_PERIOD = 1 << 29
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+def ticks_add(ticks, delta):
+    """ticks_add function"""
+    return (ticks + delta) % TICKS_PERIOD
+
+
+def ticks_diff(ticks1, ticks2):
+    """ticks_diff function, returns ticks1 - ticks2 taking the wrap into account"""
+    diff = (ticks1 - ticks2) & TICKS_MAX
+    return ((diff + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
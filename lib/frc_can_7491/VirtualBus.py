@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`frc_can.VirtualBus`
+====================================================
+In-memory CAN bus, connects any number of `CANDevice` instances (and test
+traffic) without hardware.
+
+* Author(s): Karl Fleischmann
+"""
+from collections import deque
+
+from .CANTransport import CANTransport, Message, match_frame
+
+
+class VirtualBus:
+    """VirtualBus Class
+
+    Every frame sent by one transport is delivered, in order and immediately, to
+    every other transport on the bus whose filters accept it.
+    """
+
+    def __init__(self) -> None:
+        self.transports = []
+        self.frame_count = 0
+
+    def transport(self, rx_capacity: int = 64):
+        """Create a transport connected to this bus"""
+        transport = VirtualTransport(self, rx_capacity)
+        self.transports.append(transport)
+        return transport
+
+    def detach(self, transport):
+        """Disconnect a transport"""
+        if transport in self.transports:
+            self.transports.remove(transport)
+
+    def deliver(self, sender, frame):
+        """Hand a frame to every other transport"""
+        self.frame_count += 1
+        for transport in self.transports:
+            if transport is not sender:
+                transport.deliver(frame)
+
+    def inject(self, frame_id: int, data: bytes, extended: bool = True):
+        """Put a frame on the bus that no transport sent, e.g. a heartbeat"""
+        self.deliver(None, Message(id=frame_id, data=data, extended=extended))
+
+
+class VirtualTransport(CANTransport):
+    """VirtualTransport Class
+
+    One node on a `VirtualBus`. Frames arriving while ``rx_capacity`` frames are
+    already waiting are dropped and counted in ``rx_overflow_count``, like the
+    MCP2515 RX buffers overflowing.
+    """
+
+    def __init__(self, bus: VirtualBus, rx_capacity: int = 64) -> None:
+        self.bus = bus
+        self.rx_capacity = rx_capacity
+        self.queue = deque((), rx_capacity)
+        self.matches = None
+        self.listening = False
+        self.rx_overflow_count = 0
+
+    def send(self, message) -> bool:
+        """Deliver a frame to the rest of the bus"""
+        if isinstance(message, Message):
+            # senders reuse their frame buffers, receivers get their own copy
+            message = Message(id=message.id, data=bytes(message.data), extended=message.extended)
+        self.bus.deliver(self, message)
+        return True
+
+    def set_filters(self, matches):
+        """Receive only frames passing one of the matches"""
+        self.matches = matches
+        self.listening = True
+
+    def deliver(self, frame):
+        """Called by the bus for every frame sent by another node"""
+        if not self.listening or not match_frame(self.matches, frame.id, frame.extended):
+            return
+        if len(self.queue) >= self.rx_capacity:
+            self.rx_overflow_count += 1
+            return
+        self.queue.append(frame)
+
+    def in_waiting(self) -> int:
+        """Number of received frames waiting"""
+        return len(self.queue)
+
+    def receive(self):
+        """The next received frame, None when there is none"""
+        if not self.queue:
+            return None
+        return self.queue.popleft()
+
+    def deinit(self):
+        """Leave the bus"""
+        self.bus.detach(self)
@@ -33,8 +33,23 @@ Implementation Notes
 """
 
 from .FRCConsts import *
+from .CANTransport import *
+from .BusLoad import *
+from .VirtualBus import *
 from .CANDevice import *
 from .CANMessage import *
+from .MessageSchema import *
+from .CANCapture import *
+from .CANSniffer import *
+from .CANGateway import *
+from .CANProfiler import *
+from .CANTelemetry import *
+from .RingLogger import *
+from .StatusReply import *
+from .Scheduler import *
+from .LoopMonitor import *
+from .InputMonitor import *
+from .IOBreakout import *
 
 __version__ = "0.0.0-auto.0"
 __repo__ = "https://github.com/karlfl/7491_CircuitPython_FRCCAN.git"
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+Payload layouts of every `enums.API_ID` message.
+
+Each API ID declares its fields once, compiled at import into a
+`frc_can_7491.MessageSchema` (``SCHEMAS[api_id].decode(data)``,
+``.encode_into(buffer, 0, ...)``). The firmware decodes with them and host tools
+(``tools/can_schema.py``) encode and decode with the same tables. All little
+endian, colors are 3 bytes r, g, b.
+
+Pattern speeds are in 10ms units and sizes are the tail length, sparkle count or
+bar size; 0 (or a payload too short to reach the field) selects the pattern's
+default from ``PATTERN_DEFAULTS``.
+"""
+from frc_can_7491 import Field, compile_schemas
+
+from enums import API_ID
+
+# default speed (seconds) and size used when the payload leaves them at 0
+PATTERN_DEFAULTS = {
+    API_ID.PatternChaos: (0.05, 30),
+    API_ID.PatternRainbow: (0.05, 10),
+    API_ID.PatternSolid: (0.1, 0),
+    API_ID.PatternBlink: (0.5, 0),
+    API_ID.PatternIntensity: (0.1, 0),
+    API_ID.PatternScanner: (0.05, 10),
+    API_ID.PatternAlternating: (0.5, 1),
+    API_ID.PatternChase: (0.1, 2),
+}
+
+FLAG_REVERSE = 0x01
+FLAG_BOUNCE = 0x02
+
+
+def speed(api_id: int) -> Field:
+    """Pattern speed field, 10ms units"""
+    return Field("speed", scale=0.01, default=PATTERN_DEFAULTS[api_id][0])
+
+
+def size(api_id: int) -> Field:
+    """Pattern size field"""
+    return Field("size", default=PATTERN_DEFAULTS[api_id][1] or None)
+
+
+SCHEMAS = compile_schemas(
+    API_ID,
+    {
+        "StatusRequest": (),
+        # 16 bit number of pixels in bytes 4-5, brightness (0-255) in byte 6 and
+        # the original 8 bit number of pixels in byte 7 (used when bytes 4-5 are 0)
+        "InitPixelArray": (
+            Field("pixel_count", "H", 4),
+            Field("brightness"),
+            Field("pixel_count_8"),
+        ),
+        "DefineSegment": (Field("index"), Field("start", "H"), Field("count", "H")),
+        "PatternChaos": (
+            Field("segment"),
+            speed(API_ID.PatternChaos),
+            size(API_ID.PatternChaos),
+        ),
+        "PatternRainbow": (
+            Field("segment"),
+            speed(API_ID.PatternRainbow),
+            size(API_ID.PatternRainbow),
+            Field("flags"),
+        ),
+        "PatternSolid": (Field("segment"), Field("color", "rgb")),
+        "PatternBlink": (Field("segment"), Field("color", "rgb"), speed(API_ID.PatternBlink)),
+        "PatternIntensity": (Field("segment"), Field("brightness")),
+        "PatternScanner": (
+            Field("segment"),
+            Field("color", "rgb"),
+            speed(API_ID.PatternScanner),
+            size(API_ID.PatternScanner),
+            Field("flags"),
+        ),
+        "PatternAlternating": (
+            Field("segment"),
+            Field("color", "rgb"),
+            Field("color2", "rgb"),
+            speed(API_ID.PatternAlternating),
+        ),
+        "PatternChase": (
+            Field("segment"),
+            Field("color", "rgb"),
+            speed(API_ID.PatternChase),
+            size(API_ID.PatternChase),
+            Field("flags"),
+        ),
+        # one frame per change window, bit n for input n: pressed, pressed or
+        # released in the window, long press, double press
+        "ButtonPress": (
+            Field("state", "H"),
+            Field("changed", "H"),
+            Field("long_press", "H"),
+            Field("double_press", "H"),
+        ),
+        # pixel streaming, RGB565 colors, see pixel_stream.py
+        "StreamPalette": (Field("index"), Field("color", "rgb")),
+        "StreamRun": (Field("start", "H"), Field("count", "H"), Field("color", "H")),
+        "StreamLiteral": (
+            Field("start", "H"),
+            Field("color0", "H"),
+            Field("color1", "H"),
+            Field("color2", "H"),
+        ),
+        "StreamIndexed": (
+            Field("start", "H"),
+            Field("index0"),
+            Field("index1"),
+            Field("index2"),
+            Field("index3"),
+            Field("index4"),
+            Field("index5"),
+        ),
+        "StreamCommit": (Field("frame_number", "H"),),
+        "StreamStatsRequest": (),
+        # frames per second x10, bus utilization in 0.1%, frames, dropped frames
+        "StreamStatsReply": (
+            Field("fps_x10", "H"),
+            Field("utilization", "H"),
+            Field("frames", "H"),
+            Field("dropped", "H"),
+        ),
+        # see frc_can_7491.IOBreakout
+        "IOAnalogStatus0": tuple(Field(f"analog{channel}", "H") for channel in range(4)),
+        "IOAnalogStatus1": tuple(Field(f"analog{channel}", "H") for channel in range(4, 8)),
+        "IODigitalStatus": (
+            Field("state", "H"),
+            Field("rising", "H"),
+            Field("falling", "H"),
+            Field("sequence"),
+            Field("samples"),
+        ),
+    },
+)
@@ -0,0 +1,151 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+Pattern command payloads.
+
+The payload layout of each pattern API ID is declared in `message_schemas`, and
+every command is decoded into one reused `PatternCommand`. Missing trailing
+bytes read as 0, which selects the pattern's default for that field.
+"""
+from adafruit_led_animation.animation.blink import Blink
+from adafruit_led_animation.animation.chase import Chase
+from adafruit_led_animation.animation.comet import Comet
+from adafruit_led_animation.animation.rainbowcomet import RainbowComet
+from adafruit_led_animation.animation.rainbowsparkle import RainbowSparkle
+from adafruit_led_animation.animation.solid import Solid
+
+from enums import API_ID
+from message_schemas import FLAG_BOUNCE, FLAG_REVERSE, PATTERN_DEFAULTS, SCHEMAS
+
+
+class PatternCommand:
+    """Decoded pattern parameters"""
+
+    def __init__(self) -> None:
+        self.api_id = 0
+        self.segment = 0
+        self.color = 0
+        self.color2 = 0
+        self.speed = 0.0
+        self.size = 0
+        self.brightness = 255
+        self.flags = 0
+
+    @property
+    def reverse(self):
+        """reverse property"""
+        return bool(self.flags & FLAG_REVERSE)
+
+    @property
+    def bounce(self):
+        """bounce property"""
+        return bool(self.flags & FLAG_BOUNCE)
+
+
+class PatternDecoder:
+    """Decodes pattern payloads into a single reused `PatternCommand`"""
+
+    def __init__(self) -> None:
+        self.schemas = {api_id: SCHEMAS[api_id] for api_id in PATTERN_DEFAULTS}
+        self.init_schema = SCHEMAS[API_ID.InitPixelArray]
+        self.segment_schema = SCHEMAS[API_ID.DefineSegment]
+        self.command = PatternCommand()
+
+    def decode_init(self, data):
+        """Decode an InitPixelArray payload into (brightness, number of pixels)"""
+        pixel_count, brightness, pixel_count_8 = self.init_schema.decode(data)
+        return brightness, pixel_count or pixel_count_8
+
+    def decode_segment(self, data):
+        """Decode a DefineSegment payload into [index, start, number of pixels]"""
+        return self.segment_schema.decode(data)
+
+    def decode(self, api_id: int, data):
+        """Decode a payload, returns the shared command or None for unknown API IDs"""
+        schema = self.schemas.get(api_id)
+        if schema is None:
+            return None
+
+        # fields the pattern doesn't have go back to its defaults,
+        # color and brightness are kept
+        command = self.command
+        command.api_id = api_id
+        command.segment = 0
+        command.speed, command.size = PATTERN_DEFAULTS[api_id]
+        command.flags = 0
+        return schema.decode_into(data, command)
+
+
+class Alternating(Chase):
+    """Chase with a second color in the gaps, bars and gaps are the same size"""
+
+    def __init__(self, pixel_object, speed, color, alt_color, size=1, reverse=False):
+        self.alt_color = alt_color
+        super().__init__(pixel_object, speed, color, size=size, spacing=size, reverse=reverse)
+
+    def space_color(self, n, pixel_no=0):  # pylint: disable=unused-argument
+        return self.alt_color
+
+
+def cache_key(command: PatternCommand):
+    """Animation cache key, only the parameters that need a new animation object"""
+    return (command.api_id, command.segment, command.size, command.flags)
+
+
+def build_animation(pixels, command: PatternCommand):
+    """Construct the animation for a command"""
+    api_id = command.api_id
+    if api_id == API_ID.PatternChaos:
+        return RainbowSparkle(pixels, speed=command.speed, num_sparkles=command.size)
+    if api_id == API_ID.PatternRainbow:
+        return RainbowComet(
+            pixels,
+            speed=command.speed,
+            tail_length=command.size,
+            bounce=command.bounce,
+            reverse=command.reverse,
+        )
+    if api_id == API_ID.PatternSolid:
+        return Solid(pixels, color=command.color)
+    if api_id == API_ID.PatternBlink:
+        return Blink(pixels, speed=command.speed, color=command.color)
+    if api_id == API_ID.PatternScanner:
+        return Comet(
+            pixels,
+            speed=command.speed,
+            color=command.color,
+            tail_length=command.size,
+            bounce=True,
+            reverse=command.reverse,
+        )
+    if api_id == API_ID.PatternAlternating:
+        return Alternating(
+            pixels,
+            speed=command.speed,
+            color=command.color,
+            alt_color=command.color2,
+            size=command.size,
+        )
+    if api_id == API_ID.PatternChase:
+        return Chase(
+            pixels,
+            speed=command.speed,
+            color=command.color,
+            size=command.size,
+            reverse=command.reverse,
+        )
+    return None
+
+
+def apply_parameters(animation, command: PatternCommand):
+    """Update the parameters that can change on an existing animation"""
+    if animation.speed != command.speed:
+        animation.speed = command.speed
+    api_id = command.api_id
+    if api_id in (API_ID.PatternChaos, API_ID.PatternRainbow):
+        return
+    if animation.color != command.color:
+        animation.color = command.color
+    if api_id == API_ID.PatternAlternating:
+        animation.alt_color = command.color2
@@ -0,0 +1,166 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+Pixel frame streaming over CAN.
+
+The roboRIO sends only the parts of the image that changed since the previous
+frame, as runs, literals or palette indexes, then a commit. The strip keeps its
+contents between frames, so every frame is a delta from the one before it.
+
+All little endian, colors are RGB565:
+
+StreamPalette ``<BBBB``   palette index, r, g, b
+StreamRun     ``<HHH``    first pixel, number of pixels, color
+StreamLiteral ``<HHHH``   first pixel, then up to 3 colors
+StreamIndexed ``<H6B``    first pixel, then up to 6 palette indexes (255 = leave as is)
+StreamCommit  ``<H``      frame number, the frame is shown on the next render
+"""
+from enums import API_ID
+from frc_can_7491 import BIT_RATE, frame_bits
+from frc_can_7491.Ticks import ticks_ms, ticks_diff
+
+# RGB565 channel expansion to 8 bits
+EXPAND5 = bytes((value << 3) | (value >> 2) for value in range(32))
+EXPAND6 = bytes((value << 2) | (value >> 4) for value in range(64))
+
+PALETTE_SIZE = 255
+PALETTE_SKIP = 255
+
+# a commit up to this many frame numbers behind the last one is a repeat
+COMMIT_REPEAT_WINDOW = 16
+
+
+class PixelStream:
+    """Applies streamed pixel data to a `led_renderer.PixelFrame`
+
+    Bus utilization counts every stream frame with its actual stuff bits, the
+    same `frc_can_7491.frame_bits` model as ``CANDevice.bus_load``, for frames
+    addressed to ``device_id`` (the device's type, manufacturer and number bits,
+    ``CANDevice.device_filter``) on a ``bit_rate`` bus.
+    """
+
+    def __init__(self, device_id: int = 0, bit_rate: int = BIT_RATE) -> None:
+        self.device_id = device_id
+        self.bit_rate = bit_rate
+        self.frame = None
+        self.active = False
+        self.commit_pending = False
+        self.palette = bytearray(3 * PALETTE_SIZE)
+        self.last_frame_number = None
+
+        # stats window
+        self.window_start = ticks_ms()
+        self.frames = 0
+        self.bus_bits = 0
+        self.dropped = 0
+
+    def attach(self, frame):
+        """Stream into a new pixel frame (e.g. after InitPixelArray)"""
+        self.frame = frame
+        self.active = False
+        self.commit_pending = False
+        self.last_frame_number = None
+
+    def stop(self):
+        """Leave streaming mode, animations take the strip back"""
+        self.active = False
+        self.commit_pending = False
+
+    def set_565(self, index: int, color: int):
+        """Set one pixel to an RGB565 color, pixels past the end are ignored"""
+        if index < self.frame.n:
+            self.frame.set_pixel(
+                index,
+                EXPAND5[(color >> 11) & 0x1F],
+                EXPAND6[(color >> 5) & 0x3F],
+                EXPAND5[color & 0x1F],
+            )
+
+    def handle(self, api_id: int, data):
+        """Apply one stream message, the payload bytes are read in place"""
+        if self.frame is None:
+            return
+        self.active = True
+        self.bus_bits += frame_bits(self.device_id | (api_id << 6), data)
+        length = len(data)
+
+        if api_id == API_ID.StreamRun and length >= 6:
+            start = data[0] | (data[1] << 8)
+            count = data[2] | (data[3] << 8)
+            color = data[4] | (data[5] << 8)
+            end = min(start + count, self.frame.n)
+            if start < end:
+                self.frame.fill_range(
+                    start,
+                    end,
+                    (
+                        EXPAND5[(color >> 11) & 0x1F],
+                        EXPAND6[(color >> 5) & 0x3F],
+                        EXPAND5[color & 0x1F],
+                    ),
+                )
+
+        elif api_id == API_ID.StreamLiteral and length >= 4:
+            start = data[0] | (data[1] << 8)
+            for offset in range(2, length - 1, 2):
+                self.set_565(start, data[offset] | (data[offset + 1] << 8))
+                start += 1
+
+        elif api_id == API_ID.StreamIndexed and length >= 3:
+            start = data[0] | (data[1] << 8)
+            palette = self.palette
+            for offset in range(2, length):
+                entry = data[offset]
+                if entry != PALETTE_SKIP and start < self.frame.n:
+                    entry *= 3
+                    self.frame.set_pixel(
+                        start, palette[entry], palette[entry + 1], palette[entry + 2]
+                    )
+                start += 1
+
+        elif api_id == API_ID.StreamPalette and length >= 4:
+            entry = data[0]
+            if entry < PALETTE_SIZE:
+                entry *= 3
+                self.palette[entry] = data[1]
+                self.palette[entry + 1] = data[2]
+                self.palette[entry + 2] = data[3]
+
+        elif api_id == API_ID.StreamCommit and length >= 2:
+            frame_number = data[0] | (data[1] << 8)
+            self.commit_pending = True
+            if self.last_frame_number is not None:
+                step = (frame_number - self.last_frame_number) & 0xFFFF
+                if step == 0 or step > 0xFFFF - COMMIT_REPEAT_WINDOW:
+                    # a repeated or retransmitted commit, shown again but not
+                    # counted as a new frame
+                    return
+                if step < 0x8000:
+                    # frame numbers the host skipped (or that were lost on the bus),
+                    # a bigger jump back is the host starting over
+                    self.dropped += step - 1
+            self.last_frame_number = frame_number
+            self.frames += 1
+
+    def take_commit(self):
+        """True once per committed frame, the renderer shows the strip when it is"""
+        if self.commit_pending:
+            self.commit_pending = False
+            return True
+        return False
+
+    def stats(self):
+        """(frames per second x10, bus utilization in 0.1%, frames, dropped) for the
+        window since the last call"""
+        now = ticks_ms()
+        elapsed_ms = max(1, ticks_diff(now, self.window_start))
+        fps_x10 = self.frames * 10_000 // elapsed_ms
+        utilization = self.bus_bits * 1_000_000 // (elapsed_ms * self.bit_rate)
+        result = (fps_x10, utilization, self.frames, self.dropped)
+
+        self.window_start = now
+        self.frames = 0
+        self.bus_bits = 0
+        self.dropped = 0
+        return result
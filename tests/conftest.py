@@ -0,0 +1,60 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""Host tests for the pure Python parts of the library and the app modules.
+
+Run from the repository root with ``python3 -m pytest -q``.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# code.py (the CircuitPython entry point) and lib/asyncio would shadow the
+# standard library's code and asyncio modules, so the repository goes at the
+# end of the path and python -m pytest's working directory entry is dropped
+sys.path[:] = [path for path in sys.path if path not in ("", ".", ROOT)]
+sys.path.extend((ROOT, os.path.join(ROOT, "lib"), os.path.join(ROOT, "tools")))
+
+# pylint: disable=wrong-import-position
+import types  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+class Strip:
+    """Stands in for the NeoPixel pin, every write to the strip is kept"""
+
+    def __init__(self, monkeypatch) -> None:
+        self.writes = []
+        digitalio = types.ModuleType("digitalio")
+        digitalio.DigitalInOut = Pin
+        digitalio.Direction = types.SimpleNamespace(OUTPUT="output")
+        neopixel_write = types.ModuleType("neopixel_write")
+        neopixel_write.neopixel_write = lambda pin, buffer: self.writes.append(bytes(buffer))
+        monkeypatch.setitem(sys.modules, "digitalio", digitalio)
+        monkeypatch.setitem(sys.modules, "neopixel_write", neopixel_write)
+
+    @staticmethod
+    def frame(n: int, **kwargs):
+        """A led_renderer.PixelFrame of n pixels on this strip"""
+        # pylint: disable=import-outside-toplevel
+        from led_renderer import PixelFrame
+
+        return PixelFrame("D5", n, **kwargs)
+
+
+class Pin:  # pylint: disable=too-few-public-methods
+    def __init__(self, pin) -> None:
+        self.pin = pin
+        self.direction = None
+        self.deinitialized = False
+
+    def deinit(self):
+        self.deinitialized = True
+
+
+@pytest.fixture(name="strip")
+def fixture_strip(monkeypatch):
+    """PixelFrame without a board, see Strip"""
+    return Strip(monkeypatch)
@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""AnimationCache hits, misses and eviction."""
+from animation_cache import AnimationCache
+
+
+class FakeAnimation:
+    """Stands in for an adafruit_led_animation animation"""
+
+    def __init__(self, name):
+        self.name = name
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+
+def test_miss_then_hit():
+    cache = AnimationCache(size=2)
+    assert cache.get("solid") is None
+    animation = cache.put("solid", FakeAnimation("solid"))
+    assert cache.get("solid") is animation
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 0)
+
+
+def test_get_leaves_the_animation_running():
+    # code.py reapplies the same pattern every time the roboRIO resends it, a
+    # reset here would restart the animation on every frame
+    cache = AnimationCache()
+    animation = cache.put("blink", FakeAnimation("blink"))
+    for _ in range(5):
+        assert cache.get("blink") is animation
+    assert animation.resets == 0
+
+
+def test_evicts_least_recently_used():
+    cache = AnimationCache(size=3)
+    for key in ("a", "b", "c"):
+        cache.put(key, FakeAnimation(key))
+    # touching a makes b the oldest
+    cache.get("a")
+    cache.put("d", FakeAnimation("d"))
+
+    assert cache.get("b") is None
+    assert [cache.get(key).name for key in ("a", "c", "d")] == ["a", "c", "d"]
+    assert cache.evictions == 1
+    assert len(cache) == 3
+
+
+def test_put_replaces_without_evicting():
+    cache = AnimationCache(size=2)
+    cache.put("a", FakeAnimation("a"))
+    cache.put("b", FakeAnimation("b"))
+    replacement = cache.put("a", FakeAnimation("a2"))
+
+    assert cache.evictions == 0
+    assert len(cache) == 2
+    assert cache.get("a") is replacement
+    # the replaced key moved to the most recently used end
+    cache.put("c", FakeAnimation("c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is replacement
+
+
+def test_clear():
+    cache = AnimationCache(size=2)
+    cache.put("a", FakeAnimation("a"))
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get("a") is None
@@ -0,0 +1,125 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""BinaryGateway host packets, refused filters and the stats reply."""
+import io
+from struct import pack, unpack_from
+
+import pytest
+
+import sniff
+from frc_can_7491 import BinaryGateway, CANSniffer, VirtualBus
+from gateway_sim import binary_command_packet, binary_frames_packet, serial_pair
+
+
+@pytest.fixture(name="binary")
+def fixture_binary():
+    """(bus, gateway, host end of the serial link, monitor transport on the bus)"""
+    bus = VirtualBus()
+    device_end, host = serial_pair()
+    transport = bus.transport(rx_capacity=256)
+    accept = transport.set_filters
+
+    def set_filters(matches):
+        # like canio.listen on the MCP2515, which runs out of filters
+        if matches is not None and len(matches) > 2:
+            raise ValueError("too many filters")
+        accept(matches)
+
+    transport.set_filters = set_filters
+    gateway = BinaryGateway(transport, device_end)
+    monitor = bus.transport(rx_capacity=256)
+    monitor.set_filters(None)
+    return bus, gateway, host, monitor
+
+
+def filters_packet(*filters) -> bytes:
+    body = b"".join(pack(BinaryGateway.FILTER_FORMAT, *item) for item in filters)
+    return binary_command_packet(BinaryGateway.FILTERS, body, len(filters))
+
+
+def stats(gateway, host):
+    host.write(binary_command_packet(BinaryGateway.STATS))
+    gateway.poll()
+    reply = host.read()
+    return unpack_from(BinaryGateway.STATS_FORMAT, reply, len(reply) - BinaryGateway.STATS_SIZE)
+
+
+def test_frames_to_the_bus(binary):
+    _, gateway, host, monitor = binary
+    host.write(binary_command_packet(BinaryGateway.OPEN))
+    packet = binary_frames_packet([(0x02050001, b"\x01\x02", True), (0x123, b"", False)])
+    # split across reads, packets are collected until whole
+    host.write(packet[:7])
+    gateway.poll()
+    assert not monitor.in_waiting()
+    host.write(packet[7:])
+    gateway.poll()
+
+    frames = [monitor.receive() for _ in range(monitor.in_waiting())]
+    assert [(frame.id, bytes(frame.data), frame.extended) for frame in frames] == [
+        (0x02050001, b"\x01\x02", True),
+        (0x123, b"", False),
+    ]
+
+
+def test_frames_to_the_host(binary):
+    bus, gateway, host, _ = binary
+    host.write(binary_command_packet(BinaryGateway.OPEN))
+    gateway.poll()
+    bus.inject(0x01011840, bytes(range(8)))
+    gateway.poll()
+    gateway.sniffer.flush()
+    got = [
+        (frame_id, data, extended)
+        for _, packet in sniff.read_packets(io.BytesIO(host.read()))
+        for _, frame_id, extended, _, _, data, _ in packet
+    ]
+    assert got == [(0x01011840, bytes(range(8)), True)]
+
+
+def test_refused_filters_keep_the_gateway_running(binary):
+    bus, gateway, host, _ = binary
+    host.write(filters_packet((0x02050000, 0x1FFF0000, 1)))
+    host.write(binary_command_packet(BinaryGateway.OPEN))
+    gateway.poll()
+    assert gateway.open
+
+    # three filters, more than the transport takes
+    host.write(filters_packet(*[(0x01000000 + index, 0x1FFFFFFF, 1) for index in range(3)]))
+    gateway.poll()
+    assert gateway.refused == 1
+    assert len(gateway.matches) == 1
+
+    # the filters from before still apply
+    bus.inject(0x02050123, b"\x01")
+    bus.inject(0x02060123, b"\x02")
+    assert gateway.transport.in_waiting() == 1
+    assert stats(gateway, host)[2] == 1
+
+
+def test_refused_open_leaves_the_channel_closed(binary):
+    _, gateway, host, _ = binary
+    # taken while closed, they only reach the transport at the open
+    host.write(filters_packet(*[(0x01000000 + index, 0x1FFFFFFF, 1) for index in range(3)]))
+    host.write(binary_command_packet(BinaryGateway.OPEN_LISTEN_ONLY))
+    gateway.poll()
+    assert not gateway.open
+    assert gateway.refused == 1
+
+    host.write(filters_packet())
+    host.write(binary_command_packet(BinaryGateway.OPEN))
+    gateway.poll()
+    assert gateway.open
+    assert gateway.matches is None
+
+
+def test_stats_reply(binary):
+    _, gateway, host, _ = binary
+    host.write(binary_command_packet(BinaryGateway.OPEN))
+    host.write(binary_frames_packet([(0x02050001, b"\x01", True)]))
+    gateway.poll()
+    magic, version, refused, _, _, tx_failed, overflows, dropped, bytes_in = stats(gateway, host)
+    assert (magic, version, refused) == (BinaryGateway.STATS_MAGIC, CANSniffer.VERSION, 0)
+    assert (tx_failed, overflows, dropped) == (0, 0, 0)
+    assert bytes_in == 2 * BinaryGateway.HEADER_SIZE + 13 + BinaryGateway.HEADER_SIZE
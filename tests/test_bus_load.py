@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""BusLoad frame lengths against a bit by bit reference, and the load window."""
+import random
+import sys
+
+from frc_can_7491 import BusLoad, Message, RemoteTransmissionRequest
+from frc_can_7491.BusLoad import (
+    FRAME_TAIL_BITS,
+    crc15,
+    frame_bits,
+    frame_bits_bounds,
+    message_bits,
+)
+
+
+def bits_of(value: int, width: int):
+    return [(value >> shift) & 1 for shift in range(width - 1, -1, -1)]
+
+
+def reference_frame_bits(frame_id, data, extended, rtr, dlc):
+    """Lay the frame out bit by bit, CRC it and count the stuff bits one at a time"""
+    # pylint: disable=too-many-arguments
+    bits = [0]  # start of frame
+    if extended:
+        bits += bits_of(frame_id >> 18, 11) + [1, 1] + bits_of(frame_id & 0x3FFFF, 18)
+        bits += [int(rtr), 0, 0]  # RTR, r1, r0
+    else:
+        bits += bits_of(frame_id, 11) + [int(rtr), 0, 0]  # RTR, IDE, r0
+    bits += bits_of(dlc, 4)
+    for value in data:
+        bits += bits_of(value, 8)
+    bits += bits_of(crc15(bits), 15)
+
+    stuffed = 0
+    run_bit = None
+    run = 0
+    for bit in bits:
+        if bit == run_bit:
+            run += 1
+        else:
+            run_bit = bit
+            run = 1
+        if run == 5:
+            # the complementary stuff bit starts the next run
+            stuffed += 1
+            run_bit = 1 - bit
+            run = 1
+    return len(bits) + stuffed + FRAME_TAIL_BITS
+
+
+def test_frame_bits_matches_reference():
+    rng = random.Random(7491)
+    for _ in range(20000):
+        extended = rng.random() < 0.75
+        rtr = rng.random() < 0.1
+        frame_id = rng.getrandbits(29 if extended else 11)
+        # mostly random, sometimes all 0s or all 1s to force long runs
+        fill = rng.choice((None, None, None, 0x00, 0xFF))
+        length = rng.randrange(9)
+        if fill is None:
+            data = bytes(rng.getrandbits(8) for _ in range(length))
+        else:
+            data = bytes([fill]) * length
+
+        if rtr:
+            expected = reference_frame_bits(frame_id, b"", extended, True, length)
+            got = frame_bits(frame_id, b"", extended, True, length)
+        else:
+            expected = reference_frame_bits(frame_id, data, extended, False, length)
+            got = frame_bits(frame_id, data, extended)
+        assert got == expected, (hex(frame_id), data.hex(), extended, rtr)
+
+        fewest, most = frame_bits_bounds(length, extended, rtr)
+        assert fewest <= got <= most
+
+
+def test_frame_bits_bounds():
+    # the usual figures: 131 bits for an unstuffed extended frame of 8 bytes,
+    # 47 for a standard frame without data
+    assert frame_bits_bounds(8) == (131, 160)
+    assert frame_bits_bounds(0, extended=False) == (47, 55)
+    assert frame_bits_bounds(8, rtr=True) == frame_bits_bounds(0)
+
+
+def test_message_bits():
+    data = bytes(range(8))
+    assert message_bits(Message(0x01011840, data, True)) == frame_bits(0x01011840, data)
+    assert message_bits(RemoteTransmissionRequest(0x123, 4, extended=False)) == frame_bits(
+        0x123, b"", False, True, 4
+    )
+
+
+def test_peek_leaves_the_window_alone(monkeypatch):
+    now = [1000]
+    monkeypatch.setattr(sys.modules["frc_can_7491.BusLoad"], "ticks_ms", lambda: now[0])
+    bus_load = BusLoad()
+    bits = bus_load.add(Message(0x01011840, bytes(8), True))
+
+    now[0] += 10
+    expected = (bits * 100, bits * 100 * 100 / 1_000_000)
+    assert bus_load.peek() == expected
+    assert bus_load.peek() == expected
+    assert bus_load.load() == expected
+
+    # load started a new window
+    now[0] += 10
+    assert bus_load.peek() == (0, 0)
+    bus_load.add(Message(0x01011840, bytes(8), True))
+    assert bus_load.load()[0] == bits * 100
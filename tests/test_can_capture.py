@@ -0,0 +1,224 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""CANCapture records and files, candump export/import, CANReplay and tools/can_replay."""
+import contextlib
+import importlib
+import io
+import sys
+
+import pytest
+
+from frc_can_7491 import (
+    CANCapture,
+    CANMessage,
+    CANReplay,
+    FRCBroadcast,
+    FRCManufacturer,
+    FRCReservedApi,
+    Message,
+    RemoteTransmissionRequest,
+    from_candump,
+    read_capture,
+    to_candump,
+)
+
+ENUMERATE_ID = CANMessage.assemble_message_id(
+    0, FRCManufacturer.Broadcast, 0, FRCBroadcast.Enumerate, 0
+)
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    """The capture's monotonic_ns, a one item list in microseconds"""
+    clock = [1000]
+    module = sys.modules["frc_can_7491.CANCapture"]
+    monkeypatch.setattr(module, "monotonic_ns", lambda: clock[0] * 1000)
+    return clock
+
+
+def saved(capture):
+    stream = io.BytesIO()
+    capture.write_to(stream)
+    stream.seek(0)
+    return list(read_capture(stream))
+
+
+def test_records_round_trip(clock):
+    capture = CANCapture(8)
+    capture.record(Message(id=0x0B080405, data=b"\x01\x02\x03", extended=True))
+    clock[0] += 250
+    capture.record(Message(id=0x7FF, data=bytes(range(8))), tx=True)
+    clock[0] += 1
+    capture.record(RemoteTransmissionRequest(0x123, 4))
+    capture.record(RemoteTransmissionRequest(0x1FFFFFFF, 8, extended=True), tx=True)
+
+    assert saved(capture) == [
+        (1000, 0x0B080405, True, False, 3, b"\x01\x02\x03", False),
+        (1250, 0x7FF, False, False, 8, bytes(range(8)), True),
+        (1251, 0x123, False, True, 4, b"", False),
+        (1251, 0x1FFFFFFF, True, True, 8, b"", True),
+    ]
+
+
+def test_ring_keeps_the_newest_oldest_first(clock):
+    capture = CANCapture(3)
+    for frame_id in range(5):
+        clock[0] += 1
+        capture.record(Message(id=frame_id, data=b""))
+    assert capture.overwritten == 2
+    assert [record[1] for record in saved(capture)] == [2, 3, 4]
+
+    capture.clear()
+    assert (saved(capture), capture.overwritten) == ([], 0)
+
+
+def test_stopped_capture_records_nothing(clock):  # pylint: disable=unused-argument
+    capture = CANCapture(4)
+    capture.recording = False
+    capture.record(Message(id=1, data=b""))
+    assert capture.count == 0
+
+
+def test_timestamp_wrap_is_unwrapped(clock):
+    capture = CANCapture(4)
+    clock[0] = 0xFFFFFFF0
+    capture.record(Message(id=1, data=b""))
+    clock[0] += 0x20
+    capture.record(Message(id=2, data=b""))
+    assert [record[0] for record in saved(capture)] == [0xFFFFFFF0, 0x100000010]
+
+
+def test_file_header(clock, tmp_path):  # pylint: disable=unused-argument
+    capture = CANCapture(2)
+    capture.record(Message(id=1, data=b"\xaa"))
+    path = tmp_path / "match.fcap"
+    capture.save(str(path))
+    data = path.read_bytes()
+    assert data[: CANCapture.HEADER_SIZE] == b"FCAP\x01\x00\x14\x00"
+    assert len(data) == CANCapture.HEADER_SIZE + CANCapture.RECORD_SIZE
+
+    with pytest.raises(ValueError):
+        list(read_capture(io.BytesIO(b"PCAP" + data[4:])))
+
+
+RECORDS = [
+    (0, 0x0B080405, True, False, 3, b"\x01\x02\xff", False),
+    (1500, 0x7FF, False, False, 0, b"", False),
+    (2000, 0x123, False, True, 4, b"", True),
+    (1_002_000, 0x1FFFFFFF, True, True, 8, b"", False),
+]
+
+CANDUMP = (
+    "(10.000000) can1 0B080405#0102FF\n"
+    "(10.001500) can1 7FF#\n"
+    "(10.002000) can1 123#R4\n"
+    "(11.002000) can1 1FFFFFFF#R8\n"
+)
+
+
+def test_to_candump():
+    out = io.StringIO()
+    to_candump(RECORDS, out, "can1", start_s=10.0)
+    assert out.getvalue() == CANDUMP
+
+
+def test_from_candump():
+    lines = ["# comment\n", ""] + CANDUMP.splitlines(keepends=True)
+    # candump has no tx flag
+    assert list(from_candump(lines)) == [record[:6] + (False,) for record in RECORDS]
+
+
+def test_replay_flat_out():
+    injected = []
+    polls = []
+    replay = CANReplay(
+        RECORDS,
+        lambda *frame: injected.append(frame),
+        speed=0,
+        poll=lambda: polls.append(len(injected)),
+    )
+    # remote requests and the device's own frames are left out
+    assert replay.run() == 2
+    assert injected == [(0x0B080405, b"\x01\x02\xff", True), (0x7FF, b"", False)]
+    assert polls == [1, 2]
+
+
+def test_replay_includes_sent_frames():
+    records = [(0, 1, False, False, 0, b"", True), (10, 2, False, False, 0, b"", False)]
+    injected = []
+    replay = CANReplay(records, lambda *frame: injected.append(frame[0]), speed=0, include_tx=True)
+    replay.run()
+    assert injected == [1, 2]
+
+
+def test_replay_timing(monkeypatch):
+    now = [5_000_000_000]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(round(seconds * 1_000_000))
+        now[0] += round(seconds * 1e9)
+
+    module = sys.modules["frc_can_7491.CANCapture"]
+    monkeypatch.setattr(module, "monotonic_ns", lambda: now[0])
+    monkeypatch.setattr(module, "sleep", sleep)
+    records = [(100 + offset, 1, False, False, 0, b"", False) for offset in (0, 1000, 3000, 3100)]
+
+    def inject(*_):
+        # injecting the third frame takes 2.5ms
+        if len(sleeps) == 2:
+            now[0] += 2_500_000
+
+    replay = CANReplay(records, inject, speed=2.0)
+    assert replay.run() == 4
+    # relative to the first frame, at twice the speed
+    assert sleeps == [500, 1000]
+    # so the fourth, due 50us after it, goes out late
+    assert replay.late_max_us == 2450
+
+
+@pytest.fixture(name="can_replay")
+def fixture_can_replay(monkeypatch):
+    """tools/can_replay, which puts lib first on the path"""
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    return importlib.import_module("can_replay")
+
+
+def test_load_both_formats(can_replay, clock, tmp_path):  # pylint: disable=unused-argument
+    capture = CANCapture(4)
+    capture.record(Message(id=0x7FF, data=b"\x01"))
+    capture.save(str(tmp_path / "match.fcap"))
+    (tmp_path / "match.log").write_text(CANDUMP, encoding="utf-8")
+
+    assert can_replay.load(str(tmp_path / "match.fcap")) == [
+        (1000, 0x7FF, False, False, 1, b"\x01", False)
+    ]
+    assert can_replay.load(str(tmp_path / "match.log")) == [
+        record[:6] + (False,) for record in RECORDS
+    ]
+
+
+def test_replay_device_collects_what_it_sent(can_replay):
+    records = [(0, ENUMERATE_ID, True, False, 0, b"", False)]
+    replay, device, sent, _ = can_replay.replay_device(records, "11:8:5", 0)
+    assert (replay.frames, device.rx_count) == (1, 1)
+    enumerate_reply = CANMessage.assemble_message_id_short(11, 8, FRCReservedApi.EnumerateReply, 5)
+    assert [(record[0], record[1]) for record in sent] == [(0, enumerate_reply)]
+
+
+def test_main_exports_candump(can_replay, tmp_path):
+    (tmp_path / "match.log").write_text(CANDUMP, encoding="utf-8")
+    export = tmp_path / "export.log"
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        can_replay.main(
+            [str(tmp_path / "match.log"), "--export", str(export), "--interface", "can1"]
+        )
+    assert out.getvalue() == f"4 frames in {tmp_path / 'match.log'}\n"
+    # timestamps from the start of the log
+    assert export.read_text(encoding="utf-8").splitlines() == [
+        "(0.000000) can1 0B080405#0102FF",
+        "(0.001500) can1 7FF#",
+        "(0.002000) can1 123#R4",
+        "(1.002000) can1 1FFFFFFF#R8",
+    ]
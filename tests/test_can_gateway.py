@@ -0,0 +1,26 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""The CANGateway base, without a protocol."""
+from frc_can_7491 import CANGateway, VirtualBus
+from gateway_sim import serial_pair
+
+
+def test_base_gateway_ignores_the_host():
+    bus = VirtualBus()
+    device_end, host = serial_pair()
+    transport = bus.transport()
+    transport.set_filters(None)
+    gateway = CANGateway(transport, device_end)
+    bus.inject(0x123, b"\x01")
+    monitor = bus.transport()
+    monitor.set_filters(None)
+
+    host.write(b"O\rt1230\r")
+    gateway.poll()
+    assert gateway.bytes_in == 8
+    assert not host.read()
+    assert monitor.in_waiting() == 0
+    assert (gateway.rx_frames, gateway.tx_frames) == (0, 0)
+    # bus frames are left to the transport
+    assert transport.in_waiting() == 1
@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""CANMessage id parsing and the Enumerate reply slots."""
+import contextlib
+import io
+import random
+import sys
+
+import pytest
+
+from frc_can_7491 import (
+    CANDevice,
+    CANMessage,
+    CANMessageType,
+    FRCBroadcast,
+    FRCManufacturer,
+    VirtualBus,
+)
+
+ENUMERATE_ID = CANMessage.assemble_message_id(
+    0, FRCManufacturer.Broadcast, 0, FRCBroadcast.Enumerate, 0
+)
+
+
+def test_parse_round_trips_every_field_width():
+    rng = random.Random(7491)
+    for _ in range(2000):
+        dev_type = rng.randrange(1, 32)
+        manufacturer = rng.randrange(2, 256)
+        api_class = rng.randrange(64)
+        api_index = rng.randrange(16)
+        number = rng.randrange(64)
+        frame_id = CANMessage.assemble_message_id(
+            dev_type, manufacturer, api_class, api_index, number
+        )
+        message = CANMessage(raw_msg_id=frame_id, raw_msg_data=b"")
+        assert message.msg_type == CANMessageType.Device
+        assert message.api_class == api_class
+        assert message.api_index == api_index
+        assert message.api_id == (api_class << 4) | api_index
+
+
+def test_parse_wide_api_ids():
+    frame_id = CANMessage.assemble_message_id_short(11, 8, 0x3F6, 63)
+    assert CANMessage(raw_msg_id=frame_id, raw_msg_data=b"").api_id == 0x3F6
+
+
+@pytest.mark.parametrize("index", [FRCBroadcast.Enumerate, FRCBroadcast.DeviceQuery, 15])
+def test_parse_broadcast_index(index):
+    frame_id = CANMessage.assemble_message_id(0, FRCManufacturer.Broadcast, 0, index, 0)
+    message = CANMessage(raw_msg_id=frame_id, raw_msg_data=b"")
+    assert message.msg_type == CANMessageType.Broadcast
+    assert message.api_index == index
+
+
+class FakeClock:
+    """Stands in for ticks_ms in the CANDevice module"""
+
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+def enumerate_polls(monkeypatch, numbers, period_ms):
+    """Poll index each device's Enumerate reply went out in"""
+    clock = FakeClock()
+    monkeypatch.setattr(sys.modules["frc_can_7491.CANDevice"], "ticks_ms", clock)
+    bus = VirtualBus()
+    devices = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for number in numbers:
+            device = CANDevice(11, 8, number, transport=bus.transport())
+            device.set_receive_period(period_ms)
+            device.start_listener()
+            devices.append(device)
+
+    bus.inject(ENUMERATE_ID, b"")
+    replied = {}
+    for poll in range(len(numbers) + 2):
+        for device in devices:
+            sent = device.enumerate_count
+            device.receive_messages()
+            if device.enumerate_count != sent:
+                replied[device.dev_num] = poll
+        clock.now += period_ms
+    return replied
+
+
+def test_enumerate_replies_in_separate_polls(monkeypatch):
+    numbers = list(range(8))
+    # code.py runs receive_messages() every 20ms
+    replied = enumerate_polls(monkeypatch, numbers, 20)
+    assert sorted(replied) == numbers
+    assert len(set(replied.values())) == len(numbers)
+    assert [replied[number] for number in numbers] == sorted(replied.values())
+
+
+def test_enumerate_repeat_requests_merge(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sys.modules["frc_can_7491.CANDevice"], "ticks_ms", clock)
+    bus = VirtualBus()
+    with contextlib.redirect_stdout(io.StringIO()):
+        device = CANDevice(11, 8, 2, transport=bus.transport())
+        device.start_listener()
+    for _ in range(3):
+        bus.inject(ENUMERATE_ID, b"")
+        device.receive_messages()
+    clock.now += device.enumerate_window_ms
+    device.receive_messages()
+    assert device.enumerate_count == 1
+    assert device.enumerate_latency_ms == device.enumerate_window_ms
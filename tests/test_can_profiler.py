@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""CANProfiler route stats, histograms and the ProfileQuery reply."""
+import contextlib
+import io
+import sys
+from struct import unpack
+
+import pytest
+
+from frc_can_7491 import (
+    BUCKET_LIMITS_US,
+    DEQUEUE_KEY,
+    CANDevice,
+    CANMessage,
+    CANMessageType,
+    CANProfiler,
+    FRCReservedApi,
+    RouteStats,
+    VirtualBus,
+)
+
+ROUTE_API = 0x10
+
+
+@pytest.fixture(name="device")
+def fixture_device(monkeypatch):
+    """(bus, device, clock), the clock is monotonic_ns as a one item list"""
+    clock = [10_000_000]
+    monkeypatch.setattr(sys.modules["frc_can_7491.CANDevice"], "monotonic_ns", lambda: clock[0])
+    bus = VirtualBus()
+    with contextlib.redirect_stdout(io.StringIO()):
+        device = CANDevice(11, 8, 5, transport=bus.transport())
+        device.start_listener()
+    return bus, device, clock
+
+
+def frame_id(api_id: int) -> int:
+    return CANMessage.assemble_message_id_short(11, 8, api_id, 5)
+
+
+def query(bus, device, index: int = None):
+    """Send a ProfileQuery, returns the unpacked ProfileReply or None"""
+    monitor = bus.transport()
+    monitor.set_filters(None)
+    bus.inject(frame_id(FRCReservedApi.ProfileQuery), b"" if index is None else bytes((index,)))
+    device.receive_messages()
+    replies = [monitor.receive() for _ in range(monitor.in_waiting())]
+    replies = [reply for reply in replies if reply.id == frame_id(FRCReservedApi.ProfileReply)]
+    if not replies:
+        return None
+    (reply,) = replies
+    return unpack(CANProfiler.REPLY_FORMAT, reply.data)
+
+
+@pytest.mark.parametrize(
+    "duration_us, bucket",
+    [(0, 0), (50, 0), (51, 1), (100, 1), (2500, 5), (10000, 7), (10001, 8), (10**6, 8)],
+)
+def test_histogram_buckets(duration_us, bucket):
+    stats = RouteStats(1)
+    stats.record(duration_us)
+    histogram = [0] * (len(BUCKET_LIMITS_US) + 1)
+    histogram[bucket] = 1
+    assert stats.histogram == histogram
+
+
+def test_route_stats():
+    stats = RouteStats(1)
+    assert stats.mean_us == 0
+    for duration_us in (300, 100, 200, 40):
+        stats.record(duration_us)
+    assert (stats.count, stats.min_us, stats.max_us, stats.mean_us) == (4, 40, 300, 160)
+    assert stats.histogram[:4] == [1, 1, 1, 1]
+
+
+def test_routes_in_first_seen_order(device):
+    bus, device, clock = device
+    profiler = device.enable_profiling()
+
+    @device.route(0x20, CANMessageType.Device)
+    def slow(_message):
+        clock[0] += 3_000_000
+
+    @device.route(ROUTE_API, CANMessageType.Device)
+    def fast(_message):
+        clock[0] += 20_000
+
+    for api_id in (ROUTE_API, 0x20, ROUTE_API):
+        bus.inject(frame_id(api_id), b"")
+    device.receive_messages()
+
+    fast_stats, slow_stats = profiler.route_list
+    assert fast_stats.key == (CANMessageType.Device << 10) | ROUTE_API
+    assert slow_stats.key == (CANMessageType.Device << 10) | 0x20
+    assert (fast_stats.count, fast_stats.max_us, fast_stats.histogram[0]) == (2, 20, 2)
+    assert (slow_stats.count, slow_stats.max_us, slow_stats.histogram[6]) == (1, 3000, 1)
+    assert profiler.stats_at(0) is profiler.dequeue
+    assert profiler.stats_at(2) is slow_stats
+    assert profiler.stats_at(3) is None
+
+
+def test_unrouted_frames_are_not_profiled(device):
+    bus, device, _ = device
+    profiler = device.enable_profiling()
+    bus.inject(frame_id(0x30), b"")
+    device.receive_messages()
+    assert profiler.dequeue.count == 0
+    assert not profiler.route_list
+
+
+def test_profile_query_reply(device):
+    bus, device, clock = device
+    device.enable_profiling()
+
+    @device.route(ROUTE_API, CANMessageType.Device)
+    def handler(_message):
+        clock[0] += 70_000_000
+
+    bus.inject(frame_id(ROUTE_API), b"")
+    device.receive_messages()
+
+    # mean and max saturate at 0xFFFF us
+    assert query(bus, device, 1) == (
+        (CANMessageType.Device << 10) | ROUTE_API,
+        1,
+        0xFFFF,
+        0xFFFF,
+    )
+    # index 0 is the dequeue wait, the first query was recorded too
+    key, count, _, _ = query(bus, device, 0)
+    assert (key, count) == (DEQUEUE_KEY, 2)
+    # past the last route nothing is sent
+    assert query(bus, device, 9) is None
+
+
+def test_empty_query_asks_for_the_dequeue_stats(device):
+    bus, device, _ = device
+    device.enable_profiling()
+    assert query(bus, device)[0] == DEQUEUE_KEY
+
+
+def test_disable_profiling(device):
+    bus, device, clock = device
+    calls = []
+
+    @device.route(ROUTE_API, CANMessageType.Device)
+    def handler(message):
+        calls.append(message)
+        clock[0] += 1000
+
+    device.enable_profiling()
+    device.disable_profiling()
+    assert device.profiler is None
+
+    bus.inject(frame_id(ROUTE_API), b"")
+    assert query(bus, device, 0) is None
+    # routes still run, the ProfileQuery goes unrouted
+    assert len(calls) == 1
+    assert device.unrouted_count == 1
+
+
+def test_reset():
+    profiler = CANProfiler()
+    message = CANMessage(ROUTE_API, CANMessageType.Device)
+    profiler.record(message, 0, 1000, 5000)
+    profiler.reset()
+    assert profiler.dequeue.count == 0
+    assert profiler.stats_at(1) is None
+    profiler.record(message, 0, 1000, 5000)
+    assert profiler.stats_at(1).count == 1
+
+
+def test_batch_wait_includes_earlier_handlers(device):
+    bus, device, clock = device
+    profiler = device.enable_profiling()
+
+    @device.route(ROUTE_API, CANMessageType.Device)
+    def handler(_message):
+        clock[0] += 500_000
+
+    for _ in range(3):
+        bus.inject(frame_id(ROUTE_API), b"")
+    device.receive_messages()
+
+    # every frame left the queue with the batch, the third waited for two handlers
+    assert profiler.dequeue.count == 3
+    assert (profiler.dequeue.min_us, profiler.dequeue.max_us) == (0, 1000)
+    assert profiler.dequeue.total_us == 1500
+    (route,) = profiler.route_list
+    assert (route.count, route.min_us, route.max_us) == (3, 500, 500)
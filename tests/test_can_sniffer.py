@@ -0,0 +1,218 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""CANSniffer packet layout and flushing, and reading the packets in tools/sniff."""
+import contextlib
+import importlib
+import io
+import sys
+from struct import pack, unpack_from
+
+import pytest
+
+from frc_can_7491 import (
+    BusState,
+    CANSniffer,
+    RemoteTransmissionRequest,
+    VirtualBus,
+    read_capture,
+)
+from frc_can_7491.CANTransport import REGISTER_FRAME_SIZE, unpack_registers
+
+
+class Stream:  # pylint: disable=too-few-public-methods
+    """usb_cdc.data, every write is kept"""
+
+    def __init__(self) -> None:
+        self.connected = True
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+
+    def read(self) -> bytes:
+        data = b"".join(self.writes)
+        self.writes.clear()
+        return data
+
+
+@pytest.fixture(name="sniffer")
+def fixture_sniffer(monkeypatch):
+    """(bus, sniffer, stream, clock), the clock is monotonic_ns in microseconds"""
+    clock = [7_000_000]
+    monkeypatch.setattr(
+        sys.modules["frc_can_7491.CANSniffer"], "monotonic_ns", lambda: clock[0] * 1000
+    )
+    bus = VirtualBus()
+    stream = Stream()
+    sniffer = CANSniffer(bus.transport(rx_capacity=64), stream, max_frames=4, flush_ms=5)
+    return bus, sniffer, stream, clock
+
+
+def header(packet):
+    return unpack_from(CANSniffer.HEADER_FORMAT, packet)
+
+
+def test_packet_layout(sniffer):
+    bus, sniffer, stream, clock = sniffer
+    bus.inject(0x0B080405, b"\x01\x02\x03")
+    sniffer.poll()
+    clock[0] += 300
+    bus.inject(0x7FF, b"", extended=False)
+    bus.deliver(None, RemoteTransmissionRequest(0x123, 2))
+    sniffer.poll()
+    sniffer.transport.rx_overflow_count = 0x10003
+    sniffer.flush()
+
+    (packet,) = stream.writes
+    assert len(packet) == CANSniffer.HEADER_SIZE + 3 * CANSniffer.RECORD_SIZE
+    assert header(packet) == (0x7491, 1, 3, 0, 3, 0, BusState.ERROR_ACTIVE, 7_000_000)
+    records = [
+        CANSniffer.HEADER_SIZE + index * CANSniffer.RECORD_SIZE for index in range(3)
+    ]
+    assert [unpack_registers(packet, offset) for offset in records] == [
+        (0x0B080405, True, False, 3, b"\x01\x02\x03"),
+        (0x7FF, False, False, 0, b""),
+        (0x123, False, True, 2, b""),
+    ]
+    # microseconds since the packet time, per poll
+    assert [
+        unpack_from("<H", packet, offset + REGISTER_FRAME_SIZE)[0] for offset in records
+    ] == [0, 300, 300]
+    assert (sniffer.frames, sniffer.packets, sniffer.sequence) == (3, 1, 1)
+
+
+def test_full_packet_is_sent(sniffer):
+    bus, sniffer, stream, _ = sniffer
+    for frame_id in range(6):
+        bus.inject(frame_id, b"")
+    sniffer.poll()
+    (packet,) = stream.writes
+    assert header(packet)[2] == 4
+    # the rest wait in the transport for the next packet
+    assert sniffer.transport.in_waiting() == 2
+    assert sniffer.count == 0
+
+
+def test_old_packet_is_sent(sniffer):
+    bus, sniffer, stream, clock = sniffer
+    bus.inject(1, b"")
+    sniffer.poll()
+    clock[0] += 4999
+    sniffer.poll()
+    assert not stream.writes
+    clock[0] += 1
+    sniffer.poll()
+    assert header(stream.writes[0])[2] == 1
+    # nothing to send, no empty packets
+    clock[0] += 10_000
+    sniffer.poll()
+    sniffer.flush()
+    assert len(stream.writes) == 1
+
+
+def test_disconnected_stream_drops_packets(sniffer):
+    bus, sniffer, stream, _ = sniffer
+    stream.connected = False
+    bus.inject(1, b"")
+    bus.inject(2, b"")
+    sniffer.poll()
+    sniffer.flush()
+    assert (sniffer.stream_dropped, stream.writes) == (2, [])
+
+    stream.connected = True
+    bus.inject(3, b"")
+    sniffer.poll()
+    sniffer.flush()
+    # a sequence gap and the dropped count tell the host what it missed
+    _, _, count, sequence, _, dropped, _, _ = header(stream.writes[0])
+    assert (count, sequence, dropped) == (1, 1, 2)
+
+
+def test_sniffer_receives_everything():
+    bus = VirtualBus()
+    transport = bus.transport()
+    CANSniffer(transport, Stream())
+    bus.inject(0x1FFFFFFF, b"")
+    bus.inject(0x000, b"", extended=False)
+    assert transport.in_waiting() == 2
+
+
+@pytest.fixture(name="sniff")
+def fixture_sniff(monkeypatch):
+    """tools/sniff, which puts lib first on the path"""
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    return importlib.import_module("sniff")
+
+
+def packets(sniffer, stream, frame_groups):
+    bus = sniffer.transport.bus
+    for frames in frame_groups:
+        for frame_id, data in frames:
+            bus.inject(frame_id, data)
+        sniffer.poll()
+        sniffer.flush()
+    return stream.read()
+
+
+def test_read_packets(sniffer, sniff):
+    _, sniffer, stream, _ = sniffer
+    data = packets(
+        sniffer, stream, [[(0x0B080405, b"\x01")], [(0x0B080406, b""), (0x7FF, b"\xff")]]
+    )
+    got = list(sniff.read_packets(io.BytesIO(data)))
+    assert [(head["sequence"], head["base_us"]) for head, _ in got] == [
+        (0, 7_000_000),
+        (1, 7_000_000),
+    ]
+    assert got[1][1] == [
+        (7_000_000, 0x0B080406, True, False, 0, b"", False),
+        (7_000_000, 0x7FF, True, False, 1, b"\xff", False),
+    ]
+
+
+def test_read_packets_resynchronizes(sniffer, sniff):
+    _, sniffer, stream, _ = sniffer
+    data = packets(sniffer, stream, [[(1, b"")], [(2, b"")], [(3, b"")]])
+    size = CANSniffer.HEADER_SIZE + CANSniffer.RECORD_SIZE
+    first, second, third = data[:size], data[size : 2 * size], data[2 * size :]
+    # an unknown version is skipped
+    second = second[:2] + b"\x09" + second[3:]
+    stream = io.BytesIO(b"\x91\x00junk\x74" + first + second + third[:-1])
+    got = list(sniff.read_packets(stream))
+    # the truncated packet ends the stream
+    assert [frames[0][1] for _, frames in got] == [1]
+
+
+def test_stats_count_lost_packets(sniff):
+    stats = sniff.SniffStats()
+    assert stats.summary() == "no packets"
+    for sequence, overflows in ((0xFFFE, 0xFFFF), (0xFFFF, 0xFFFF), (2, 3)):
+        head = {"sequence": sequence, "rx_overflows": overflows, "stream_dropped": 5}
+        stats.add(head, [None])
+    assert stats.lost_packets == 2
+    assert stats.summary() == (
+        "3 frames in 3 packets, 2 packets lost, 4 receive buffer overflows, "
+        "0 frames dropped by the Feather"
+    )
+
+
+def test_main_saves_a_capture(sniffer, sniff, tmp_path):
+    _, sniffer, stream, _ = sniffer
+    recording = tmp_path / "packets.bin"
+    recording.write_bytes(packets(sniffer, stream, [[(0x0B080405, b"\x01\x02")], [(0x123, b"")]]))
+    capture = tmp_path / "pits.fcap"
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+        stats = sniff.main([str(recording), "--capture", str(capture), "--interface", "can1"])
+    assert (stats.packets, stats.frames) == (2, 2)
+    assert out.getvalue() == "(7.000000) can1 0B080405#0102\n(7.000000) can1 00000123#\n"
+    with open(capture, "rb") as stream:
+        assert list(read_capture(stream)) == [
+            (7_000_000, 0x0B080405, True, False, 2, b"\x01\x02", False),
+            (7_000_000, 0x123, True, False, 0, b"", False),
+        ]
+
+
+def test_magic_bytes():
+    assert pack("<H", CANSniffer.MAGIC) == b"\x91\x74"
@@ -0,0 +1,263 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""CANTelemetry frames, the device counters behind them and the MCP2515 driver's
+health counters."""
+import contextlib
+import io
+import sys
+from struct import unpack
+
+import pytest
+
+import mcp2515_sim
+from frc_can_7491 import (
+    BusState,
+    CANDevice,
+    CANMessage,
+    CANTelemetry,
+    FRCReservedApi,
+    VirtualBus,
+    frame_bits_bounds,
+)
+
+
+@pytest.fixture(name="device")
+def fixture_device(monkeypatch):
+    """(bus, device, clock, monitor), the clock is the telemetry's ticks_ms as a
+    one item list, the monitor transport receives everything the device sends"""
+    clock = [1000]
+    monkeypatch.setattr(sys.modules["frc_can_7491.CANTelemetry"], "ticks_ms", lambda: clock[0])
+    monkeypatch.setattr(sys.modules["frc_can_7491.CANDevice"], "monotonic_ns", lambda: 0)
+    bus = VirtualBus()
+    with contextlib.redirect_stdout(io.StringIO()):
+        device = CANDevice(11, 8, 5, transport=bus.transport(rx_capacity=4))
+        device.start_listener()
+    monitor = bus.transport(rx_capacity=64)
+    monitor.set_filters(None)
+    return bus, device, clock, monitor
+
+
+def frame_id(api_id: int) -> int:
+    return CANMessage.assemble_message_id_short(11, 8, api_id, 5)
+
+
+def bus_frame(telemetry):
+    return unpack(CANTelemetry.BUS_FORMAT, telemetry.bus_frame)
+
+
+def loop_frame(telemetry):
+    return unpack(CANTelemetry.LOOP_FORMAT, telemetry.loop_frame)
+
+
+def sent(monitor):
+    """{api id: data} of the telemetry frames the device sent"""
+    frames = [monitor.receive() for _ in range(monitor.in_waiting())]
+    return {
+        frame.id: bytes(frame.data)
+        for frame in frames
+        if frame.id
+        in (
+            frame_id(FRCReservedApi.TelemetryBus),
+            frame_id(FRCReservedApi.TelemetryLoop),
+            frame_id(FRCReservedApi.TelemetryLag),
+        )
+    }
+
+
+def test_window_rates_and_counts(device):
+    bus, device, clock, monitor = device
+    telemetry = device.enable_telemetry(0)
+    for _ in range(4):
+        bus.inject(frame_id(0x20), b"")
+    device.receive_messages()
+    device.send_message_simple(0x21, b"\x01")
+    device.send_message_simple(0x21, b"\x02")
+
+    clock[0] += 500
+    telemetry.publish()
+    # 4 received and 2 sent in half a second, none of them routed
+    assert bus_frame(telemetry) == (8, 4, 0, 0, 0, BusState.ERROR_ACTIVE)
+    assert loop_frame(telemetry) == (4, 4, 0, 0, 0)
+    frames = sent(monitor)
+    assert frames[frame_id(FRCReservedApi.TelemetryBus)] == bytes(telemetry.bus_frame)
+    assert frames[frame_id(FRCReservedApi.TelemetryLoop)] == bytes(telemetry.loop_frame)
+
+    # the next window only counts the two telemetry frames sent since
+    clock[0] += 1000
+    telemetry.sample()
+    assert bus_frame(telemetry) == (0, 2, 0, 0, 0, BusState.ERROR_ACTIVE)
+    assert loop_frame(telemetry) == (0, 0, 0, 0, 0)
+
+
+def test_loop_maximums_are_per_window(device, monkeypatch):
+    _, device, _, _ = device
+    now = [0]
+    monkeypatch.setattr(sys.modules["frc_can_7491.CANDevice"], "monotonic_ns", lambda: now[0])
+    telemetry = device.enable_telemetry(0)
+    for period_ns in (0, 30_000_000, 12_000_000):
+        now[0] += period_ns
+        device.receive_messages()
+
+    telemetry.sample()
+    assert loop_frame(telemetry)[2] == 30
+    assert device.loop_period_max_us == 0
+    # the boot peak stays for StatusReply
+    assert device.loop_period_peak_us == 30_000
+
+
+def test_overflows_failures_and_bus_state(device, monkeypatch):
+    bus, device, _, _ = device
+    telemetry = device.enable_telemetry(0)
+    transport = device.transport
+    for _ in range(7):
+        bus.inject(frame_id(0x20), b"")
+    assert transport.rx_overflow_count == 3
+
+    state = [BusState.BUS_OFF]
+    monkeypatch.setattr(type(transport), "state", property(lambda _: state[0]))
+    transport.error_counts = (200, 130)
+    transport.bus_state_transition_count = 2
+    assert not device.send_message_simple(0x21, b"")
+
+    telemetry.sample()
+    assert bus_frame(telemetry)[2:] == (200, 130, 3, BusState.BUS_OFF | 2 << 3)
+    assert loop_frame(telemetry)[4] == 1
+
+    # back to error active, only the new transition is in the next window
+    state[0] = BusState.ERROR_ACTIVE
+    transport.bus_state_transition_count = 3
+    telemetry.sample()
+    assert bus_frame(telemetry)[4:] == (0, BusState.ERROR_ACTIVE | 1 << 3)
+    assert loop_frame(telemetry)[4] == 0
+
+
+def test_fields_saturate(device):
+    _, device, clock, _ = device
+    telemetry = device.enable_telemetry(0)
+    transport = device.transport
+    device.rx_count += 100_000
+    device.unrouted_count += 300
+    device.rx_queue_max = 999
+    device.loop_period_max_us = 100_000_000
+    device.loop_busy_max_us = 100_000
+    device.tx_fail_count += 70_000
+    transport.rx_overflow_count += 1000
+    transport.bus_state_transition_count = 40
+    clock[0] += 1
+
+    telemetry.sample()
+    assert bus_frame(telemetry) == (0xFFFF, 0, 0, 0, 0xFF, 0x1F << 3)
+    assert loop_frame(telemetry) == (0xFF, 0xFF, 0xFFFF, 0xFFFF, 0xFFFF)
+
+
+def test_service_period(device):
+    _, device, clock, monitor = device
+    telemetry = device.enable_telemetry(100)
+    clock[0] += 99
+    device.receive_messages()
+    assert telemetry.publish_count == 0
+    clock[0] += 1
+    device.receive_messages()
+    assert telemetry.publish_count == 1
+    assert len(sent(monitor)) == 2
+
+    # 0 only publishes on request
+    telemetry = device.enable_telemetry(0)
+    clock[0] += 10_000
+    device.receive_messages()
+    assert device.telemetry.publish_count == 1
+
+
+def test_request_publishes(device):
+    bus, device, _, monitor = device
+    telemetry = device.enable_telemetry(0)
+    bus.inject(frame_id(FRCReservedApi.TelemetryRequest), b"")
+    device.receive_messages()
+    assert telemetry.publish_count == 1
+    assert len(sent(monitor)) == 2
+
+
+def test_loop_monitor_adds_the_lag_frame(device):
+    bus, device, _, monitor = device
+
+    class FakeLoopMonitor:  # pylint: disable=too-few-public-methods
+        @staticmethod
+        def pack():
+            return bytes(range(8))
+
+    device.enable_telemetry(1000)
+    assert device.bus_load.periodic["telemetry"] == 2 * frame_bits_bounds(8, True)[1]
+    device.attach_loop_monitor(FakeLoopMonitor())
+    # declared to the bus load budget with the third frame
+    assert device.bus_load.periodic["telemetry"] == 3 * frame_bits_bounds(8, True)[1]
+    bus.inject(frame_id(FRCReservedApi.TelemetryRequest), b"")
+    device.receive_messages()
+    assert sent(monitor)[frame_id(FRCReservedApi.TelemetryLag)] == bytes(range(8))
+
+
+def test_disable_telemetry(device):
+    bus, device, _, monitor = device
+    device.enable_telemetry(0)
+    device.disable_telemetry()
+    bus.inject(frame_id(FRCReservedApi.TelemetryRequest), b"")
+    device.receive_messages()
+    assert not sent(monitor)
+    assert device.unrouted_count == 1
+    assert "telemetry" not in device.bus_load.periodic
+
+
+@pytest.fixture(name="chip")
+def fixture_chip(monkeypatch):
+    """(simulated MCP2515, the adafruit_mcp2515 driver on it)"""
+    # install() puts lib first on the path, where lib/asyncio would shadow the
+    # standard library for later tests
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    chip = mcp2515_sim.SimulatedMCP2515()
+    return chip, mcp2515_sim.driver(chip)
+
+
+def test_driver_counts_overflows_of_both_buffers(chip):
+    chip, can_bus = chip
+    chip.registers[mcp2515_sim.EFLG] |= mcp2515_sim.RX1OVR
+    assert can_bus.state == BusState.ERROR_ACTIVE
+    assert can_bus.rx_overflow_count == 1
+    # the flags are cleared once counted
+    assert not chip.registers[mcp2515_sim.EFLG] & (mcp2515_sim.RX0OVR | mcp2515_sim.RX1OVR)
+
+    chip.registers[mcp2515_sim.EFLG] |= mcp2515_sim.RX0OVR | mcp2515_sim.RX1OVR
+    can_bus.state  # pylint: disable=pointless-statement
+    can_bus.state  # pylint: disable=pointless-statement
+    assert can_bus.rx_overflow_count == 3
+
+
+def test_driver_counts_received_overflows(chip):
+    chip, can_bus = chip
+    can_bus.listen(timeout=0)
+    # RXB0, rollover into RXB1, then nowhere to go
+    for index in range(3):
+        chip.inject(0x0B080405 + index, b"")
+    assert chip.dropped == 1
+    can_bus.state  # pylint: disable=pointless-statement
+    assert can_bus.rx_overflow_count == 1
+
+
+def test_driver_counts_bus_state_transitions(chip):
+    chip, can_bus = chip
+    for tec, rec, state in (
+        (0, 100, BusState.ERROR_WARNING),
+        (0, 110, BusState.ERROR_WARNING),
+        (130, 110, BusState.ERROR_PASSIVE),
+        (0, 0, BusState.ERROR_ACTIVE),
+    ):
+        chip.set_error_counts(tec, rec)
+        assert can_bus.state == state
+    assert can_bus.bus_state_transition_count == 3
+
+
+def test_driver_reads_both_error_counts_at_once(chip):
+    chip, can_bus = chip
+    chip.set_error_counts(17, 42)
+    chip.reset_stats()
+    assert can_bus.error_counts == (17, 42)
+    assert chip.stats()["transactions"] == 1
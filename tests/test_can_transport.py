@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""CANTransport batches, filters and the MCP2515 register layout, on a VirtualBus."""
+import pytest
+
+from frc_can_7491 import (
+    BusState,
+    CANTransport,
+    Match,
+    Message,
+    RemoteTransmissionRequest,
+    VirtualBus,
+)
+from frc_can_7491.CANTransport import (
+    REGISTER_FRAME_SIZE,
+    match_frame,
+    pack_registers,
+    unpack_registers,
+)
+
+
+@pytest.fixture(name="bus")
+def fixture_bus():
+    """(bus, transport), the transport receives everything"""
+    bus = VirtualBus()
+    transport = bus.transport(rx_capacity=8)
+    transport.set_filters(None)
+    return bus, transport
+
+
+def test_receive_batch_is_limited_by_the_list(bus):
+    bus, transport = bus
+    for frame_id in range(5):
+        bus.inject(frame_id, b"", extended=False)
+    frames = [None] * 3
+    assert transport.receive_batch(frames) == 3
+    assert [frame.id for frame in frames] == [0, 1, 2]
+    # the rest wait for the next batch, in order
+    assert transport.in_waiting() == 2
+    assert transport.receive_batch(frames) == 2
+    assert [frame.id for frame in frames[:2]] == [3, 4]
+    assert transport.receive_batch(frames) == 0
+    assert not transport.pending()
+
+
+def test_receive_batch_of_nothing(bus):
+    bus, transport = bus
+    bus.inject(1, b"")
+    assert transport.receive_batch([]) == 0
+    assert transport.in_waiting() == 1
+
+
+def test_receive_batch_keeps_remote_frames(bus):
+    bus, transport = bus
+    sender = bus.transport()
+    sender.send(RemoteTransmissionRequest(0x123, 4))
+    frames = [None]
+    assert transport.receive_batch(frames) == 1
+    assert isinstance(frames[0], RemoteTransmissionRequest)
+    assert (frames[0].id, frames[0].length) == (0x123, 4)
+
+
+def test_nothing_is_received_before_set_filters():
+    bus = VirtualBus()
+    transport = bus.transport()
+    bus.inject(1, b"")
+    assert transport.receive_batch([None]) == 0
+
+
+def test_match_frame():
+    matches = [Match(0x02050000, mask=0x1FFF0000, extended=True), Match(0x123)]
+    assert match_frame(None, 0x7FF, False)
+    assert match_frame(matches, 0x0205ABCD, True)
+    assert not match_frame(matches, 0x0206ABCD, True)
+    # a mask of 0 is an exact match, and standard and extended ids never match each other
+    assert match_frame(matches, 0x123, False)
+    assert not match_frame(matches, 0x122, False)
+    assert not match_frame(matches, 0x123, True)
+
+
+@pytest.mark.parametrize(
+    "frame, expected",
+    [
+        (
+            Message(id=0x0B080405, data=b"\x01\x02\x03", extended=True),
+            (0x0B080405, True, False, 3, b"\x01\x02\x03"),
+        ),
+        (Message(id=0x7FF, data=bytes(range(8))), (0x7FF, False, False, 8, bytes(range(8)))),
+        (RemoteTransmissionRequest(0x1FFFFFFF, 8, extended=True), (0x1FFFFFFF, True, True, 8, b"")),
+        (RemoteTransmissionRequest(0x001, 2), (0x001, False, True, 2, b"")),
+    ],
+)
+def test_register_layout_round_trip(frame, expected):
+    buffer = bytearray(2 + REGISTER_FRAME_SIZE)
+    pack_registers(frame, buffer, 2)
+    assert unpack_registers(buffer, 2) == expected
+
+
+def test_read_raw_frames_stride_and_end(bus):
+    bus, transport = bus
+    for frame_id in range(3):
+        bus.inject(frame_id, bytes([frame_id]))
+    stride = REGISTER_FRAME_SIZE + 3
+    buffer = bytearray(100)
+    # room for two frames before end
+    end = 4 + stride + REGISTER_FRAME_SIZE
+    assert transport.read_raw_frames(buffer, 4, end, stride) == 4 + 2 * stride
+    assert [unpack_registers(buffer, 4 + index * stride)[0] for index in range(2)] == [0, 1]
+    assert transport.in_waiting() == 1
+
+
+def test_base_transport_has_no_bus():
+    transport = CANTransport()
+    transport.set_filters([Match(0x123)])
+    assert not transport.send(Message(id=0x123, data=b""))
+    assert (transport.in_waiting(), transport.receive()) == (0, None)
+    assert transport.receive_batch([None] * 4) == 0
+    assert not transport.pending()
+    buffer = bytearray(REGISTER_FRAME_SIZE)
+    assert transport.read_raw_frames(buffer) == 0
+    assert transport.state == BusState.ERROR_ACTIVE
+    assert (transport.error_counts, transport.rx_overflow_count) == ((0, 0), 0)
@@ -0,0 +1,145 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""InputMonitor change windows and keypad event times."""
+import sys
+from collections import deque
+
+import pytest
+
+from frc_can_7491 import InputMonitor
+from enums import API_ID
+from message_schemas import SCHEMAS
+
+BUTTON_PRESS = SCHEMAS[API_ID.ButtonPress]
+
+
+class FakeEvent:  # pylint: disable=too-few-public-methods
+    """A keypad.Event"""
+
+    def __init__(self, key_number, pressed, timestamp):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = timestamp
+
+
+class FakeEvents:
+    """keypad.EventQueue, the calls InputMonitor makes without keypad"""
+
+    def __init__(self):
+        self.queue = deque()
+
+    def get(self):
+        return self.queue.popleft() if self.queue else None
+
+
+class FakeKeys:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.events = FakeEvents()
+
+
+class FakeDevice:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.frames = []
+
+    def send_message_simple(self, api_id, data):
+        self.frames.append((api_id, bytes(data)))
+
+
+@pytest.fixture(name="monitor")
+def fixture_monitor(monkeypatch):
+    """(monitor, keys, device, clock), the clock is a one item list in ms"""
+    clock = [5000]
+    monkeypatch.setattr(sys.modules["frc_can_7491.InputMonitor"], "ticks_ms", lambda: clock[0])
+    keys = FakeKeys()
+    device = FakeDevice()
+    monitor = InputMonitor(device, API_ID.ButtonPress, keys)
+    monitor.event = None
+    return monitor, keys, device, clock
+
+
+def decoded(device):
+    frames = [dict(zip(BUTTON_PRESS.names, BUTTON_PRESS.decode(data))) for _, data in device.frames]
+    device.frames.clear()
+    return frames
+
+
+def test_burst_on_several_keys_is_one_frame(monitor):
+    monitor, keys, device, clock = monitor
+    keys.events.queue.extend(
+        (
+            FakeEvent(0, True, 4990),
+            FakeEvent(3, True, 4995),
+            FakeEvent(3, False, 4998),
+            FakeEvent(15, True, 4999),
+        )
+    )
+    monitor.poll()
+
+    (frame,) = decoded(device)
+    assert frame == {
+        "state": 1 << 15 | 1 << 0,
+        "changed": 1 << 15 | 1 << 3 | 1 << 0,
+        "long_press": 0,
+        "double_press": 0,
+    }
+
+    # nothing new, nothing sent
+    clock[0] += 100
+    monitor.poll()
+    assert not device.frames
+
+
+def test_polls_within_the_interval_share_a_frame(monitor):
+    monitor, keys, device, clock = monitor
+    assert monitor.min_interval_ms > 20
+    keys.events.queue.append(FakeEvent(0, True, 5000))
+    monitor.poll()
+    assert len(decoded(device)) == 1
+
+    # three 20ms polls with events, one frame once the interval is up
+    for key in (1, 2, 0):
+        clock[0] += 20
+        keys.events.queue.append(FakeEvent(key, key != 0, clock[0] - 1))
+        monitor.poll()
+    (frame,) = decoded(device)
+    assert (frame["state"], frame["changed"]) == (0b110, 0b111)
+    assert monitor.frames_sent == 2
+
+
+def test_double_press_uses_event_times(monitor):
+    monitor, keys, device, clock = monitor
+    keys.events.queue.extend((FakeEvent(1, True, 4000), FakeEvent(1, False, 4100)))
+    monitor.poll()
+    decoded(device)
+
+    # polled late, but the presses were 250ms apart on the keypad
+    clock[0] += 1000
+    keys.events.queue.extend((FakeEvent(1, True, 4250), FakeEvent(1, False, 4300)))
+    monitor.poll()
+    (frame,) = decoded(device)
+    assert (frame["changed"], frame["double_press"]) == (0b10, 0b10)
+
+
+def test_long_press_is_reported_once(monitor):
+    monitor, keys, device, clock = monitor
+    keys.events.queue.append(FakeEvent(2, True, 5000))
+    monitor.poll()
+    decoded(device)
+
+    # held from the keypad's timestamp, not from when it was polled
+    clock[0] = 5000 + monitor.long_press_ms
+    monitor.poll()
+    (frame,) = decoded(device)
+    assert frame == {"state": 0b100, "changed": 0, "long_press": 0b100, "double_press": 0}
+
+    clock[0] += 100
+    monitor.poll()
+    assert not device.frames
+
+
+def test_inputs_past_sixteen_are_ignored(monitor):
+    monitor, keys, device, _ = monitor
+    keys.events.queue.append(FakeEvent(16, True, 5000))
+    monitor.poll()
+    assert not device.frames
@@ -0,0 +1,211 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""IOBreakout sampling, decimation, history and the status frames."""
+import sys
+import types
+from struct import unpack
+
+import pytest
+
+from frc_can_7491 import IOBreakout
+
+ANALOG_API = 0x60
+DIGITAL_API = 0x62
+
+
+class FakeInput:
+    """AnalogIn and DigitalInOut, the value comes from the pin, reads are counted"""
+
+    def __init__(self, pin) -> None:
+        self.pin = pin
+        self.reads = 0
+        self.direction = None
+        self.pull = None
+        self.deinitialized = False
+
+    @property
+    def value(self):
+        self.reads += 1
+        return self.pin.value
+
+    def deinit(self):
+        self.deinitialized = True
+
+
+class FakeDevice:  # pylint: disable=too-few-public-methods
+    def __init__(self) -> None:
+        self.sent = []
+
+    def send_message_simple(self, api_id, data):
+        self.sent.append((api_id, bytes(data)))
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    """Board IO modules for the breakout, returns its ticks_ms as a one item list"""
+    analogio = types.ModuleType("analogio")
+    analogio.AnalogIn = FakeInput
+    digitalio = types.ModuleType("digitalio")
+    digitalio.DigitalInOut = FakeInput
+    digitalio.Direction = types.SimpleNamespace(INPUT="input")
+    digitalio.Pull = types.SimpleNamespace(UP="up")
+    monkeypatch.setitem(sys.modules, "analogio", analogio)
+    monkeypatch.setitem(sys.modules, "digitalio", digitalio)
+    clock = [1000]
+    monkeypatch.setattr(sys.modules["frc_can_7491.IOBreakout"], "ticks_ms", lambda: clock[0])
+    return clock
+
+
+def pins(count):
+    return [types.SimpleNamespace(value=0) for _ in range(count)]
+
+
+def breakout(analog=(), digital=(), **kwargs):
+    kwargs.setdefault("analog_api", ANALOG_API)
+    kwargs.setdefault("digital_api", DIGITAL_API)
+    # publishing is left to the tests unless they set a period
+    kwargs.setdefault("publish_period_ms", 1_000_000)
+    device = FakeDevice()
+    io = IOBreakout(device, analog, digital, **kwargs)
+    io.next_publish += 1_000_000
+    return device, io
+
+
+def test_digital_edges_are_latched(clock):  # pylint: disable=unused-argument
+    digital = pins(3)
+    device, io = breakout(digital=digital)
+    io.sample()
+    # a pulse on input 1 between two publishes
+    digital[1].value = 1
+    io.sample()
+    digital[1].value = 0
+    digital[2].value = 1
+    io.sample()
+    io.publish()
+
+    (frame,) = device.sent
+    assert frame[0] == DIGITAL_API
+    assert unpack(IOBreakout.DIGITAL_FORMAT, frame[1]) == (0b100, 0b110, 0b010, 0, 3)
+
+    device.sent.clear()
+    io.sample()
+    io.publish()
+    assert unpack(IOBreakout.DIGITAL_FORMAT, device.sent[0][1]) == (0b100, 0, 0, 1, 1)
+
+
+def test_averaged_decimation(clock):  # pylint: disable=unused-argument
+    analog = pins(2)
+    _, io = breakout(analog=analog, decimation=4)
+    for value in (100, 200, 300, 401):
+        analog[0].value = value
+        analog[1].value = 2 * value
+        io.sample()
+        if value < 401:
+            assert io.count == 0
+    assert io.count == 1
+    # integer means, rounded down
+    assert (io.latest(0), io.latest(1)) == (250, 500)
+
+
+def test_latest_sample_decimation_reads_once(clock):  # pylint: disable=unused-argument
+    analog = pins(1)
+    _, io = breakout(analog=analog, decimation=4, average=False)
+    for value in (100, 200, 300, 400):
+        analog[0].value = value
+        io.sample()
+    assert io.latest(0) == 400
+    assert io.analog[0].reads == 1
+
+
+def test_history_wraps_oldest_first(clock):  # pylint: disable=unused-argument
+    analog = pins(2)
+    digital = pins(1)
+    _, io = breakout(analog=analog, digital=digital, history=3)
+    out = [None] * 5
+    assert io.read_history(0, out) == 0
+    assert io.latest(0) == 0
+
+    for value in range(1, 6):
+        analog[1].value = value
+        digital[0].value = value & 1
+        io.sample()
+    assert io.read_history(1, out) == 3
+    assert out[:3] == [3, 4, 5]
+    assert io.read_history(-1, out) == 3
+    assert out[:3] == [1, 0, 1]
+    short = [None] * 2
+    assert io.read_history(1, short) == 2
+    assert short == [4, 5]
+
+
+def test_analog_frames_four_channels_each(clock):  # pylint: disable=unused-argument
+    analog = pins(5)
+    device, io = breakout(analog=analog)
+    assert io.publish_frames == 2
+    for channel, pin in enumerate(analog):
+        pin.value = 1000 * (channel + 1)
+    io.sample()
+    io.publish()
+
+    assert [(api_id, unpack(IOBreakout.ANALOG_FORMAT, data)) for api_id, data in device.sent] == [
+        (ANALOG_API, (1000, 2000, 3000, 4000)),
+        (ANALOG_API + 1, (5000, 0, 0, 0)),
+    ]
+    assert io.frames_sent == 2
+
+
+def test_nothing_is_published_before_the_first_entry(clock):  # pylint: disable=unused-argument
+    device, io = breakout(analog=pins(1), digital=pins(1), decimation=2)
+    io.sample()
+    io.publish()
+    assert not device.sent
+    assert io.publish_frames == 2
+
+
+def test_publish_period(clock):
+    device, io = breakout(digital=pins(1), publish_period_ms=20)
+    io.next_publish = clock[0]
+    io.sample()
+    assert len(device.sent) == 1
+    clock[0] += 19
+    io.sample()
+    assert len(device.sent) == 1
+    clock[0] += 1
+    io.sample()
+    assert len(device.sent) == 2
+    assert unpack(IOBreakout.DIGITAL_FORMAT, device.sent[1][1])[3:] == (1, 2)
+
+
+def test_sequence_and_sample_count_wrap(clock):  # pylint: disable=unused-argument
+    device, io = breakout(digital=pins(1))
+    for _ in range(300):
+        io.sample()
+    io.sequence = 0xFF
+    io.publish()
+    io.sample()
+    io.publish()
+    assert [unpack(IOBreakout.DIGITAL_FORMAT, data)[3:] for _, data in device.sent] == [
+        (0xFF, 0xFF),
+        (0, 1),
+    ]
+
+
+def test_no_api_ids_no_frames(clock):  # pylint: disable=unused-argument
+    device, io = breakout(analog=pins(2), digital=pins(2), analog_api=None, digital_api=None)
+    io.sample()
+    io.publish()
+    assert io.publish_frames == 0
+    assert not device.sent
+
+
+def test_pins_are_set_up_and_released(clock):  # pylint: disable=unused-argument
+    _, io = breakout(analog=pins(1), digital=pins(1))
+    assert (io.digital[0].direction, io.digital[0].pull) == ("input", "up")
+    io.deinit()
+    assert io.analog[0].deinitialized and io.digital[0].deinitialized
+
+
+def test_too_many_digital_inputs(clock):  # pylint: disable=unused-argument
+    with pytest.raises(ValueError):
+        breakout(digital=pins(17))
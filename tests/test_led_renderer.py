@@ -0,0 +1,219 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""PixelFrame change tracking and output tables, segments and the LEDRenderer
+counters."""
+import pytest
+
+from led_renderer import LEDRenderer, PixelSegment, build_lut, fill_bytes
+
+
+class Painter:
+    """Stands in for an animation, draws the colors it's given one per animate()"""
+
+    def __init__(self, pixels, colors):
+        self.pixels = pixels
+        self.colors = list(colors)
+        self.shows = []
+
+    def animate(self, show=True):
+        self.shows.append(show)
+        if self.colors:
+            self.pixels.fill(self.colors.pop(0))
+
+
+def test_auto_write_stays_off(strip):
+    frame = strip.frame(4)
+    # adafruit_led_animation turns it off when an animation is built
+    frame.auto_write = False
+    frame.auto_write = True
+    assert frame.auto_write is False
+
+
+def test_segment_auto_write_stays_off(strip):
+    segment = PixelSegment(strip.frame(10), 2, 6)
+    segment.auto_write = False
+    segment.auto_write = True
+    assert segment.auto_write is False
+
+
+def test_show_only_writes_changes(strip):
+    frame = strip.frame(3)
+    # the first show always writes, the strip's state is unknown
+    assert frame.show()
+    assert not frame.show()
+
+    frame[1] = (1, 2, 3)
+    assert frame.show()
+    # the same color again is not a change
+    frame[1] = 0x010203
+    frame[0] = (0, 0, 0)
+    assert not frame.show()
+    assert (frame.shown, frame.skipped) == (2, 2)
+    assert len(strip.writes) == 2
+
+
+def test_writes_and_reads(strip):
+    frame = strip.frame(4)
+    frame[0] = 0x102030
+    frame[-1] = (4, 5, 6)
+    frame[1:3] = [(7, 8, 9), 0x0A0B0C]
+    assert frame[:] == [(0x10, 0x20, 0x30), (7, 8, 9), (10, 11, 12), (4, 5, 6)]
+    assert frame[-4] == (0x10, 0x20, 0x30)
+
+
+def test_fill(strip):
+    frame = strip.frame(4)
+    frame.show()
+    frame.fill(0x00FF00)
+    assert frame.show()
+    # filling with the same color again is skipped
+    frame.fill((0, 255, 0))
+    assert not frame.show()
+
+    # a single pixel write ends the fill, so the next fill is a change
+    frame[2] = 0xFF0000
+    frame.show()
+    frame.fill(0x00FF00)
+    assert frame.show()
+    assert frame[:] == [(0, 255, 0)] * 4
+
+
+def test_fill_range(strip):
+    frame = strip.frame(6)
+    frame.show()
+    frame.fill_range(1, 4, 0x0000FF)
+    assert frame.show()
+    assert frame[:] == [(0, 0, 0)] + [(0, 0, 255)] * 3 + [(0, 0, 0)] * 2
+    frame.fill_range(1, 4, (0, 0, 255))
+    assert not frame.show()
+
+
+def test_renderer_counts(strip):
+    frame = strip.frame(2)
+    renderer = LEDRenderer()
+    animation = Painter(frame, [0x010101, 0x010101, 0x020202])
+    for _ in range(4):
+        renderer.render(animation, frame)
+
+    # first frame, repeat, new color, nothing drawn
+    assert (renderer.frames_rendered, renderer.frames_skipped) == (2, 2)
+    assert animation.shows == [False] * 4
+    assert len(strip.writes) == 2
+    renderer.reset_stats()
+    assert (renderer.frames_rendered, renderer.frames_skipped) == (0, 0)
+
+
+def test_deinit_turns_the_strip_off(strip):
+    frame = strip.frame(2)
+    frame.fill(0xFFFFFF)
+    frame.show()
+    frame.deinit()
+    assert strip.writes[-1] == bytes(6)
+    assert frame.pin.deinitialized
+
+
+def test_segment_writes_into_its_part_of_the_frame(strip):
+    frame = strip.frame(8)
+    segment = PixelSegment(frame, 2, 5)
+    assert len(segment) == 3
+    segment[0] = 0x010101
+    segment[-1] = (3, 3, 3)
+    segment[1:2] = [(2, 2, 2)]
+    assert frame[:] == [(0, 0, 0)] * 2 + [(1, 1, 1), (2, 2, 2), (3, 3, 3)] + [(0, 0, 0)] * 3
+    assert segment[:] == [(1, 1, 1), (2, 2, 2), (3, 3, 3)]
+    assert segment[-3] == (1, 1, 1)
+
+
+def test_segment_fill(strip):
+    frame = strip.frame(6)
+    segment = PixelSegment(frame, 0, 3)
+    frame.show()
+    segment.fill(0xFF0000)
+    assert frame.show()
+    assert frame[:] == [(255, 0, 0)] * 3 + [(0, 0, 0)] * 3
+    # the same fill again doesn't touch the frame
+    segment.fill((255, 0, 0))
+    assert not frame.show()
+    # the segment's brightness is the whole strip's
+    segment.brightness = 0.5
+    assert frame.brightness == 0.5
+
+
+def test_render_segments_shows_once(strip):
+    frame = strip.frame(6)
+    renderer = LEDRenderer()
+    left = Painter(PixelSegment(frame, 0, 3), [0x010101, 0x010101])
+    right = Painter(PixelSegment(frame, 3, 6), [0x020202, 0x030303])
+    for _ in range(2):
+        renderer.render_segments(frame, [left, None, right])
+
+    # one strip write per tick, however many segments changed
+    assert len(strip.writes) == 2
+    assert (renderer.frames_rendered, renderer.frames_skipped) == (2, 0)
+    assert frame[:] == [(1, 1, 1)] * 3 + [(3, 3, 3)] * 3
+    renderer.render_segments(frame, [left, None, right])
+    assert renderer.frames_skipped == 1
+
+
+@pytest.mark.parametrize(
+    "brightness, gamma, expected",
+    [
+        (1.0, 1.0, {0: 0, 1: 1, 128: 128, 255: 255}),
+        (0.5, 1.0, {0: 0, 1: 1, 128: 64, 255: 128}),
+        (1.0, 2.0, {0: 0, 1: 0, 128: 64, 255: 255}),
+        # out of range brightness is clamped
+        (1.5, 1.0, {128: 128, 255: 255}),
+        (-1.0, 1.0, {128: 0, 255: 0}),
+    ],
+)
+def test_build_lut(brightness, gamma, expected):
+    lut = bytearray(256)
+    build_lut(lut, brightness, gamma)
+    assert {value: lut[value] for value in expected} == expected
+    assert list(lut) == sorted(lut)
+
+
+@pytest.mark.parametrize("total", [0, 2, 3, 4, 7, 30, 31])
+def test_fill_bytes(total):
+    buffer = bytearray(b"\xee" * 40)
+    fill_bytes(memoryview(buffer)[:total], 1, 2, 3)
+    expected = bytes((1, 2, 3) * 11)[:total] if total >= 3 else b"\xee" * total
+    assert buffer[:total] == expected
+    assert buffer[total:] == b"\xee" * (40 - total)
+
+
+def test_wire_is_in_strip_order(strip):
+    frame = strip.frame(2)
+    frame[0] = (1, 2, 3)
+    frame.fill_range(1, 2, (4, 5, 6))
+    frame.show()
+    assert strip.writes[-1] == bytes((2, 1, 3, 5, 4, 6))
+
+    frame = strip.frame(2, pixel_order="RGB")
+    frame.fill((1, 2, 3))
+    frame.show()
+    assert strip.writes[-1] == bytes((1, 2, 3, 1, 2, 3))
+
+
+def test_brightness_remaps_the_wire_buffer(strip):
+    frame = strip.frame(2, brightness=0.5)
+    frame[0] = (200, 100, 0)
+    frame.show()
+    assert strip.writes[-1][:3] == bytes((50, 100, 0))
+
+    frame.brightness = 1.0
+    # the drawn colors are kept, only the output changes
+    assert frame[0] == (200, 100, 0)
+    assert frame.show()
+    assert strip.writes[-1][:3] == bytes((100, 200, 0))
+    # setting the same brightness doesn't touch the strip
+    frame.brightness = 1.0
+    assert not frame.show()
+
+
+def test_gamma(strip):
+    frame = strip.frame(1, gamma=2.0)
+    frame[0] = (255, 128, 16)
+    frame.show()
+    assert strip.writes[-1] == bytes((64, 255, 1))
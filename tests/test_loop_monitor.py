@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""LoopMonitor lag percentiles, the TelemetryLag frame and the lag warnings."""
+import asyncio
+import sys
+import types
+from struct import unpack
+
+import pytest
+
+from frc_can_7491 import LogEvent, LoopMonitor, RingLogger, Scheduler
+
+
+class FakeDevice:  # pylint: disable=too-few-public-methods
+    """The part of CANDevice a LoopMonitor attaches to"""
+
+    def __init__(self):
+        self.log = RingLogger()
+        self.loop_monitor = None
+
+    def attach_loop_monitor(self, loop_monitor):
+        self.loop_monitor = loop_monitor
+
+
+def lag_frame(monitor):
+    return unpack(LoopMonitor.LAG_FORMAT, monitor.pack())
+
+
+def test_percentiles():
+    monitor = LoopMonitor()
+    assert (monitor.percentile(50), monitor.percentile(99)) == (0, 0)
+    for lag_ms in [0] * 98 + [7, 300]:
+        monitor.record(lag_ms)
+    # bucket upper limits, the last bucket is the max
+    assert (monitor.percentile(50), monitor.percentile(99), monitor.percentile(100)) == (1, 10, 300)
+    assert monitor.histogram == [98, 0, 0, 1, 0, 0, 0, 0, 1]
+
+
+def test_percentile_is_capped_by_the_max():
+    monitor = LoopMonitor()
+    monitor.record(3)
+    assert monitor.percentile(50) == 3
+
+
+def test_lag_frame_covers_one_window():
+    scheduler = Scheduler()
+    leds = scheduler.add("leds", lambda: None, 20)
+    can = scheduler.add("can", lambda: None, 20)
+    monitor = LoopMonitor(scheduler=scheduler)
+    leds.window_max_us = 4_000
+    can.window_max_us = 9_500
+    can.overruns = 3
+    for lag_ms in (1, 2, 40):
+        monitor.record(lag_ms)
+
+    assert lag_frame(monitor) == (40, 2, 40, 1, 9, 3)
+    # a new window, overruns from before don't count again
+    assert (leds.window_max_us, can.window_max_us) == (0, 0)
+    leds.overruns = 1
+    assert lag_frame(monitor) == (0, 0, 0, 0, 0, 1)
+
+
+def test_overruns_after_a_scheduler_reset():
+    scheduler = Scheduler()
+    task = scheduler.add("can", lambda: None, 20)
+    monitor = LoopMonitor(scheduler=scheduler)
+    task.overruns = 5
+    monitor.pack()
+    task.reset_stats()
+    task.overruns = 2
+    assert monitor.window_overruns() == 2
+
+
+def test_lag_frame_saturates():
+    monitor = LoopMonitor()
+    monitor.record(70_000)
+    assert lag_frame(monitor) == (0xFFFF, 0xFF, 0xFF, 0, 0, 0)
+
+
+def test_long_lag_is_logged():
+    device = FakeDevice()
+    monitor = LoopMonitor(device=device, warn_ms=50)
+    assert device.loop_monitor is monitor
+    monitor.record(50)
+    monitor.record(51)
+    monitor.record(80)
+    lines = []
+    device.log.drain(out=lines.append)
+    # rate limited, the second one is only counted
+    assert len(lines) == 1
+    assert lines[0].endswith("Event loop lag 51ms (period 10ms) (+1 suppressed)")
+    assert LogEvent.LoopLag in device.log.rate_limits
+
+
+def test_run_measures_late_wakes(monkeypatch):
+    clock = [1000]
+    lags = [0, 3, 60, -2]
+
+    class Stop(Exception):
+        pass
+
+    async def sleep(seconds):
+        if not lags:
+            raise Stop
+        clock[0] += round(seconds * 1000) + lags.pop(0)
+
+    module = sys.modules["frc_can_7491.LoopMonitor"]
+    monkeypatch.setattr(module, "ticks_ms", lambda: clock[0])
+    monkeypatch.setattr(module, "asyncio", types.SimpleNamespace(sleep=sleep))
+    monitor = LoopMonitor(period_ms=10, warn_ms=1000)
+    with pytest.raises(Stop):
+        asyncio.run(monitor.run())
+
+    # an early wake counts as no lag
+    assert monitor.samples == 4
+    assert monitor.lag_max_ms == 60
+    assert monitor.histogram == [2, 0, 1, 0, 0, 0, 1, 0, 0]
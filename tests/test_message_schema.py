@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""MessageSchema encode/decode round trips over every declared schema."""
+import random
+
+import pytest
+
+from frc_can_7491 import HEARTBEAT_SCHEMA, Field, MessageSchema, RobotHeartbeat
+from frc_can_7491.MessageSchema import FIELD_SIZES
+from enums import API_ID
+from message_schemas import PATTERN_DEFAULTS, SCHEMAS
+
+ALL_SCHEMAS = list(SCHEMAS.values()) + [HEARTBEAT_SCHEMA]
+
+
+def random_raw(rng, field: Field) -> int:
+    """A nonzero raw value that fits the field"""
+    if field.bit is not None:
+        width = field.bits
+    else:
+        width = 8 * FIELD_SIZES[field.code]
+    if field.code.islower() and field.code != "rgb" and field.bit is None:
+        return rng.choice((-1, 1)) * rng.randrange(1, 1 << (width - 1))
+    return rng.randrange(1, 1 << width)
+
+
+def expected_value(field: Field, raw: int):
+    if field.scale is None:
+        return raw
+    return raw / round(1 / field.scale) if field.scale < 1 else raw * field.scale
+
+
+@pytest.mark.parametrize("schema", ALL_SCHEMAS, ids=lambda schema: schema.name)
+def test_round_trip(schema):
+    rng = random.Random(schema.name)
+    for _ in range(200):
+        values = [expected_value(field, random_raw(rng, field)) for field in schema.fields]
+        payload = schema.encode(*values)
+        assert len(payload) == schema.size
+        assert schema.decode(payload) == values
+        # and back to the same bytes
+        assert schema.encode(*schema.decode(payload)) == payload
+
+
+@pytest.mark.parametrize("schema", ALL_SCHEMAS, ids=lambda schema: schema.name)
+def test_encode_into_offset(schema):
+    buffer = bytearray(b"\xee" * (schema.size + 4))
+    values = [expected_value(field, 1) for field in schema.fields]
+    assert schema.encode_into(buffer, 2, *values) == schema.size
+    assert bytes(buffer[2 : 2 + schema.size]) == schema.encode(*values)
+    assert buffer[:2] == b"\xee\xee" and buffer[2 + schema.size :] == b"\xee\xee"
+
+
+def test_short_payload_picks_defaults():
+    schema = SCHEMAS[API_ID.PatternChase]
+    speed, size = PATTERN_DEFAULTS[API_ID.PatternChase]
+    # segment and color only
+    assert schema.decode(b"\x02\x11\x22\x33") == [2, 0x112233, speed, size, 0]
+    assert schema.decode(b"") == [0, 0, speed, size, 0]
+
+
+def test_scale_is_exact():
+    schema = SCHEMAS[API_ID.PatternBlink]
+    assert schema.decode(bytes([0, 0, 0, 0, 7]))[2] == 0.07
+    assert schema.encode(0, 0, 0.07) == bytes([0, 0, 0, 0, 7])
+
+
+def test_gaps_are_zeroed():
+    schema = SCHEMAS[API_ID.InitPixelArray]
+    assert schema.encode(300, 64, 0) == bytes([0, 0, 0, 0, 0x2C, 0x01, 64, 0])
+    buffer = bytearray(b"\xff" * 8)
+    schema.encode_into(buffer, 0, 300, 64, 0)
+    assert bytes(buffer) == schema.encode(300, 64, 0)
+
+
+def test_heartbeat_schema_matches_robot_heartbeat():
+    rng = random.Random(7491)
+    for _ in range(200):
+        data = bytes(rng.getrandbits(8) for _ in range(8))
+        heartbeat = RobotHeartbeat(data)
+        fields = dict(zip(HEARTBEAT_SCHEMA.names, HEARTBEAT_SCHEMA.decode(data)))
+        assert fields["match_time"] == heartbeat.match_time
+        assert fields["match_number"] == heartbeat.match_number
+        assert fields["replay_number"] == heartbeat.replay_number
+        assert fields["system_watchdog"] == heartbeat.system_watchdog_p
+        assert fields["test_mode"] == heartbeat.test_mode
+        assert fields["auto_mode"] == heartbeat.auto_mode
+        assert fields["enabled"] == heartbeat.enabled
+        assert fields["red_alliance"] == heartbeat.red_alliance
+
+
+def test_fields_are_not_changed():
+    fields = (Field("first"), Field("second", "H"), Field("third", "H", 6))
+    first = MessageSchema("First", fields)
+    second = MessageSchema("Second", fields[1:])
+    assert [field.offset for field in fields] == [None, None, 6]
+    assert first.offsets == (0, 1, 6)
+    assert second.offsets == (0, 6)
+    assert second.encode(0x0102, 0x0304) == bytes([2, 1, 0, 0, 0, 0, 4, 3])
+
+
+def test_overlapping_fields_are_refused():
+    with pytest.raises(ValueError):
+        MessageSchema("Overlap", (Field("wide", "I"), Field("narrow", "B", 2)))
@@ -0,0 +1,261 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""Pattern payload decoding, animation construction and parameter updates."""
+import pytest
+
+pytest.importorskip("adafruit_led_animation.animation.blink")
+
+# pylint: disable=wrong-import-position
+from adafruit_led_animation.animation.blink import Blink  # noqa: E402
+from adafruit_led_animation.animation.chase import Chase  # noqa: E402
+from adafruit_led_animation.animation.comet import Comet  # noqa: E402
+from adafruit_led_animation.animation.rainbowcomet import RainbowComet  # noqa: E402
+from adafruit_led_animation.animation.rainbowsparkle import RainbowSparkle  # noqa: E402
+from adafruit_led_animation.animation.solid import Solid  # noqa: E402
+
+from enums import API_ID  # noqa: E402
+from led_renderer import PixelSegment  # noqa: E402
+from message_schemas import FLAG_BOUNCE, FLAG_REVERSE, PATTERN_DEFAULTS, SCHEMAS  # noqa: E402
+from pattern_commands import (  # noqa: E402
+    Alternating,
+    PatternDecoder,
+    apply_parameters,
+    build_animation,
+    cache_key,
+)
+
+# payload, then what it decodes to, for each pattern layout
+PAYLOADS = {
+    API_ID.PatternChaos: (
+        bytes((1, 7, 12)),
+        {"segment": 1, "speed": 0.07, "size": 12, "flags": 0},
+    ),
+    API_ID.PatternRainbow: (
+        bytes((2, 3, 5, FLAG_REVERSE)),
+        {"segment": 2, "speed": 0.03, "size": 5, "flags": FLAG_REVERSE},
+    ),
+    API_ID.PatternSolid: (
+        bytes((1, 0x12, 0x34, 0x56)),
+        {"segment": 1, "color": 0x123456},
+    ),
+    API_ID.PatternBlink: (
+        bytes((0, 0xFF, 0, 0, 25)),
+        {"segment": 0, "color": 0xFF0000, "speed": 0.25},
+    ),
+    API_ID.PatternIntensity: (bytes((3, 128)), {"segment": 3, "brightness": 128}),
+    API_ID.PatternScanner: (
+        bytes((1, 0, 0xFF, 0, 4, 6, FLAG_BOUNCE)),
+        {"segment": 1, "color": 0x00FF00, "speed": 0.04, "size": 6, "flags": FLAG_BOUNCE},
+    ),
+    API_ID.PatternAlternating: (
+        bytes((0, 0xFF, 0, 0, 0, 0, 0xFF, 20)),
+        {"segment": 0, "color": 0xFF0000, "color2": 0x0000FF, "speed": 0.2},
+    ),
+    API_ID.PatternChase: (
+        bytes((2, 0, 0, 0xFF, 10, 3, FLAG_REVERSE)),
+        {"segment": 2, "color": 0x0000FF, "speed": 0.1, "size": 3, "flags": FLAG_REVERSE},
+    ),
+}
+
+
+def decoded(command, names):
+    return {name: getattr(command, name) for name in names}
+
+
+@pytest.mark.parametrize("api_id", sorted(PAYLOADS))
+def test_decode_each_layout(api_id):
+    data, expected = PAYLOADS[api_id]
+    command = PatternDecoder().decode(api_id, data)
+    assert command.api_id == api_id
+    assert decoded(command, expected) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("api_id", sorted(PAYLOADS))
+def test_decode_matches_the_schema_encoding(api_id):
+    data, expected = PAYLOADS[api_id]
+    # the host tools encode with the same tables
+    values = [expected.get(name) for name in SCHEMAS[api_id].names]
+    assert SCHEMAS[api_id].encode(*values) == data.ljust(SCHEMAS[api_id].size, b"\x00")
+
+
+@pytest.mark.parametrize("api_id", sorted(PAYLOADS))
+def test_empty_payload_selects_the_defaults(api_id):
+    command = PatternDecoder().decode(api_id, b"")
+    speed, size = PATTERN_DEFAULTS[api_id]
+    assert (command.segment, command.speed, command.size, command.flags) == (0, speed, size, 0)
+
+
+def test_short_payload_defaults_the_missing_fields():
+    decoder = PatternDecoder()
+    # segment and color only, speed, size and flags cut off
+    command = decoder.decode(API_ID.PatternChase, bytes((1, 0x10, 0x20, 0x30)))
+    assert (command.segment, command.color) == (1, 0x102030)
+    assert (command.speed, command.size) == PATTERN_DEFAULTS[API_ID.PatternChase]
+    assert not command.reverse
+
+    # a color cut off part way reads the missing bytes as 0
+    command = decoder.decode(API_ID.PatternSolid, bytes((0, 0xAB)))
+    assert command.color == 0xAB0000
+
+
+@pytest.mark.parametrize("api_id", sorted(PAYLOADS))
+@pytest.mark.parametrize("data", [b"\xff" * 8, bytes(range(0x80, 0x88)), b"\x55" * 12])
+def test_garbage_payload_decodes_in_range(api_id, data):
+    command = PatternDecoder().decode(api_id, data)
+    assert 0 <= command.segment <= 0xFF
+    assert 0 <= command.color <= 0xFFFFFF
+    assert 0 <= command.color2 <= 0xFFFFFF
+    assert 0 < command.speed <= 2.55
+    assert 0 <= command.size <= 0xFF
+    assert 0 <= command.flags <= 0xFF
+
+
+@pytest.mark.parametrize("api_id", [API_ID.InitPixelArray, API_ID.ButtonPress, 0x3FF])
+def test_unknown_api_id(api_id):
+    assert PatternDecoder().decode(api_id, bytes(8)) is None
+
+
+def test_decode_resets_the_fields_the_pattern_lacks():
+    decoder = PatternDecoder()
+    decoder.decode(API_ID.PatternChase, bytes((2, 0, 0, 0xFF, 10, 3, FLAG_REVERSE)))
+    command = decoder.decode(API_ID.PatternBlink, bytes((1,)))
+
+    # shared command, segment, speed, size and flags start over for each pattern
+    assert command is decoder.command
+    assert command.api_id == API_ID.PatternBlink
+    assert command.segment == 1
+    assert (command.speed, command.size) == PATTERN_DEFAULTS[API_ID.PatternBlink]
+    assert command.flags == 0
+    # blink's color was cut off, so it reads as 0 rather than keeping chase's
+    assert command.color == 0
+
+
+def test_intensity_keeps_the_color():
+    decoder = PatternDecoder()
+    decoder.decode(API_ID.PatternSolid, bytes((0, 0x12, 0x34, 0x56)))
+    command = decoder.decode(API_ID.PatternIntensity, bytes((0, 40)))
+    assert (command.color, command.brightness) == (0x123456, 40)
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (bytes((0, 0, 0, 0, 0x2C, 0x01, 128, 0)), (128, 300)),
+        # 16 bit count left at 0, the original 8 bit count in byte 7
+        (bytes((0, 0, 0, 0, 0, 0, 200, 60)), (200, 60)),
+        (b"", (0, 0)),
+    ],
+)
+def test_decode_init(data, expected):
+    assert PatternDecoder().decode_init(data) == expected
+
+
+def test_decode_segment():
+    assert list(PatternDecoder().decode_segment(bytes((2, 10, 0, 0x2C, 0x01)))) == [2, 10, 300]
+    assert list(PatternDecoder().decode_segment(bytes((1,)))) == [1, 0, 0]
+
+
+@pytest.mark.parametrize(
+    "api_id, kind",
+    [
+        (API_ID.PatternChaos, RainbowSparkle),
+        (API_ID.PatternRainbow, RainbowComet),
+        (API_ID.PatternSolid, Solid),
+        (API_ID.PatternBlink, Blink),
+        (API_ID.PatternScanner, Comet),
+        (API_ID.PatternAlternating, Alternating),
+        (API_ID.PatternChase, Chase),
+    ],
+)
+def test_build_animation(strip, api_id, kind):
+    data, _ = PAYLOADS[api_id]
+    command = PatternDecoder().decode(api_id, data)
+    animation = build_animation(strip.frame(30), command)
+    assert type(animation) is kind  # pylint: disable=unidiomatic-typecheck
+    if api_id != API_ID.PatternSolid:
+        assert animation.speed == pytest.approx(command.speed)
+
+
+def test_build_animation_sizes_and_flags(strip):
+    decoder = PatternDecoder()
+    pixels = strip.frame(30)
+
+    chase = build_animation(
+        pixels, decoder.decode(API_ID.PatternChase, PAYLOADS[API_ID.PatternChase][0])
+    )
+    assert (chase._size, chase.reverse) == (3, True)  # pylint: disable=protected-access
+
+    scanner = build_animation(pixels, decoder.decode(API_ID.PatternScanner, b""))
+    # the scanner always bounces
+    assert scanner.bounce
+    assert scanner._tail_length == 10  # pylint: disable=protected-access
+
+    alternating = build_animation(
+        pixels, decoder.decode(API_ID.PatternAlternating, PAYLOADS[API_ID.PatternAlternating][0])
+    )
+    assert (alternating.color, alternating.alt_color) == ((255, 0, 0), 0x0000FF)
+
+
+def test_animation_draws_into_its_segment(strip):
+    frame = strip.frame(10)
+    segment = PixelSegment(frame, 2, 6)
+    command = PatternDecoder().decode(API_ID.PatternSolid, bytes((0, 0x12, 0x34, 0x56)))
+    build_animation(segment, command).animate(show=False)
+    assert frame[:] == [(0, 0, 0)] * 2 + [(0x12, 0x34, 0x56)] * 4 + [(0, 0, 0)] * 4
+
+
+def test_build_animation_without_one(strip):
+    command = PatternDecoder().decode(API_ID.PatternIntensity, bytes((0, 40)))
+    # intensity only changes the brightness, code.py handles it
+    assert build_animation(strip.frame(30), command) is None
+
+
+def test_apply_parameters(strip):
+    decoder = PatternDecoder()
+    command = decoder.decode(API_ID.PatternBlink, bytes((0, 0xFF, 0, 0, 50)))
+    animation = build_animation(strip.frame(30), command)
+
+    command = decoder.decode(API_ID.PatternBlink, bytes((0, 0, 0xFF, 0, 20)))
+    apply_parameters(animation, command)
+    assert animation.speed == pytest.approx(0.2)
+    # blink picks the new color up at the start of its next cycle
+    assert animation.colors[0] == (0, 255, 0)
+
+
+def test_apply_parameters_alternating(strip):
+    decoder = PatternDecoder()
+    command = decoder.decode(API_ID.PatternAlternating, PAYLOADS[API_ID.PatternAlternating][0])
+    animation = build_animation(strip.frame(30), command)
+
+    command = decoder.decode(API_ID.PatternAlternating, bytes((0, 0, 0xFF, 0, 0x10, 0x20, 0x30)))
+    apply_parameters(animation, command)
+    assert animation.color == (0, 255, 0)
+    assert animation.alt_color == 0x102030
+    # speed cut off, back to the default
+    assert animation.speed == pytest.approx(PATTERN_DEFAULTS[API_ID.PatternAlternating][0])
+
+
+@pytest.mark.parametrize("api_id", [API_ID.PatternChaos, API_ID.PatternRainbow])
+def test_apply_parameters_leaves_rainbow_colors(strip, api_id):
+    decoder = PatternDecoder()
+    animation = build_animation(strip.frame(30), decoder.decode(api_id, b""))
+    color = animation.color
+    # a color left over from an earlier pattern doesn't reach the rainbow
+    decoder.command.color = 0x123456
+    apply_parameters(animation, decoder.decode(api_id, bytes((0, 9))))
+    assert animation.color == color
+    assert animation.speed == pytest.approx(0.09)
+
+
+def test_cache_key_ignores_the_live_parameters():
+    decoder = PatternDecoder()
+    first = cache_key(decoder.decode(API_ID.PatternChase, bytes((1, 0xFF, 0, 0, 10, 3))))
+    # color and speed are applied to the cached animation
+    assert cache_key(decoder.decode(API_ID.PatternChase, bytes((1, 0, 0xFF, 0, 20, 3)))) == first
+    # size and flags need a new one
+    assert cache_key(decoder.decode(API_ID.PatternChase, bytes((1, 0xFF, 0, 0, 10, 4)))) != first
+    assert (
+        cache_key(decoder.decode(API_ID.PatternChase, bytes((1, 0xFF, 0, 0, 10, 3, FLAG_REVERSE))))
+        != first
+    )
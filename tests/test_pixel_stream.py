@@ -0,0 +1,141 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""PixelStream messages applied to a PixelFrame, and the stream stats."""
+import sys
+from struct import pack
+
+import pytest
+
+from enums import API_ID
+from frc_can_7491 import frame_bits
+from pixel_stream import PixelStream
+
+DEVICE_ID = (11 << 24) | (8 << 16) | 5
+RED = 0xF800
+GREEN = 0x07E0
+WHITE = 0xFFFF
+
+
+@pytest.fixture(name="stream")
+def fixture_stream(strip):
+    """(stream, frame) on a 10 pixel strip"""
+    frame = strip.frame(10)
+    stream = PixelStream(DEVICE_ID)
+    stream.attach(frame)
+    return stream, frame
+
+
+def pixels(frame):
+    return [frame[index] for index in range(frame.n)]
+
+
+def test_nothing_happens_before_attach():
+    stream = PixelStream()
+    stream.handle(API_ID.StreamRun, pack("<HHH", 0, 4, RED))
+    assert not stream.active
+
+
+def test_run(stream):
+    stream, frame = stream
+    stream.handle(API_ID.StreamRun, pack("<HHH", 2, 3, RED))
+    assert stream.active
+    assert pixels(frame) == [(0, 0, 0)] * 2 + [(255, 0, 0)] * 3 + [(0, 0, 0)] * 5
+
+    # clipped to the strip, a run past the end changes nothing
+    stream.handle(API_ID.StreamRun, pack("<HHH", 8, 100, GREEN))
+    stream.handle(API_ID.StreamRun, pack("<HHH", 12, 4, WHITE))
+    assert pixels(frame)[7:] == [(0, 0, 0), (0, 255, 0), (0, 255, 0)]
+
+
+def test_run_that_changes_nothing_leaves_the_frame_clean(stream):
+    stream, frame = stream
+    stream.handle(API_ID.StreamRun, pack("<HHH", 0, 10, RED))
+    frame.show()
+    stream.handle(API_ID.StreamRun, pack("<HHH", 0, 10, RED))
+    assert not frame.dirty
+
+
+def test_literal(stream):
+    stream, frame = stream
+    stream.handle(API_ID.StreamLiteral, pack("<HHHH", 8, RED, GREEN, WHITE))
+    assert pixels(frame)[8:] == [(255, 0, 0), (0, 255, 0)]
+    # fewer colors than fit in the frame
+    stream.handle(API_ID.StreamLiteral, pack("<HH", 0, WHITE))
+    assert pixels(frame)[:2] == [(255, 255, 255), (0, 0, 0)]
+
+
+def test_palette_and_indexed(stream):
+    stream, frame = stream
+    stream.handle(API_ID.StreamPalette, bytes((1, 10, 20, 30)))
+    stream.handle(API_ID.StreamPalette, bytes((2, 40, 50, 60)))
+    # the skip index is not a palette entry
+    stream.handle(API_ID.StreamPalette, bytes((255, 1, 2, 3)))
+    stream.handle(API_ID.StreamIndexed, pack("<H6B", 5, 1, 255, 2, 0, 1, 1))
+
+    assert pixels(frame)[5:] == [(10, 20, 30), (0, 0, 0), (40, 50, 60), (0, 0, 0), (10, 20, 30)]
+
+
+def test_short_payloads_are_ignored(stream):
+    stream, frame = stream
+    stream.handle(API_ID.StreamRun, pack("<HH", 0, 10))
+    stream.handle(API_ID.StreamLiteral, b"\x00\x00")
+    stream.handle(API_ID.StreamIndexed, b"\x00\x00")
+    stream.handle(API_ID.StreamPalette, b"\x01\x02")
+    stream.handle(API_ID.StreamCommit, b"\x01")
+    assert pixels(frame) == [(0, 0, 0)] * 10
+    assert not stream.take_commit()
+
+
+def commit(stream, number):
+    stream.handle(API_ID.StreamCommit, pack("<H", number))
+
+
+def test_commit(stream):
+    stream, _ = stream
+    commit(stream, 7)
+    assert stream.take_commit()
+    assert not stream.take_commit()
+
+
+@pytest.mark.parametrize(
+    "numbers, frames, dropped",
+    [
+        ((1, 2, 3), 3, 0),
+        ((1, 4), 2, 2),
+        ((0xFFFE, 0xFFFF, 0, 1), 4, 0),
+        # repeated and retransmitted commits aren't drops
+        ((5, 5, 6), 2, 0),
+        ((5, 6, 5, 7), 3, 0),
+        # the host starting over
+        ((900, 0, 1), 3, 0),
+    ],
+)
+def test_commit_frame_numbers(stream, numbers, frames, dropped):
+    stream, _ = stream
+    for number in numbers:
+        commit(stream, number)
+    _, _, got_frames, got_dropped = stream.stats()
+    assert (got_frames, got_dropped) == (frames, dropped)
+
+
+def test_stats_count_bus_bits(stream, monkeypatch):
+    stream, _ = stream
+    now = [1000]
+    monkeypatch.setattr(sys.modules["pixel_stream"], "ticks_ms", lambda: now[0])
+    stream.window_start = now[0]
+
+    run = pack("<HHH", 0, 10, RED)
+    stream.handle(API_ID.StreamRun, run)
+    commit(stream, 1)
+    bits = frame_bits(DEVICE_ID | API_ID.StreamRun << 6, run) + frame_bits(
+        DEVICE_ID | API_ID.StreamCommit << 6, pack("<H", 1)
+    )
+    assert stream.bus_bits == bits
+
+    now[0] += 10
+    fps_x10, utilization, frames, dropped = stream.stats()
+    assert (fps_x10, frames, dropped) == (1000, 1, 0)
+    # 0.1% units of a 1 Mbit/s bus over 10 ms
+    assert utilization == bits * 1000 // 10_000
+    assert stream.stats()[1:] == (0, 0, 0)
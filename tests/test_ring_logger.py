@@ -0,0 +1,112 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""RingLogger records, wrapping, rate limits and draining."""
+import sys
+
+import pytest
+
+from frc_can_7491 import LogEvent, LogLevel, RingLogger
+
+EVENT = 64
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    """The logger's ticks_ms, a one item list in ms"""
+    clock = [1000]
+    monkeypatch.setattr(sys.modules["frc_can_7491.RingLogger"], "ticks_ms", lambda: clock[0])
+    return clock
+
+
+def drained(logger, limit=0):
+    lines = []
+    logger.drain(limit, out=lines.append)
+    return lines
+
+
+def test_args_saturate_at_the_record_width(clock):  # pylint: disable=unused-argument
+    logger = RingLogger()
+    logger.register(EVENT, "{0} {1} {2}")
+    logger.info(EVENT, 0x80000000, -(1 << 40), 0xFFFFFFFF)
+    logger.info(EVENT, 0x7FFFFFFF, -0x80000000, 0x1FFFFFFF)
+    assert [line.split(None, 2)[2] for line in drained(logger)] == [
+        "2147483647 -2147483648 2147483647",
+        "2147483647 -2147483648 536870911",
+    ]
+
+
+def test_record_and_drain(clock):
+    logger = RingLogger()
+    logger.register(EVENT, "pattern {0:#x} segment {1}")
+    logger.info(EVENT, 0x22, 3)
+    clock[0] = 1500
+    logger.error(EVENT + 1, 1, 2, 3)
+
+    assert drained(logger) == [
+        "      1000 INFO  pattern 0x22 segment 3",
+        "      1500 ERROR event 65: 1 2 3",
+    ]
+    assert logger.count == 0
+    assert not drained(logger)
+
+
+def test_level_filter(clock):  # pylint: disable=unused-argument
+    logger = RingLogger(level=LogLevel.WARNING)
+    logger.debug(EVENT)
+    logger.info(EVENT)
+    logger.warning(EVENT)
+    logger.error(EVENT)
+    assert [line.split()[1] for line in drained(logger)] == ["WARN", "ERROR"]
+
+
+def test_wrap_keeps_the_newest_records(clock):
+    logger = RingLogger(capacity=3)
+    for value in range(5):
+        clock[0] += 1
+        logger.info(EVENT, value)
+    assert (logger.count, logger.overwritten) == (3, 2)
+
+    lines = drained(logger)
+    assert lines[0] == "      1005 WARN  log overflow, 2 records lost"
+    assert [line.split()[-3] for line in lines[1:]] == ["2", "3", "4"]
+    assert logger.overwritten == 0
+    # the ring keeps going after the wrap
+    logger.info(EVENT, 9)
+    assert drained(logger)[0].endswith("event 64: 9 0 0")
+
+
+def test_drain_limit(clock):  # pylint: disable=unused-argument
+    logger = RingLogger()
+    for value in range(5):
+        logger.info(EVENT, value)
+    assert logger.drain(2, out=lambda line: None) == 2
+    assert logger.count == 3
+    assert [line.split()[-3] for line in drained(logger)] == ["2", "3", "4"]
+
+
+def test_rate_limit_counts_the_suppressed_records(clock):
+    logger = RingLogger()
+    logger.set_rate_limit(EVENT, 100)
+    logger.info(EVENT, 1)
+    for _ in range(3):
+        clock[0] += 30
+        logger.info(EVENT, 2)
+    clock[0] += 10
+    logger.info(EVENT, 3)
+
+    # the count goes on the next record of that event that is drained
+    assert [line.split(None, 2)[2] for line in drained(logger)] == [
+        "event 64: 1 0 0 (+3 suppressed)",
+        "event 64: 3 0 0",
+    ]
+
+
+def test_unrouted_frames_are_rate_limited(clock):  # pylint: disable=unused-argument
+    logger = RingLogger()
+    for _ in range(10):
+        logger.info(LogEvent.UnroutedDevice, 0x0B080405, 0x10, 2)
+    (line,) = drained(logger)
+    assert line.endswith(
+        "Handler Not Defined. API ID: 0x10 Message Type: 2 ID: 0xb080405 (+9 suppressed)"
+    )
@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""Scheduler release grid, skipped periods and task selection."""
+import sys
+
+import pytest
+
+from frc_can_7491 import Scheduler
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    """The scheduler's ticks_ms, a one item list in ms"""
+    clock = [1000]
+    monkeypatch.setattr(sys.modules["frc_can_7491.Scheduler"], "ticks_ms", lambda: clock[0])
+    return clock
+
+
+def taking(clock, run_ms):
+    """A task function that takes run_ms"""
+
+    def func():
+        clock[0] += run_ms
+
+    return func
+
+
+def test_on_time_run(clock):
+    scheduler = Scheduler()
+    task = scheduler.add("can", taking(clock, 5), 20)
+    Scheduler.run_task(task, clock[0], True)
+
+    assert task.next_release == 1020
+    assert (task.runs, task.skipped, task.overruns) == (1, 0, 0)
+    assert scheduler.next_task(clock[0]) is None
+    assert scheduler.wait_ms(clock[0]) == 15
+
+
+@pytest.mark.parametrize("run_ms", [20, 21, 39])
+def test_slightly_late_run_keeps_the_next_period(clock, run_ms):
+    scheduler = Scheduler()
+    task = scheduler.add("can", taking(clock, run_ms), 20)
+    Scheduler.run_task(task, clock[0], True)
+
+    # released already, runs late on the next pass instead of losing a period
+    assert task.next_release == 1020
+    assert task.skipped == 0
+    assert scheduler.next_task(clock[0]) is task
+    assert task.overruns == (1 if run_ms > 20 else 0)
+
+
+@pytest.mark.parametrize("run_ms, skipped", [(40, 1), (45, 1), (65, 2)])
+def test_whole_missed_periods_are_skipped(clock, run_ms, skipped):
+    scheduler = Scheduler()
+    task = scheduler.add("can", taking(clock, run_ms), 20)
+    Scheduler.run_task(task, clock[0], True)
+
+    assert task.skipped == skipped
+    assert task.next_release == 1020 + 20 * skipped
+    # still on the grid and less than a period behind
+    assert 0 <= clock[0] - task.next_release < 20
+    assert scheduler.next_task(clock[0]) is task
+
+
+def test_steady_late_runs_keep_the_rate(clock):
+    scheduler = Scheduler()
+    task = scheduler.add("can", taking(clock, 1), 20)
+    task.next_release = clock[0]
+    # every run starts 1ms after its release and takes 1ms, none are lost
+    for _ in range(50):
+        clock[0] = task.next_release + 1
+        Scheduler.run_task(task, clock[0], True)
+    assert task.runs == 50
+    assert task.skipped == 0
+    assert task.next_release == 1000 + 50 * 20
+
+
+def test_early_runs_leave_the_grid_alone(clock):
+    scheduler = Scheduler()
+    task = scheduler.add("can", taking(clock, 1), 20)
+    task.next_release = 1010
+    Scheduler.run_task(task, clock[0], False)
+    assert (task.runs, task.early_runs, task.next_release) == (1, 1, 1010)
+
+
+def test_priority_then_earliest_deadline(clock):
+    scheduler = Scheduler()
+    leds = scheduler.add("leds", taking(clock, 1), 20, priority=0)
+    status = scheduler.add("status", taking(clock, 1), 100, priority=1, deadline_ms=50)
+    can = scheduler.add("can", taking(clock, 1), 20, priority=1, deadline_ms=10)
+    for task in scheduler.tasks:
+        task.next_release = clock[0]
+
+    assert scheduler.next_task(clock[0]) is can
+    can.next_release = clock[0] + 20
+    assert scheduler.next_task(clock[0]) is status
+    status.next_release = clock[0] + 100
+    assert scheduler.next_task(clock[0]) is leds
+
+
+def test_urgent_task_cuts_in(clock):
+    waiting = [False]
+    scheduler = Scheduler()
+    scheduler.add("leds", taking(clock, 1), 20, priority=0)
+    can = scheduler.add("can", taking(clock, 1), 20, priority=1, pending=lambda: waiting[0])
+
+    assert scheduler.urgent_task(0) is None
+    waiting[0] = True
+    assert scheduler.urgent_task(0) is can
+    assert scheduler.urgent_task(1) is None
@@ -0,0 +1,172 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""SLCANGateway command parsing and bus to host lines."""
+import pytest
+
+from frc_can_7491 import Message, RemoteTransmissionRequest, SLCANGateway, VirtualBus
+from gateway_sim import serial_pair
+
+
+@pytest.fixture(name="slcan")
+def fixture_slcan():
+    """(bus, gateway, host end of the serial link, monitor transport on the bus)"""
+    bus = VirtualBus()
+    device_end, host = serial_pair()
+    gateway = SLCANGateway(bus.transport(rx_capacity=256), device_end)
+    monitor = bus.transport(rx_capacity=256)
+    monitor.set_filters(None)
+    return bus, gateway, host, monitor
+
+
+def run(gateway, host, commands: bytes) -> bytes:
+    host.write(commands)
+    gateway.poll()
+    return host.read()
+
+
+def sent(monitor):
+    frames = []
+    while monitor.in_waiting():
+        frames.append(monitor.receive())
+    return frames
+
+
+def test_open_send_close(slcan):
+    _, gateway, host, monitor = slcan
+    assert run(gateway, host, b"S8\rO\r") == b"\r\r"
+    assert run(gateway, host, b"T1234567830102FF\rt7FF0\r") == b"Z\rz\r"
+
+    extended, standard = sent(monitor)
+    assert (extended.id, bytes(extended.data), extended.extended) == (
+        0x12345678,
+        b"\x01\x02\xff",
+        True,
+    )
+    assert (standard.id, bytes(standard.data), standard.extended) == (0x7FF, b"", False)
+
+    assert run(gateway, host, b"C\rt1230\r") == b"\r\a"
+    assert not sent(monitor)
+
+
+def test_remote_frames(slcan):
+    _, gateway, host, monitor = slcan
+    run(gateway, host, b"O\r")
+    assert run(gateway, host, b"R0204000C4\rr1238\r") == b"Z\rz\r"
+
+    extended, standard = sent(monitor)
+    assert isinstance(extended, RemoteTransmissionRequest)
+    assert (extended.id, extended.length, extended.extended) == (0x0204000C, 4, True)
+    assert (standard.id, standard.length, standard.extended) == (0x123, 8, False)
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        b"T123456789",  # length 9
+        b"T12345678201",  # 1 data byte short
+        b"T123456781GG",  # not hex
+        b"t12",  # id cut short
+        b"X",  # unknown command
+        b"S9",  # no such bit rate
+        b"MZZZZZZZZ",  # acceptance code not hex
+        b"m-0000001",  # nor the mask
+    ],
+)
+def test_malformed_commands_are_refused(slcan, line):
+    _, gateway, host, monitor = slcan
+    run(gateway, host, b"O\r")
+    assert run(gateway, host, line + b"\r") == b"\a"
+    assert not sent(monitor)
+
+
+def test_bad_acceptance_filter_keeps_the_gateway_running(slcan):
+    bus, gateway, host, _ = slcan
+    assert run(gateway, host, b"MZZZZZZZZ\rm0000FFFG\r") == b"\a\a"
+    assert (gateway.acceptance_code, gateway.acceptance_mask) == (0, 0x1FFFFFFF)
+    assert run(gateway, host, b"O\r") == b"\r"
+    bus.inject(0x02050123, b"")
+    assert run(gateway, host, b"") == b"T020501230\r"
+
+
+def test_commands_split_across_reads(slcan):
+    _, gateway, host, monitor = slcan
+    run(gateway, host, b"O\r")
+    assert run(gateway, host, b"T0102") == b""
+    assert run(gateway, host, b"03041AA\r") == b"Z\r"
+    (frame,) = sent(monitor)
+    assert (frame.id, bytes(frame.data)) == (0x01020304, b"\xaa")
+
+
+def test_bit_rate_must_match_the_transport(slcan):
+    _, gateway, host, _ = slcan
+    gateway.transport.baud_rate = 1_000_000
+    assert run(gateway, host, b"S6\rS8\r") == b"\a\r"
+    run(gateway, host, b"O\r")
+    # the bit rate can't change while the channel is open
+    assert run(gateway, host, b"S8\r") == b"\a"
+
+
+def test_listen_only_refuses_frames(slcan):
+    _, gateway, host, monitor = slcan
+    assert run(gateway, host, b"L\r") == b"\r"
+    assert run(gateway, host, b"t1230\r") == b"\a"
+    assert not sent(monitor)
+
+
+def test_acceptance_filter(slcan):
+    bus, gateway, host, _ = slcan
+    # device number and API index don't care, everything else has to match
+    assert run(gateway, host, b"M02050000\rm0000FFFF\rO\r") == b"\r\r\r"
+    bus.inject(0x02050123, b"\x01")
+    bus.inject(0x02060123, b"\x02")
+    bus.inject(0x123, b"\x03", extended=False)
+    assert run(gateway, host, b"") == b"T02050123101\r"
+
+
+def test_bus_to_host_lines(slcan):
+    bus, gateway, host, _ = slcan
+    run(gateway, host, b"O\r")
+    bus.inject(0x01011840, bytes(range(8)))
+    bus.inject(0x7FF, b"\xab", extended=False)
+    gateway.transport.deliver(RemoteTransmissionRequest(0x0204000C, 2, extended=True))
+    assert run(gateway, host, b"") == (
+        b"T0101184080001020304050607\r" b"t7FF1AB\r" b"R0204000C2\r"
+    )
+    assert gateway.rx_frames == 3
+
+
+def test_time_stamps(slcan):
+    bus, gateway, host, _ = slcan
+    run(gateway, host, b"Z1\rO\r")
+    bus.inject(0x123, b"", extended=False)
+    line = run(gateway, host, b"")
+    assert line.startswith(b"t1230") and line.endswith(b"\r")
+    assert int(line[5:9], 16) < 60000
+
+
+def test_version_serial_and_status(slcan):
+    _, gateway, host, _ = slcan
+    assert run(gateway, host, b"V\rN\rF\r") == b"V0101\rN7491\rF00\r"
+
+
+def test_stats_reply(slcan):
+    _, gateway, host, _ = slcan
+    run(gateway, host, b"O\r")
+    gateway.transport.rx_overflow_count = 2
+    reply = run(gateway, host, b"Q\r")
+    assert reply[:1] == b"Q" and reply[-1:] == b"\r"
+    rx_rate, tx_rate, tx_failed, overflows, dropped = (
+        int(value, 16) for value in reply[1:-1].split(b",")
+    )
+    assert (tx_failed, overflows, dropped) == (0, 2, 0)
+    assert rx_rate >= 0 and tx_rate >= 0
+
+
+def test_several_frames_in_one_read(slcan):
+    _, gateway, host, monitor = slcan
+    run(gateway, host, b"O\r")
+    run(gateway, host, b"T000000011AA\rT000000021BB\r")
+    frames = sent(monitor)
+    assert all(isinstance(frame, Message) for frame in frames)
+    assert [(frame.id, bytes(frame.data)) for frame in frames] == [(0x01, b"\xaa"), (0x02, b"\xbb")]
@@ -0,0 +1,200 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""SocketCANTransport frames, kernel filters and bus state, on a fake socket."""
+import socket
+import sys
+import types
+from struct import pack, unpack
+
+import pytest
+
+from frc_can_7491 import BusState, Match, Message, RemoteTransmissionRequest
+from frc_can_7491.SocketCANTransport import (
+    CAN_EFF_FLAG,
+    CAN_ERR_BUSOFF,
+    CAN_ERR_CRTL,
+    CAN_ERR_CRTL_ACTIVE,
+    CAN_ERR_CRTL_RX_OVERFLOW,
+    CAN_ERR_CRTL_RX_WARNING,
+    CAN_ERR_CRTL_TX_PASSIVE,
+    CAN_ERR_FLAG,
+    CAN_RAW_ERR_FILTER,
+    CAN_RTR_FLAG,
+    SocketCANTransport,
+)
+
+SOCKET_CONSTANTS = ("AF_CAN", "SOCK_RAW", "CAN_RAW", "SOL_CAN_RAW", "CAN_RAW_FILTER")
+
+
+class FakeSocket:
+    """Stands in for the raw CAN socket, frames to receive go in ``rx``"""
+
+    def __init__(self, *args) -> None:
+        self.args = args
+        self.options = {}
+        self.sent = []
+        self.rx = []
+        self.bound = None
+        self.closed = False
+
+    def setsockopt(self, level, option, value):
+        self.options[(level, option)] = bytes(value)
+
+    def bind(self, address):
+        self.bound = address
+
+    def setblocking(self, blocking):
+        assert not blocking
+
+    def send(self, frame):
+        self.sent.append(bytes(frame))
+        return len(frame)
+
+    def recv_into(self, buffer):
+        if not self.rx:
+            raise BlockingIOError
+        frame = self.rx.pop(0)
+        buffer[: len(frame)] = frame
+        return len(frame)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(name="transport")
+def fixture_transport(monkeypatch):
+    """SocketCANTransport on a FakeSocket"""
+    if not all(hasattr(socket, name) for name in SOCKET_CONSTANTS):
+        pytest.skip("no SocketCAN constants on this platform")
+    fake = types.SimpleNamespace(socket=FakeSocket)
+    for name in SOCKET_CONSTANTS:
+        setattr(fake, name, getattr(socket, name))
+    monkeypatch.setattr(sys.modules["frc_can_7491.SocketCANTransport"], "socket", fake)
+    return SocketCANTransport("vcan0")
+
+
+def test_socket_setup(transport):
+    sock = transport.socket
+    assert sock.args == (socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+    assert sock.bound == ("vcan0",)
+    # controller and bus off error frames for the bus state
+    assert sock.options[(socket.SOL_CAN_RAW, CAN_RAW_ERR_FILTER)] == pack(
+        "=I", CAN_ERR_CRTL | CAN_ERR_BUSOFF
+    )
+    transport.deinit()
+    assert sock.closed
+
+
+def kernel_filters(transport):
+    option = transport.socket.options[(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER)]
+    return [unpack("=II", option[offset : offset + 8]) for offset in range(0, len(option), 8)]
+
+
+def test_matches_become_kernel_filters(transport):
+    transport.set_filters([Match(0x02050000, mask=0x1FFF003F, extended=True), Match(0x123)])
+    assert kernel_filters(transport) == [
+        (0x02050000 | CAN_EFF_FLAG, 0x1FFF003F | CAN_EFF_FLAG),
+        (0x123, 0x7FF | CAN_EFF_FLAG),
+    ]
+
+
+@pytest.mark.parametrize("matches", [None, []])
+def test_no_matches_receive_everything_again(transport, matches):
+    transport.set_filters([Match(0x123)])
+    transport.set_filters(matches)
+    # id 0 mask 0 is the kernel's accept all, an empty list would accept nothing
+    assert kernel_filters(transport) == [(0, 0)]
+
+
+def frame(can_id, data=b"", length=None):
+    if length is None:
+        length = len(data)
+    return pack(SocketCANTransport.FRAME_FORMAT, can_id, length, data)
+
+
+def test_send_frame_layout(transport):
+    assert transport.send(Message(id=0x0B080405, data=b"\x01\x02", extended=True))
+    assert transport.send(Message(id=0x123, data=bytes(range(8))))
+    assert transport.send(RemoteTransmissionRequest(0x456, 3))
+    assert transport.socket.sent == [
+        frame(0x0B080405 | CAN_EFF_FLAG, b"\x01\x02"),
+        frame(0x123, bytes(range(8))),
+        frame(0x456 | CAN_RTR_FLAG, length=3),
+    ]
+
+
+def test_full_socket_buffer_fails_the_send(transport, monkeypatch):
+    def send(_):
+        raise BlockingIOError
+
+    monkeypatch.setattr(transport.socket, "send", send)
+    assert not transport.send(Message(id=0x123, data=b""))
+
+
+def test_received_frames(transport):
+    transport.socket.rx += [
+        frame(0x0B080405 | CAN_EFF_FLAG, b"\x01\x02\x03"),
+        frame(0x7FF, b"\xff"),
+        frame(0x1FFFFFFF | CAN_EFF_FLAG | CAN_RTR_FLAG, length=8),
+        # a short read is skipped
+        b"\x00" * 8,
+    ]
+    assert transport.in_waiting() == 3
+    message = transport.receive()
+    assert (message.id, bytes(message.data), message.extended) == (
+        0x0B080405,
+        b"\x01\x02\x03",
+        True,
+    )
+    message = transport.receive()
+    assert (message.id, bytes(message.data), message.extended) == (0x7FF, b"\xff", False)
+    remote = transport.receive()
+    assert isinstance(remote, RemoteTransmissionRequest)
+    assert (remote.id, remote.length, remote.extended) == (0x1FFFFFFF, 8, True)
+    assert transport.receive() is None
+
+
+def test_receive_reads_the_socket(transport):
+    transport.socket.rx.append(frame(0x123, b"\x01"))
+    assert transport.receive().id == 0x123
+
+
+def test_receive_batch(transport):
+    transport.socket.rx += [frame(frame_id) for frame_id in range(5)]
+    frames = [None] * 3
+    assert transport.receive_batch(frames) == 3
+    assert [message.id for message in frames] == [0, 1, 2]
+    assert transport.receive_batch(frames) == 2
+    assert [message.id for message in frames[:2]] == [3, 4]
+    assert transport.receive_batch(frames) == 0
+
+
+def controller(status):
+    return frame(CAN_ERR_FLAG | CAN_ERR_CRTL, bytes([0, status, 0, 0, 0, 0, 0, 0]))
+
+
+def test_error_frames_follow_the_bus_state(transport):
+    socket_rx = transport.socket.rx
+    for error, state in (
+        (controller(CAN_ERR_CRTL_RX_WARNING), BusState.ERROR_WARNING),
+        (controller(CAN_ERR_CRTL_TX_PASSIVE), BusState.ERROR_PASSIVE),
+        (frame(CAN_ERR_FLAG | CAN_ERR_BUSOFF, bytes(8)), BusState.BUS_OFF),
+        (controller(CAN_ERR_CRTL_ACTIVE), BusState.ERROR_ACTIVE),
+    ):
+        socket_rx.append(error)
+        # error frames are never received
+        assert transport.in_waiting() == 0
+        assert transport.state == state
+    assert transport.bus_state_transition_count == 4
+
+    socket_rx.append(controller(CAN_ERR_CRTL_ACTIVE))
+    transport.in_waiting()
+    assert transport.bus_state_transition_count == 4
+
+
+def test_error_frames_count_overflows(transport):
+    transport.socket.rx += [controller(CAN_ERR_CRTL_RX_OVERFLOW)] * 2
+    transport.in_waiting()
+    assert transport.rx_overflow_count == 2
+    assert transport.state == BusState.ERROR_ACTIVE
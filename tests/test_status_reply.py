@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""StatusReply pages and the heartbeat age."""
+import contextlib
+import io
+import sys
+from struct import unpack_from
+
+import pytest
+
+from frc_can_7491 import CANDevice, StatusReply, VirtualBus
+from frc_can_7491.Ticks import TICKS_HALFPERIOD, ticks_add
+
+
+@pytest.fixture(name="status")
+def fixture_status(monkeypatch):
+    """(status, device, clock), the clock is ticks_ms as a one item list"""
+    clock = [1000]
+    monkeypatch.setattr(sys.modules["frc_can_7491.StatusReply"], "ticks_ms", lambda: clock[0])
+    with contextlib.redirect_stdout(io.StringIO()):
+        device = CANDevice(11, 8, 5, transport=VirtualBus().transport())
+    status = StatusReply(device, 0x31, firmware_version=(2, 7))
+    return status, device, clock
+
+
+def page(status, index):
+    """Repack every page and unpack one"""
+    for _ in range(StatusReply.PAGE_COUNT):
+        status.refresh()
+    return unpack_from(StatusReply.PAGE_FORMATS[index], status.pages[index])
+
+
+def test_pages(status):
+    status, device, _ = status
+    device.rx_count = 0x10005
+    device.tx_count = 7
+    device.tx_fail_count = 2
+    device.transport.rx_overflow_count = 300
+    device.loop_period_peak_us = 42_000
+    status.set_enabled(True)
+
+    assert page(status, 0) == (0x30, StatusReply.FLAG_ENABLED, 0xFFFF, 42, 0x0207)
+    # counters wrap, the overflow count saturates
+    assert page(status, 1) == (0x31, 0xFF, 5, 7, 2)
+    header, _, _, uptime_ms = page(status, 2)
+    assert header == 0x32
+    assert uptime_ms > 0
+
+
+def test_heartbeat_age(status):
+    status, _, clock = status
+    status.heartbeat()
+    clock[0] += 35
+    flags, age_ms = page(status, 0)[1:3]
+    assert (flags, age_ms) == (StatusReply.FLAG_HEARTBEAT, 35)
+
+    clock[0] += 0x10000
+    assert page(status, 0)[2] == 0xFFFF
+
+
+@pytest.mark.parametrize("age_ms", [TICKS_HALFPERIOD + 1, 2 * TICKS_HALFPERIOD - 10])
+def test_heartbeat_age_past_the_ticks_half_period(status, age_ms):
+    # ticks_diff goes negative, then small again, the age stays saturated
+    status, _, clock = status
+    status.heartbeat()
+    clock[0] = ticks_add(clock[0], age_ms)
+    assert page(status, 0)[1:3] == (StatusReply.FLAG_HEARTBEAT, 0xFFFF)
+    clock[0] = ticks_add(clock[0], 20)
+    assert page(status, 0)[2] == 0xFFFF
+
+
+def test_send(status):
+    status, device, _ = status
+    sent = []
+    device.send_message_simple = lambda api_id, data: sent.append((api_id, bytes(data)))
+    status.send()
+    assert [data[0] for _, data in sent] == [0x30, 0x31, 0x32]
+    assert {api_id for api_id, _ in sent} == {0x31}
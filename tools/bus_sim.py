@@ -0,0 +1,523 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`bus_sim`
+====================================================
+Discrete-event simulation of a robot CAN bus: 1 Mbit/s arbitration by CAN id,
+frame times including bit stuffing, a roboRIO sending heartbeats through a
+match, a fleet of vendor devices sending status frames and any number of
+`CANDevice` instances running their real receive path on virtual time.
+
+Host only (CPython)::
+
+    python3 tools/bus_sim.py --load 60 --can-devices 2 --duration 10
+    python3 tools/bus_sim.py --load 80 --poll-ms 20 --json
+
+Reports bus load, queueing delay per sender and, for every `CANDevice`, frames
+received, frames dropped in its two RX buffers, latency from the sender queueing
+the frame to the device handling it and heartbeat jitter.
+
+* Author(s): Karl Fleischmann
+"""
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+
+# pylint: disable=wrong-import-position
+from frc_can_7491 import (  # noqa: E402
+    BIT_RATE,
+    CANDevice,
+    CANMessage,
+    CANMessageType,
+    CANTransport,
+    FRCBroadcast,
+    FRCDeviceType,
+    FRCManufacturer,
+    HEARTBEAT_SCHEMA,
+    Message,
+    frame_bits,
+    match_frame,
+)
+
+HEARTBEAT_ID = 0x01011840
+HEARTBEAT_PERIOD_US = 20_000
+
+
+def heartbeat_data(
+    enabled: bool, auto: bool = False, match_time: int = 0, red_alliance: bool = True
+) -> bytes:
+    """Heartbeat payload in the bit layout `RobotHeartbeat` parses"""
+    # match time, match and replay number, tournament type, system watchdog,
+    # test, auto, enabled, red alliance, date and time
+    return HEARTBEAT_SCHEMA.encode(
+        match_time & 0xFF, 0, 0, 0, enabled, 0, auto, enabled, red_alliance, 0
+    )
+
+
+class Frame:  # pylint: disable=too-few-public-methods
+    """Frame Class, a frame queued on a node"""
+
+    __slots__ = ("frame_id", "data", "extended", "queued_us", "sender", "bits")
+
+    def __init__(self, frame_id, data, queued_us, sender, extended=True):
+        # pylint: disable=too-many-arguments
+        self.frame_id = frame_id
+        self.data = bytes(data)
+        self.extended = extended
+        self.queued_us = queued_us
+        self.sender = sender
+        self.bits = frame_bits(frame_id, self.data, extended)
+
+
+class Node:
+    """Node Class
+
+    A controller on the bus with ``tx_buffers`` transmit buffers; the lowest id
+    waiting is offered for arbitration. Frames queued while every buffer is full
+    are dropped and counted.
+    """
+
+    def __init__(self, bus, name: str, tx_buffers: int = 3) -> None:
+        self.bus = bus
+        self.name = name
+        self.tx_buffers = tx_buffers
+        self.tx_queue = []
+        self.tx_sent = 0
+        self.tx_dropped = 0
+        self.wait_total_us = 0
+        self.wait_max_us = 0
+
+    def queue(self, frame_id: int, data: bytes, extended: bool = True) -> bool:
+        """Queue a frame for transmission"""
+        if len(self.tx_queue) >= self.tx_buffers:
+            self.tx_dropped += 1
+            return False
+        self.tx_queue.append(Frame(frame_id, data, self.bus.now_us, self, extended))
+        self.bus.wake()
+        return True
+
+    def head(self):
+        """The frame this node offers for arbitration"""
+        if not self.tx_queue:
+            return None
+        return min(self.tx_queue, key=arbitration_key)
+
+    def transmitted(self, frame: Frame):
+        """Called when the node's frame won arbitration and finished"""
+        self.tx_queue.remove(frame)
+        self.tx_sent += 1
+        wait_us = self.bus.now_us - int(frame.bits * self.bus.bit_time_us) - frame.queued_us
+        self.wait_total_us += wait_us
+        self.wait_max_us = max(self.wait_max_us, wait_us)
+
+    def receive(self, frame: Frame):
+        """Called for every frame sent by another node"""
+
+    def stats(self) -> dict:
+        """stats function"""
+        return {
+            "sent": self.tx_sent,
+            "tx_dropped": self.tx_dropped,
+            "wait_mean_us": self.wait_total_us // self.tx_sent if self.tx_sent else 0,
+            "wait_max_us": self.wait_max_us,
+        }
+
+
+def arbitration_key(frame: Frame) -> int:
+    """Lower wins arbitration: the 11 base id bits first, then standard before extended"""
+    if frame.extended:
+        return (frame.frame_id >> 18) << 19 | 1 << 18 | (frame.frame_id & 0x3FFFF)
+    return frame.frame_id << 19
+
+
+class SimBus:
+    """SimBus Class
+
+    Event queue on a microsecond clock. Whenever the bus is idle and frames are
+    waiting, the node with the lowest arbitration id sends; the frame reaches
+    every other node when its last bit is on the bus.
+    """
+
+    def __init__(self, bit_rate: int = BIT_RATE) -> None:
+        self.bit_time_us = 1_000_000 / bit_rate
+        self.now_us = 0
+        self.events = []
+        self.sequence = 0
+        self.nodes = []
+        self.busy_until_us = 0
+        self.arbitration_pending = False
+        self.busy_us = 0
+        self.frames = 0
+
+    def add(self, node):
+        """Attach a node"""
+        self.nodes.append(node)
+        return node
+
+    def at(self, time_us: int, callback):
+        """Run callback at time_us"""
+        self.sequence += 1
+        heapq.heappush(self.events, (time_us, self.sequence, callback))
+
+    def wake(self):
+        """A node has a frame waiting, arbitrate as soon as the bus is idle"""
+        if not self.arbitration_pending:
+            self.arbitration_pending = True
+            self.at(max(self.now_us, self.busy_until_us), self.arbitrate)
+
+    def arbitrate(self):
+        """Pick the winning frame and put it on the bus"""
+        self.arbitration_pending = False
+        winner = None
+        for node in self.nodes:
+            frame = node.head()
+            if frame is not None and (
+                winner is None or arbitration_key(frame) < arbitration_key(winner)
+            ):
+                winner = frame
+        if winner is None:
+            return
+        duration_us = int(winner.bits * self.bit_time_us)
+        self.busy_until_us = self.now_us + duration_us
+        self.busy_us += duration_us
+        self.at(self.busy_until_us, lambda: self.complete(winner))
+
+    def complete(self, frame: Frame):
+        """The frame's last bit is on the bus"""
+        self.frames += 1
+        frame.sender.transmitted(frame)
+        for node in self.nodes:
+            if node is not frame.sender:
+                node.receive(frame)
+        self.wake()
+
+    def run(self, duration_us: int):
+        """Process events until duration_us"""
+        events = self.events
+        while events and events[0][0] <= duration_us:
+            time_us, _, callback = heapq.heappop(events)
+            self.now_us = time_us
+            callback()
+        self.now_us = duration_us
+
+    def every(self, period_us: int, callback, offset_us: int = 0, jitter_us: int = 0):
+        """Run callback every period_us, optionally with random jitter"""
+
+        def tick(start_us=offset_us):
+            callback()
+            delay = random.randint(-jitter_us, jitter_us) if jitter_us else 0
+            next_us = start_us + period_us
+            self.at(max(self.now_us, next_us + delay), lambda: tick(next_us))
+
+        self.at(offset_us, tick)
+
+
+class RoboRIO(Node):
+    """RoboRIO Class
+
+    Heartbeat every 20 ms through a match: disabled, autonomous, teleop and
+    disabled again. An Enumerate broadcast is sent at the start.
+    """
+
+    def __init__(self, bus, phases=((1.0, "disabled"), (15.0, "auto"), (135.0, "teleop"))):
+        super().__init__(bus, "roboRIO")
+        self.phases = phases
+        self.heartbeats = 0
+
+    def phase_at(self, time_us: int):
+        """(phase name, seconds left in it)"""
+        elapsed = time_us / 1_000_000
+        for seconds, name in self.phases:
+            if elapsed < seconds:
+                return name, seconds - elapsed
+            elapsed -= seconds
+        return "disabled", 0
+
+    def start(self):
+        """Schedule the robot's traffic"""
+        self.bus.at(0, lambda: self.queue(
+            CANMessage.assemble_message_id(0, 0, 0, FRCBroadcast.Enumerate, 0), b""
+        ))
+        self.bus.every(HEARTBEAT_PERIOD_US, self.heartbeat, offset_us=500)
+
+    def heartbeat(self):
+        """Send the heartbeat for the current match phase"""
+        phase, left = self.phase_at(self.bus.now_us)
+        self.heartbeats += 1
+        self.queue(
+            HEARTBEAT_ID,
+            heartbeat_data(phase != "disabled", auto=phase == "auto", match_time=int(left)),
+        )
+
+
+# (name, device type, manufacturer, [(api id, period ms, data length)])
+VENDOR_PROFILES = (
+    (
+        "spark_max",
+        FRCDeviceType.MotorController,
+        FRCManufacturer.REVRobotics,
+        [(0x060, 10, 8), (0x061, 20, 8), (0x062, 20, 8), (0x063, 50, 8), (0x064, 50, 8)],
+    ),
+    (
+        "talon_fx",
+        FRCDeviceType.MotorController,
+        FRCManufacturer.CTRElectronics,
+        [(0x140, 10, 8), (0x141, 20, 8), (0x142, 50, 8), (0x147, 100, 8)],
+    ),
+    (
+        "pdh",
+        FRCDeviceType.PowerDistributionModule,
+        FRCManufacturer.REVRobotics,
+        [(0x064, 50, 8), (0x065, 50, 8), (0x066, 50, 8), (0x067, 50, 8)],
+    ),
+)
+
+
+class VendorDevice(Node):
+    """VendorDevice Class, periodic status frames with realistic rates"""
+
+    def __init__(self, bus, profile, number: int) -> None:
+        name, dev_type, manufacturer, frames = profile
+        super().__init__(bus, f"{name}_{number}")
+        self.frames = [
+            (
+                CANMessage.assemble_message_id_short(dev_type, manufacturer, api, number),
+                period,
+                bytes(random.getrandbits(8) for _ in range(length)),
+            )
+            for api, period, length in frames
+        ]
+
+    def load_bits_per_s(self) -> float:
+        """Average bus bits per second this device sends"""
+        return sum(
+            frame_bits(frame_id, payload) * 1000 / period
+            for frame_id, period, payload in self.frames
+        )
+
+    def start(self):
+        """Schedule the status frames with a random phase and a little jitter"""
+        for frame_id, period, payload in self.frames:
+            self.bus.every(
+                period * 1000,
+                lambda frame_id=frame_id, payload=payload: self.queue(frame_id, payload),
+                offset_us=random.randrange(period * 1000),
+                jitter_us=100,
+            )
+
+
+class SimTransport(CANTransport):
+    """SimTransport Class
+
+    Attaches a `CANDevice` to the simulated bus. Like the MCP2515 there are
+    ``rx_buffers`` receive buffers, frames arriving while they are all full are
+    dropped, so a device that polls too rarely loses frames.
+    """
+
+    def __init__(self, node) -> None:
+        self.node = node
+        self.matches = None
+        self.rx_overflow_count = 0
+
+    def send(self, message) -> bool:
+        """Queue the frame on the node"""
+        return self.node.queue(message.id, message.data, message.extended)
+
+    def set_filters(self, matches):
+        """Receive only frames passing one of the matches"""
+        self.matches = matches
+
+    def in_waiting(self) -> int:
+        """Number of received frames waiting"""
+        return len(self.node.rx_queue)
+
+    def receive(self):
+        """The next received frame, None when there is none"""
+        if not self.node.rx_queue:
+            return None
+        frame = self.node.rx_queue.pop(0)
+        self.node.handled(frame)
+        return Message(id=frame.frame_id, data=frame.data, extended=frame.extended)
+
+
+class DeviceNode(Node):
+    """DeviceNode Class
+
+    A `CANDevice` on the bus. ``receive_messages()`` runs every ``poll_ms`` of
+    virtual time and the device sends a status frame every ``status_ms``.
+    """
+
+    def __init__(self, bus, number: int, poll_ms: int = 1, status_ms: int = 20, rx_buffers: int = 2):
+        # pylint: disable=too-many-arguments
+        super().__init__(bus, f"can_device_{number}")
+        self.poll_ms = poll_ms
+        self.status_ms = status_ms
+        self.rx_buffers = rx_buffers
+        self.rx_queue = []
+        self.rx_dropped = 0
+        self.latencies = []
+        self.heartbeat_times = []
+        self.heartbeats_handled = 0
+        self.transport = SimTransport(self)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.device = CANDevice(
+                FRCDeviceType.IOBreakout,
+                FRCManufacturer.TeamUse,
+                number,
+                transport=self.transport,
+            )
+            self.device.set_receive_period(poll_ms)
+            self.device.route(msg_type=CANMessageType.Heartbeat)(self.heartbeat)
+            self.device.start_listener()
+        self.status = bytearray(8)
+
+    def heartbeat(self, message):  # pylint: disable=unused-argument
+        """Route for the robot heartbeat"""
+        self.heartbeats_handled += 1
+
+    def receive(self, frame: Frame):
+        """Acceptance filter, then an RX buffer if one is free"""
+        if not match_frame(self.transport.matches, frame.frame_id, frame.extended):
+            return
+        if frame.frame_id == HEARTBEAT_ID:
+            # jitter is measured on arrival, before the poll period hides it
+            self.heartbeat_times.append(self.bus.now_us)
+        if len(self.rx_queue) >= self.rx_buffers:
+            self.rx_dropped += 1
+            self.transport.rx_overflow_count += 1
+            return
+        self.rx_queue.append(frame)
+
+    def handled(self, frame: Frame):
+        """A frame was taken out of an RX buffer by the device"""
+        self.latencies.append(self.bus.now_us - frame.queued_us)
+
+    def poll(self):
+        """poll function"""
+        self.device.receive_messages()
+
+    def send_status(self):
+        """send_status function"""
+        self.status[0] = (self.status[0] + 1) & 0xFF
+        self.device.send_message_simple(0x01, self.status)
+
+    def start(self):
+        """Schedule the device's loop"""
+        self.bus.every(self.poll_ms * 1000, self.poll, offset_us=random.randrange(self.poll_ms * 1000))
+        self.bus.every(self.status_ms * 1000, self.send_status, offset_us=random.randrange(1000))
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        latencies = sorted(self.latencies)
+        intervals = [
+            later - earlier for earlier, later in zip(self.heartbeat_times, self.heartbeat_times[1:])
+        ]
+        stats.update(
+            {
+                "received": len(latencies),
+                "rx_dropped": self.rx_dropped,
+                "rx_drop_pct": round(
+                    100 * self.rx_dropped / max(1, self.rx_dropped + len(latencies)), 2
+                ),
+                "latency_mean_us": sum(latencies) // len(latencies) if latencies else 0,
+                "latency_p99_us": latencies[len(latencies) * 99 // 100] if latencies else 0,
+                "latency_max_us": latencies[-1] if latencies else 0,
+                "heartbeats": self.heartbeats_handled,
+                "heartbeat_jitter_max_us": max(
+                    (abs(interval - HEARTBEAT_PERIOD_US) for interval in intervals), default=0
+                ),
+                "enumerate_replies": self.device.enumerate_count,
+            }
+        )
+        return stats
+
+
+def build(load_pct: float, can_devices: int, poll_ms: int, rx_buffers: int, seed: int):
+    """Build a bus with vendor devices added until the target load is reached"""
+    # pylint: disable=too-many-arguments
+    random.seed(seed)
+    bus = SimBus()
+    robot = bus.add(RoboRIO(bus))
+    devices = [
+        bus.add(DeviceNode(bus, number + 1, poll_ms=poll_ms, rx_buffers=rx_buffers))
+        for number in range(can_devices)
+    ]
+
+    target_bits = BIT_RATE * load_pct / 100
+    load_bits = frame_bits(HEARTBEAT_ID, bytes(8)) * 1_000_000 / HEARTBEAT_PERIOD_US
+    load_bits += can_devices * frame_bits(0x0B080041, bytes(8)) * 1000 / 20
+    vendors = []
+    counts = {}
+    while load_bits < target_bits:
+        # round robin over the profiles, a lighter one fills the last gap
+        vendor = None
+        for offset in range(len(VENDOR_PROFILES)):
+            profile = VENDOR_PROFILES[(len(vendors) + offset) % len(VENDOR_PROFILES)]
+            candidate = VendorDevice(bus, profile, counts.get(profile[0], 0) + 1)
+            if load_bits + candidate.load_bits_per_s() <= target_bits * 1.02 or not vendors:
+                vendor = candidate
+                break
+        if vendor is None:
+            break
+        counts[profile[0]] = counts.get(profile[0], 0) + 1
+        load_bits += vendor.load_bits_per_s()
+        vendors.append(bus.add(vendor))
+
+    robot.start()
+    for node in devices + vendors:
+        node.start()
+    return bus, robot, devices, vendors
+
+
+def main(argv=None):
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--load", type=float, default=50, help="target bus load in percent")
+    parser.add_argument("--can-devices", type=int, default=1, help="CANDevice instances")
+    parser.add_argument("--duration", type=float, default=5, help="simulated seconds")
+    parser.add_argument("--poll-ms", type=int, default=1, help="CANDevice receive period")
+    parser.add_argument("--rx-buffers", type=int, default=2, help="receive buffers per CANDevice")
+    parser.add_argument("--seed", type=int, default=7491)
+    parser.add_argument("--json", action="store_true", help="machine readable output")
+    args = parser.parse_args(argv)
+
+    bus, robot, devices, vendors = build(
+        args.load, args.can_devices, args.poll_ms, args.rx_buffers, args.seed
+    )
+    duration_us = int(args.duration * 1_000_000)
+    bus.run(duration_us)
+
+    result = {
+        "duration_s": args.duration,
+        "target_load_pct": args.load,
+        "bus_load_pct": round(100 * bus.busy_us / duration_us, 2),
+        "frames": bus.frames,
+        "vendor_devices": len(vendors),
+        "heartbeats": robot.heartbeats,
+        "roborio": robot.stats(),
+        "vendors_wait_max_us": max((vendor.wait_max_us for vendor in vendors), default=0),
+        "vendors_tx_dropped": sum(vendor.tx_dropped for vendor in vendors),
+        "can_devices": {device.name: device.stats() for device in devices},
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"bus load {result['bus_load_pct']}% ({bus.frames} frames, {len(vendors)} vendor devices)")
+        print(f"roboRIO  {result['roborio']}")
+        print(f"vendors  wait max {result['vendors_wait_max_us']}us, "
+              f"tx dropped {result['vendors_tx_dropped']}")
+        for name, stats in result["can_devices"].items():
+            print(f"{name}  {stats}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`can_analyze`
+====================================================
+Offline analysis of `CANCapture` files with NumPy: the capture is memory mapped
+and every id and heartbeat is decoded at once with the bit masks in `FRCMask`
+and `FRCHeartbeatMask`, the same values `CANMessage` and `RobotHeartbeat`
+use on the device.
+
+Host only (needs numpy)::
+
+    python3 tools/can_analyze.py match.fcap
+    python3 tools/can_analyze.py match.fcap --phase auto --window-ms 100 --json
+
+Reports match phases from the heartbeats, rate, bits and share of the bus per
+device and per API id, period and inter-arrival jitter per API id and bus load
+over time. ``--phase`` limits the statistics to frames sent while the roboRIO
+reported that phase. Bus load uses the frame length without stuff bits and
+the worst case with them; ``--exact`` stuffs every distinct frame instead.
+
+* Author(s): Karl Fleischmann
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+
+# pylint: disable=wrong-import-position
+from frc_can_7491 import (  # noqa: E402
+    BIT_RATE,
+    CAPTURE_EXTENDED,
+    CAPTURE_ID_MASK,
+    CAPTURE_RTR,
+    CAPTURE_TX,
+    CANCapture,
+    CANMessage,
+    FRCFilter,
+    FRCHeartbeatMask,
+    FRAME_TAIL_BITS,
+    FRCMask,
+    RobotHeartbeat,
+    STUFFED_BITS_EXTENDED,
+    STUFFED_BITS_STANDARD,
+    frame_bits as stuffed_frame_bits,
+)
+
+# one CANCapture record, data read as the little endian integer RobotHeartbeat decodes
+RECORD_DTYPE = np.dtype(
+    [
+        ("timestamp", "<u4"),
+        ("can_id", "<u4"),
+        ("dlc", "u1"),
+        ("flags", "u1"),
+        ("pad", "V2"),
+        ("data", "<u8"),
+    ]
+)
+
+PHASES = ("unknown", "disabled", "auto", "teleop", "test")
+
+
+def open_capture(path: str) -> np.ndarray:
+    """Memory map the records of a capture file"""
+    with open(path, "rb") as stream:
+        header = stream.read(CANCapture.HEADER_SIZE)
+    magic, version, size = np.frombuffer(
+        header, dtype=[("magic", "S4"), ("version", "<u2"), ("size", "<u2")]
+    )[0]
+    if magic != CANCapture.MAGIC or version != CANCapture.VERSION or size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path} is not a CAN capture file")
+    count = (os.path.getsize(path) - CANCapture.HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(
+        path, dtype=RECORD_DTYPE, mode="r", offset=CANCapture.HEADER_SIZE, shape=(count,)
+    )
+
+
+def decode(records: np.ndarray) -> dict:
+    """Column arrays for every record: time, id fields, frame flags and data"""
+    timestamp = records["timestamp"].astype(np.int64)
+    # the 32 bit microsecond counter wraps about every 71 minutes
+    wraps = np.concatenate(([0], np.cumsum(np.diff(timestamp) < 0)))
+    time_us = timestamp + (wraps << 32)
+
+    can_id = records["can_id"]
+    frame_id = can_id & CAPTURE_ID_MASK
+    columns = {
+        "time_us": time_us,
+        "frame_id": frame_id,
+        "extended": (can_id & CAPTURE_EXTENDED) != 0,
+        "rtr": (can_id & CAPTURE_RTR) != 0,
+        "tx": (records["flags"] & CAPTURE_TX) != 0,
+        "dlc": np.minimum(records["dlc"], 8),
+        "data": records["data"],
+        "device_type": (frame_id & FRCMask.device_type) >> FRCMask.device_type_shift,
+        "mfg_code": (frame_id & FRCMask.mfg_code) >> FRCMask.mfg_code_shift,
+        "api_class": (frame_id & FRCMask.api_class) >> FRCMask.api_class_shift,
+        "api_index": (frame_id & FRCMask.api_index) >> FRCMask.api_index_shift,
+        "api_id": (frame_id & FRCMask.api) >> FRCMask.api_shift,
+        "device_number": frame_id & FRCMask.device_number,
+    }
+    return columns
+
+
+def decode_heartbeats(columns: dict) -> dict:
+    """Time and decoded fields of every heartbeat frame"""
+    selected = columns["extended"] & (columns["frame_id"] == FRCFilter.heartbeat)
+    data = columns["data"][selected]
+    heartbeats = {"time_us": columns["time_us"][selected], "data": data}
+    for field in (
+        "match_time",
+        "match_number",
+        "replay_number",
+        "system_watchdog",
+        "test_mode",
+        "auto_mode",
+        "enabled",
+        "red_alliance",
+    ):
+        mask = np.uint64(getattr(FRCHeartbeatMask, field))
+        shift = np.uint64(getattr(FRCHeartbeatMask, field + "_shift"))
+        heartbeats[field] = (data & mask) >> shift
+    return heartbeats
+
+
+def heartbeat_phases(heartbeats: dict) -> np.ndarray:
+    """Index into PHASES for every heartbeat"""
+    phase = np.full(len(heartbeats["time_us"]), PHASES.index("disabled"), dtype=np.int8)
+    enabled = heartbeats["enabled"] != 0
+    phase[enabled] = PHASES.index("teleop")
+    phase[enabled & (heartbeats["auto_mode"] != 0)] = PHASES.index("auto")
+    phase[enabled & (heartbeats["test_mode"] != 0)] = PHASES.index("test")
+    return phase
+
+
+def match_segments(heartbeats: dict, phase: np.ndarray, end_us: int) -> list:
+    """(phase, start us, end us, match time at the start) for every phase change"""
+    if len(phase) == 0:
+        return []
+    changes = np.flatnonzero(np.diff(phase)) + 1
+    starts = np.concatenate(([0], changes))
+    times = heartbeats["time_us"]
+    ends = np.concatenate((times[changes], [end_us]))
+    return [
+        (PHASES[phase[start]], int(times[start]), int(end), int(heartbeats["match_time"][start]))
+        for start, end in zip(starts, ends)
+    ]
+
+
+def frame_phases(columns: dict, heartbeats: dict, phase: np.ndarray) -> np.ndarray:
+    """Phase of the last heartbeat before every frame, unknown before the first"""
+    last = np.searchsorted(heartbeats["time_us"], columns["time_us"], side="right") - 1
+    result = np.zeros(len(last), dtype=np.int8)
+    seen = last >= 0
+    result[seen] = phase[last[seen]]
+    return result
+
+
+def frame_bits(columns: dict) -> tuple:
+    """Bits of every frame without stuff bits and with the most stuff bits possible"""
+    data_bits = np.where(columns["rtr"], 0, columns["dlc"].astype(np.int64) * 8)
+    stuffed = np.where(columns["extended"], STUFFED_BITS_EXTENDED, STUFFED_BITS_STANDARD) + data_bits
+    # a stuff bit after the first 5 equal bits, then after every 4 more
+    return stuffed + FRAME_TAIL_BITS, stuffed + (stuffed - 1) // 4 + FRAME_TAIL_BITS
+
+
+def exact_frame_bits(columns: dict) -> np.ndarray:
+    """Bits of every frame with its actual stuff bits, computed once per distinct frame"""
+    rtr = columns["rtr"].astype(np.uint64)
+    dlc = np.minimum(columns["dlc"], 8).astype(np.uint64)
+    # only the first dlc bytes count, the capture pads the rest with zeros,
+    # remote frames have none
+    keep = np.where(
+        dlc >= 8,
+        np.uint64(0xFFFFFFFFFFFFFFFF),
+        (np.uint64(1) << (np.minimum(dlc, 7) * np.uint64(8))) - np.uint64(1),
+    )
+    keep[columns["rtr"]] = 0
+    keys = np.stack(
+        (
+            columns["frame_id"].astype(np.uint64)
+            | (columns["extended"].astype(np.uint64) << np.uint64(32))
+            | (dlc << np.uint64(33))
+            | (rtr << np.uint64(37)),
+            columns["data"] & keep,
+        ),
+        axis=1,
+    )
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    bits = np.empty(len(unique), dtype=np.int64)
+    for index, (key, data) in enumerate(unique.tolist()):
+        length = key >> 33 & 0x0F
+        remote = bool(key >> 37 & 1)
+        payload = b"" if remote else data.to_bytes(8, "little")[:length]
+        bits[index] = stuffed_frame_bits(key & CAPTURE_ID_MASK, payload, bool(key >> 32 & 1), remote, length)
+    return bits[inverse.reshape(-1)]
+
+
+def group_stats(keys, time_us, bits, duration_s: float, timing: bool = True) -> dict:
+    """Frames, rate, bits, bus share and, with timing, period and jitter per key"""
+    unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    total_bits = np.bincount(inverse, weights=bits, minlength=len(unique))
+
+    # inter-arrival times between consecutive frames of the same key
+    order = np.lexsort((time_us, inverse))
+    group = inverse[order]
+    gaps = np.diff(time_us[order]).astype(np.float64)
+    same = group[1:] == group[:-1]
+    group = group[1:][same]
+    gaps = gaps[same]
+    gap_count = np.bincount(group, minlength=len(unique)) if timing else np.zeros(len(unique))
+    gap_sum = np.bincount(group, weights=gaps, minlength=len(unique))
+    gap_square = np.bincount(group, weights=gaps * gaps, minlength=len(unique))
+    gap_min = np.full(len(unique), np.inf)
+    gap_max = np.zeros(len(unique))
+    np.minimum.at(gap_min, group, gaps)
+    np.maximum.at(gap_max, group, gaps)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        period = gap_sum / gap_count
+        jitter = np.sqrt(np.maximum(gap_square / gap_count - period * period, 0))
+    return {
+        int(key): {
+            "frames": int(counts[index]),
+            "rate_hz": round(counts[index] / duration_s, 2) if duration_s else 0.0,
+            "bits": int(total_bits[index]),
+            "load_pct": round(100 * total_bits[index] / (duration_s * BIT_RATE), 3) if duration_s else 0.0,
+            "period_us": round(float(period[index]), 1) if gap_count[index] else None,
+            "jitter_us": round(float(jitter[index]), 1) if gap_count[index] else None,
+            "gap_min_us": int(gap_min[index]) if gap_count[index] else None,
+            "gap_max_us": int(gap_max[index]) if gap_count[index] else None,
+        }
+        for index, key in enumerate(unique)
+    }
+
+
+def load_over_time(time_us: np.ndarray, bits: np.ndarray, start_us: int, window_us: int) -> list:
+    """Bus load in percent for every window from start_us"""
+    if len(time_us) == 0:
+        return []
+    windows = (time_us - start_us) // window_us
+    total = np.bincount(windows, weights=bits)
+    return [round(float(value), 2) for value in 100 * total / (window_us * BIT_RATE / 1_000_000)]
+
+
+def verify(columns: dict, heartbeats: dict, count: int) -> int:
+    """Check the vectorized decode against CANMessage/RobotHeartbeat on the first frames"""
+    fields = ("device_type", "api_class", "api_index", "api_id", "device_number")
+    checked = 0
+    for index in np.flatnonzero(columns["extended"])[:count]:
+        message = CANMessage(raw_msg_id=int(columns["frame_id"][index]), raw_msg_data=bytes(8))
+        expected = (
+            message.device_type,
+            message.api_class_id,
+            message.api_index_id,
+            message.api_id,
+            message.device_number,
+        )
+        found = tuple(int(columns[field][index]) for field in fields)
+        if expected != found:
+            raise AssertionError(f"record {index}: CANMessage {expected}, vectorized {found}")
+        checked += 1
+
+    fields = ("match_time", "system_watchdog", "test_mode", "auto_mode", "enabled", "red_alliance")
+    for index in range(min(count, len(heartbeats["time_us"]))):
+        heartbeat = RobotHeartbeat(int(heartbeats["data"][index]).to_bytes(8, sys.byteorder))
+        expected = (
+            heartbeat.match_time,
+            heartbeat.system_watchdog_p,
+            heartbeat.test_mode,
+            heartbeat.auto_mode,
+            heartbeat.enabled,
+            heartbeat.red_alliance,
+        )
+        found = tuple(int(heartbeats[field][index]) for field in fields)
+        if expected != found:
+            raise AssertionError(f"heartbeat {index}: RobotHeartbeat {expected}, vectorized {found}")
+        checked += 1
+    return checked
+
+
+def device_name(key: int) -> str:
+    """type:manufacturer:number of a device key"""
+    return (
+        f"{(key & FRCMask.device_type) >> FRCMask.device_type_shift}:"
+        f"{(key & FRCMask.mfg_code) >> FRCMask.mfg_code_shift}:"
+        f"{key & FRCMask.device_number}"
+    )
+
+
+def frame_name(key: int, per_api: bool) -> str:
+    """Name of a device or API id key, standard ids have bit 31 set"""
+    if key & (1 << 31):
+        return f"std:{key & 0x7FF:03X}"
+    if per_api:
+        return f"{device_name(key)}/0x{(key & FRCMask.api) >> FRCMask.api_shift:03X}"
+    return device_name(key)
+
+
+def analyze(path: str, phase: str = None, window_ms: int = 1000, exact: bool = False, check: int = 1000):
+    """Everything the report shows, as a dict"""
+    # pylint: disable=too-many-locals
+    records = open_capture(path)
+    columns = decode(records)
+    heartbeats = decode_heartbeats(columns)
+    phases = heartbeat_phases(heartbeats)
+    time_us = columns["time_us"]
+    start_us = int(time_us[0]) if len(time_us) else 0
+    end_us = int(time_us[-1]) if len(time_us) else 0
+    segments = match_segments(heartbeats, phases, end_us)
+
+    if exact:
+        unstuffed = worst_case = exact_frame_bits(columns)
+    else:
+        unstuffed, worst_case = frame_bits(columns)
+
+    selected = np.ones(len(time_us), dtype=bool)
+    duration_us = end_us - start_us
+    if phase is not None:
+        selected = frame_phases(columns, heartbeats, phases) == PHASES.index(phase)
+        duration_us = sum(end - start for name, start, end, _ in segments if name == phase)
+    duration_s = duration_us / 1_000_000
+    capacity = duration_s * BIT_RATE or 1
+
+    # FRC frames are extended, standard ids get bit 31 to keep them apart
+    extended = columns["extended"][selected]
+    frame_id = columns["frame_id"][selected].astype(np.int64)
+    times = time_us[selected]
+    window_start_us = int(times[0]) if len(times) else start_us
+    bits = worst_case[selected]
+    device_keys = np.where(extended, frame_id & FRCMask.type_mfg_num, frame_id | (1 << 31))
+    api_keys = np.where(extended, frame_id, frame_id | (1 << 31))
+
+    return {
+        "frames": int(len(records)),
+        "frames_selected": int(selected.sum()),
+        "frames_sent_by_device": int(columns["tx"].sum()),
+        "duration_s": round((end_us - start_us) / 1_000_000, 6),
+        "phase": phase,
+        "phase_duration_s": round(duration_s, 6),
+        "verified_frames": verify(columns, heartbeats, check) if check else 0,
+        "bus_load_unstuffed_pct": round(100 * float(unstuffed[selected].sum()) / capacity, 2),
+        "bus_load_worst_case_pct": round(100 * float(bits.sum()) / capacity, 2),
+        "match_phases": [
+            {
+                "phase": name,
+                "start_s": round((start - start_us) / 1_000_000, 3),
+                "duration_s": round((end - start) / 1_000_000, 3),
+                "match_time": match_time,
+            }
+            for name, start, end, match_time in segments
+        ],
+        "devices": {
+            frame_name(key, False): stats
+            for key, stats in group_stats(device_keys, times, bits, duration_s, False).items()
+        },
+        "api_ids": {
+            frame_name(key, True): stats
+            for key, stats in group_stats(api_keys, times, bits, duration_s).items()
+        },
+        "window_ms": window_ms,
+        "load_over_time_pct": load_over_time(times, bits, window_start_us, window_ms * 1000),
+    }
+
+
+def print_report(result: dict, top: int):
+    """Human readable report"""
+    print(
+        f"{result['frames']} frames over {result['duration_s']}s, "
+        f"{result['frames_sent_by_device']} sent by the capturing device, "
+        f"{result['verified_frames']} checked against CANMessage"
+    )
+    for segment in result["match_phases"]:
+        print(
+            f"  {segment['phase']:8} at {segment['start_s']:>9}s for {segment['duration_s']:>8}s"
+            f"  match time {segment['match_time']}"
+        )
+    scope = f"during {result['phase']}" if result["phase"] else "overall"
+    print(
+        f"{scope}: {result['frames_selected']} frames in {result['phase_duration_s']}s, bus load "
+        f"{result['bus_load_unstuffed_pct']}% to {result['bus_load_worst_case_pct']}%"
+    )
+    for title, table in (("device", result["devices"]), ("device/api", result["api_ids"])):
+        rows = sorted(table.items(), key=lambda item: item[1]["bits"], reverse=True)[:top]
+        print(f"\n{title:18} {'frames':>9} {'rate Hz':>9} {'load %':>8} {'period us':>10} {'jitter us':>10}")
+        for name, stats in rows:
+            period = "" if stats["period_us"] is None else stats["period_us"]
+            jitter = "" if stats["jitter_us"] is None else stats["jitter_us"]
+            print(
+                f"{name:18} {stats['frames']:>9} {stats['rate_hz']:>9} {stats['load_pct']:>8}"
+                f" {period:>10} {jitter:>10}"
+            )
+    loads = result["load_over_time_pct"]
+    if loads:
+        print(
+            f"\nload per {result['window_ms']}ms: min {min(loads)}% mean "
+            f"{round(sum(loads) / len(loads), 2)}% max {max(loads)}%"
+        )
+
+
+def main(argv=None):
+    """main function"""
+    parser = argparse.ArgumentParser(description="Analyze a CANCapture file")
+    parser.add_argument("capture", help="CANCapture file")
+    parser.add_argument("--phase", choices=PHASES, help="only frames sent during this match phase")
+    parser.add_argument("--window-ms", type=int, default=1000, help="bus load window")
+    parser.add_argument("--exact", action="store_true", help="count the actual stuff bits (slow with varying payloads)")
+    parser.add_argument("--verify", type=int, default=1000, help="frames checked against CANMessage")
+    parser.add_argument("--top", type=int, default=20, help="rows per table")
+    parser.add_argument("--json", action="store_true", help="machine readable output")
+    args = parser.parse_args(argv)
+
+    result = analyze(args.capture, args.phase, args.window_ms, args.exact, args.verify)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result, args.top)
+    return result
+
+
+if __name__ == "__main__":
+    main()
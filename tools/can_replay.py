@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`can_replay`
+====================================================
+Export and replay CAN captures (`CANCapture` files or ``candump -L`` logs).
+
+Host only::
+
+    # capture to candump format
+    python3 tools/can_replay.py match.fcap --export match.log
+
+    # replay into a CANDevice (type:manufacturer:number) as fast as possible,
+    # writing what the device sent for comparison between builds
+    python3 tools/can_replay.py match.log --device 11:8:5 --speed 0 --sent sent.log
+
+    # replay onto a SocketCAN interface at the original timing
+    python3 tools/can_replay.py match.fcap --channel vcan0
+
+* Author(s): Karl Fleischmann
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+
+# pylint: disable=wrong-import-position
+from frc_can_7491 import (  # noqa: E402
+    CANDevice,
+    CANReplay,
+    Message,
+    VirtualBus,
+    from_candump,
+    read_capture,
+    to_candump,
+)
+
+
+def load(path: str):
+    """Records of a capture or candump file"""
+    with open(path, "rb") as stream:
+        binary = stream.read(4) == b"FCAP"
+    if binary:
+        with open(path, "rb") as stream:
+            return list(read_capture(stream))
+    with open(path, "r", encoding="utf-8") as stream:
+        return list(from_candump(stream))
+
+
+def replay_device(records, device_spec: str, speed: float):
+    """Replay into a CANDevice on a virtual bus, returns (replay, device, frames it sent, seconds)"""
+    dev_type, manufacturer, number = (int(value, 0) for value in device_spec.split(":"))
+    bus = VirtualBus()
+    with contextlib.redirect_stdout(io.StringIO()):
+        device = CANDevice(dev_type, manufacturer, number, transport=bus.transport(rx_capacity=1024))
+        device.start_listener()
+    # receive_messages() is polled back to back below
+    device.set_receive_period(1)
+
+    # the device's own capture marks what it sent, timestamps are dropped so
+    # runs compare line by line
+    capture = device.enable_capture(max(1, len(records)) * 4)
+    replay = CANReplay(records, bus.inject, speed=speed, poll=device.receive_messages)
+    started = perf_counter()
+    replay.run()
+    elapsed = perf_counter() - started
+    # let delayed replies (Enumerate) go out
+    settle = perf_counter() + device.enumerate_window_ms / 1000
+    while perf_counter() < settle:
+        device.receive_messages()
+    stream = io.BytesIO()
+    capture.write_to(stream)
+    stream.seek(0)
+    sent = [(0,) + record[1:] for record in read_capture(stream) if record[6]]
+    return replay, device, sent, elapsed
+
+
+def replay_socketcan(records, channel: str, speed: float):
+    """Replay onto a SocketCAN interface"""
+    # pylint: disable=import-outside-toplevel
+    from frc_can_7491.SocketCANTransport import SocketCANTransport
+
+    transport = SocketCANTransport(channel)
+
+    def inject(frame_id, data, extended):
+        while not transport.send(Message(id=frame_id, data=data, extended=extended)):
+            pass
+
+    replay = CANReplay(records, inject, speed=speed)
+    replay.run()
+    transport.deinit()
+    return replay
+
+
+def main(argv=None):
+    """main function"""
+    parser = argparse.ArgumentParser(description="Export and replay CAN captures")
+    parser.add_argument("capture", help="CANCapture file or candump -L log")
+    parser.add_argument("--export", help="write the capture as a candump -L log")
+    parser.add_argument("--interface", default="can0", help="interface name in the export")
+    parser.add_argument("--device", help="replay into a CANDevice type:manufacturer:number")
+    parser.add_argument("--channel", help="replay onto a SocketCAN interface")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = original timing, 0 = flat out")
+    parser.add_argument("--include-tx", action="store_true", help="also replay frames the device sent")
+    parser.add_argument("--sent", help="write what the device sent as a candump -L log")
+    args = parser.parse_args(argv)
+
+    records = load(args.capture)
+    if not args.include_tx:
+        records = [record for record in records if not record[6]]
+    print(f"{len(records)} frames in {args.capture}")
+
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as out:
+            to_candump(load(args.capture), out, args.interface)
+
+    if args.device:
+        replay, device, sent, elapsed = replay_device(records, args.device, args.speed)
+        print(
+            f"replayed {replay.frames} frames in {elapsed:.3f}s ({replay.frames / max(elapsed, 1e-9):.0f}/s), "
+            f"late max {replay.late_max_us}us"
+        )
+        print(f"device received {device.rx_count}, unrouted {device.unrouted_count}, sent {len(sent)}")
+        if args.sent:
+            with open(args.sent, "w", encoding="utf-8") as out:
+                to_candump(sent, out, args.interface)
+
+    if args.channel:
+        replay = replay_socketcan(records, args.channel, args.speed)
+        print(f"replayed {replay.frames} frames on {args.channel}, late max {replay.late_max_us}us")
+
+
+if __name__ == "__main__":
+    main()
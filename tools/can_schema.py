@@ -0,0 +1,115 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`can_schema`
+====================================================
+Encode and decode the payloads declared in ``message_schemas.py`` (and the
+roboRIO heartbeat) with the same compiled `MessageSchema` tables the firmware
+uses.
+
+Host only::
+
+    python3 tools/can_schema.py
+    python3 tools/can_schema.py encode PatternBlink segment=1 color=0xFF0000 speed=0.25
+    python3 tools/can_schema.py decode InitPixelArray 00000000900040
+    python3 tools/can_schema.py decode RobotHeartbeat 0000000017000078
+
+``encode`` prints a ``cansend`` frame for the device given with ``--device``
+(type:manufacturer:number), fields left out are 0 (the default where the field
+has one).
+
+* Author(s): Karl Fleischmann
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "lib"))
+
+# pylint: disable=wrong-import-position
+from frc_can_7491 import HEARTBEAT_SCHEMA, CANMessage  # noqa: E402
+from message_schemas import SCHEMAS  # noqa: E402
+
+
+def schemas_by_name() -> dict:
+    """name -> (API id or None, MessageSchema)"""
+    schemas = {schema.name: (api_id, schema) for api_id, schema in SCHEMAS.items()}
+    schemas[HEARTBEAT_SCHEMA.name] = (None, HEARTBEAT_SCHEMA)
+    return schemas
+
+
+def parse_value(text: str):
+    """int in any base, otherwise float"""
+    try:
+        return int(text, 0)
+    except ValueError:
+        return float(text)
+
+
+def describe(schema) -> str:
+    """One line per field"""
+    lines = []
+    for field, offset in zip(schema.fields, schema.offsets):
+        if field.bit is not None:
+            where = f"bits {field.bit + field.bits - 1}-{field.bit}"
+        else:
+            where = f"byte {offset} {field.code}"
+        extra = ""
+        if field.scale is not None:
+            extra += f" x{field.scale}"
+        if field.default is not None:
+            extra += f" (0 = {field.default})"
+        lines.append(f"    {field.name:<16} {where}{extra}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """main function"""
+    parser = argparse.ArgumentParser(description="Encode and decode API id payloads")
+    parser.add_argument("action", nargs="?", choices=("list", "encode", "decode"), default="list")
+    parser.add_argument("name", nargs="?", help="API id name, e.g. PatternSolid")
+    parser.add_argument("values", nargs="*", help="field=value to encode, or the payload hex to decode")
+    parser.add_argument("--device", default="11:8:5", help="type:manufacturer:number for encode")
+    args = parser.parse_args(argv)
+
+    schemas = schemas_by_name()
+    if args.action == "list":
+        for name, (api_id, schema) in schemas.items():
+            api = "" if api_id is None else f" 0x{api_id:02X}"
+            print(f"{name}{api}, {schema.size} bytes")
+            if schema.fields:
+                print(describe(schema))
+        return None
+
+    if args.name not in schemas:
+        parser.error(f"unknown name {args.name}, see the list")
+    api_id, schema = schemas[args.name]
+
+    if args.action == "decode":
+        data = bytes.fromhex("".join(args.values))
+        values = schema.decode(data)
+        for name, value in zip(schema.names, values):
+            print(f"{name} = {value:#x}" if name.startswith("color") else f"{name} = {value}")
+        return dict(zip(schema.names, values))
+
+    given = {}
+    for item in args.values:
+        name, _, text = item.partition("=")
+        if name not in schema.names:
+            parser.error(f"{args.name} has no field {name}, fields: {', '.join(schema.names)}")
+        given[name] = parse_value(text)
+    payload = schema.encode(*[given.get(name) for name in schema.names])
+    if api_id is None:
+        print(payload.hex().upper())
+    else:
+        dev_type, dev_mfg, dev_num = (int(part, 0) for part in args.device.split(":"))
+        frame_id = CANMessage.assemble_message_id_short(dev_type, dev_mfg, api_id, dev_num)
+        print(f"{frame_id:08X}#{payload.hex().upper()}")
+    return payload
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`gateway_sim`
+====================================================
+Runs the gateway mode (`SLCANGateway` / `BinaryGateway`) on the host against a
+`VirtualBus`, so host tools can be tried without a Feather.
+
+Host only::
+
+    # a pseudo terminal standard tools can open, e.g.
+    #   slcand -o -s8 /dev/pts/5 can0 && candump can0
+    #   python3 -c "import can; can.Bus('slcan', channel='/dev/pts/5', bitrate=1000000)"
+    python3 tools/gateway_sim.py --pty --heartbeat
+
+    # throughput both ways through the gateway, in process
+    python3 tools/gateway_sim.py --selftest 20000
+    python3 tools/gateway_sim.py --selftest 20000 --protocol binary
+
+The bus has a `CANDevice` (11:8:5) that answers Enumerate, and ``--heartbeat``
+adds a roboRIO heartbeat every 20 ms.
+
+* Author(s): Karl Fleischmann
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+from collections import deque
+from struct import pack
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+
+# pylint: disable=wrong-import-position
+import sniff  # noqa: E402
+from frc_can_7491 import (  # noqa: E402
+    REGISTER_FRAME_SIZE,
+    BinaryGateway,
+    CANDevice,
+    Message,
+    SLCANGateway,
+    VirtualBus,
+    pack_registers,
+)
+
+HEARTBEAT_ID = 0x01011840
+
+
+class SerialEnd:
+    """SerialEnd Class, one end of an in-memory serial link with the ``usb_cdc.Serial`` calls"""
+
+    connected = True
+
+    def __init__(self, incoming: deque, outgoing: deque) -> None:
+        self.incoming = incoming
+        self.outgoing = outgoing
+        self.partial = b""
+
+    @property
+    def in_waiting(self) -> int:
+        """Bytes waiting to be read"""
+        return len(self.partial) + sum(len(chunk) for chunk in self.incoming)
+
+    def read(self, size: int = -1) -> bytes:
+        """Up to size bytes, b"" when nothing is waiting"""
+        data = self.partial
+        while self.incoming and (size < 0 or len(data) < size):
+            data += self.incoming.popleft()
+        if size < 0:
+            size = len(data)
+        self.partial = data[size:]
+        return data[:size]
+
+    def readinto(self, buffer) -> int:
+        """Read into buffer, returns the number of bytes"""
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def write(self, data) -> int:
+        """Send bytes to the other end"""
+        self.outgoing.append(bytes(data))
+        return len(data)
+
+    def close(self):
+        """close function"""
+
+
+def serial_pair():
+    """Two connected SerialEnds, (device end, host end)"""
+    to_device = deque()
+    to_host = deque()
+    return SerialEnd(to_device, to_host), SerialEnd(to_host, to_device)
+
+
+class PtyStream:
+    """PtyStream Class, the master side of a pseudo terminal with the ``usb_cdc.Serial`` calls"""
+
+    connected = True
+
+    def __init__(self) -> None:
+        # pylint: disable=import-outside-toplevel
+        import pty
+        import tty
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.name = os.ttyname(self.slave)
+
+    @property
+    def in_waiting(self) -> int:
+        """Bytes waiting to be read"""
+        # pylint: disable=import-outside-toplevel
+        import fcntl
+        import termios
+
+        return int.from_bytes(fcntl.ioctl(self.master, termios.FIONREAD, b"\0\0\0\0"), sys.byteorder)
+
+    def readinto(self, buffer) -> int:
+        """Read into buffer, returns the number of bytes"""
+        try:
+            data = os.read(self.master, len(buffer))
+        except BlockingIOError:
+            return 0
+        buffer[: len(data)] = data
+        return len(data)
+
+    def write(self, data) -> int:
+        """Send bytes to whoever has the terminal open"""
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.master, view) :]
+            except BlockingIOError:
+                sleep(0.001)
+        return len(data)
+
+
+def binary_frames_packet(frames) -> bytes:
+    """BinaryGateway FRAMES packet for up to 255 (id, data, extended) frames"""
+    body = bytearray(len(frames) * REGISTER_FRAME_SIZE)
+    for index, (frame_id, data, extended) in enumerate(frames):
+        pack_registers(Message(frame_id, data, extended), body, index * REGISTER_FRAME_SIZE)
+    return pack(BinaryGateway.HEADER_FORMAT, BinaryGateway.MAGIC, BinaryGateway.FRAMES, len(frames)) + body
+
+
+def binary_command_packet(command: int, body: bytes = b"", count: int = 0) -> bytes:
+    """BinaryGateway packet without frames"""
+    return pack(BinaryGateway.HEADER_FORMAT, BinaryGateway.MAGIC, command, count) + body
+
+
+def build(protocol: str, stream, heartbeat: bool):
+    """The virtual bus, gateway and CANDevice"""
+    bus = VirtualBus()
+    gateway_class = SLCANGateway if protocol == "slcan" else BinaryGateway
+    gateway = gateway_class(bus.transport(rx_capacity=4096), stream)
+    with contextlib.redirect_stdout(io.StringIO()):
+        device = CANDevice(11, 8, 5, transport=bus.transport())
+        device.start_listener()
+    return bus, gateway, device, heartbeat
+
+
+def serve(protocol: str, heartbeat: bool):
+    """Run the gateway on a pseudo terminal until interrupted"""
+    stream = PtyStream()
+    bus, gateway, device, heartbeat = build(protocol, stream, heartbeat)
+    print(f"{protocol} gateway on {stream.name}")
+    last_heartbeat = perf_counter()
+    try:
+        while True:
+            now = perf_counter()
+            if heartbeat and now - last_heartbeat >= 0.02:
+                last_heartbeat = now
+                bus.inject(HEARTBEAT_ID, bytes(8))
+            device.receive_messages()
+            gateway.poll()
+            sleep(0.0005)
+    except KeyboardInterrupt:
+        pass
+    rx_rate, tx_rate = gateway.throughput()
+    print(
+        f"bus to host {gateway.rx_frames}, host to bus {gateway.tx_frames} "
+        f"({gateway.tx_failed} failed, {gateway.host_dropped} dropped), last rates {rx_rate}/{tx_rate} fps"
+    )
+
+
+def selftest(protocol: str, count: int):
+    """Push count frames each way through the gateway, returns the rates"""
+    # pylint: disable=too-many-locals
+    device_end, host = serial_pair()
+    bus, gateway, _, _ = build(protocol, device_end, False)
+    monitor = bus.transport(rx_capacity=count + 16)
+    monitor.set_filters(None)
+
+    if protocol == "slcan":
+        host.write(b"S8\rO\r")
+    else:
+        host.write(binary_command_packet(BinaryGateway.OPEN))
+    gateway.poll()
+    host.read()
+
+    # host to bus, as one batch of lines / packets per 32 frames
+    frames = [(0x02050000 | (index & 0xFFFF), (index & 0xFFFFFFFF).to_bytes(4, "little"), True) for index in range(count)]
+    started = perf_counter()
+    for start in range(0, count, 32):
+        batch = frames[start : start + 32]
+        if protocol == "slcan":
+            host.write(b"".join(b"T%08X%d%s\r" % (frame_id, len(data), data.hex().upper().encode()) for frame_id, data, _ in batch))
+        else:
+            host.write(binary_frames_packet(batch))
+        gateway.poll()
+    tx_seconds = perf_counter() - started
+    host.read()
+    received = []
+    while monitor.in_waiting():
+        frame = monitor.receive()
+        received.append((frame.id, bytes(frame.data), frame.extended))
+    assert received == frames, "host to bus frames differ"
+
+    # bus to host
+    started = perf_counter()
+    for start in range(0, count, 32):
+        for frame_id, data, extended in frames[start : start + 32]:
+            bus.inject(frame_id, data, extended)
+        gateway.poll()
+    if protocol == "binary":
+        gateway.sniffer.flush()
+    rx_seconds = perf_counter() - started
+
+    output = io.BytesIO(host.read())
+    if protocol == "slcan":
+        lines = output.getvalue().split(b"\r")[:-1]
+        got = [(int(line[1:9], 16), bytes.fromhex(line[10:].decode()), True) for line in lines]
+    else:
+        got = [
+            (frame_id, data, extended)
+            for _, packet in sniff.read_packets(output)
+            for _, frame_id, extended, _, _, data, _ in packet
+        ]
+    assert got == frames, "bus to host frames differ"
+    return count / tx_seconds, count / rx_seconds, gateway
+
+
+def main(argv=None):
+    """main function"""
+    parser = argparse.ArgumentParser(description="Gateway mode on a virtual bus")
+    parser.add_argument("--protocol", choices=("slcan", "binary"), default="slcan")
+    parser.add_argument("--pty", action="store_true", help="serve on a pseudo terminal")
+    parser.add_argument("--heartbeat", action="store_true", help="roboRIO heartbeats on the bus")
+    parser.add_argument("--selftest", type=int, metavar="FRAMES", help="frames to push each way")
+    args = parser.parse_args(argv)
+
+    if args.selftest:
+        tx_rate, rx_rate, gateway = selftest(args.protocol, args.selftest)
+        print(
+            f"{args.protocol}: host to bus {tx_rate:.0f} frames/s, bus to host {rx_rate:.0f} frames/s, "
+            f"{gateway.bytes_in} bytes in, {gateway.bytes_out} bytes out, "
+            f"{gateway.tx_failed} failed, {gateway.host_dropped} dropped"
+        )
+    if args.pty:
+        serve(args.protocol, args.heartbeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,611 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`mcp2515_sim`
+====================================================
+Register level model of the MCP2515 behind a simulated SPI bus, so the
+unmodified ``adafruit_mcp2515`` driver (and `CANDevice` on top of it) runs on a
+host and its SPI traffic can be counted.
+
+Host only (CPython). ``install()`` puts ``lib`` on the path and provides the
+CircuitPython pieces the driver imports that only exist as .mpy files
+(``micropython.const``, ``adafruit_mcp2515.canio``, ``adafruit_mcp2515.timer``
+and ``adafruit_bus_device.spi_device``)::
+
+    import mcp2515_sim
+    mcp2515_sim.install()
+
+    chip = mcp2515_sim.SimulatedMCP2515()
+    can_bus = mcp2515_sim.driver(chip)
+    chip.inject(0x0B080405, b"hi", extended=True)
+    print(can_bus.listen().receive().data, chip.stats())
+
+* Author(s): Karl Fleischmann
+"""
+import os
+import sys
+import types
+from time import monotonic
+
+LIB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+
+# SPI instructions
+RESET = 0xC0
+READ = 0x03
+WRITE = 0x02
+BITMOD = 0x05
+READ_STATUS = 0xA0
+RX_STATUS = 0xB0
+LOAD_TX = 0x40  # 0x40-0x45, buffer and start at SIDH or D0
+RTS = 0x80  # 0x81-0x87, one bit per TX buffer
+READ_RX = 0x90  # 0x90-0x96, buffer and start at SIDH or D0
+
+COMMAND_NAMES = {
+    RESET: "RESET",
+    READ: "READ",
+    WRITE: "WRITE",
+    BITMOD: "BITMOD",
+    READ_STATUS: "READ_STATUS",
+    RX_STATUS: "RX_STATUS",
+}
+
+# registers
+CANSTAT = 0x0E
+CANCTRL = 0x0F
+TEC = 0x1C
+REC = 0x1D
+CANINTE = 0x2B
+CANINTF = 0x2C
+EFLG = 0x2D
+TXB_CTRL = (0x30, 0x40, 0x50)
+RXB_CTRL = (0x60, 0x70)
+RXM = (0x20, 0x24)
+# filters 0-1 belong to RXB0, 2-5 to RXB1
+RXF = ((0x00, 0x04), (0x08, 0x10, 0x14, 0x18))
+
+MODE_MASK = 0xE0
+MODE_NORMAL = 0x00
+MODE_LOOPBACK = 0x40
+MODE_LISTENONLY = 0x60
+MODE_CONFIG = 0x80
+
+TXREQ = 0x08
+RXM_ANY = 0x60
+BUKT = 0x04
+RTR_BIT = 0x40
+IDE_BIT = 0x08
+
+# EFLG bits
+EWARN = 0x01
+RXWAR = 0x02
+TXWAR = 0x04
+RXEP = 0x08
+TXEP = 0x10
+TXBO = 0x20
+RX0OVR = 0x40
+RX1OVR = 0x80
+
+
+def encode_id(frame_id: int, extended: bool):
+    """SIDH, SIDL, EID8, EID0 for a frame id"""
+    if extended:
+        return (
+            (frame_id >> 21) & 0xFF,
+            (((frame_id >> 18) & 0x07) << 5) | IDE_BIT | ((frame_id >> 16) & 0x03),
+            (frame_id >> 8) & 0xFF,
+            frame_id & 0xFF,
+        )
+    return ((frame_id >> 3) & 0xFF, (frame_id & 0x07) << 5, 0, 0)
+
+
+def id_bits(sidh: int, sidl: int, eid8: int, eid0: int) -> int:
+    """All 29 id bits of four id registers, the standard id is the top 11"""
+    return (sidh << 21) | ((sidl >> 5) << 18) | ((sidl & 0x03) << 16) | (eid8 << 8) | eid0
+
+
+def decode_id(sidh: int, sidl: int, eid8: int, eid0: int):
+    """(frame id, extended) from the four id registers"""
+    if sidl & IDE_BIT:
+        return id_bits(sidh, sidl, eid8, eid0), True
+    return (sidh << 3) | (sidl >> 5), False
+
+
+class SimulatedMCP2515:  # pylint: disable=too-many-instance-attributes
+    """SimulatedMCP2515 Class
+
+    The register file plus the parts of the controller the driver relies on:
+    mode requests, acceptance masks and filters, RXB0 to RXB1 rollover, receive
+    overflow flags, three TX buffers and the interrupt flags. Frames come in
+    through ``inject()``; transmitted frames are collected in ``transmitted`` (or
+    handed to ``on_transmit``) as ``(id, data, extended, rtr, length)``.
+
+    Every chip select assertion is one transaction, ``stats()`` reports the
+    transactions and bytes clocked in total and per instruction.
+    """
+
+    def __init__(self, on_transmit=None) -> None:
+        self.registers = bytearray(128)
+        self.on_transmit = on_transmit
+        self.transmitted = []
+        self.received = 0
+        self.dropped = 0
+        self.rejected = 0
+
+        self.selected = False
+        self.command = None
+        self.address = 0
+        self.position = 0
+        self.bitmod_mask = 0
+        self.read_rx_buffer = None
+
+        self.transactions = 0
+        self.current_stats = None
+        self.bytes = 0
+        self.command_stats = {}
+        self.reset()
+
+    # controller state
+
+    def reset(self):
+        """Power on / RESET instruction state, configuration mode"""
+        self.registers[:] = bytes(128)
+        self.registers[CANCTRL] = 0x87
+        self.registers[CANSTAT] = MODE_CONFIG
+
+    @property
+    def mode(self):
+        """Current operating mode"""
+        return self.registers[CANSTAT] & MODE_MASK
+
+    def set_error_counts(self, tec: int, rec: int):
+        """Set TEC/REC and the error flags that follow from them"""
+        self.registers[TEC] = min(tec, 255)
+        self.registers[REC] = min(rec, 255)
+        flags = self.registers[EFLG] & (RX0OVR | RX1OVR)
+        if rec >= 96:
+            flags |= RXWAR | EWARN
+        if tec >= 96:
+            flags |= TXWAR | EWARN
+        if rec >= 128:
+            flags |= RXEP
+        if tec >= 128:
+            flags |= TXEP
+        if tec >= 256:
+            flags |= TXBO
+        self.registers[EFLG] = flags
+
+    def write_register(self, address: int, value: int):
+        """Register write, mode requests take effect immediately"""
+        address &= 0x7F
+        if address == CANSTAT:
+            return
+        self.registers[address] = value
+        if address == CANCTRL:
+            self.registers[CANSTAT] = (self.registers[CANSTAT] & ~MODE_MASK) | (value & MODE_MASK)
+        elif address in TXB_CTRL and value & TXREQ:
+            self.transmit(TXB_CTRL.index(address))
+
+    def accepts(self, buffer: int, frame_id: int, extended: bool) -> int:
+        """Index of the filter that accepts the frame into the buffer, -1 for none"""
+        registers = self.registers
+        if registers[RXB_CTRL[buffer]] & RXM_ANY == RXM_ANY:
+            return 0
+        mask_address = RXM[buffer]
+        mask = id_bits(*registers[mask_address : mask_address + 4])
+        # standard frames only compare the top 11 bits
+        shift = 0 if extended else 18
+        for index, address in enumerate(RXF[buffer]):
+            if bool(registers[address + 1] & IDE_BIT) != extended:
+                continue
+            filter_id = id_bits(*registers[address : address + 4]) >> shift
+            if (filter_id ^ frame_id) & (mask >> shift) == 0:
+                return index
+        return -1
+
+    def inject(
+        self, frame_id: int, data: bytes = b"", extended: bool = True, rtr: bool = False, length=0
+    ):  # pylint: disable=too-many-arguments
+        """A frame arriving from the bus, returns True if it was stored in an RX buffer.
+        Remote requests (rtr) carry a length instead of data."""
+        registers = self.registers
+        if self.mode == MODE_CONFIG:
+            return False
+
+        target = None
+        if self.accepts(0, frame_id, extended) >= 0:
+            if not registers[CANINTF] & 0x01:
+                target = 0
+            elif registers[RXB_CTRL[0]] & BUKT and not registers[CANINTF] & 0x02:
+                target = 1
+            else:
+                registers[EFLG] |= RX0OVR
+        elif self.accepts(1, frame_id, extended) >= 0:
+            if not registers[CANINTF] & 0x02:
+                target = 1
+            else:
+                registers[EFLG] |= RX1OVR
+        else:
+            self.rejected += 1
+            return False
+
+        if target is None:
+            self.dropped += 1
+            return False
+
+        base = RXB_CTRL[target]
+        registers[base + 1 : base + 5] = bytes(encode_id(frame_id, extended))
+        if rtr:
+            registers[base + 5] = RTR_BIT | min(length, 8)
+        else:
+            payload = bytes(data[:8])
+            registers[base + 5] = len(payload)
+            registers[base + 6 : base + 6 + len(payload)] = payload
+        registers[CANINTF] |= 1 << target
+        self.received += 1
+        return True
+
+    def transmit(self, buffer: int):
+        """Send a TX buffer: completes at once and raises its interrupt flag"""
+        registers = self.registers
+        base = TXB_CTRL[buffer]
+        frame_id, extended = decode_id(*registers[base + 1 : base + 5])
+        dlc = registers[base + 5]
+        rtr = bool(dlc & RTR_BIT)
+        length = min(dlc & 0x0F, 8)
+        data = b"" if rtr else bytes(registers[base + 6 : base + 6 + length])
+
+        registers[base] &= ~TXREQ
+        registers[CANINTF] |= 0x04 << buffer
+        if self.mode == MODE_LISTENONLY:
+            return
+        if self.mode == MODE_LOOPBACK:
+            self.inject(frame_id, data, extended, rtr, length)
+            return
+        frame = (frame_id, data, extended, rtr, length)
+        if self.on_transmit is not None:
+            self.on_transmit(frame)
+        else:
+            self.transmitted.append(frame)
+
+    def read_status(self) -> int:
+        """READ STATUS instruction result"""
+        registers = self.registers
+        intf = registers[CANINTF]
+        status = intf & 0x03
+        for buffer in range(3):
+            if registers[TXB_CTRL[buffer]] & TXREQ:
+                status |= 0x04 << (2 * buffer)
+            if intf & (0x04 << buffer):
+                status |= 0x08 << (2 * buffer)
+        return status
+
+    # SPI side
+
+    def select(self):
+        """Chip select asserted, a new instruction starts"""
+        self.selected = True
+        self.command = None
+        self.position = 0
+        self.read_rx_buffer = None
+        self.transactions += 1
+
+    def deselect(self):
+        """Chip select released"""
+        if self.read_rx_buffer is not None:
+            # READ RX BUFFER clears the buffer's interrupt flag when CS is raised
+            self.registers[CANINTF] &= ~(1 << self.read_rx_buffer)
+        self.selected = False
+
+    def command_name(self, command: int) -> str:
+        """command_name function"""
+        if command in COMMAND_NAMES:
+            return COMMAND_NAMES[command]
+        if command & 0xF8 == LOAD_TX:
+            return "LOAD_TX"
+        if command & 0xF8 == RTS:
+            return "RTS"
+        if command & 0xF9 == READ_RX:
+            return "READ_RX"
+        return f"UNKNOWN_{command:#04x}"
+
+    def transfer(self, value: int) -> int:  # pylint: disable=too-many-branches
+        """Clock one byte in and return the byte clocked out"""
+        self.bytes += 1
+        if self.command is None:
+            self.command = value
+            name = self.command_name(value)
+            stats = self.command_stats.get(name)
+            if stats is None:
+                stats = self.command_stats[name] = [0, 0]
+            stats[0] += 1
+            self.current_stats = stats
+            self.start(value)
+            stats[1] += 1
+            return 0
+
+        self.current_stats[1] += 1
+        self.position += 1
+        command = self.command
+        if command == READ:
+            if self.position == 1:
+                self.address = value
+                return 0
+            result = self.registers[self.address & 0x7F]
+            self.address += 1
+            return result
+        if command == WRITE:
+            if self.position == 1:
+                self.address = value
+            else:
+                self.write_register(self.address, value)
+                self.address += 1
+            return 0
+        if command == BITMOD:
+            if self.position == 1:
+                self.address = value
+            elif self.position == 2:
+                self.bitmod_mask = value
+            elif self.position == 3:
+                current = self.registers[self.address & 0x7F]
+                mask = self.bitmod_mask
+                self.write_register(self.address, (current & ~mask) | (value & mask))
+            return 0
+        if command == READ_STATUS:
+            return self.read_status()
+        if command == RX_STATUS:
+            return self.registers[CANINTF] & 0x03
+        if command & 0xF8 == LOAD_TX:
+            self.registers[self.address & 0x7F] = value
+            self.address += 1
+            return 0
+        if command & 0xF9 == READ_RX:
+            result = self.registers[self.address & 0x7F]
+            self.address += 1
+            return result
+        return 0
+
+    def start(self, command: int):
+        """Instructions that act on the command byte alone"""
+        if command == RESET:
+            self.reset()
+        elif command & 0xF8 == LOAD_TX:
+            buffer = (command >> 1) & 0x03
+            self.address = TXB_CTRL[buffer] + (6 if command & 0x01 else 1)
+        elif command & 0xF8 == RTS:
+            for buffer in range(3):
+                if command & (1 << buffer):
+                    self.registers[TXB_CTRL[buffer]] |= TXREQ
+                    self.transmit(buffer)
+        elif command & 0xF9 == READ_RX:
+            buffer = (command >> 2) & 0x01
+            self.read_rx_buffer = buffer
+            self.address = RXB_CTRL[buffer] + (6 if command & 0x02 else 1)
+
+    def stats(self) -> dict:
+        """SPI transactions and bytes, in total and per instruction"""
+        return {
+            "transactions": self.transactions,
+            "bytes": self.bytes,
+            "commands": {
+                name: {"transactions": count, "bytes": size}
+                for name, (count, size) in sorted(self.command_stats.items())
+            },
+        }
+
+    def reset_stats(self):
+        """Clear the SPI counters"""
+        self.transactions = 0
+        self.bytes = 0
+        self.command_stats = {}
+
+
+class SimulatedSPI:
+    """SimulatedSPI Class
+
+    ``busio.SPI`` style read/write calls, clocked byte by byte into the chip.
+    """
+
+    def __init__(self, chip: SimulatedMCP2515) -> None:
+        self.chip = chip
+
+    def write(self, buffer, *, start=0, end=None):
+        """write function"""
+        transfer = self.chip.transfer
+        for value in buffer[start : len(buffer) if end is None else end]:
+            transfer(value)
+
+    def readinto(self, buffer, *, start=0, end=None, write_value=0):
+        """readinto function"""
+        transfer = self.chip.transfer
+        for index in range(start, len(buffer) if end is None else end):
+            buffer[index] = transfer(write_value)
+
+    def write_readinto(
+        self, out_buffer, in_buffer, *, out_start=0, out_end=None, in_start=0, in_end=None
+    ):  # pylint: disable=too-many-arguments
+        """write_readinto function"""
+        out_end = len(out_buffer) if out_end is None else out_end
+        in_end = len(in_buffer) if in_end is None else in_end
+        transfer = self.chip.transfer
+        for offset in range(out_end - out_start):
+            value = transfer(out_buffer[out_start + offset])
+            if in_start + offset < in_end:
+                in_buffer[in_start + offset] = value
+
+    def try_lock(self):
+        """try_lock function"""
+        return True
+
+    def unlock(self):
+        """unlock function"""
+
+    def configure(self, **kwargs):
+        """configure function"""
+
+
+class SimulatedPin:  # pylint: disable=too-few-public-methods
+    """SimulatedPin Class, stands in for the chip select DigitalInOut"""
+
+    value = True
+
+    def switch_to_output(self, value=True):
+        """switch_to_output function"""
+        self.value = value
+
+    def deinit(self):
+        """deinit function"""
+
+
+class SPIDevice:
+    """SPIDevice Class, ``adafruit_bus_device.spi_device`` on the simulated bus"""
+
+    def __init__(self, spi, chip_select=None, *, baudrate=100000, polarity=0, phase=0, extra_clocks=0):
+        # pylint: disable=too-many-arguments,unused-argument
+        self.spi = spi
+        self.chip_select = chip_select
+
+    def __enter__(self):
+        self.spi.chip.select()
+        return self.spi
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.spi.chip.deselect()
+        return False
+
+
+class Timer:
+    """Timer Class, ``adafruit_mcp2515.timer``"""
+
+    def __init__(self, timeout=0.0) -> None:
+        self._timeout = None
+        self._start_time = None
+        self.rewind_to(timeout)
+
+    def rewind_to(self, new_timeout):
+        """Restart the timer with a new timeout (seconds)"""
+        self._timeout = float(new_timeout)
+        self._start_time = monotonic()
+
+    @property
+    def expired(self):
+        """True once the timeout has passed"""
+        return (monotonic() - self._start_time) > self._timeout
+
+
+def canio_module():
+    """``adafruit_mcp2515.canio`` with the same classes as the .mpy"""
+    module = types.ModuleType("adafruit_mcp2515.canio")
+
+    class Message:  # pylint: disable=too-few-public-methods
+        """Message Class"""
+
+        def __init__(self, id, data, extended=False):  # pylint: disable=redefined-builtin
+            if len(data) > 8:
+                raise AttributeError("`canio.Message` object data must be of length 8 or less")
+            self.id = id
+            self.data = data
+            self.extended = extended
+
+    class RemoteTransmissionRequest:  # pylint: disable=too-few-public-methods
+        """RemoteTransmissionRequest Class"""
+
+        def __init__(self, id, length, *, extended=False):  # pylint: disable=redefined-builtin
+            self.id = id
+            self.length = length
+            self.extended = extended
+
+    class Match:  # pylint: disable=too-few-public-methods
+        """Match Class"""
+
+        def __init__(self, address, *, mask=0, extended=False):
+            self.address = address
+            self.mask = mask
+            self.extended = extended
+
+    class BusState:  # pylint: disable=too-few-public-methods
+        """BusState Class"""
+
+        ERROR_ACTIVE = 0
+        ERROR_WARNING = 1
+        ERROR_PASSIVE = 2
+        BUS_OFF = 3
+
+    class Listener:
+        """Listener Class"""
+
+        def __init__(self, can_bus_obj, timeout=1.0):
+            self._timer = Timer()
+            self._can_bus_obj = can_bus_obj
+            self.timeout = timeout
+
+        def receive(self):
+            """The next message, waits up to timeout seconds"""
+            self._timer.rewind_to(self.timeout)
+            while not self._timer.expired:
+                if self._can_bus_obj.unread_message_count == 0:
+                    continue
+                return self._can_bus_obj.read_message()
+            return None
+
+        def in_waiting(self):
+            """Number of messages waiting"""
+            return self._can_bus_obj.unread_message_count
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            message = self.receive()
+            if message is None:
+                raise StopIteration
+            return message
+
+        def deinit(self):
+            """deinit function"""
+            self._can_bus_obj.deinit_filtering_registers()
+
+    module.Message = Message
+    module.RemoteTransmissionRequest = RemoteTransmissionRequest
+    module.Match = Match
+    module.BusState = BusState
+    module.Listener = Listener
+    module.__all__ = ["Message", "RemoteTransmissionRequest", "Match", "BusState", "Listener"]
+    return module
+
+
+def install():
+    """Make the MCP2515 driver importable on the host"""
+    if LIB_PATH not in sys.path:
+        sys.path.insert(0, LIB_PATH)
+    # canio is the marker: importing frc_can_7491 first does not import the
+    # driver package, and a second canio would have different frame classes.
+    # With Blinka's micropython module the driver import gets as far as the
+    # .mpy canio directory, which is left behind as an empty namespace package.
+    if hasattr(sys.modules.get("adafruit_mcp2515.canio"), "Message"):
+        return
+
+    micropython = types.ModuleType("micropython")
+    micropython.const = lambda value: value
+    sys.modules.setdefault("micropython", micropython)
+
+    sys.modules["adafruit_mcp2515.canio"] = canio_module()
+
+    timer = types.ModuleType("adafruit_mcp2515.timer")
+    timer.Timer = Timer
+    sys.modules["adafruit_mcp2515.timer"] = timer
+
+    import adafruit_bus_device  # pylint: disable=import-outside-toplevel
+
+    spi_device = types.ModuleType("adafruit_bus_device.spi_device")
+    spi_device.SPIDevice = SPIDevice
+    sys.modules["adafruit_bus_device.spi_device"] = spi_device
+    adafruit_bus_device.spi_device = spi_device
+
+
+def driver(chip: SimulatedMCP2515, baudrate: int = 1_000_000, **kwargs):
+    """The real ``adafruit_mcp2515.MCP2515`` driver on a simulated chip"""
+    install()
+    from adafruit_mcp2515 import MCP2515  # pylint: disable=import-outside-toplevel
+
+    return MCP2515(SimulatedSPI(chip), SimulatedPin(), baudrate=baudrate, **kwargs)
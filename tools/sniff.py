@@ -0,0 +1,185 @@
+# SPDX-FileCopyrightText: Copyright (c) 2024 Karl Fleischmann for Team 7491 Cyber Soldiers
+#
+# SPDX-License-Identifier: MIT
+"""
+`sniff`
+====================================================
+Host side of the sniffer mode (``"mode": "sniffer"`` in can_config.json): reads
+the `CANSniffer` packets from the Feather's USB data port, prints frames as
+``candump -L`` lines and/or saves them as a `CANCapture` file for
+``tools/can_analyze.py``.
+
+Host only::
+
+    python3 tools/sniff.py /dev/ttyACM1
+    python3 tools/sniff.py /dev/ttyACM1 --capture pits.fcap --quiet
+
+The serial port is opened with pyserial when it is installed, otherwise as a
+plain file (run ``stty -F /dev/ttyACM1 raw`` first). A file of recorded
+packets is always read as a file. Lost packets (sequence
+gaps), receive buffer overflows and frames the Feather could not send are
+reported on exit.
+
+* Author(s): Karl Fleischmann
+"""
+import argparse
+import os
+import sys
+from struct import pack, unpack_from
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+
+# pylint: disable=wrong-import-position
+from frc_can_7491 import (  # noqa: E402
+    CAPTURE_EXTENDED,
+    CAPTURE_RTR,
+    CANCapture,
+    CANSniffer,
+    REGISTER_FRAME_SIZE,
+    to_candump,
+    unpack_registers,
+)
+
+MAGIC = pack("<H", CANSniffer.MAGIC)
+# CANSniffer.HEADER_FORMAT after the magic
+HEADER_REST_FORMAT = "<BBHHHBxI"
+
+
+def read_exact(stream, size: int) -> bytes:
+    """size bytes, fewer only at the end of the stream"""
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def read_packets(stream):
+    """(header, frames) for every packet, frames as CANCapture style records
+    (timestamp us, id, extended, rtr, dlc, data, tx). Skips to the next magic
+    when the stream is out of step."""
+    window = b""
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            return
+        window = (window + byte)[-2:]
+        if window != MAGIC:
+            continue
+        window = b""
+        rest = read_exact(stream, CANSniffer.HEADER_SIZE - 2)
+        if len(rest) < CANSniffer.HEADER_SIZE - 2:
+            return
+        version, count, sequence, overflows, dropped, state, base_us = unpack_from(
+            HEADER_REST_FORMAT, rest
+        )
+        if version != CANSniffer.VERSION or count == 0:
+            continue
+        body = read_exact(stream, count * CANSniffer.RECORD_SIZE)
+        if len(body) < count * CANSniffer.RECORD_SIZE:
+            return
+        frames = []
+        for offset in range(0, len(body), CANSniffer.RECORD_SIZE):
+            frame_id, extended, rtr, dlc, data = unpack_registers(body, offset)
+            delta = body[offset + REGISTER_FRAME_SIZE] | body[offset + REGISTER_FRAME_SIZE + 1] << 8
+            frames.append((base_us + delta, frame_id, extended, rtr, dlc, data, False))
+        header = {
+            "sequence": sequence,
+            "rx_overflows": overflows,
+            "stream_dropped": dropped,
+            "state": state,
+            "base_us": base_us,
+        }
+        yield header, frames
+
+
+class SniffStats:  # pylint: disable=too-few-public-methods
+    """SniffStats Class, loss counters over a session"""
+
+    def __init__(self) -> None:
+        self.packets = 0
+        self.frames = 0
+        self.lost_packets = 0
+        self.first = None
+        self.last = None
+
+    def add(self, header: dict, frames: list):
+        """Count a packet"""
+        if self.last is not None:
+            self.lost_packets += (header["sequence"] - self.last["sequence"] - 1) & 0xFFFF
+        if self.first is None:
+            self.first = header
+        self.last = header
+        self.packets += 1
+        self.frames += len(frames)
+
+    def summary(self) -> str:
+        """One line summary"""
+        if self.first is None:
+            return "no packets"
+        overflows = (self.last["rx_overflows"] - self.first["rx_overflows"]) & 0xFFFF
+        dropped = (self.last["stream_dropped"] - self.first["stream_dropped"]) & 0xFFFF
+        return (
+            f"{self.frames} frames in {self.packets} packets, {self.lost_packets} packets lost, "
+            f"{overflows} receive buffer overflows, {dropped} frames dropped by the Feather"
+        )
+
+
+def open_port(path: str):
+    """The serial port, through pyserial when it is installed, or a file of recorded packets"""
+    if not os.path.isfile(path):
+        try:
+            import serial  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            pass
+        else:
+            return serial.Serial(path, timeout=None)
+    return open(path, "rb", buffering=0)  # pylint: disable=consider-using-with
+
+
+def main(argv=None):
+    """main function"""
+    parser = argparse.ArgumentParser(description="Read frames from a Feather in sniffer mode")
+    parser.add_argument("port", help="USB data serial port, or a file of recorded packets")
+    parser.add_argument("--capture", help="also save the frames as a CANCapture file")
+    parser.add_argument("--interface", default="can0", help="interface name in candump lines")
+    parser.add_argument("--quiet", action="store_true", help="do not print frames")
+    args = parser.parse_args(argv)
+
+    stats = SniffStats()
+    capture = None
+    port = open_port(args.port)
+    if args.capture:
+        capture = open(args.capture, "wb")  # pylint: disable=consider-using-with
+        capture.write(
+            pack(CANCapture.HEADER_FORMAT, CANCapture.MAGIC, CANCapture.VERSION, CANCapture.RECORD_SIZE)
+        )
+    try:
+        for header, frames in read_packets(port):
+            stats.add(header, frames)
+            if not args.quiet:
+                to_candump(frames, sys.stdout, args.interface)
+            if capture is not None:
+                for timestamp, frame_id, extended, rtr, dlc, data, _ in frames:
+                    can_id = frame_id
+                    if extended:
+                        can_id |= CAPTURE_EXTENDED
+                    if rtr:
+                        can_id |= CAPTURE_RTR
+                    capture.write(
+                        pack(CANCapture.RECORD_FORMAT, timestamp & 0xFFFFFFFF, can_id, dlc, 0, data)
+                    )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        port.close()
+        if capture is not None:
+            capture.close()
+    print(stats.summary(), file=sys.stderr)
+    return stats
+
+
+if __name__ == "__main__":
+    main()